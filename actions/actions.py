@@ -14,23 +14,35 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import concurrent.futures
+import fnmatch
+import json
 import os
 import subprocess
 import sys
+import time
 import uuid
 
 sys.path.append('hooks/')
 
+import admin_api
+import hook_trace
+import log_sink
 import multisite
 
+from log_sink import log
+
 from charmhelpers.core.hookenv import (
     action_fail,
     config,
     is_leader,
+    relation_get,
+    relation_ids,
+    related_units,
     leader_set,
     action_set,
     action_get,
-    log,
     ERROR,
     DEBUG,
 )
@@ -39,17 +51,16 @@ from charmhelpers.contrib.openstack.ip import (
     PUBLIC,
 )
 from utils import (
+    graceful_restart,
     pause_unit_helper,
     resume_unit_helper,
     register_configs,
     listen_port,
     service_name,
 )
-from charmhelpers.core.host import (
-    service_restart,
-)
 
 DEFAULT_SYNC_POLICY_ID = 'default'
+MULTISITE_SYSTEM_USER = 'multisite-sync'
 
 
 def pause(args):
@@ -80,7 +91,7 @@ def promote(args):
                               default=True, master=True)
         multisite.update_period(zonegroup=zonegroup, zone=zone)
         leader_set(restart_nonce=str(uuid.uuid4()))
-        service_restart(service_name())
+        graceful_restart(service_name())
         action_set(
             values={'message': 'zone:{} promoted to '
                     'master/default'.format(zone)}
@@ -192,30 +203,22 @@ def force_enable_multisite(args):
         return
 
     try:
-        # Rename chosen zonegroup/zone as per charm config value.
-        rename_result = multisite.rename_multisite_config(
-            [current_zonegroup],
-            new_zonegroup,
-            [current_zone], new_zone
-        )
-        if rename_result is None:
-            action_fail('Failed to rename zone {} or zonegroup {}.'
-                        .format(current_zone, current_zonegroup))
-            return
-
-        # Configure zonegroup/zone as master for multisite.
-        modify_result = multisite.modify_multisite_config(
-            new_zone, new_zonegroup,
-            realm=realm,
+        # Rename chosen zonegroup/zone as per charm config value and
+        # configure them as master for multisite.
+        plan = multisite.plan_force_enable(
+            current_zonegroup, current_zone,
+            realm, new_zonegroup, new_zone,
             endpoints=endpoints
         )
-        if modify_result is None:
-            action_fail('Failed to configure zone {} or zonegroup {}.'
-                        .format(new_zonegroup, new_zone))
+        if plan.apply() is None:
+            action_fail('Failed to rename or configure zone {} and '
+                        'zonegroup {}.'.format(current_zone,
+                                               current_zonegroup))
             return
 
-        leader_set(restart_nonce=str(uuid.uuid4()))
-        service_restart(service_name())
+        if plan.mutation:
+            leader_set(restart_nonce=str(uuid.uuid4()))
+            graceful_restart(service_name())
         action_set(
             values={
                 'message': 'Multisite Configuration Resolved'
@@ -229,6 +232,57 @@ def force_enable_multisite(args):
         action_fail(message + " : {}".format(cpe.output))
 
 
+def multisite_plan(args):
+    """Show the operations the multisite hooks would run (dry-run)
+
+    The plan is computed from the charm configuration and the data of the
+    primary or secondary relation, nothing is changed.
+    """
+    realm = config('realm')
+    zonegroup = config('zonegroup')
+    zone = config('zone')
+    if not all((realm, zonegroup, zone)):
+        action_fail("Missing required charm configurations realm({}), "
+                    "zonegroup({}) and zone({}).".format(
+                        realm, zonegroup, zone
+                    ))
+        return
+    endpoints = ['{}:{}'.format(
+        canonical_url(register_configs(), PUBLIC),
+        listen_port(),
+    )]
+
+    plan = None
+    if relation_ids('primary') or relation_ids('master'):
+        plan = multisite.plan_primary(realm, zonegroup, zone,
+                                      endpoints=endpoints,
+                                      system_user=MULTISITE_SYSTEM_USER)
+    for rid in relation_ids('secondary') + relation_ids('slave'):
+        for unit in related_units(rid):
+            primary_data = relation_get(rid=rid, unit=unit)
+            if all(primary_data.get(key)
+                   for key in ('url', 'access_key', 'secret')):
+                plan = multisite.plan_secondary(
+                    realm, zonegroup, zone,
+                    endpoints=endpoints,
+                    url=primary_data['url'],
+                    access_key=primary_data['access_key'],
+                    secret=primary_data['secret'])
+                break
+    if plan is None:
+        action_fail('No complete primary or secondary relation found.')
+        return
+
+    steps = plan.describe()
+    action_set(
+        values={
+            'plan': '\n'.join(steps) if steps else 'No changes required',
+            'operations': len(plan.operations),
+            'errors': '\n'.join(plan.errors),
+        }
+    )
+
+
 def is_multisite_sync_policy_action_allowed():
     """Check if the current Juju unit is allowed to run sync policy actions.
 
@@ -281,7 +335,123 @@ def is_multisite_sync_policy_action_allowed():
     return True
 
 
-def update_buckets_sync_policy(buckets, sync_policy_state):
+BUCKET_STATUS_SUCCESS = 'success'
+BUCKET_STATUS_MISSING = 'missing'
+BUCKET_STATUS_FAILED = 'failed'
+DEFAULT_BUCKETS_CONCURRENCY = 8
+
+
+def select_buckets(buckets, pattern, zone, zonegroup):
+    """Select the buckets an action applies to.
+
+    :param buckets: List of bucket names.
+    :type buckets: list
+    :param pattern: Glob matched against all bucket names of the zone, a
+        bucket name prefix can be selected with "prefix*".
+    :type pattern: str
+    :param zone: Zone of the buckets.
+    :type zone: str
+    :param zonegroup: Zonegroup of the buckets.
+    :type zonegroup: str
+    :returns: Bucket names, each with whether it is known to exist.
+    :rtype: List[Tuple[str, bool]]
+    """
+    selected = [(bucket, False) for bucket in dict.fromkeys(buckets)]
+    if pattern:
+        named = set(buckets)
+        selected.extend(
+            (bucket, True)
+            for bucket in multisite.iter_buckets(zone, zonegroup)
+            if fnmatch.fnmatchcase(bucket, pattern) and bucket not in named)
+    return selected
+
+
+def process_buckets(buckets, operation, zone, zonegroup,
+                    concurrency=DEFAULT_BUCKETS_CONCURRENCY):
+    """Apply an operation to buckets using a bounded pool of workers.
+
+    Buckets not known to exist are checked first. The outcome for every
+    bucket is logged and published with the action results, together with
+    a summary of the run. Each worker thread uses its own Admin Ops API
+    client, and each bucket gets its own radosgw-admin retry budget.
+
+    :param buckets: Bucket names, each with whether it is known to exist.
+    :type buckets: List[Tuple[str, bool]]
+    :param operation: Callable applied to a bucket name, returning a
+        message describing the change made.
+    :type operation: Callable[[str], str]
+    :param zone: Zone of the buckets.
+    :type zone: str
+    :param zonegroup: Zonegroup of the buckets.
+    :type zonegroup: str
+    :param concurrency: Maximum number of buckets processed at once.
+    :type concurrency: int
+    :returns: Result of every bucket, in the order of buckets.
+    :rtype: List[dict]
+    """
+    def _process(bucket, exists):
+        try:
+            with multisite.retry_budget():
+                if not (exists or multisite.bucket_exists(
+                        bucket, zone=zone, zonegroup=zonegroup)):
+                    return {
+                        'bucket': bucket,
+                        'status': BUCKET_STATUS_MISSING,
+                        'message': ('Bucket "{}" does not exist in the '
+                                    'zonegroup "{}" and zone "{}"'.format(
+                                        bucket, zonegroup, zone)),
+                    }
+                return {
+                    'bucket': bucket,
+                    'status': BUCKET_STATUS_SUCCESS,
+                    'message': operation(bucket),
+                }
+        except subprocess.CalledProcessError as cpe:
+            return {
+                'bucket': bucket,
+                'status': BUCKET_STATUS_FAILED,
+                'message': 'Failed to process bucket "{}" : {}'.format(
+                    bucket, cpe.output),
+            }
+        except Exception as e:
+            # Any other failure, e.g. a timed out command, only fails this
+            # bucket and leaves the results of the others.
+            return {
+                'bucket': bucket,
+                'status': BUCKET_STATUS_FAILED,
+                'message': 'Failed to process bucket "{}" : {}'.format(
+                    bucket, e),
+            }
+
+    start = time.monotonic()
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, concurrency)) as executor:
+        futures = [executor.submit(_process, bucket, exists)
+                   for bucket, exists in buckets]
+        results = [future.result() for future in futures]
+    elapsed = time.monotonic() - start
+
+    for result in results:
+        log(result['message'])
+    counts = collections.Counter(result['status'] for result in results)
+    action_set(
+        values={
+            'message': '\n'.join(result['message'] for result in results),
+            'results': json.dumps(results),
+            'summary.total': len(results),
+            'summary.succeeded': counts[BUCKET_STATUS_SUCCESS],
+            'summary.missing': counts[BUCKET_STATUS_MISSING],
+            'summary.failed': counts[BUCKET_STATUS_FAILED],
+            'summary.elapsed-seconds': round(elapsed, 2),
+            'summary.buckets-per-second': round(
+                len(results) / elapsed, 2) if elapsed else len(results),
+        }
+    )
+    return results
+
+
+def update_buckets_sync_policy(buckets, sync_policy_state, pattern=None,
+                               concurrency=DEFAULT_BUCKETS_CONCURRENCY):
     """Update the sync policy state for all the given buckets.
 
     This method gets a list of bucket names and a sync policy state to set
@@ -298,38 +468,37 @@ def update_buckets_sync_policy(buckets, sync_policy_state):
     :type buckets: list
     :param sync_policy_state: The sync policy state to set for the buckets.
     :type sync_policy_state: str
+    :param pattern: Glob selecting further buckets by name.
+    :type pattern: str
+    :param concurrency: Maximum number of buckets updated at once.
+    :type concurrency: int
+    :returns: Result of every bucket.
+    :rtype: List[dict]
     """
     zone = config('zone')
     zonegroup = config('zonegroup')
-    existing_buckets = multisite.list_buckets(zonegroup=zonegroup, zone=zone)
-    messages = []
-    for bucket in buckets:
-        if bucket in existing_buckets:
-            multisite.create_sync_group(
-                bucket=bucket,
-                group_id=DEFAULT_SYNC_POLICY_ID,
-                status=sync_policy_state)
-            multisite.create_sync_group_pipe(
-                bucket=bucket,
-                group_id=DEFAULT_SYNC_POLICY_ID,
-                pipe_id=DEFAULT_SYNC_POLICY_ID,
-                source_zones=['*'],
-                dest_zones=['*'])
-            message = 'Updated "{}" bucket sync policy to "{}"'.format(
-                bucket, sync_policy_state)
-        else:
-            message = ('Bucket "{}" does not exist in the zonegroup "{}" and '
-                       'zone "{}"'.format(bucket, zonegroup, zone))
-        log(message)
-        messages.append(message)
-    action_set(
-        values={
-            'message': '\n'.join(messages)
-        }
-    )
 
-
-def reset_buckets_sync_policy(buckets):
+    def _update(bucket):
+        multisite.create_sync_group(
+            bucket=bucket,
+            group_id=DEFAULT_SYNC_POLICY_ID,
+            status=sync_policy_state)
+        multisite.create_sync_group_pipe(
+            bucket=bucket,
+            group_id=DEFAULT_SYNC_POLICY_ID,
+            pipe_id=DEFAULT_SYNC_POLICY_ID,
+            source_zones=['*'],
+            dest_zones=['*'])
+        return 'Updated "{}" bucket sync policy to "{}"'.format(
+            bucket, sync_policy_state)
+
+    return process_buckets(
+        select_buckets(buckets, pattern, zone, zonegroup),
+        _update, zone, zonegroup, concurrency=concurrency)
+
+
+def reset_buckets_sync_policy(buckets, pattern=None,
+                              concurrency=DEFAULT_BUCKETS_CONCURRENCY):
     """Reset the sync policy state for all the given buckets.
 
     For every bucket in the given list, this method resets the sync policy
@@ -337,69 +506,136 @@ def reset_buckets_sync_policy(buckets):
 
     :param buckets: List of bucket names.
     :type buckets: list
+    :param pattern: Glob selecting further buckets by name.
+    :type pattern: str
+    :param concurrency: Maximum number of buckets reset at once.
+    :type concurrency: int
+    :returns: Result of every bucket.
+    :rtype: List[dict]
     """
     zone = config('zone')
     zonegroup = config('zonegroup')
-    existing_buckets = multisite.list_buckets(zonegroup=zonegroup, zone=zone)
-    messages = []
-    for bucket in buckets:
-        if bucket in existing_buckets:
-            multisite.remove_sync_group(
-                bucket=bucket,
-                group_id=DEFAULT_SYNC_POLICY_ID)
-            message = 'Reset "{}" bucket sync policy'.format(bucket)
-        else:
-            message = ('Bucket "{}" does not exist in the zonegroup "{}" and '
-                       'zone "{}"'.format(bucket, zonegroup, zone))
-        log(message)
-        messages.append(message)
-    action_set(
-        values={
-            'message': '\n'.join(messages)
-        }
-    )
+
+    def _reset(bucket):
+        multisite.remove_sync_group(
+            bucket=bucket,
+            group_id=DEFAULT_SYNC_POLICY_ID)
+        return 'Reset "{}" bucket sync policy'.format(bucket)
+
+    return process_buckets(
+        select_buckets(buckets, pattern, zone, zonegroup),
+        _reset, zone, zonegroup, concurrency=concurrency)
+
+
+def _buckets_action_params():
+    """Bucket selection and concurrency parameters of the current action"""
+    return {
+        'buckets': [bucket for bucket in
+                    (action_get('buckets') or '').split(',') if bucket],
+        'pattern': action_get('pattern'),
+        'concurrency': (action_get('concurrency') or
+                        DEFAULT_BUCKETS_CONCURRENCY),
+    }
+
+
+def _check_buckets_results(results, message):
+    """Fail the action if any bucket could not be processed"""
+    failed = [result['bucket'] for result in results
+              if result['status'] == BUCKET_STATUS_FAILED]
+    if failed:
+        log(message, level=ERROR)
+        action_fail("{} : {}".format(message, ', '.join(failed)))
 
 
 def enable_buckets_sync(args):
     """Enable sync for the given buckets"""
     if not is_multisite_sync_policy_action_allowed():
         return
+    message = "Failed to enable sync for the given buckets"
     try:
-        update_buckets_sync_policy(
-            buckets=action_get('buckets').split(','),
+        results = update_buckets_sync_policy(
             sync_policy_state=multisite.SYNC_POLICY_ENABLED,
+            **_buckets_action_params()
         )
     except subprocess.CalledProcessError as cpe:
-        message = "Failed to enable sync for the given buckets"
         log(message, level=ERROR)
         action_fail(message + " : {}".format(cpe.output))
+        return
+    _check_buckets_results(results, message)
 
 
 def disable_buckets_sync(args):
     """Disable sync for the given buckets"""
     if not is_multisite_sync_policy_action_allowed():
         return
+    message = "Failed to disable sync for the given buckets"
     try:
-        update_buckets_sync_policy(
-            buckets=action_get('buckets').split(','),
+        results = update_buckets_sync_policy(
             sync_policy_state=multisite.SYNC_POLICY_FORBIDDEN,
+            **_buckets_action_params()
         )
     except subprocess.CalledProcessError as cpe:
-        message = "Failed to disable sync for the given buckets"
         log(message, level=ERROR)
         action_fail(message + " : {}".format(cpe.output))
+        return
+    _check_buckets_results(results, message)
 
 
 def reset_buckets_sync(args):
     """Reset sync policy for the given buckets"""
     if not is_multisite_sync_policy_action_allowed():
         return
+    message = "Failed to reset sync for the given buckets"
+    try:
+        results = reset_buckets_sync_policy(**_buckets_action_params())
+    except subprocess.CalledProcessError as cpe:
+        log(message, level=ERROR)
+        action_fail(message + " : {}".format(cpe.output))
+        return
+    _check_buckets_results(results, message)
+
+
+def benchmark_admin_backends(args):
+    """Compare per-call latency of the radosgw-admin and Admin Ops backends"""
     try:
-        reset_buckets_sync_policy(buckets=action_get('buckets').split(','))
+        results = multisite.benchmark_admin_backends(
+            iterations=action_get('iterations'))
+    except admin_api.AdminAPIError as e:
+        message = "Unable to benchmark the Admin Ops API"
+        log(message, level=ERROR)
+        action_fail(message + " : {}".format(e))
+        return
     except subprocess.CalledProcessError as cpe:
-        message = "Failed to reset sync for the given buckets"
+        message = "Unable to benchmark radosgw-admin"
         log(message, level=ERROR)
         action_fail(message + " : {}".format(cpe.output))
+        return
+    values = {}
+    for backend, durations in results.items():
+        durations = sorted(d * 1000 for d in durations)
+        values['{}-min-ms'.format(backend)] = round(durations[0], 2)
+        values['{}-mean-ms'.format(backend)] = round(
+            sum(durations) / len(durations), 2)
+        values['{}-max-ms'.format(backend)] = round(durations[-1], 2)
+    action_set(values=values)
+
+
+def hook_profile(args):
+    """Show the subprocess traces of the most recent hooks"""
+    traces = hook_trace.read_traces(hook_trace.trace_file(),
+                                    count=action_get('count'))
+    if not traces:
+        message = "No hook traces recorded"
+        if not config('hook-trace'):
+            message += ", enable the hook-trace option to record them"
+        action_set(values={'message': message})
+        return
+    action_set(
+        values={
+            'message': "{} hook traces".format(len(traces)),
+            'traces': json.dumps(traces),
+        }
+    )
 
 
 # A dictionary of all the defined actions to callables (which take
@@ -415,6 +651,9 @@ ACTIONS = {
     "enable-buckets-sync": enable_buckets_sync,
     "disable-buckets-sync": disable_buckets_sync,
     "reset-buckets-sync": reset_buckets_sync,
+    "benchmark-admin-backends": benchmark_admin_backends,
+    "multisite-plan": multisite_plan,
+    "hook-profile": hook_profile,
 }
 
 
@@ -426,7 +665,8 @@ def main(args):
         return "Action %s undefined" % action_name
     else:
         try:
-            action(args)
+            with log_sink.buffered():
+                action(args)
         except Exception as e:
             action_fail(str(e))
 
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Nagios check for RADOS Gateway multi-site replication.
+
+'radosgw-admin sync status' is expensive and needs access to the cephx key
+of the gateway, so it is not run by the check itself: a cron job running
+this script with --refresh stores its output in a cache file, at most once
+per TTL, and the check evaluates the cached report.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import sync_status
+
+STATE_OK = 0
+STATE_WARNING = 1
+STATE_CRITICAL = 2
+STATE_UNKNOWN = 3
+
+STATE_NAMES = {
+    STATE_OK: 'OK',
+    STATE_WARNING: 'WARNING',
+    STATE_CRITICAL: 'CRITICAL',
+    STATE_UNKNOWN: 'UNKNOWN',
+}
+
+DEFAULT_CACHE_FILE = '/var/lib/nagios/rgw-sync-status.txt'
+
+
+def refresh(cache_file, ttl, key_name, timeout=60):
+    """Store the output of radosgw-admin sync status in the cache file
+
+    :param cache_file: path of the cache file
+    :type cache_file: str
+    :param ttl: age in seconds below which the cache file is left as is
+    :type ttl: int
+    :param key_name: name of the cephx key to run radosgw-admin with
+    :type key_name: str
+    :param timeout: seconds after which radosgw-admin is given up on
+    :type timeout: int
+    :return: whether the cache file was updated
+    :rtype: bool
+    :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired
+    """
+    try:
+        if time.time() - os.path.getmtime(cache_file) < ttl:
+            return False
+    except OSError:
+        pass
+    output = subprocess.check_output(
+        ['radosgw-admin', '--id={}'.format(key_name), 'sync', 'status'],
+        stderr=subprocess.DEVNULL, timeout=timeout)
+    # Replace the cache file atomically so the check never reads a
+    # partially written report.
+    fd, path = tempfile.mkstemp(dir=os.path.dirname(cache_file))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(output)
+    os.chmod(path, 0o644)
+    os.rename(path, cache_file)
+    return True
+
+
+def check(status, behind_warning, behind_critical, lag_warning,
+          lag_critical, metadata_stall):
+    """Evaluate a sync status report against thresholds
+
+    :param status: parsed sync status report
+    :type status: sync_status.SyncStatus
+    :param behind_warning: data shards behind raising a warning
+    :type behind_warning: int
+    :param behind_critical: data shards behind raising a critical
+    :type behind_critical: int
+    :param lag_warning: age in seconds of the oldest unsynced change
+                        raising a warning
+    :type lag_warning: int
+    :param lag_critical: age in seconds of the oldest unsynced change
+                         raising a critical
+    :type lag_critical: int
+    :param metadata_stall: age in seconds of the oldest unsynced metadata
+                           change after which metadata sync is considered
+                           stalled
+    :type metadata_stall: int
+    :return: nagios state and message
+    :rtype: Tuple[int, str]
+    """
+    if not status.is_multisite:
+        return STATE_OK, 'multi-site sync not configured'
+    if status.errors:
+        return STATE_CRITICAL, '; '.join(status.errors)
+
+    state = STATE_OK
+    messages = []
+
+    def _raise(new_state, message):
+        nonlocal state
+        state = max(state, new_state)
+        messages.append(message)
+
+    behind = status.data_behind_shards
+    if behind >= behind_critical:
+        _raise(STATE_CRITICAL, 'data behind on {} shards'.format(behind))
+    elif behind >= behind_warning:
+        _raise(STATE_WARNING, 'data behind on {} shards'.format(behind))
+
+    lag = status.lag()
+    if lag is not None:
+        seconds = int(lag.total_seconds())
+        if seconds >= lag_critical:
+            _raise(STATE_CRITICAL, 'oldest change {}s old'.format(seconds))
+        elif seconds >= lag_warning:
+            _raise(STATE_WARNING, 'oldest change {}s old'.format(seconds))
+
+    metadata = status.metadata
+    if metadata.behind_shards and metadata.oldest_change is not None:
+        now = status.current_time or metadata.oldest_change
+        seconds = int((now - metadata.oldest_change).total_seconds())
+        if seconds >= metadata_stall:
+            _raise(STATE_CRITICAL,
+                   'metadata sync stalled for {}s on {} shards'.format(
+                       seconds, metadata.behind_shards))
+
+    if not messages:
+        messages.append(status.summary())
+    return state, ', '.join(messages)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--cache-file', default=DEFAULT_CACHE_FILE)
+    parser.add_argument('--refresh', action='store_true',
+                        help='update the cache file instead of checking')
+    parser.add_argument('--ttl', type=int, default=300,
+                        help='seconds the cached report is reused for')
+    parser.add_argument('--id', dest='key_name', default='radosgw.gateway',
+                        help='cephx key name to run radosgw-admin with')
+    parser.add_argument('--max-age', type=int, default=900,
+                        help='seconds after which the cached report is '
+                             'considered stale')
+    parser.add_argument('--behind-shards-warning', type=int, default=16)
+    parser.add_argument('--behind-shards-critical', type=int, default=64)
+    parser.add_argument('--lag-warning', type=int, default=900)
+    parser.add_argument('--lag-critical', type=int, default=3600)
+    parser.add_argument('--metadata-stall', type=int, default=1800)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.refresh:
+        try:
+            refresh(args.cache_file, args.ttl, args.key_name)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired,
+                OSError) as e:
+            print('Failed to refresh sync status: {}'.format(e))
+            return 1
+        return 0
+
+    try:
+        age = time.time() - os.path.getmtime(args.cache_file)
+        with open(args.cache_file) as f:
+            output = f.read()
+    except OSError as e:
+        state, message = STATE_UNKNOWN, 'no cached sync status: {}'.format(e)
+    else:
+        if age > args.max_age:
+            state, message = (STATE_UNKNOWN,
+                              'cached sync status is {}s old'.format(
+                                  int(age)))
+        else:
+            state, message = check(
+                sync_status.parse_sync_status(output),
+                args.behind_shards_warning, args.behind_shards_critical,
+                args.lag_warning, args.lag_critical, args.metadata_stall)
+    print('{}: {}'.format(STATE_NAMES[state], message))
+    return state
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,202 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import base64
+import email.utils
+import hashlib
+import hmac
+import http.client
+import json
+import urllib.parse
+
+
+class AdminAPIError(Exception):
+    """Raised when a RADOS Gateway Admin Ops API request fails"""
+
+    def __init__(self, message, status=None):
+        super(AdminAPIError, self).__init__(message)
+        self.status = status
+
+
+class AdminAPIClient(object):
+    """Client for the RADOS Gateway Admin Operations REST API
+
+    All requests are issued over a single keep-alive HTTP connection to the
+    local gateway and signed (AWS signature version 2) with the credentials
+    of a user holding the required admin capabilities.
+    """
+
+    def __init__(self, host, port, access_key, secret, timeout=10,
+                 admin_path='/admin'):
+        self.host = host
+        self.port = port
+        self.access_key = access_key
+        self.secret = secret
+        self.timeout = timeout
+        self.admin_path = admin_path
+        self._conn = None
+
+    def close(self):
+        """Close the pooled connection to the gateway"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _sign(self, method, path, date):
+        """Build the Authorization header for a request
+
+        :param method: HTTP method of the request
+        :type method: str
+        :param path: resource path of the request, without query string
+        :type path: str
+        :param date: value of the Date header of the request
+        :type date: str
+        :return: Authorization header value
+        :rtype: str
+        """
+        string_to_sign = '\n'.join((method, '', '', date, path))
+        digest = hmac.new(self.secret.encode('UTF-8'),
+                          string_to_sign.encode('UTF-8'),
+                          hashlib.sha1).digest()
+        return 'AWS {}:{}'.format(self.access_key,
+                                  base64.b64encode(digest).decode('UTF-8'))
+
+    def request(self, method, resource, **params):
+        """Issue a signed request against the Admin Ops API
+
+        A request failing on a connection re-used from a previous call is
+        retried once on a fresh connection, as the gateway may have closed
+        an idle keep-alive connection in the meantime.
+
+        :param method: HTTP method
+        :type method: str
+        :param resource: admin resource, e.g. 'user' or 'metadata/user'
+        :type resource: str
+        :param params: query parameters, None values are omitted
+        :type params: Dict[str, str]
+        :return: decoded JSON response body
+        :rtype: Union[dict, list, None]
+        :raises: AdminAPIError
+        """
+        path = '{}/{}'.format(self.admin_path, resource)
+        query = [('format', 'json')]
+        query.extend(sorted((key, value) for key, value in params.items()
+                            if value is not None))
+        url = '{}?{}'.format(path, urllib.parse.urlencode(query))
+        while True:
+            reused = self._conn is not None
+            if not reused:
+                self._conn = http.client.HTTPConnection(
+                    self.host, self.port, timeout=self.timeout)
+            date = email.utils.formatdate(usegmt=True)
+            headers = {
+                'Date': date,
+                'Authorization': self._sign(method, path, date),
+                'Content-Length': '0',
+            }
+            try:
+                self._conn.request(method, url, headers=headers)
+                response = self._conn.getresponse()
+                body = response.read()
+            except (http.client.HTTPException, OSError) as e:
+                self.close()
+                if reused:
+                    continue
+                raise AdminAPIError(
+                    '{} {} failed: {}'.format(method, path, e))
+            break
+        if response.will_close:
+            self.close()
+        if response.status >= 300:
+            raise AdminAPIError(
+                '{} {} returned {}: {}'.format(
+                    method, path, response.status,
+                    body.decode('UTF-8', 'replace')),
+                status=response.status)
+        if not body:
+            return None
+        try:
+            return json.loads(body.decode('UTF-8'))
+        except ValueError as e:
+            raise AdminAPIError(
+                '{} {} returned invalid JSON: {}'.format(method, path, e),
+                status=response.status)
+
+    def list_users(self):
+        """List user ids known to the gateway
+
+        :rtype: List[str]
+        """
+        return self.request('GET', 'metadata/user')
+
+    def get_user(self, uid):
+        """Get user information including keys
+
+        :param uid: user id
+        :type uid: str
+        :rtype: dict
+        """
+        return self.request('GET', 'user', uid=uid)
+
+    def create_user(self, uid, display_name, system=False):
+        """Create a user
+
+        :param uid: user id
+        :type uid: str
+        :param display_name: display name of the user
+        :type display_name: str
+        :param system: whether to grant the system user role
+        :type system: bool
+        :return: user information including generated keys
+        :rtype: dict
+        """
+        return self.request('PUT', 'user', uid=uid,
+                            **{'display-name': display_name,
+                               'system': 'true' if system else None})
+
+    def suspend_user(self, uid):
+        """Suspend a user
+
+        :param uid: user id
+        :type uid: str
+        :rtype: dict
+        """
+        return self.request('POST', 'user', uid=uid, suspended='true')
+
+    def list_metadata_keys(self, section, max_entries=None, marker=None):
+        """List metadata keys of a section, one page at a time
+
+        :param section: metadata section, e.g. 'bucket' or 'user'
+        :type section: str
+        :param max_entries: maximum number of keys to return
+        :type max_entries: Optional[int]
+        :param marker: marker returned with the previous page
+        :type marker: Optional[str]
+        :return: keys, with truncated and marker when max_entries is set
+        :rtype: Union[dict, list]
+        """
+        return self.request('GET', 'metadata/{}'.format(section),
+                            **{'max-entries': max_entries,
+                               'marker': marker})
+
+    def get_metadata(self, section, key):
+        """Get a metadata entry
+
+        :param section: metadata section, e.g. 'bucket' or 'user'
+        :type section: str
+        :param key: metadata key within the section
+        :type key: str
+        :rtype: dict
+        """
+        return self.request('GET', 'metadata/{}'.format(section), key=key)
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
 import os
 import re
 import socket
@@ -19,6 +20,8 @@ import tempfile
 import shutil
 
 import multisite
+from log_sink import log
+from pkg_versions import cmp_pkgrevno
 from charmhelpers.contrib.openstack import context
 from charmhelpers.contrib.hahelpers.cluster import (
     determine_api_port,
@@ -26,17 +29,15 @@ from charmhelpers.contrib.hahelpers.cluster import (
     https,
 )
 from charmhelpers.core.host import (
-    cmp_pkgrevno,
     arch,
 )
 from charmhelpers.core.hookenv import (
+    atexit,
     DEBUG,
     WARNING,
     ERROR,
     config,
-    log,
     related_units,
-    relation_get,
     relation_ids,
     unit_public_ip,
     leader_get,
@@ -55,9 +56,98 @@ CIVETWEB_FRONTEND = 'civetweb'
 SUPPORTED_FRONTENDS = (BEAST_FRONTEND, CIVETWEB_FRONTEND)
 UNSUPPORTED_BEAST_ARCHS = ('s390x', 'riscv64')
 
+# Results of the context generators registered with the config renderer are
+# kept for the remainder of the hook execution. Each generator declares the
+# sources it depends on (relation names, 'leader', 'certificates',
+# 'multisite'), and a cached result is discarded once any of these sources
+# has been invalidated. Charm config cannot change during a hook.
+_context_generations = {}
+_context_stats = {'evaluations': 0, 'saved': 0}
+_context_stats_logged = False
+
+
+def _log_context_stats():
+    """Log the context evaluation counters for the current hook"""
+    log("Context generators: {evaluations} evaluations, {saved} saved"
+        .format(**_context_stats), level=DEBUG)
+
+
+def _source_generation(source):
+    """Number of times a context source has been invalidated
+
+    :param source: relation name, 'leader', 'certificates' or 'multisite'
+    :type source: str
+    :rtype: int
+    """
+    if source == 'multisite':
+        return multisite.cache_generation()
+    return _context_generations.get(source, 0)
+
+
+def invalidate_contexts(*sources):
+    """Discard cached contexts depending on the provided sources
+
+    :param sources: relation names, 'leader' or 'certificates'
+    :type sources: str
+    """
+    for source in sources:
+        _context_generations[source] = _context_generations.get(source, 0) + 1
+
+
+def context_stats():
+    """Context evaluation counters for the current hook
+
+    :return: number of evaluations run and evaluations saved
+    :rtype: dict
+    """
+    return dict(_context_stats)
+
+
+class MemoizedContext(object):
+    """Context generator computing its context at most once per hook
+
+    Attributes other than the context itself (interfaces, missing_data,
+    get_related, ...) are those of the wrapped generator.
+    """
+
+    def __init__(self, generator, depends=None):
+        """
+        :param generator: context generator to memoize
+        :type generator: context.OSContextGenerator
+        :param depends: sources the context depends on, defaults to the
+                        depends attribute of the generator or its interfaces
+        :type depends: Optional[Iterable[str]]
+        """
+        self.generator = generator
+        if depends is None:
+            depends = getattr(generator, 'depends', generator.interfaces)
+        self.depends = tuple(depends)
+        self._generations = None
+        self._ctxt = None
+
+    def __getattr__(self, name):
+        return getattr(self.generator, name)
+
+    def __call__(self):
+        global _context_stats_logged
+        generations = tuple(_source_generation(source)
+                            for source in self.depends)
+        if generations == self._generations:
+            _context_stats['saved'] += 1
+            return copy.deepcopy(self._ctxt)
+        ctxt = self.generator()
+        _context_stats['evaluations'] += 1
+        if not _context_stats_logged:
+            atexit(_log_context_stats)
+            _context_stats_logged = True
+        self._generations = generations
+        self._ctxt = copy.deepcopy(ctxt)
+        return ctxt
+
 
 class ApacheSSLContext(context.ApacheSSLContext):
     interfaces = ['https']
+    depends = ('certificates',)
     service_namespace = 'ceph-radosgw'
 
     def __call__(self):
@@ -69,6 +159,8 @@ class ApacheSSLContext(context.ApacheSSLContext):
 
 
 class HAProxyContext(context.HAProxyContext):
+    # https() depends on the certificates processed
+    depends = ('cluster', 'certificates')
 
     def __call__(self):
         ctxt = super(HAProxyContext, self).__call__()
@@ -103,6 +195,7 @@ class HAProxyContext(context.HAProxyContext):
 
 class IdentityServiceContext(context.IdentityServiceContext):
     interfaces = ['identity-service']
+    depends = ('identity-service', 'leader')
 
     def __call__(self):
         ctxt = super(IdentityServiceContext, self).__call__()
@@ -223,6 +316,16 @@ def validate_http_frontend(frontend_config):
 
 class MonContext(context.CephContext):
     interfaces = ['mon']
+    depends = ('mon', 'multisite')
+
+    def __init__(self, query_topology=True):
+        """
+        :param query_topology: whether to look up the configured zone,
+                               zonegroup and realm in the realm topology,
+                               which runs radosgw-admin
+        :type query_topology: bool
+        """
+        self.query_topology = query_topology
 
     def __call__(self):
         if not relation_ids(self.interfaces[0]):
@@ -237,21 +340,20 @@ class MonContext(context.CephContext):
 
         for rid in relation_ids(self.interfaces[0]):
             for unit in related_units(rid):
+                data = utils.relation_data(rid, unit)
                 if fsid is None:
-                    fsid = relation_get('fsid', rid=rid, unit=unit)
-                _auth = relation_get('auth', rid=rid, unit=unit)
+                    fsid = data.get('fsid')
+                _auth = data.get('auth')
                 if _auth:
                     auths.append(_auth)
 
-                ceph_pub_addr = relation_get('ceph-public-address', rid=rid,
-                                             unit=unit)
-                unit_priv_addr = relation_get('private-address', rid=rid,
-                                              unit=unit)
+                ceph_pub_addr = data.get('ceph-public-address')
+                unit_priv_addr = data.get('private-address')
                 ceph_addr = ceph_pub_addr or unit_priv_addr
                 ceph_addr = format_ipv6_addr(ceph_addr) or ceph_addr
                 if ceph_addr:
                     mon_hosts.append(ceph_addr)
-                if relation_get('rgw.{}_key'.format(host), rid=rid, unit=unit):
+                if data.get('rgw.{}_key'.format(host)):
                     systemd_rgw = True
 
         if len(set(auths)) != 1:
@@ -325,11 +427,14 @@ class MonContext(context.CephContext):
             realm = config('realm')
             log("config: zone {} zonegroup {} realm {}"
                 .format(zone, zonegroup, realm), level=DEBUG)
-            if zone in multisite.plain_list('zone'):
+            if not (self.query_topology and any((zone, zonegroup, realm))):
+                return ctxt
+            topology = multisite.topology()
+            if zone in topology['zones']:
                 ctxt['rgw_zone'] = zone
-            if zonegroup in multisite.plain_list('zonegroup'):
+            if zonegroup in topology['zonegroups']:
                 ctxt['rgw_zonegroup'] = zonegroup
-            if realm in multisite.plain_list('realm'):
+            if realm in topology['realms']:
                 ctxt['rgw_realm'] = realm
             return ctxt
 
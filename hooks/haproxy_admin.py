@@ -0,0 +1,189 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import contextlib
+import csv
+import socket
+import time
+
+from charmhelpers.core import hookenv
+
+from log_sink import log
+
+# Configured by the haproxy.cfg template of charmhelpers.
+ADMIN_SOCKET = '/var/run/haproxy/admin.sock'
+SOCKET_TIMEOUT = 10
+DRAIN_POLL_INTERVAL = 1
+
+SERVER_STATES = ('ready', 'drain', 'maint')
+
+
+class HAProxyAdminError(Exception):
+    """Raised when a command sent to the HAProxy admin socket fails"""
+    pass
+
+
+def server_name(unit=None):
+    """Name of the server of a unit in the haproxy.cfg backends
+
+    :param unit: unit name, defaults to the local unit
+    :type unit: Optional[str]
+    :rtype: str
+    """
+    return (unit or hookenv.local_unit()).replace('/', '-')
+
+
+def command(cmd, path=ADMIN_SOCKET):
+    """Send a command to the HAProxy admin socket
+
+    :param cmd: command, e.g. 'show stat'
+    :type cmd: str
+    :param path: admin socket
+    :type path: str
+    :return: command output
+    :rtype: str
+    :raises: HAProxyAdminError
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(SOCKET_TIMEOUT)
+    chunks = []
+    try:
+        sock.connect(path)
+        sock.sendall(cmd.encode('UTF-8') + b'\n')
+        while True:
+            data = sock.recv(4096)
+            if not data:
+                break
+            chunks.append(data)
+    except OSError as e:
+        raise HAProxyAdminError('{}: {}'.format(cmd, e))
+    finally:
+        sock.close()
+    return b''.join(chunks).decode('UTF-8')
+
+
+def server_stats(server, path=ADMIN_SOCKET):
+    """Statistics of a server in each of the backends it is part of
+
+    :param server: server name
+    :type server: str
+    :param path: admin socket
+    :type path: str
+    :return: 'show stat' rows of the server, by backend name
+    :rtype: Dict[str, Dict[str, str]]
+    :raises: HAProxyAdminError
+    """
+    output = command('show stat', path=path)
+    lines = output.strip().splitlines()
+    if not lines or not lines[0].startswith('# '):
+        raise HAProxyAdminError('show stat: unexpected output')
+    rows = csv.DictReader([lines[0][2:]] + lines[1:])
+    return {row['pxname']: row for row in rows if row['svname'] == server}
+
+
+def active_sessions(server, path=ADMIN_SOCKET):
+    """Number of sessions of a server, over all of its backends
+
+    :param server: server name
+    :type server: str
+    :param path: admin socket
+    :type path: str
+    :rtype: int
+    :raises: HAProxyAdminError
+    """
+    return sum(int(row['scur'] or 0)
+               for row in server_stats(server, path=path).values())
+
+
+def set_server_state(server, state, path=ADMIN_SOCKET):
+    """Set the administrative state of a server in all of its backends
+
+    :param server: server name
+    :type server: str
+    :param state: one of SERVER_STATES
+    :type state: str
+    :param path: admin socket
+    :type path: str
+    :return: backends the server is part of
+    :rtype: List[str]
+    :raises: HAProxyAdminError
+    """
+    if state not in SERVER_STATES:
+        raise ValueError('Unknown server state {}'.format(state))
+    backends = sorted(server_stats(server, path=path))
+    for backend in backends:
+        output = command('set server {}/{} state {}'.format(
+            backend, server, state), path=path).strip()
+        if output:
+            raise HAProxyAdminError(output)
+    return backends
+
+
+def drain(server, timeout, path=ADMIN_SOCKET):
+    """Stop sending new sessions to a server and wait for its sessions
+
+    :param server: server name
+    :type server: str
+    :param timeout: seconds to wait for active sessions to complete
+    :type timeout: int
+    :param path: admin socket
+    :type path: str
+    :return: whether the server has no active sessions left
+    :rtype: bool
+    :raises: HAProxyAdminError
+    """
+    if not set_server_state(server, 'drain', path=path):
+        return True
+    start = time.monotonic()
+    while True:
+        sessions = active_sessions(server, path=path)
+        if not sessions:
+            return True
+        if time.monotonic() - start >= timeout:
+            log('{} still has {} active sessions after {} seconds'
+                .format(server, sessions, timeout), level=hookenv.WARNING)
+            return False
+        time.sleep(DRAIN_POLL_INTERVAL)
+
+
+@contextlib.contextmanager
+def drained(server, timeout, path=ADMIN_SOCKET):
+    """Drain a server from HAProxy for the duration of the block
+
+    The server is set back to ready when the block exits, including when it
+    raises. Draining is best effort: when HAProxy cannot be reached, e.g. as
+    it is not running, the block is run regardless.
+
+    :param server: server name
+    :type server: str
+    :param timeout: seconds to wait for active sessions to complete
+    :type timeout: int
+    :param path: admin socket
+    :type path: str
+    """
+    try:
+        drain(server, timeout, path=path)
+    except HAProxyAdminError as e:
+        log('Unable to drain {} from haproxy: {}'.format(server, e),
+            level=hookenv.WARNING)
+        yield
+        return
+    try:
+        yield
+    finally:
+        try:
+            set_server_state(server, 'ready', path=path)
+        except HAProxyAdminError as e:
+            log('Unable to set {} ready in haproxy: {}'.format(server, e),
+                level=hookenv.WARNING)
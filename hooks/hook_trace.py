@@ -0,0 +1,322 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import contextlib
+import datetime
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from charmhelpers.core import hookenv
+
+from log_sink import log
+
+TRACE_FILE = 'hook-traces.jsonl'
+TRACE_KEEP = 20
+TRACE_SLOWEST = 10
+
+ARGV_SUMMARY_ARGS = 4
+ARGV_SUMMARY_WIDTH = 48
+
+# Commands reported under a common category, others are reported under
+# the name of the executable (relation-get, radosgw-admin, ...).
+COMMAND_CATEGORIES = {
+    'apt': 'apt',
+    'apt-cache': 'apt',
+    'apt-get': 'apt',
+    'apt-mark': 'apt',
+    'dpkg': 'apt',
+    'dpkg-query': 'apt',
+    'service': 'systemctl',
+    'systemctl': 'systemctl',
+}
+
+# Libraries shipped with the charm, skipped when looking up the caller.
+VENDORED_PACKAGES = ('charmhelpers', 'charms_ceph')
+
+_SENSITIVE_ARG_RE = re.compile(
+    r'^(-*[\w.-]*(?:key|secret|password|token)[\w.-]*)=.+$', re.IGNORECASE)
+
+_tracer = None
+_popen = subprocess.Popen
+
+
+def command_category(argv):
+    """Category a command line is accounted under
+
+    :param argv: command line
+    :type argv: list[str]
+    :rtype: str
+    """
+    if not argv:
+        return 'unknown'
+    name = os.path.basename(argv[0])
+    return COMMAND_CATEGORIES.get(name, name)
+
+
+def summarize_argv(argv):
+    """Short, credential free description of a command line
+
+    :param argv: command line
+    :type argv: list[str]
+    :rtype: str
+    """
+    if not argv:
+        return ''
+    args = [os.path.basename(argv[0])]
+    for arg in argv[1:ARGV_SUMMARY_ARGS + 1]:
+        arg = _SENSITIVE_ARG_RE.sub(r'\1=***', arg)
+        if len(arg) > ARGV_SUMMARY_WIDTH:
+            arg = arg[:ARGV_SUMMARY_WIDTH - 3] + '...'
+        args.append(arg)
+    if len(argv) > ARGV_SUMMARY_ARGS + 1:
+        args.append('...')
+    return ' '.join(args)
+
+
+def _caller(root):
+    """Location in the charm code that spawned the current subprocess
+
+    Frames of the standard library and of the vendored libraries are
+    skipped, so that e.g. a relation-get is reported against the charm
+    function calling relation_get().
+
+    :param root: charm directory
+    :type root: str
+    :return: 'path:line function', relative to the charm directory
+    :rtype: str
+    """
+    skip = (os.path.abspath(__file__), os.path.abspath(subprocess.__file__))
+    frame = sys._getframe(1)
+    fallback = None
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename not in skip:
+            if fallback is None:
+                fallback = frame
+            relative = os.path.relpath(filename, root)
+            if (not relative.startswith(os.pardir) and
+                    not any(package in relative.split(os.sep)
+                            for package in VENDORED_PACKAGES)):
+                break
+        frame = frame.f_back
+    frame = frame or fallback
+    if frame is None:
+        return 'unknown'
+    filename = os.path.abspath(frame.f_code.co_filename)
+    relative = os.path.relpath(filename, root)
+    if relative.startswith(os.pardir):
+        relative = filename
+    return '{}:{} {}'.format(relative, frame.f_lineno, frame.f_code.co_name)
+
+
+class HookTracer(object):
+    """Subprocesses spawned during the execution of a hook"""
+
+    def __init__(self, hook_name, root):
+        self.hook_name = hook_name
+        self.root = root
+        self.started = datetime.datetime.utcnow()
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+        self.calls = []
+
+    def record(self, argv, duration, caller):
+        """Record a completed subprocess
+
+        :param argv: command line
+        :type argv: list[str]
+        :param duration: wall clock time in seconds
+        :type duration: float
+        :param caller: location in the charm code that spawned it
+        :type caller: str
+        """
+        with self._lock:
+            self.calls.append({
+                'category': command_category(argv),
+                'argv': summarize_argv(argv),
+                'seconds': duration,
+                'caller': caller,
+            })
+
+    def report(self, slowest=TRACE_SLOWEST):
+        """Compact description of the trace
+
+        :param slowest: number of slowest calls to include
+        :type slowest: int
+        :rtype: dict
+        """
+        with self._lock:
+            calls = list(self.calls)
+        categories = {}
+        for call in calls:
+            totals = categories.setdefault(call['category'],
+                                           {'count': 0, 'seconds': 0.0})
+            totals['count'] += 1
+            totals['seconds'] += call['seconds']
+        for totals in categories.values():
+            totals['seconds'] = round(totals['seconds'], 3)
+        top = sorted(calls, key=lambda call: call['seconds'],
+                     reverse=True)[:slowest]
+        return {
+            'hook': self.hook_name,
+            'started': self.started.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'seconds': round(time.monotonic() - self._start, 3),
+            'calls': len(calls),
+            'subprocess-seconds': round(
+                sum(call['seconds'] for call in calls), 3),
+            'categories': categories,
+            'slowest': [dict(call, seconds=round(call['seconds'], 3))
+                        for call in top],
+        }
+
+
+class _TracedPopen(_popen):
+    """Popen recording the command with the active tracer once it exits"""
+
+    def __init__(self, args, *popenargs, **kwargs):
+        self._tracer = _tracer
+        self._traced = False
+        if self._tracer is not None:
+            if isinstance(args, (str, bytes, os.PathLike)):
+                self._trace_argv = os.fsdecode(args).split()
+            else:
+                self._trace_argv = [os.fsdecode(arg) for arg in args]
+            self._trace_caller = _caller(self._tracer.root)
+            self._trace_start = time.monotonic()
+        super(_TracedPopen, self).__init__(args, *popenargs, **kwargs)
+
+    def wait(self, timeout=None):
+        returncode = super(_TracedPopen, self).wait(timeout=timeout)
+        if self._tracer is not None and not self._traced:
+            self._traced = True
+            self._tracer.record(self._trace_argv,
+                                time.monotonic() - self._trace_start,
+                                self._trace_caller)
+        return returncode
+
+
+def start(hook_name, root=None):
+    """Start recording the subprocesses spawned by this process
+
+    :param hook_name: name of the hook being executed
+    :type hook_name: str
+    :param root: charm directory, defaults to the one of the hook
+    :type root: Optional[str]
+    :rtype: HookTracer
+    """
+    global _tracer
+    _tracer = HookTracer(hook_name, os.path.abspath(root or
+                                                    hookenv.charm_dir()))
+    subprocess.Popen = _TracedPopen
+    return _tracer
+
+
+def stop():
+    """Stop recording subprocesses
+
+    :return: the tracer that was active, if any
+    :rtype: Optional[HookTracer]
+    """
+    global _tracer
+    tracer, _tracer = _tracer, None
+    subprocess.Popen = _popen
+    return tracer
+
+
+def trace_file():
+    """Path of the file the hook traces are kept in
+
+    :rtype: str
+    """
+    return os.path.join(hookenv.charm_dir(), TRACE_FILE)
+
+
+def read_traces(path, count=None):
+    """Read the most recent hook traces
+
+    :param path: trace file
+    :type path: str
+    :param count: number of traces to return, all when None
+    :type count: Optional[int]
+    :return: traces, oldest first
+    :rtype: list[dict]
+    """
+    try:
+        with open(path) as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return []
+    traces = []
+    for line in lines:
+        try:
+            traces.append(json.loads(line))
+        except ValueError:
+            continue
+    if count is not None:
+        traces = traces[-count:] if count > 0 else []
+    return traces
+
+
+def write_trace(path, trace, keep=TRACE_KEEP):
+    """Append a hook trace, only keeping the most recent ones
+
+    :param path: trace file
+    :type path: str
+    :param trace: trace as returned by HookTracer.report()
+    :type trace: dict
+    :param keep: number of traces to keep
+    :type keep: int
+    """
+    traces = read_traces(path, count=keep - 1) + [trace]
+    directory = os.path.dirname(path) or '.'
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.' + TRACE_FILE)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            for entry in traces:
+                f.write(json.dumps(entry, sort_keys=True) + '\n')
+        os.replace(tmp, path)
+    except Exception:
+        os.unlink(tmp)
+        raise
+
+
+@contextlib.contextmanager
+def traced(hook_name):
+    """Trace the subprocesses spawned in the block if enabled by hook-trace
+
+    The trace is written to the charm directory when the block exits,
+    including when it raises.
+
+    :param hook_name: name of the hook being executed
+    :type hook_name: str
+    """
+    if not hookenv.config('hook-trace'):
+        yield None
+        return
+    tracer = start(hook_name)
+    try:
+        yield tracer
+    finally:
+        stop()
+        try:
+            write_trace(trace_file(), tracer.report())
+        except OSError as e:
+            log('Unable to write hook trace: {}'.format(e),
+                level=hookenv.WARNING)
@@ -15,8 +15,10 @@
 # limitations under the License.
 
 import base64
+import functools
 import json
 import os
+import shutil
 import subprocess
 import sys
 import socket
@@ -27,11 +29,17 @@ import utils
 sys.path.append('lib')
 
 import ceph_rgw as ceph
-import charms_ceph.utils as ceph_utils
+import ceph_radosgw_context
+import hook_trace
+import log_sink
 import multisite
 
+from log_sink import log
+from pkg_versions import cmp_pkgrevno
+
 from charmhelpers.core.hookenv import (
-    ERROR,
+    atstart,
+    hook_name,
     relation_get,
     relation_id as ch_relation_id,
     relation_ids,
@@ -40,17 +48,15 @@ from charmhelpers.core.hookenv import (
     open_port,
     opened_ports,
     close_port,
-    relation_set,
-    log,
     DEBUG,
     WARNING,
     Hooks, UnregisteredHookError,
     status_set,
     is_leader,
-    leader_set,
     leader_get,
     remote_service_name,
     WORKLOAD_STATES,
+    charm_dir,
 )
 from charmhelpers.core.strutils import bool_from_string
 from charmhelpers.fetch import (
@@ -63,13 +69,12 @@ from charmhelpers.fetch import (
 )
 from charmhelpers.payload.execd import execd_preinstall
 from charmhelpers.core.host import (
-    cmp_pkgrevno,
     service,
     service_pause,
     service_reload,
-    service_restart,
     service_resume,
     service_stop,
+    write_file,
 )
 from charmhelpers.contrib.network.ip import (
     get_relation_ip,
@@ -93,18 +98,31 @@ from charmhelpers.contrib.openstack.ha.utils import (
     generate_ha_relation_data,
 )
 from utils import (
+    apply_ceph_conf_changes,
     assess_status,
     boto_client,
+    changed_config_keys,
+    clear_config_full_pass,
+    config_full_pass_requested,
     disable_unused_apache_sites,
+    graceful_restart,
+    LazyConfigRenderer,
+    leader_set,
     listen_port,
     multisite_deployment,
     pause_unit_helper,
     ready_for_service,
     register_configs,
+    register_status_configs,
+    relation_data,
+    relation_set,
+    request_config_full_pass,
     request_per_unit_key,
     restart_map,
     restart_nonce_changed,
     resume_unit_helper,
+    rolling_restart,
+    save_config_snapshot,
     s3_app,
     service_name,
     services,
@@ -122,7 +140,20 @@ from charmhelpers.contrib.openstack.cert_utils import (
 )
 
 hooks = Hooks()
-CONFIGS = register_configs()
+CONFIGS = LazyConfigRenderer(register_configs, register_status_configs)
+
+
+def invalidate_multisite_status():
+    """Discard the multi-site health facts kept for assess_status
+
+    Relation data and configuration changes may change them, they are
+    queried again by hooks running on such changes.
+    """
+    if ch_relation_id() or hook_name() == 'config-changed':
+        multisite.invalidate_status_cache()
+
+
+atstart(invalidate_multisite_status)
 
 PACKAGES = [
     'haproxy',
@@ -134,9 +165,128 @@ APACHE_PACKAGES = [
     'libapache2-mod-fastcgi',
 ]
 
+# Configuration options the endpoints advertised on relations depend on.
+ENDPOINT_CONFIG = {
+    'port',
+    'prefer-ipv6',
+    'dns-ha',
+    'vip',
+    'os-admin-hostname',
+    'os-internal-hostname',
+    'os-public-hostname',
+    'os-admin-network',
+    'os-internal-network',
+    'os-public-network',
+    'ssl_cert',
+    'ssl_key',
+    'ssl_ca',
+}
+
+MULTISITE_CONFIG = {
+    'realm',
+    'zonegroup',
+    'zone',
+    'sync-policy-state',
+    'sync-policy-flow-type',
+}
+
+# Steps of config-changed and the configuration options they depend on; a
+# step is only run when one of its options changed, or on a full pass.
+CONFIG_CHANGED_HANDLERS = {
+    'ipv6': {'prefer-ipv6'},
+    'identity-service': ENDPOINT_CONFIG | {
+        'operator-roles',
+        'admin-roles',
+        'region',
+    },
+    'cluster': {
+        'prefer-ipv6',
+        'os-admin-network',
+        'os-internal-network',
+        'os-public-network',
+    },
+    'mon': {
+        'pool-prefix',
+        'zone',
+        'restrict-ceph-pools',
+        'ceph-osd-replication-count',
+        'rgw-buckets-pool-weight',
+        'rgw-lightweight-pool-pg-num',
+        'pool-type',
+        'ec-profile-name',
+        'ec-rbd-metadata-pool',
+        'ec-profile-k',
+        'ec-profile-m',
+        'ec-profile-locality',
+        'ec-profile-crush-locality',
+        'ec-profile-durability-estimator',
+        'ec-profile-helper-chunks',
+        'ec-profile-scalar-mds',
+        'ec-profile-plugin',
+        'ec-profile-technique',
+        'ec-profile-device-class',
+        'bluestore-compression-algorithm',
+        'bluestore-compression-mode',
+        'bluestore-compression-required-ratio',
+        'bluestore-compression-min-blob-size',
+        'bluestore-compression-min-blob-size-hdd',
+        'bluestore-compression-min-blob-size-ssd',
+        'bluestore-compression-max-blob-size',
+        'bluestore-compression-max-blob-size-hdd',
+        'bluestore-compression-max-blob-size-ssd',
+    },
+    'ha': {
+        'dns-ha',
+        'vip',
+        'ha-bindiface',
+        'ha-mcastport',
+        'os-admin-hostname',
+        'os-internal-hostname',
+        'os-public-hostname',
+        'os-admin-network',
+        'os-internal-network',
+        'os-public-network',
+    },
+    'certificates': ENDPOINT_CONFIG | {'virtual-hosted-bucket-enabled'},
+    'object-store': ENDPOINT_CONFIG,
+    'radosgw-user': ENDPOINT_CONFIG,
+    'multisite': ENDPOINT_CONFIG | MULTISITE_CONFIG,
+    'https': ENDPOINT_CONFIG,
+    'nrpe': MULTISITE_CONFIG | {
+        'nagios_context',
+        'nagios_servicegroups',
+        'nagios-sync-cache-ttl',
+        'nagios-sync-behind-shards-warning',
+        'nagios-sync-behind-shards-critical',
+        'nagios-sync-lag-warning',
+        'nagios-sync-lag-critical',
+        'nagios-metadata-sync-stall',
+    },
+}
+
+# Passing this argument to the config-changed hook forces a full pass.
+CONFIG_CHANGED_FULL_ARG = '--full'
+
 MULTISITE_SYSTEM_USER = 'multisite-sync'
 MULTISITE_DEFAULT_SYNC_GROUP_ID = 'default'
 
+NAGIOS_PLUGINS = '/usr/local/lib/nagios/plugins'
+SYNC_STATUS_CHECK = 'check_rgw_sync_status.py'
+SYNC_STATUS_CHECK_NAME = 'rgw-sync-status'
+SYNC_STATUS_CACHE = '/var/lib/nagios/rgw-sync-status.txt'
+SYNC_STATUS_CRON = '/etc/cron.d/check-rgw-sync-status'
+
+
+def radosgw_restart_functions(stopstart=False):
+    """restart_on_change() functions applying ceph.conf changes at runtime
+
+    :param stopstart: stop and start the service when it must be restarted
+    :type stopstart: bool
+    :rtype: Dict[str, Callable[[str], None]]
+    """
+    return {service_name(): functools.partial(apply_ceph_conf_changes,
+                                              CONFIGS, stopstart=stopstart)}
+
 
 def upgrade_available():
     """Check for upgrade for ceph
@@ -144,6 +294,7 @@ def upgrade_available():
     :returns: whether an upgrade is available
     :rtype: boolean
     """
+    import charms_ceph.utils as ceph_utils
     c = config()
     old_version = ceph_utils.resolve_ceph_version(c.previous('source') or
                                                   'distro')
@@ -210,6 +361,8 @@ def install():
         os.makedirs('/etc/ceph')
     if is_leader():
         leader_set(namespace_tenants=config('namespace-tenants'))
+    # The first config-changed applies the whole configuration.
+    request_config_full_pass()
 
 
 @hooks.hook('object-store-relation-joined')
@@ -225,17 +378,43 @@ def object_store_joined(relation_id=None):
 def upgrade_charm():
     if is_leader() and not leader_get('namespace_tenants') == 'True':
         leader_set(namespace_tenants=False)
+    # The new charm code may render or publish things differently for the
+    # same configuration, re-run all config-changed steps.
+    request_config_full_pass()
+
+
+def config_changed_handlers():
+    """Determine the config-changed steps to run
+
+    :returns: names of the steps, keys of CONFIG_CHANGED_HANDLERS
+    :rtype: set
+    """
+    if (config_full_pass_requested() or
+            CONFIG_CHANGED_FULL_ARG in sys.argv[1:]):
+        log('Running all config-changed steps', level=DEBUG)
+        return set(CONFIG_CHANGED_HANDLERS)
+    changed = changed_config_keys()
+    handlers = set(name for name, keys in CONFIG_CHANGED_HANDLERS.items()
+                   if keys & changed)
+    log('Changed options: {}, running config-changed steps: {}'.format(
+        ', '.join(sorted(changed)) or 'none',
+        ', '.join(sorted(handlers)) or 'none'), level=DEBUG)
+    return handlers
 
 
 @hooks.hook('config-changed')
 @harden()
 def config_changed():
-    @restart_on_change(restart_map())
+    @restart_on_change(restart_map(),
+                       restart_functions=radosgw_restart_functions())
     def _config_changed():
         # if we are paused, delay doing any config changed hooks.
         # It is forced on the resume.
         if is_unit_paused_set():
             log("Unit is pause or upgrading. Skipping config_changed", "WARN")
+            # Configuration changes made while paused are not reported as
+            # changed anymore by the time the unit is resumed.
+            request_config_full_pass()
             return
 
         # NOTE(wolsen) if an upgrade has been applied, then the radosgw
@@ -243,46 +422,59 @@ def config_changed():
         # itself. See LP#1906707
         if install_packages():
             log("Packages have been installed/upgraded... restarting", "INFO")
-            service_restart(service_name())
+            graceful_restart(service_name())
+
+        handlers = config_changed_handlers()
 
-        if config('prefer-ipv6'):
+        if 'ipv6' in handlers and config('prefer-ipv6'):
             status_set('maintenance', 'configuring ipv6')
             setup_ipv6()
 
-        for r_id in relation_ids('identity-service'):
-            identity_changed(relid=r_id)
+        if 'identity-service' in handlers:
+            for r_id in relation_ids('identity-service'):
+                identity_changed(relid=r_id)
 
-        for r_id in relation_ids('cluster'):
-            cluster_joined(rid=r_id)
+        if 'cluster' in handlers:
+            for r_id in relation_ids('cluster'):
+                cluster_joined(rid=r_id)
 
         # NOTE(jamespage): Re-exec mon relation for any changes to
         #                  enable ceph pool permissions restrictions
-        for r_id in relation_ids('mon'):
-            for unit in related_units(r_id):
-                mon_relation(r_id, unit)
+        if 'mon' in handlers:
+            for r_id in relation_ids('mon'):
+                for unit in related_units(r_id):
+                    mon_relation(r_id, unit)
 
         # Re-trigger hacluster relations to switch to ifaceless
         # vip configuration
-        for r_id in relation_ids('ha'):
-            ha_relation_joined(r_id)
+        if 'ha' in handlers:
+            for r_id in relation_ids('ha'):
+                ha_relation_joined(r_id)
 
         # Refire certificates relations for VIP changes
-        for r_id in relation_ids('certificates'):
-            certs_joined(r_id)
+        if 'certificates' in handlers:
+            for r_id in relation_ids('certificates'):
+                certs_joined(r_id)
 
         # Refire object-store relations for VIP/port changes
-        for r_id in relation_ids('object-store'):
-            object_store_joined(r_id)
+        if 'object-store' in handlers:
+            for r_id in relation_ids('object-store'):
+                object_store_joined(r_id)
 
-        for r_id in relation_ids('radosgw-user'):
-            radosgw_user_changed(r_id)
+        if 'radosgw-user' in handlers:
+            radosgw_user_changed()
 
-        process_multisite_relations()
+        if 'multisite' in handlers:
+            process_multisite_relations()
 
-        CONFIGS.write_all()
-        configure_https()
+        if 'https' in handlers:
+            # configure_https() renders all the configuration files too.
+            configure_https()
+        else:
+            CONFIGS.write_all()
 
-        update_nrpe_config()
+        if 'nrpe' in handlers:
+            update_nrpe_config()
 
         port = listen_port()
         open_port(port)
@@ -292,6 +484,8 @@ def config_changed():
                 close_port(opened_port_number)
                 log('Closed port %s in favor of port %s' %
                     (opened_port_number, port))
+        save_config_snapshot()
+        clear_config_full_pass()
     _config_changed()
 
     # Update s3 apps with ssl-ca, if available
@@ -303,7 +497,8 @@ def config_changed():
 @hooks.hook('mon-relation-departed',
             'mon-relation-changed')
 def mon_relation(rid=None, unit=None):
-    @restart_on_change(restart_map())
+    @restart_on_change(restart_map(),
+                       restart_functions=radosgw_restart_functions())
     def _mon_relation():
         key_name = 'rgw.{}'.format(socket.gethostname())
         legacy = True
@@ -327,13 +522,12 @@ def mon_relation(rid=None, unit=None):
         if is_request_complete(rq, relation='mon'):
             log('Broker request complete', level=DEBUG)
             CONFIGS.write_all()
+            data = relation_data(rid, unit)
             # New style per unit keys
-            key = relation_get(attribute='{}_key'.format(key_name),
-                               rid=rid, unit=unit)
+            key = data.get('{}_key'.format(key_name))
             if not key:
                 # Fallback to old style global key
-                key = relation_get(attribute='radosgw_key',
-                                   rid=rid, unit=unit)
+                key = data.get('radosgw_key')
                 key_name = None
 
             if key:
@@ -400,10 +594,9 @@ def mon_relation(rid=None, unit=None):
                         raise RuntimeError("Could not create zone '{}'".format(
                             zone))
 
-                    service_restart(service_name())
+                    graceful_restart(service_name())
 
-            for r_id in relation_ids('radosgw-user'):
-                radosgw_user_changed(r_id)
+            radosgw_user_changed()
 
         else:
             send_request_if_needed(rq, relation='mon')
@@ -467,7 +660,8 @@ def identity_joined(relid=None):
 
 @hooks.hook('identity-service-relation-changed')
 def identity_changed(relid=None):
-    @restart_on_change(restart_map())
+    @restart_on_change(restart_map(),
+                       restart_functions=radosgw_restart_functions())
     def _identity_changed():
         identity_joined(relid)
         CONFIGS.write_all()
@@ -476,7 +670,8 @@ def identity_changed(relid=None):
 
 @hooks.hook('cluster-relation-joined')
 def cluster_joined(rid=None):
-    @restart_on_change(restart_map())
+    @restart_on_change(restart_map(),
+                       restart_functions=radosgw_restart_functions())
     def _cluster_joined():
         settings = {}
 
@@ -495,7 +690,8 @@ def cluster_joined(rid=None):
 
 @hooks.hook('cluster-relation-changed')
 def cluster_changed():
-    @restart_on_change(restart_map())
+    @restart_on_change(restart_map(),
+                       restart_functions=radosgw_restart_functions())
     def _cluster_changed():
         CONFIGS.write_all()
         for r_id in relation_ids('identity-service'):
@@ -550,9 +746,67 @@ def update_nrpe_config(checks_to_remove=None):
             nrpe_setup.remove_check(shortname=svc)
     nrpe.add_init_service_checks(nrpe_setup, services(), current_unit)
     nrpe.add_haproxy_checks(nrpe_setup, current_unit)
+    if multisite_deployment():
+        add_sync_status_check(nrpe_setup, current_unit)
+    else:
+        remove_sync_status_check(nrpe_setup)
     nrpe_setup.write()
 
 
+def add_sync_status_check(nrpe_setup, unit_name):
+    """Add the multi-site replication check.
+
+    The check evaluates a cached sync status report, refreshed by a cron job
+    as radosgw-admin needs the cephx key of the gateway.
+
+    :param nrpe_setup: NRPE configuration to add the check to.
+    :type nrpe_setup: nrpe.NRPE
+    :param unit_name: Unit name used in the check description.
+    :type unit_name: str
+    """
+    if not os.path.exists(NAGIOS_PLUGINS):
+        os.makedirs(NAGIOS_PLUGINS)
+    for src in (os.path.join(charm_dir(), 'files', 'nagios',
+                             SYNC_STATUS_CHECK),
+                os.path.join(charm_dir(), 'hooks', 'sync_status.py')):
+        shutil.copy2(src, NAGIOS_PLUGINS)
+    check_cmd = os.path.join(NAGIOS_PLUGINS, SYNC_STATUS_CHECK)
+    ttl = config('nagios-sync-cache-ttl')
+    write_file(
+        SYNC_STATUS_CRON,
+        '# Juju managed\n'
+        '* * * * * root {} --refresh --cache-file {} --ttl {} --id {}\n'
+        .format(check_cmd, SYNC_STATUS_CACHE, ttl, multisite._key_name()),
+        perms=0o644)
+    nrpe_setup.add_check(
+        shortname=SYNC_STATUS_CHECK_NAME,
+        description='multi-site replication {}'.format(unit_name),
+        check_cmd=(
+            '{} --cache-file {} --max-age {} '
+            '--behind-shards-warning {} --behind-shards-critical {} '
+            '--lag-warning {} --lag-critical {} --metadata-stall {}'.format(
+                check_cmd, SYNC_STATUS_CACHE,
+                # The cron job refreshes the report every minute once it is
+                # older than the TTL, anything older than that is stale.
+                2 * ttl + 60,
+                config('nagios-sync-behind-shards-warning'),
+                config('nagios-sync-behind-shards-critical'),
+                config('nagios-sync-lag-warning'),
+                config('nagios-sync-lag-critical'),
+                config('nagios-metadata-sync-stall'))))
+
+
+def remove_sync_status_check(nrpe_setup):
+    """Remove the multi-site replication check and its cron job.
+
+    :param nrpe_setup: NRPE configuration to remove the check from.
+    :type nrpe_setup: nrpe.NRPE
+    """
+    nrpe_setup.remove_check(shortname=SYNC_STATUS_CHECK_NAME)
+    if os.path.exists(SYNC_STATUS_CRON):
+        os.remove(SYNC_STATUS_CRON)
+
+
 def configure_https():
     '''Enables SSL API Apache config if appropriate and kicks
     identity-service and image-service with any required
@@ -618,9 +872,11 @@ def certs_joined(relation_id=None):
 
 @hooks.hook('certificates-relation-changed')
 def certs_changed(relation_id=None, unit=None):
-    @restart_on_change(restart_map(), stopstart=True)
+    @restart_on_change(restart_map(), stopstart=True,
+                       restart_functions=radosgw_restart_functions(True))
     def _certs_changed():
         process_certificates('ceph-radosgw', relation_id, unit)
+        ceph_radosgw_context.invalidate_contexts('certificates')
         configure_https()
     _certs_changed()
     for r_id in relation_ids('identity-service'):
@@ -647,72 +903,127 @@ def get_radosgw_system_username(r_id):
     return gw_user
 
 
+def radosgw_user_creds_key(gw_user):
+    """Leader settings key of the credentials of a radosgw-user user"""
+    return 'user-creds-{}'.format(gw_user)
+
+
+def cached_radosgw_user_creds(gw_user):
+    """Credentials of a radosgw-user user, as recorded by the leader
+
+    :param gw_user: username
+    :type gw_user: str
+    :return: access key and secret, None if no credentials are recorded
+    :rtype: Optional[Tuple[str, str]]
+    """
+    creds = leader_get(radosgw_user_creds_key(gw_user))
+    if not creds:
+        return None
+    return tuple(json.loads(creds))
+
+
 @hooks.hook('radosgw-user-relation-departed')
 def radosgw_user_departed():
     # If there are no related units then the last unit
     # is currently departing.
     if not related_units():
         r_id = ch_relation_id()
-        for user in [get_radosgw_system_username(r_id),
-                     get_radosgw_username(r_id)]:
+        users = [get_radosgw_system_username(r_id),
+                 get_radosgw_username(r_id)]
+        for user in users:
             multisite.suspend_user(user)
+        if is_leader():
+            leader_set({radosgw_user_creds_key(user): None
+                        for user in users})
+
+
+def reconcile_radosgw_user(r_id, leader_settings):
+    """Ensure the user requested on a radosgw-user relation exists
+
+    Users whose credentials are recorded in leader settings are not looked
+    up again; new credentials are added to leader_settings. The user of the
+    other role is suspended whether or not its credentials are recorded, as
+    it may have been created before they were.
+
+    :param r_id: relation id
+    :type r_id: str
+    :param leader_settings: leader settings to update
+    :type leader_settings: Dict[str, Optional[str]]
+    :return: username, access key and secret, None if no user is requested
+    :rtype: Optional[Tuple[str, str, str]]
+    """
+    relation_data = relation_get(
+        rid=r_id,
+        app=remote_service_name(r_id))
+    if 'system-role' not in relation_data:
+        log('system-role not in relation data, cannot create user',
+            level=DEBUG)
+        return None
+    system_user = bool_from_string(
+        relation_data.get('system-role', 'false'))
+    if system_user:
+        gw_user = get_radosgw_system_username(r_id)
+        other_user = get_radosgw_username(r_id)
+    else:
+        gw_user = get_radosgw_username(r_id)
+        other_user = get_radosgw_system_username(r_id)
+    # If there is a pre-existing user of the other role then ensure it is
+    # suspended
+    multisite.suspend_user(other_user)
+    if cached_radosgw_user_creds(other_user):
+        leader_settings[radosgw_user_creds_key(other_user)] = None
+    creds = cached_radosgw_user_creds(gw_user)
+    if not creds:
+        creds = multisite.get_user_creds(gw_user)
+        if not all(creds):
+            creds = multisite.create_user(
+                gw_user,
+                system_user=system_user)
+        if all(creds):
+            leader_settings[radosgw_user_creds_key(gw_user)] = \
+                json.dumps(creds)
+    return (gw_user,) + tuple(creds)
 
 
 @hooks.hook('radosgw-user-relation-changed')
 def radosgw_user_changed(relation_id=None):
-    if not ready_for_service(legacy=False):
-        log('unit not ready, deferring radosgw_user configuration')
-        return
     if relation_id:
         r_ids = [relation_id]
     else:
         r_ids = relation_ids('radosgw-user')
+    if not r_ids:
+        return
+    if not ready_for_service(legacy=False):
+        log('unit not ready, deferring radosgw_user configuration')
+        return
     # The leader manages the users and sets the credentials using the
     # the application relation data bag.
     if is_leader():
+        leader_settings = {}
         for r_id in r_ids:
-            remote_app = remote_service_name(r_id)
-            relation_data = relation_get(
-                rid=r_id,
-                app=remote_app)
-            if 'system-role' not in relation_data:
-                log('system-role not in relation data, cannot create user',
-                    level=DEBUG)
-                return
-            system_user = bool_from_string(
-                relation_data.get('system-role', 'false'))
-            if system_user:
-                gw_user = get_radosgw_system_username(r_id)
-                # If there is a pre-existing non-system user then ensure it is
-                # suspended
-                multisite.suspend_user(get_radosgw_username(r_id))
-            else:
-                gw_user = get_radosgw_username(r_id)
-                # If there is a pre-existing system user then ensure it is
-                # suspended
-                multisite.suspend_user(get_radosgw_system_username(r_id))
-            if gw_user in multisite.list_users():
-                (access_key, secret_key) = multisite.get_user_creds(gw_user)
-            else:
-                (access_key, secret_key) = multisite.create_user(
-                    gw_user,
-                    system_user=system_user)
+            user = reconcile_radosgw_user(r_id, leader_settings)
+            if user is None:
+                continue
+            gw_user, access_key, secret_key = user
             relation_set(
-                app=remote_app,
+                app=remote_service_name(r_id),
                 relation_id=r_id,
                 relation_settings={
                     'uid': gw_user,
                     'access-key': access_key,
                     'secret-key': secret_key})
+        if leader_settings:
+            leader_set(leader_settings)
     # Each unit publishes its own endpoint data and daemon id using the
     # unit relation data bag.
+    internal_url = "{}:{}".format(
+        canonical_url(CONFIGS, INTERNAL),
+        listen_port())
     for r_id in r_ids:
         relation_set(
             relation_id=r_id,
             relation_settings={
-                'internal-url': "{}:{}".format(
-                    canonical_url(CONFIGS, INTERNAL),
-                    listen_port()),
+                'internal-url': internal_url,
                 'daemon-id': socket.gethostname()})
 
 
@@ -761,94 +1072,78 @@ def primary_relation_joined(relation_id=None):
         # this operation but a period update will force it to be created.
         multisite.update_period(fatal=False)
 
-    mutation = False
-
-    if realm not in multisite.list_realms():
-        log('Realm {} not found, creating now'.format(realm))
-        multisite.create_realm(realm, default=True)
-        mutation = True
-
-    # Migration if primary site has buckets configured.
-    # Migration involves renaming existing zone/zongroups such that existing
-    # buckets and their objects can be preserved on the primary site.
-    if multisite.check_cluster_has_buckets() is True:
-        log('Migrating to multisite with zone ({}) and zonegroup ({})'
-            .format(zone, zonegroup), level=DEBUG)
-        zones = multisite.list_zones()
-        zonegroups = multisite.list_zonegroups()
-
-        if (len(zonegroups) > 1) and (zonegroup not in zonegroups):
-            log('Multiple zonegroups found {}, aborting.'
-                .format(zonegroups), level=ERROR)
-            return
-
-        if (len(zones) > 1) and (zone not in zones):
-            log('Multiple zones found {}, aborting.'
-                .format(zones), level=ERROR)
-            return
-
-        rename_result = multisite.rename_multisite_config(
-            zonegroups, zonegroup,
-            zones, zone
-        )
-        if rename_result is None:
-            return
-
-        modify_result = multisite.modify_multisite_config(
-            zone, zonegroup,
-            endpoints=endpoints,
-            realm=realm
-        )
-        if modify_result is None:
-            return
-        mutation = True
-
-    if zonegroup not in multisite.list_zonegroups():
-        log('zonegroup {} not found, creating now'.format(zonegroup))
-        multisite.create_zonegroup(zonegroup,
-                                   endpoints=endpoints,
-                                   default=True, master=True,
-                                   realm=realm)
-        mutation = True
-
-    if zone not in multisite.list_zones():
-        log('zone {} not found, creating now'.format(zone))
-        multisite.create_zone(zone,
-                              endpoints=endpoints,
-                              default=True, master=True,
-                              zonegroup=zonegroup)
-        mutation = True
-
-    if MULTISITE_SYSTEM_USER not in multisite.list_users():
-        log('User {} not found, creating now'.format(MULTISITE_SYSTEM_USER))
-        access_key, secret = multisite.create_system_user(
-            MULTISITE_SYSTEM_USER
-        )
-        multisite.modify_zone(zone,
-                              access_key=access_key,
-                              secret=secret)
+    plan = multisite.plan_primary(realm, zonegroup, zone,
+                                  endpoints=endpoints,
+                                  system_user=MULTISITE_SYSTEM_USER)
+    if plan.errors:
+        return
+    period = plan.apply()
+    if period is None:
+        return
+    credentials = plan.result('create-system-user')
+    if credentials:
+        access_key, secret = credentials
         leader_set(access_key=access_key,
                    secret=secret)
-        mutation = True
 
-    if mutation:
+    if not plan.mutation:
+        log('No mutation detected.', 'INFO')
+    elif not period.epoch_changed:
+        log('Mutation detected, period unchanged. Not restarting {}.'
+            .format(service_name()), 'INFO')
+    else:
         log(
             'Mutation detected. Restarting {}.'.format(service_name()),
             'INFO')
-        multisite.update_period(zonegroup=zonegroup, zone=zone)
         CONFIGS.write_all()
-        service_restart(service_name())
+        graceful_restart(service_name())
         leader_set(restart_nonce=str(uuid.uuid4()))
-    else:
-        log('No mutation detected.', 'INFO')
 
     relation_set(relation_id=relation_id,
                  access_key=access_key,
                  secret=secret)
 
 
+def secondary_sync_flows():
+    """Sync policy flow type requested by each related secondary zone
+
+    Secondary units that have not provided the required data yet are
+    skipped.
+
+    :return: flow type by secondary zone name
+    :rtype: Dict[str, str]
+    """
+    secondaries = {}
+    for r_id in relation_ids('primary'):
+        for unit in related_units(r_id):
+            secondary_data = relation_get(rid=r_id, unit=unit)
+            if not all((secondary_data.get('zone'),
+                        secondary_data.get('sync_policy_flow_type'))):
+                log("Secondary unit {} has not provided required data yet"
+                    .format(unit), level=DEBUG)
+                continue
+            secondary_zone = secondary_data['zone']
+            sync_flow_type = secondary_data['sync_policy_flow_type']
+            if (secondary_data.get('zone_tier_type') == 'cloud' and
+                    sync_flow_type != multisite.SYNC_FLOW_DIRECTIONAL):
+                log("The secondary zone {} is set with cloud tier type. "
+                    "Ignoring configured {} sync policy flow, and using {}."
+                    .format(secondary_zone, sync_flow_type,
+                            multisite.SYNC_FLOW_DIRECTIONAL),
+                    level=WARNING)
+                sync_flow_type = multisite.SYNC_FLOW_DIRECTIONAL
+            secondaries[secondary_zone] = sync_flow_type
+    return secondaries
+
+
 @hooks.hook('primary-relation-changed')
-def primary_relation_changed(relation_id=None, unit=None):
+def primary_relation_changed():
+    """Configure the default sync group for all related secondary zones
+
+    The sync group is read once and the flows and pipes of every secondary
+    zone are updated together, with a single period commit and at most one
+    restart per hook.
+    """
     if not is_leader():
         log('Cannot setup multisite configuration, this unit is not the '
             'leader')
@@ -863,68 +1158,34 @@ def primary_relation_changed(relation_id=None, unit=None):
             "default sync policy configuration")
         return
 
-    secondary_data = relation_get(rid=relation_id, unit=unit)
-    if not all((secondary_data.get('zone'),
-                secondary_data.get('sync_policy_flow_type'))):
+    secondaries = secondary_sync_flows()
+    if not secondaries:
         log("Defer processing until secondary RGW has provided required data")
         return
 
-    zonegroup = config('zonegroup')
-    primary_zone = config('zone')
-    secondary_zone = secondary_data['zone']
-    sync_flow_type = secondary_data['sync_policy_flow_type']
-
-    if (secondary_data.get('zone_tier_type') == 'cloud' and
-            sync_flow_type != multisite.SYNC_FLOW_DIRECTIONAL):
-        log("The secondary zone is set with cloud tier type. Ignoring "
-            "configured {} sync policy flow, and using {}.".format(
-                sync_flow_type,
-                multisite.SYNC_FLOW_DIRECTIONAL),
-            level=WARNING)
-        sync_flow_type = multisite.SYNC_FLOW_DIRECTIONAL
-
-    flow_id = '{}-{}'.format(primary_zone, secondary_zone)
-    pipe_id = '{}-{}'.format(primary_zone, secondary_zone)
-
-    mutation = multisite.is_sync_group_update_needed(
+    plan = multisite.plan_sync_group(
         group_id=MULTISITE_DEFAULT_SYNC_GROUP_ID,
-        flow_id=flow_id,
-        pipe_id=pipe_id,
-        source_zone=primary_zone,
-        dest_zone=secondary_zone,
-        desired_status=sync_policy_state,
-        desired_flow_type=sync_flow_type,
+        status=sync_policy_state,
+        zonegroup=config('zonegroup'),
+        zone=config('zone'),
+        secondaries=secondaries,
     )
-
-    if mutation:
-        multisite.create_sync_group(
-            group_id=MULTISITE_DEFAULT_SYNC_GROUP_ID,
-            status=sync_policy_state)
-        multisite.create_sync_group_flow(
-            group_id=MULTISITE_DEFAULT_SYNC_GROUP_ID,
-            flow_id=flow_id,
-            flow_type=sync_flow_type,
-            source_zone=primary_zone,
-            dest_zone=secondary_zone)
-        source_zones = [primary_zone, secondary_zone]
-        dest_zones = [primary_zone, secondary_zone]
-        if sync_flow_type == multisite.SYNC_FLOW_DIRECTIONAL:
-            source_zones = [primary_zone]
-            dest_zones = [secondary_zone]
-        multisite.create_sync_group_pipe(
-            group_id=MULTISITE_DEFAULT_SYNC_GROUP_ID,
-            pipe_id=pipe_id,
-            source_zones=source_zones,
-            dest_zones=dest_zones)
+    if not plan.mutation:
+        log('No mutation detected.', 'INFO')
+        return
+    period = plan.apply()
+    if period is None:
+        return
+    if period.epoch_changed:
         log(
             'Mutation detected. Restarting {}.'.format(service_name()),
             'INFO')
-        multisite.update_period(zonegroup=zonegroup, zone=primary_zone)
         CONFIGS.write_all()
-        service_restart(service_name())
+        graceful_restart(service_name())
         leader_set(restart_nonce=str(uuid.uuid4()))
     else:
-        log('No mutation detected.', 'INFO')
+        log('Mutation detected, period unchanged. Not restarting {}.'
+            .format(service_name()), 'INFO')
 
 
 @hooks.hook('primary-relation-departed')
@@ -948,23 +1209,8 @@ def multisite_relation_departed():
         log('Multisite is not configured, skipping scaledown.')
         return
 
-    zonegroup_info = multisite.get_zonegroup_info(zonegroup)
-    # remove other zones from zonegroup
-    for zone_info in zonegroup_info['zones']:
-        if zone_info['name'] is not zone:
-            multisite.remove_zone_from_zonegroup(
-                zone_info['name'], zonegroup
-            )
-
-    # modify self as master zone.
-    multisite.modify_zone(zone, default=True, master=True,
-                          zonegroup=zonegroup)
-
-    # Update period.
-    multisite.update_period(
-        fatal=True, zonegroup=zonegroup,
-        zone=zone, realm=realm
-    )
+    # Remove other zones from zonegroup and make self the master zone.
+    multisite.plan_scaledown(realm, zonegroup, zone).apply()
 
     # Verify multisite is not configured.
     if multisite.is_multisite_configured(zone=zone,
@@ -1020,49 +1266,29 @@ def secondary_relation_changed(relation_id=None, unit=None):
     relation_set(relation_id=relation_id,
                  sync_policy_flow_type=config('sync-policy-flow-type'))
 
-    mutation = False
-
-    # NOTE(utkarshbhatthere):
-    # A site with existing data can create inconsistencies when added as a
-    # secondary site for RGW. Hence it must be pristine.
-    if multisite.check_cluster_has_buckets():
-        log("Non-Pristine site can't be used as secondary", level=ERROR)
+    plan = multisite.plan_secondary(realm, zonegroup, zone,
+                                    endpoints=endpoints,
+                                    url=master_data['url'],
+                                    access_key=master_data['access_key'],
+                                    secret=master_data['secret'])
+    if plan.errors:
+        return
+    period = plan.apply()
+    if period is None:
         return
 
-    if realm not in multisite.list_realms():
-        log('Realm {} not found, pulling now'.format(realm))
-        multisite.pull_realm(url=master_data['url'],
-                             access_key=master_data['access_key'],
-                             secret=master_data['secret'])
-        multisite.pull_period(url=master_data['url'],
-                              access_key=master_data['access_key'],
-                              secret=master_data['secret'])
-        multisite.set_default_realm(realm)
-        mutation = True
-
-    if zone not in multisite.list_zones():
-        log('zone {} not found, creating now'.format(zone))
-        multisite.pull_period(url=master_data['url'],
-                              access_key=master_data['access_key'],
-                              secret=master_data['secret'])
-        multisite.create_zone(zone,
-                              endpoints=endpoints,
-                              default=False, master=False,
-                              zonegroup=zonegroup,
-                              access_key=master_data['access_key'],
-                              secret=master_data['secret'])
-        mutation = True
-
-    if mutation:
+    if not plan.mutation:
+        log('No mutation detected.', 'INFO')
+    elif period.epoch_changed:
         log(
             'Mutation detected. Restarting {}.'.format(service_name()),
             'INFO')
-        multisite.update_period(zonegroup=zonegroup, zone=zone)
         CONFIGS.write_all()
-        service_restart(service_name())
+        graceful_restart(service_name())
         leader_set(restart_nonce=str(uuid.uuid4()))
     else:
-        log('No mutation detected.', 'INFO')
+        log('Mutation detected, period unchanged. Not restarting {}.'
+            .format(service_name()), 'INFO')
 
     relation_set(relation_id=relation_id, zone=zone)
 
@@ -1095,18 +1321,18 @@ def leader_settings_changed():
     #       data has been created/changed - trigger restarts
     #       of rgw services.
     if restart_nonce_changed(leader_get('restart_nonce')):
-        service_restart(service_name())
+        rolling_restart(service_name())
     if not is_leader():
         # Deprecated Master/Slave relation
         for r_id in relation_ids('master'):
             master_relation_joined(r_id)
         # Primary/Secondary relation
-        for r_id in relation_ids('primary'):
+        primary_rids = relation_ids('primary')
+        for r_id in primary_rids:
             primary_relation_joined(r_id)
-            for unit in related_units(r_id):
-                primary_relation_changed(r_id, unit)
-        for r_id in relation_ids('radosgw-user'):
-            radosgw_user_changed(r_id)
+        if primary_rids:
+            primary_relation_changed()
+        radosgw_user_changed()
 
 
 def process_multisite_relations():
@@ -1118,10 +1344,11 @@ def process_multisite_relations():
         for unit in related_units(r_id):
             slave_relation_changed(r_id, unit)
     # Primary/Secondary relation
-    for r_id in relation_ids('primary'):
+    primary_rids = relation_ids('primary')
+    for r_id in primary_rids:
         primary_relation_joined(r_id)
-        for unit in related_units(r_id):
-            primary_relation_changed(r_id, unit)
+    if primary_rids:
+        primary_relation_changed()
     for r_id in relation_ids('secondary'):
         for unit in related_units(r_id):
             secondary_relation_changed(r_id, unit)
@@ -1288,12 +1515,14 @@ def s3_relation_departed(relation_id=None):
 
 
 if __name__ == '__main__':
-    try:
-        hooks.execute(sys.argv)
-    except UnregisteredHookError as e:
-        log('Unknown hook {} - skipping.'.format(e))
-    except ValueError as e:
-        # Handle any invalid configuration values
-        status_set(WORKLOAD_STATES.BLOCKED, str(e))
-    else:
-        assess_status(CONFIGS)
+    with hook_trace.traced(os.path.basename(sys.argv[0])), \
+            log_sink.buffered():
+        try:
+            hooks.execute(sys.argv)
+        except UnregisteredHookError as e:
+            log('Unknown hook {} - skipping.'.format(e))
+        except ValueError as e:
+            # Handle any invalid configuration values
+            status_set(WORKLOAD_STATES.BLOCKED, str(e))
+        else:
+            assess_status(CONFIGS)
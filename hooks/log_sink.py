@@ -0,0 +1,177 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import contextlib
+import threading
+
+from charmhelpers.core import hookenv
+
+# Characters buffered before they are written to the juju log.
+FLUSH_THRESHOLD = 32768
+
+# Messages at these levels are written out immediately, along with the
+# messages buffered before them.
+IMMEDIATE_LEVELS = (
+    hookenv.WARNING,
+    'WARN',
+    hookenv.ERROR,
+    hookenv.CRITICAL,
+)
+
+# Payloads longer than this are summarised by summarise().
+MAX_PAYLOAD = 2048
+SAMPLE_SIZE = 5
+
+
+def summarise(payload, limit=MAX_PAYLOAD, sample=SAMPLE_SIZE):
+    """Representation of a payload bounded in size, for logging
+
+    Collections whose representation is longer than limit are summarised
+    as their number of items and the first sample items; strings are
+    truncated.
+
+    :param payload: value to log
+    :type payload: Any
+    :param limit: characters beyond which the payload is summarised
+    :type limit: int
+    :param sample: number of items of a collection included in a summary
+    :type sample: int
+    :rtype: str
+    """
+    text = payload if isinstance(payload, str) else repr(payload)
+    if len(text) <= limit:
+        return text
+    if isinstance(payload, dict):
+        head = dict(list(payload.items())[:sample])
+    elif isinstance(payload, (list, tuple, set, frozenset)):
+        head = list(payload)[:sample]
+    else:
+        return '{}... ({} more characters)'.format(
+            text[:limit], len(text) - limit)
+    return '{} items, first {}: {}'.format(
+        len(payload), len(head), summarise(repr(head), limit=limit))
+
+
+class LogSink(object):
+    """Write juju log messages in batches
+
+    Each juju-log call is a process; buffered messages of the same level are
+    written by a single call, joined by newlines. Messages may be logged
+    from several threads.
+    """
+
+    def __init__(self, threshold=FLUSH_THRESHOLD):
+        """
+        :param threshold: characters buffered before they are written
+        :type threshold: int
+        """
+        self.threshold = threshold
+        self.buffering = False
+        self.messages = []
+        self.size = 0
+        self._lock = threading.Lock()
+
+    def log(self, message, level=None):
+        """Write a message to the juju log, see hookenv.log
+
+        :param message: message to log
+        :type message: Any
+        :param level: log level, e.g. hookenv.DEBUG
+        :type level: Optional[str]
+        """
+        if not self.buffering:
+            hookenv.log(message, level=level)
+            return
+        if not isinstance(message, str):
+            message = repr(message)
+        with self._lock:
+            self.messages.append((level, message))
+            self.size += len(message)
+            full = self.size >= self.threshold
+        if full or level in IMMEDIATE_LEVELS:
+            self.flush()
+
+    def batches(self, messages=None):
+        """Group messages into juju-log calls
+
+        Consecutive messages of the same level are joined, up to threshold
+        characters per call.
+
+        :param messages: level and text of the messages, the buffered
+                         messages by default
+        :type messages: Optional[List[Tuple[Optional[str], str]]]
+        :return: level and message of each call
+        :rtype: List[Tuple[Optional[str], str]]
+        """
+        if messages is None:
+            messages = self.messages
+        batches = []
+        for level, message in messages:
+            if batches:
+                batch_level, lines = batches[-1]
+                size = sum(len(line) + 1 for line in lines) + len(message)
+                if batch_level == level and size <= self.threshold:
+                    lines.append(message)
+                    continue
+            batches.append((level, [message]))
+        return [(level, '\n'.join(lines)) for level, lines in batches]
+
+    def flush(self):
+        """Write the buffered messages to the juju log"""
+        with self._lock:
+            messages = self.messages
+            self.messages = []
+            self.size = 0
+        for level, message in self.batches(messages):
+            hookenv.log(message, level=level)
+
+    @contextlib.contextmanager
+    def buffered(self):
+        """Buffer messages for the duration of the block
+
+        The buffered messages are written when the outermost block exits,
+        including when it raises.
+        """
+        buffering = self.buffering
+        self.buffering = True
+        try:
+            yield self
+        finally:
+            self.buffering = buffering
+            if not buffering:
+                self.flush()
+
+
+_sink = LogSink()
+
+
+def log(message, level=None):
+    """Write a message to the juju log, buffered inside buffered()
+
+    :param message: message to log
+    :type message: Any
+    :param level: log level, e.g. hookenv.DEBUG
+    :type level: Optional[str]
+    """
+    _sink.log(message, level=level)
+
+
+def flush():
+    """Write the buffered messages to the juju log"""
+    _sink.flush()
+
+
+def buffered():
+    """Buffer the juju log messages of the block, see LogSink.buffered"""
+    return _sink.buffered()
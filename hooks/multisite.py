@@ -13,17 +13,48 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextlib
+import errno
 import json
 import functools
+import random
+import signal
 import subprocess
 import socket
+import threading
+import time
 import utils
+import admin_api
+import sync_status
+
+from log_sink import log, summarise
 
 import charmhelpers.core.hookenv as hookenv
-import charmhelpers.core.decorators as decorators
+from charmhelpers.core import unitdata
+from charmhelpers.contrib.hahelpers.cluster import determine_api_port
 
 RGW_ADMIN = 'radosgw-admin'
 
+# Unit data key remembering that local zones were found to hold buckets.
+CLUSTER_HAS_BUCKETS_KEY = 'multisite-cluster-has-buckets'
+
+# Unit data key of the multi-site health facts kept across hooks, and the
+# entity types whose mutation makes them stale.
+STATUS_CACHE_KEY = 'multisite-status-cache'
+STATUS_ENTITIES = frozenset(('realm', 'zonegroup', 'zone', 'sync'))
+
+# Unit data key of the realm topology kept across hooks, and the entity
+# types whose mutation makes it stale.
+TOPOLOGY_KEY = 'multisite-topology'
+TOPOLOGY_ENTITIES = frozenset(('realm', 'zonegroup', 'zone'))
+
+ADMIN_BACKEND_CLI = 'cli'
+ADMIN_BACKEND_REST = 'rest'
+ADMIN_BACKENDS = [
+    ADMIN_BACKEND_CLI,
+    ADMIN_BACKEND_REST,
+]
+
 SYNC_POLICY_ENABLED = 'enabled'
 SYNC_POLICY_ALLOWED = 'allowed'
 SYNC_POLICY_FORBIDDEN = 'forbidden'
@@ -50,26 +81,445 @@ class UnknownSyncFlowType(Exception):
     pass
 
 
-@decorators.retry_on_exception(num_retries=10, base_delay=5,
-                               exc_type=subprocess.CalledProcessError)
+# Results of read-only radosgw-admin queries are kept for the remainder of
+# the hook execution. Entries are grouped by the type of entity they describe
+# (realm, zonegroup, zone, user) so that mutating calls only discard the
+# groups they affect.
+_query_cache = {}
+# Guards the query cache and the retry counters, which are shared by the
+# workers of actions processing buckets concurrently.
+_lock = threading.RLock()
+_cache_stats = {'hits': 0, 'misses': 0}
+_cache_stats_logged = False
+_cache_generation = 0
+_topology = None
+
+
+def _log_cache_stats():
+    """Log the query cache hit/miss counters for the current hook"""
+    log("radosgw-admin query cache: {hits} hits, {misses} misses"
+        .format(**_cache_stats), level=hookenv.DEBUG)
+
+
+def _cache_get(entity, cmd):
+    """Look up a cached query result
+
+    :param entity: type of entity described by the query
+    :type entity: str
+    :param cmd: radosgw-admin command line of the query
+    :type cmd: list[str]
+    :return: cached command output or None
+    :rtype: Optional[str]
+    """
+    global _cache_stats_logged
+    with _lock:
+        try:
+            result = _query_cache[entity][tuple(cmd)]
+        except KeyError:
+            _cache_stats['misses'] += 1
+            if not _cache_stats_logged:
+                hookenv.atexit(_log_cache_stats)
+                _cache_stats_logged = True
+            return None
+        _cache_stats['hits'] += 1
+        return result
+
+
+def _cache_set(entity, cmd, result):
+    """Record the result of a query for the remainder of the hook"""
+    with _lock:
+        _query_cache.setdefault(entity, {})[tuple(cmd)] = result
+
+
+def _cached_check_output(entity, cmd):
+    """Caching wrapper for _check_output used by read-only queries
+
+    :param entity: type of entity described by the query
+    :type entity: str
+    :param cmd: radosgw-admin command line of the query
+    :type cmd: list[str]
+    :return: command output
+    :rtype: str
+    """
+    result = _cache_get(entity, cmd)
+    if result is None:
+        result = _check_output(cmd)
+        _cache_set(entity, cmd, result)
+    return result
+
+
+def invalidate_cache(*entities):
+    """Discard cached query results for the provided entity types
+
+    :param entities: entity types to discard (zone, zonegroup, realm, user)
+    :type entities: str
+    """
+    global _cache_generation
+    with _lock:
+        for entity in entities:
+            _query_cache.pop(entity, None)
+        _cache_generation += 1
+    if STATUS_ENTITIES.intersection(entities):
+        invalidate_status_cache()
+    if TOPOLOGY_ENTITIES.intersection(entities):
+        invalidate_topology()
+
+
+def flush_cache():
+    """Discard all cached query results and reset the cache counters"""
+    global _cache_generation, _topology
+    with _lock:
+        _query_cache.clear()
+        _cache_stats.update(hits=0, misses=0)
+        _cache_generation += 1
+        _topology = None
+
+
+def cache_generation():
+    """Number of times cached query results have been discarded
+
+    Callers keeping results derived from radosgw-admin queries can compare
+    it with the value seen when computing them to know if they are stale.
+
+    :rtype: int
+    """
+    return _cache_generation
+
+
+def cache_stats():
+    """Query cache hit/miss counters for the current hook
+
+    :return: number of cache hits and misses
+    :rtype: dict
+    """
+    return dict(_cache_stats)
+
+
+def _invalidates(*entities):
+    """Decorator for mutating calls, discarding affected cached queries"""
+    def wrap(f):
+        @functools.wraps(f)
+        def wrapped_f(*args, **kwargs):
+            try:
+                return f(*args, **kwargs)
+            finally:
+                invalidate_cache(*entities)
+        return wrapped_f
+    return wrap
+
+
+def invalidate_status_cache():
+    """Discard the multi-site health facts kept across hooks"""
+    db = unitdata.kv()
+    if db.get(STATUS_CACHE_KEY) is not None:
+        db.unset(STATUS_CACHE_KEY)
+        db.flush()
+
+
+def _status_cached(f):
+    """Decorator keeping the result of a health check across hooks
+
+    Results are kept in unit data for multisite-status-interval seconds,
+    by function and arguments, until invalidate_status_cache is called. The
+    result must be serialisable to JSON; None results, reported when the
+    check could not be completed, are not kept.
+    """
+    @functools.wraps(f)
+    def wrapped_f(*args):
+        interval = hookenv.config('multisite-status-interval') or 0
+        if not interval:
+            return f(*args)
+        key = '{}{}'.format(f.__name__, json.dumps(args))
+        db = unitdata.kv()
+        now = time.time()
+        entry = (db.get(STATUS_CACHE_KEY) or {}).get(key)
+        if entry is not None and 0 <= now - entry['time'] < interval:
+            return entry['value']
+        value = f(*args)
+        if value is not None:
+            # The check may have invalidated the cache, read it again.
+            cache = db.get(STATUS_CACHE_KEY) or {}
+            cache[key] = {'time': now, 'value': value}
+            db.set(STATUS_CACHE_KEY, cache)
+            db.flush()
+        return value
+    return wrapped_f
+
+
+FAILURE_TRANSIENT = 'transient'
+FAILURE_PERMANENT = 'permanent'
+FAILURE_UNKNOWN = 'unknown'
+
+# radosgw-admin exits with the errno of the failed operation.
+TRANSIENT_ERRNOS = {
+    errno.EAGAIN,
+    errno.EBUSY,
+    errno.EINTR,
+    errno.EIO,
+    errno.ETIMEDOUT,
+    errno.ECANCELED,
+    errno.ECONNREFUSED,
+    errno.ECONNRESET,
+    errno.EHOSTUNREACH,
+    errno.ENETUNREACH,
+}
+PERMANENT_ERRNOS = {
+    errno.ENOENT,
+    errno.EEXIST,
+    errno.EINVAL,
+    errno.EACCES,
+    errno.ENOTEMPTY,
+    errno.ENOTSUP,
+    errno.ERANGE,
+}
+TRANSIENT_MESSAGES = (
+    'resource temporarily unavailable',
+    'device or resource busy',
+    'timed out',
+    'connection refused',
+    'failed to acquire lock',
+    'lease',
+    'monclient',
+    "couldn't init storage provider",
+)
+PERMANENT_MESSAGES = (
+    'invalid argument',
+    'no such file or directory',
+    'does not exist',
+    'not found',
+    'already exists',
+    'unrecognized arg',
+)
+# Failures raised by subprocess itself, rather than by radosgw-admin.
+TRANSIENT_EXCEPTIONS = (subprocess.TimeoutExpired,)
+
+
+def classify_failure(returncode, stderr=None):
+    """Classify a failed radosgw-admin execution
+
+    The exit code is used where it identifies a known errno, otherwise
+    the error output is matched against known messages.
+
+    :param returncode: exit code of radosgw-admin
+    :type returncode: Optional[int]
+    :param stderr: error output of radosgw-admin
+    :type stderr: Optional[Union[str, bytes]]
+    :return: one of FAILURE_TRANSIENT, FAILURE_PERMANENT or FAILURE_UNKNOWN
+    :rtype: str
+    """
+    if returncode in TRANSIENT_ERRNOS:
+        return FAILURE_TRANSIENT
+    if returncode in PERMANENT_ERRNOS:
+        return FAILURE_PERMANENT
+    if isinstance(stderr, bytes):
+        stderr = stderr.decode('UTF-8', 'replace')
+    stderr = (stderr or '').lower()
+    if any(message in stderr for message in TRANSIENT_MESSAGES):
+        return FAILURE_TRANSIENT
+    if any(message in stderr for message in PERMANENT_MESSAGES):
+        return FAILURE_PERMANENT
+    return FAILURE_UNKNOWN
+
+
+class RetryPolicy(object):
+    """Capped exponential backoff with jitter"""
+
+    def __init__(self, max_attempts, base_delay, max_delay):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt):
+        """Backoff before retrying after the given (1-based) attempt
+
+        :param attempt: number of the failed attempt
+        :type attempt: int
+        :return: delay in seconds
+        :rtype: float
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+
+READ_RETRY_POLICY = RetryPolicy(max_attempts=8, base_delay=1, max_delay=30)
+WRITE_RETRY_POLICY = RetryPolicy(max_attempts=5, base_delay=1, max_delay=20)
+# Wall-clock time a single hook may spend running and retrying radosgw-admin
+# commands before surfacing failures.
+RETRY_BUDGET = 300
+# Timeout of a command run once the retry budget is spent.
+MIN_COMMAND_TIMEOUT = 30
+
+_retry_state = {'start': None, 'logged': False}
+_retry_stats = {}
+# Start of the retry budget of the current thread, set by retry_budget().
+_thread_budget = threading.local()
+
+
+def _log_retry_stats():
+    """Log retry counters per command type for the current hook"""
+    for category, stats in sorted(_retry_stats.items()):
+        log("radosgw-admin {}: {calls} calls, {retries} retries, "
+            "{failures} failures, {backoff:.1f}s backing off"
+            .format(category, **stats), level=hookenv.DEBUG)
+
+
+def retry_stats():
+    """Retry counters per command type for the current hook
+
+    :return: calls, retries, failures and backoff time per command type
+    :rtype: Dict[str, dict]
+    """
+    with _lock:
+        return {category: dict(stats)
+                for category, stats in _retry_stats.items()}
+
+
+def _remaining_budget():
+    """Seconds left of the retry budget of the current hook
+
+    The budget is measured from the first radosgw-admin command of the hook,
+    or from the start of the enclosing retry_budget() block of the thread.
+
+    :rtype: float
+    """
+    now = time.monotonic()
+    start = getattr(_thread_budget, 'start', None)
+    if start is not None:
+        return RETRY_BUDGET - (now - start)
+    with _lock:
+        if _retry_state['start'] is None:
+            _retry_state['start'] = now
+        return RETRY_BUDGET - (now - _retry_state['start'])
+
+
+@contextlib.contextmanager
+def retry_budget():
+    """Give the commands run by the current thread a retry budget of their own
+
+    Used by actions processing many buckets, each bucket being given the
+    budget a hook would have.
+    """
+    previous = getattr(_thread_budget, 'start', None)
+    _thread_budget.start = time.monotonic()
+    try:
+        yield
+    finally:
+        _thread_budget.start = previous
+
+
+def _command_timeout():
+    """Timeout of the next radosgw-admin command
+
+    Commands may run for the remainder of the retry budget, so that a hung
+    monitor connection does not block the hook for the timeout of
+    radosgw-admin itself.
+
+    :return: timeout in seconds
+    :rtype: float
+    """
+    return max(_remaining_budget(), MIN_COMMAND_TIMEOUT)
+
+
+def _command_category(cmd):
+    """Command type of a radosgw-admin command line, e.g. 'zone list'"""
+    return ' '.join(arg for arg in cmd[1:] if not arg.startswith('-'))
+
+
+def _retry_on_failure(policy, exc_type=(subprocess.CalledProcessError,
+                                        subprocess.TimeoutExpired)):
+    """Decorator retrying transient failures according to a retry policy
+
+    Failures classified as permanent are raised straight away, as are any
+    failures once the policy is exhausted or the hook retry budget has been
+    spent. The first positional argument of the decorated function is
+    expected to be the radosgw-admin command line, if any.
+
+    :param policy: backoff policy to apply
+    :type policy: RetryPolicy
+    :param exc_type: exception types signalling a failed attempt
+    :type exc_type: Tuple[Type[Exception]]
+    """
+    def wrap(f):
+        @functools.wraps(f)
+        def wrapped_f(*args, **kwargs):
+            if args and isinstance(args[0], list):
+                category = _command_category(args[0])
+            else:
+                category = f.__name__
+            with _lock:
+                stats = _retry_stats.setdefault(
+                    category,
+                    {'calls': 0, 'retries': 0, 'failures': 0,
+                     'backoff': 0.0})
+                stats['calls'] += 1
+            attempt = 0
+            while True:
+                attempt += 1
+                try:
+                    return f(*args, **kwargs)
+                except exc_type as e:
+                    if isinstance(e, TRANSIENT_EXCEPTIONS):
+                        failure = FAILURE_TRANSIENT
+                    else:
+                        failure = classify_failure(
+                            getattr(e, 'returncode', None),
+                            getattr(e, 'stderr', None))
+                    delay = policy.delay(attempt)
+                    remaining = _remaining_budget()
+                    if (failure == FAILURE_PERMANENT or
+                            attempt >= policy.max_attempts or
+                            delay > remaining):
+                        with _lock:
+                            stats['failures'] += 1
+                        log("{} failed ({}) after {} attempt(s): {}"
+                            .format(category, failure, attempt, e),
+                            level=hookenv.WARNING)
+                        raise
+                    with _lock:
+                        stats['retries'] += 1
+                        stats['backoff'] += delay
+                        if not _retry_state['logged']:
+                            hookenv.atexit(_log_retry_stats)
+                            _retry_state['logged'] = True
+                    log("{} failed ({}), retrying in {:.1f}s: {}"
+                        .format(category, failure, delay, e),
+                        level=hookenv.DEBUG)
+                    time.sleep(delay)
+        return wrapped_f
+    return wrap
+
+
+@_retry_on_failure(READ_RETRY_POLICY)
 def _check_output(cmd):
     """Logging wrapper for subprocess.check_ouput"""
-    hookenv.log("Executing: {}".format(' '.join(cmd)), level=hookenv.DEBUG)
-    return subprocess.check_output(cmd).decode('UTF-8')
+    log("Executing: {}".format(' '.join(cmd)), level=hookenv.DEBUG)
+    try:
+        return subprocess.check_output(
+            cmd, stderr=subprocess.PIPE,
+            timeout=_command_timeout()).decode('UTF-8')
+    except subprocess.CalledProcessError as e:
+        if e.stderr:
+            log(summarise(e.stderr.decode('UTF-8', 'replace')),
+                level=hookenv.WARNING)
+        raise
 
 
-@decorators.retry_on_exception(num_retries=5, base_delay=3,
-                               exc_type=subprocess.CalledProcessError)
+@_retry_on_failure(WRITE_RETRY_POLICY)
 def _check_call(cmd):
     """Logging wrapper for subprocess.check_call"""
-    hookenv.log("Executing: {}".format(' '.join(cmd)), level=hookenv.DEBUG)
-    return subprocess.check_call(cmd)
+    log("Executing: {}".format(' '.join(cmd)), level=hookenv.DEBUG)
+    return subprocess.check_call(cmd, timeout=_command_timeout())
 
 
 def _call(cmd):
     """Logging wrapper for subprocess.call"""
-    hookenv.log("Executing: {}".format(' '.join(cmd)), level=hookenv.DEBUG)
-    return subprocess.call(cmd)
+    log("Executing: {}".format(' '.join(cmd)), level=hookenv.DEBUG)
+    try:
+        return subprocess.call(cmd, timeout=_command_timeout())
+    except subprocess.TimeoutExpired as e:
+        log(str(e), level=hookenv.WARNING)
+        # subprocess.call() kills the command once it timed out
+        return -signal.SIGKILL
 
 
 def _key_name():
@@ -80,6 +530,56 @@ def _key_name():
         return 'radosgw.gateway'
 
 
+# Admin Ops API clients, one per thread as their connection is not
+# thread-safe.
+_admin_api_clients = threading.local()
+
+
+def admin_api_client():
+    """Admin Ops API client for the local RADOS Gateway
+
+    Requests are authenticated as the multisite system user, whose
+    credentials are distributed through leader storage. Each thread gets
+    its own client.
+
+    :return: Admin Ops API client, None if no credentials are available
+    :rtype: Optional[admin_api.AdminAPIClient]
+    """
+    client = getattr(_admin_api_clients, 'client', None)
+    if client is None:
+        access_key = hookenv.leader_get('access_key')
+        secret = hookenv.leader_get('secret')
+        if not (access_key and secret):
+            return None
+        client = admin_api.AdminAPIClient(
+            'localhost',
+            determine_api_port(utils.listen_port(), singlenode_mode=True),
+            access_key, secret)
+        _admin_api_clients.client = client
+    return client
+
+
+def _admin_api():
+    """Admin Ops API client if selected by the rgw-admin-backend option
+
+    :return: Admin Ops API client, None if radosgw-admin should be used
+    :rtype: Optional[admin_api.AdminAPIClient]
+    """
+    if hookenv.config('rgw-admin-backend') != ADMIN_BACKEND_REST:
+        return None
+    client = admin_api_client()
+    if client is None:
+        log("No credentials available for the Admin Ops API, "
+            "using radosgw-admin", level=hookenv.DEBUG)
+    return client
+
+
+def _admin_api_failed(error):
+    """Log a failed Admin Ops API request before falling back to the CLI"""
+    log("Admin Ops API request failed, falling back to "
+        "radosgw-admin: {}".format(error), level=hookenv.WARNING)
+
+
 def _list(key):
     """
     Internal implementation for list_* functions
@@ -94,10 +594,8 @@ def _list(key):
         key, 'list'
     ]
     try:
-        result = json.loads(_check_output(cmd))
-        hookenv.log("Results: {}".format(
-            result),
-            level=hookenv.DEBUG)
+        result = json.loads(_cached_check_output(key, cmd))
+        log("Results: {}".format(summarise(result)), level=hookenv.DEBUG)
         if isinstance(result, dict):
             return result['{}s'.format(key)]
         else:
@@ -121,22 +619,25 @@ def plain_list(key):
         key, 'list'
     ]
     try:
-        result = json.loads(subprocess.check_output(
-            cmd, stderr=subprocess.PIPE
-        ).decode('UTF-8'))
-        hookenv.log("Results: {}".format(result), level=hookenv.DEBUG)
+        output = _cache_get(key, cmd)
+        if output is None:
+            output = subprocess.check_output(
+                cmd, stderr=subprocess.PIPE, timeout=_command_timeout()
+            ).decode('UTF-8')
+            _cache_set(key, cmd, output)
+        result = json.loads(output)
+        log("Results: {}".format(summarise(result)), level=hookenv.DEBUG)
         if isinstance(result, dict):
             return result['{}s'.format(key)]
         else:
             return result
-    except subprocess.CalledProcessError:
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
         return []
     except TypeError:
         return []
 
 
-@decorators.retry_on_exception(num_retries=5, base_delay=3,
-                               exc_type=ValueError)
+@_retry_on_failure(READ_RETRY_POLICY, exc_type=ValueError)
 def list_zones(retry_on_empty=False):
     """
     List zones
@@ -149,42 +650,181 @@ def list_zones(retry_on_empty=False):
     """
     _zones = _list('zone')
     if retry_on_empty and not _zones:
-        hookenv.log("No zones found", level=hookenv.DEBUG)
+        log("No zones found", level=hookenv.DEBUG)
+        # Make sure the retry actually queries radosgw-admin again.
+        invalidate_cache('zone')
         raise ValueError("No zones found")
     return _zones
 
 
 list_realms = functools.partial(_list, 'realm')
 list_zonegroups = functools.partial(_list, 'zonegroup')
-list_users = functools.partial(_list, 'user')
 
 
-def list_buckets(zone, zonegroup):
-    """List Buckets served under the provided zone and zonegroup pair.
+def list_users():
+    """
+    List users
+
+    :return: List of user ids
+    :rtype: list
+    """
+    client = _admin_api()
+    if client:
+        try:
+            return client.list_users()
+        except admin_api.AdminAPIError as e:
+            _admin_api_failed(e)
+    return _list('user')
+
+
+def _local_admin_api(zone, zonegroup):
+    """Admin Ops API client if it serves the provided zone
+
+    :return: Admin Ops API client, None if radosgw-admin should be used
+    :rtype: Optional[admin_api.AdminAPIClient]
+    """
+    client = _admin_api()
+    # The local gateway only serves buckets of its own zone.
+    if client and (zone, zonegroup) == (hookenv.config('zone'),
+                                        hookenv.config('zonegroup')):
+        return client
+    return None
+
+
+def _bucket_page(zone, zonegroup, page_size, marker=None):
+    """Fetch a single page of bucket metadata keys
+
+    :return: bucket names, and marker of the next page if truncated
+    :rtype: Tuple[List[str], Optional[str]]
+    """
+    result = None
+    client = _local_admin_api(zone, zonegroup)
+    if client:
+        try:
+            result = client.list_metadata_keys('bucket',
+                                               max_entries=page_size,
+                                               marker=marker)
+        except admin_api.AdminAPIError as e:
+            _admin_api_failed(e)
+    if result is None:
+        cmd = [
+            RGW_ADMIN, '--id={}'.format(_key_name()),
+            'metadata', 'list', 'bucket',
+            '--rgw-zone={}'.format(zone),
+            '--rgw-zonegroup={}'.format(zonegroup),
+            '--max-entries={}'.format(page_size),
+        ]
+        if marker:
+            cmd.append('--marker={}'.format(marker))
+        result = json.loads(_check_output(cmd))
+    # Releases ignoring --max-entries return a plain list of all keys.
+    if isinstance(result, list):
+        return result, None
+    if result.get('truncated') and result.get('marker'):
+        return result.get('keys', []), result['marker']
+    return result.get('keys', []), None
+
+
+def iter_buckets(zone, zonegroup, page_size=1000):
+    """Iterate over buckets served under the provided zone and zonegroup.
+
+    Buckets are fetched page by page, so neither the time to the first
+    bucket nor the memory used depend on the number of buckets.
+
+    :param zone: Parent zone.
+    :type zone: str
+    :param zonegroup: Parent zonegroup.
+    :type zonegroup: str
+    :param page_size: Number of buckets to fetch per radosgw-admin call.
+    :type page_size: int
+    :returns: Iterator over bucket names
+    :rtype: Iterator[str]
+    :raises: subprocess.CalledProcessError
+    """
+    marker = None
+    while True:
+        buckets, marker = _bucket_page(zone, zonegroup, page_size, marker)
+        for bucket in buckets:
+            yield bucket
+        if not marker:
+            return
+
 
+def zone_has_any_bucket(zone, zonegroup):
+    """Check whether the provided zone and zonegroup pair has any bucket.
+
+    Only a single bucket is fetched, whatever the number of buckets.
+
+    :param zone: Parent zone.
+    :type zone: str
     :param zonegroup: Parent zonegroup.
     :type zonegroup: str
+    :rtype: bool
+    :raises: subprocess.CalledProcessError
+    """
+    return next(iter_buckets(zone, zonegroup, page_size=1), None) is not None
+
+
+def bucket_exists(bucket, zone, zonegroup):
+    """Check whether a bucket exists under the provided zone and zonegroup.
+
+    :param bucket: Bucket name.
+    :type bucket: str
     :param zone: Parent zone.
     :type zone: str
-    :returns: List of buckets found
-    :rtype: list
+    :param zonegroup: Parent zonegroup.
+    :type zonegroup: str
+    :rtype: bool
+    :raises: subprocess.CalledProcessError
     """
+    client = _local_admin_api(zone, zonegroup)
+    if client:
+        try:
+            client.get_metadata('bucket', bucket)
+            return True
+        except admin_api.AdminAPIError as e:
+            if e.status == 404:
+                return False
+            _admin_api_failed(e)
     cmd = [
         RGW_ADMIN, '--id={}'.format(_key_name()),
-        'bucket', 'list',
+        'metadata', 'get', 'bucket:{}'.format(bucket),
         '--rgw-zone={}'.format(zone),
         '--rgw-zonegroup={}'.format(zonegroup),
     ]
     try:
-        return json.loads(_check_output(cmd))
+        _check_output(cmd)
+    except subprocess.CalledProcessError as e:
+        if e.returncode == errno.ENOENT:
+            return False
+        raise
+    return True
+
+
+def list_buckets(zone, zonegroup):
+    """List Buckets served under the provided zone and zonegroup pair.
+
+    Prefer iter_buckets, zone_has_any_bucket or bucket_exists which do not
+    need to hold every bucket name at once.
+
+    :param zonegroup: Parent zonegroup.
+    :type zonegroup: str
+    :param zone: Parent zone.
+    :type zone: str
+    :returns: List of buckets found
+    :rtype: list
+    """
+    try:
+        return list(iter_buckets(zone, zonegroup))
     except subprocess.CalledProcessError:
-        hookenv.log("Bucket queried for incorrect zone({})-zonegroup({}) "
-                    "pair".format(zone, zonegroup), level=hookenv.ERROR)
+        log("Bucket queried for incorrect zone({})-zonegroup({}) "
+            "pair".format(zone, zonegroup), level=hookenv.ERROR)
         return None
-    except TypeError:
+    except (TypeError, AttributeError):
         return None
 
 
+@_invalidates('realm')
 def create_realm(name, default=False):
     """
     Create a new RADOS Gateway Realm.
@@ -209,6 +849,7 @@ def create_realm(name, default=False):
         return None
 
 
+@_invalidates('realm')
 def set_default_realm(name):
     """
     Set the default RADOS Gateway Realm
@@ -224,6 +865,7 @@ def set_default_realm(name):
     _check_call(cmd)
 
 
+@_invalidates('zonegroup')
 def create_zonegroup(name, endpoints, default=False, master=False, realm=None):
     """
     Create a new RADOS Gateway zone Group
@@ -259,6 +901,7 @@ def create_zonegroup(name, endpoints, default=False, master=False, realm=None):
         return None
 
 
+@_invalidates('zonegroup')
 def modify_zonegroup(name, endpoints=None, default=False,
                      master=False, realm=None):
     """Modify an existing RADOS Gateway zonegroup
@@ -298,6 +941,7 @@ def modify_zonegroup(name, endpoints=None, default=False,
         return None
 
 
+@_invalidates('zone', 'zonegroup')
 def create_zone(name, endpoints, default=False, master=False, zonegroup=None,
                 access_key=None, secret=None, readonly=False):
     """
@@ -344,6 +988,7 @@ def create_zone(name, endpoints, default=False, master=False, zonegroup=None,
         return None
 
 
+@_invalidates('zone', 'zonegroup')
 def modify_zone(name, endpoints=None, default=False, master=False,
                 access_key=None, secret=None, readonly=False,
                 realm=None, zonegroup=None):
@@ -412,11 +1057,12 @@ def get_zone_info(name, zonegroup=None):
     if zonegroup:
         cmd.append('--rgw-zonegroup={}'.format(zonegroup))
     try:
-        return json.loads(_check_output(cmd))
+        return json.loads(_cached_check_output('zone', cmd))
     except TypeError:
         return None
 
 
+@_invalidates('zone', 'zonegroup')
 def remove_zone_from_zonegroup(zone, zonegroup):
     """Remove RADOS Gateway zone from provided parent zonegroup
 
@@ -445,6 +1091,7 @@ def remove_zone_from_zonegroup(zone, zonegroup):
             .format(zone, zonegroup, result)) from exc
 
 
+@_invalidates('zone', 'zonegroup')
 def add_zone_to_zonegroup(zone, zonegroup):
     """Add RADOS Gateway zone to provided zonegroup
 
@@ -470,9 +1117,180 @@ def add_zone_to_zonegroup(zone, zonegroup):
             .format(zone, zonegroup, result)) from exc
 
 
+def get_period():
+    """Get the current period of the realm
+
+    The period map describes every zonegroup and zone of the realm. As
+    no period exists before a realm has been configured, failures are
+    expected and not retried.
+
+    :return: period configuration, None if no period could be read
+    :rtype: Optional[dict]
+    """
+    cmd = [
+        RGW_ADMIN, '--id={}'.format(_key_name()),
+        'period', 'get'
+    ]
+    try:
+        result = json.loads(subprocess.check_output(
+            cmd, stderr=subprocess.PIPE, timeout=_command_timeout()
+        ).decode('UTF-8'))
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired,
+            TypeError, ValueError):
+        return None
+    if not isinstance(result, dict):
+        return None
+    return result
+
+
+def get_period_epoch():
+    """Identify the current period of the realm
+
+    :return: period id and epoch, None if no period could be read
+    :rtype: Optional[Tuple[str, int]]
+    """
+    period = get_period()
+    try:
+        return (period['id'], period['epoch'])
+    except (TypeError, KeyError):
+        return None
+
+
+def _read_topology(period):
+    """Query the realm topology of the local cluster
+
+    :param period: current period, as returned by get_period()
+    :type period: Optional[dict]
+    :return: see topology()
+    :rtype: Dict[str, Any]
+    """
+    period = period or {}
+    return {
+        'realm_id': period.get('realm_id'),
+        'period': period.get('id'),
+        'epoch': period.get('epoch'),
+        'master_zonegroup': period.get('master_zonegroup'),
+        'master_zone': period.get('master_zone'),
+        'realms': plain_list('realm'),
+        'zonegroups': plain_list('zonegroup'),
+        'zones': plain_list('zone'),
+    }
+
+
+def topology():
+    """Snapshot of the realm topology of the local cluster
+
+    The snapshot is kept in unit data and revalidated once per hook with a
+    single period query: it is taken again when the current period id or
+    epoch differs from the one it was taken for, as any period commit
+    bumps the epoch, and when the charm creates or modifies a realm,
+    zonegroup or zone. Without a realm there is no period, the snapshot
+    is then kept until a period appears.
+
+    :return: realm id, current period id and epoch, ids of the master
+             zonegroup and zone, and names of the local realms, zonegroups
+             and zones
+    :rtype: Dict[str, Any]
+    """
+    global _topology
+    if _topology is not None:
+        return _topology
+    db = unitdata.kv()
+    period = get_period() or {}
+    snapshot = db.get(TOPOLOGY_KEY)
+    if (snapshot is None or
+            (snapshot.get('period'), snapshot.get('epoch')) !=
+            (period.get('id'), period.get('epoch'))):
+        snapshot = _read_topology(period)
+        db.set(TOPOLOGY_KEY, snapshot)
+        db.flush()
+    _topology = snapshot
+    return snapshot
+
+
+def invalidate_topology():
+    """Discard the realm topology snapshot"""
+    global _topology
+    _topology = None
+    db = unitdata.kv()
+    if db.get(TOPOLOGY_KEY) is not None:
+        db.unset(TOPOLOGY_KEY)
+        db.flush()
+
+
+class PeriodTransaction(object):
+    """Period commit requests coalesced by period_transaction()"""
+
+    def __init__(self):
+        self.pending = None
+        self.committed = False
+        self.epoch_changed = False
+
+    def record(self, fatal=True, zonegroup=None, zone=None, realm=None):
+        """Record a period commit request
+
+        Requests are merged; the commit is fatal if any request was and
+        the most recently provided zonegroup, zone and realm are used.
+        """
+        if self.pending is None:
+            self.pending = {'fatal': fatal, 'zonegroup': None,
+                            'zone': None, 'realm': None}
+        else:
+            self.pending['fatal'] = self.pending['fatal'] or fatal
+        for key, value in (('zonegroup', zonegroup), ('zone', zone),
+                           ('realm', realm)):
+            if value is not None:
+                self.pending[key] = value
+
+    def commit(self):
+        """Issue the coalesced period commit, if one was requested"""
+        if self.pending is None:
+            return
+        before = get_period_epoch()
+        update_period(**self.pending)
+        after = get_period_epoch()
+        self.committed = True
+        self.epoch_changed = after is None or before != after
+        log("Period {} after commit ({} -> {})".format(
+            'changed' if self.epoch_changed else 'unchanged', before, after),
+            level=hookenv.DEBUG)
+
+
+_period_transaction = None
+
+
+@contextlib.contextmanager
+def period_transaction():
+    """Coalesce period commits into a single commit
+
+    Calls to update_period() made within the context are recorded and a
+    single commit is issued when the context exits without error. Nested
+    contexts are folded into the outermost one. The yielded transaction
+    reports whether the commit changed the period epoch, so callers can
+    skip restarting gateways when it did not.
+
+    :return: transaction for the context
+    :rtype: Iterator[PeriodTransaction]
+    """
+    global _period_transaction
+    if _period_transaction is not None:
+        yield _period_transaction
+        return
+    transaction = _period_transaction = PeriodTransaction()
+    try:
+        yield transaction
+    finally:
+        _period_transaction = None
+    transaction.commit()
+
+
+@_invalidates('zone', 'zonegroup', 'sync')
 def update_period(fatal=True, zonegroup=None, zone=None, realm=None):
     """Update RADOS Gateway configuration period
 
+    Within a period_transaction() the commit is only recorded and issued
+    once the outermost transaction completes.
+
     :param fatal: In failure case, whether CalledProcessError is to be raised.
     :type fatal: boolean
     :param zonegroup: zonegroup name
@@ -482,6 +1300,10 @@ def update_period(fatal=True, zonegroup=None, zone=None, realm=None):
     :param realm: realm name
     :type realm: str
     """
+    if _period_transaction is not None:
+        _period_transaction.record(fatal=fatal, zonegroup=zonegroup,
+                                   zone=zone, realm=realm)
+        return
     cmd = [
         RGW_ADMIN, '--id={}'.format(_key_name()),
         'period', 'update', '--commit'
@@ -498,51 +1320,118 @@ def update_period(fatal=True, zonegroup=None, zone=None, realm=None):
         _call(cmd)
 
 
+@_invalidates('zone', 'zonegroup')
 def tidy_defaults():
     """
     Purge any default zonegroup and zone definitions
     """
-    if ('default' in list_zonegroups() and
-            'default' in list_zones()):
-        cmd = [
-            RGW_ADMIN, '--id={}'.format(_key_name()),
-            'zonegroup', 'remove',
-            '--rgw-zonegroup=default',
-            '--rgw-zone=default'
-        ]
-        _call(cmd)
-        update_period()
-
-    if 'default' in list_zones():
-        cmd = [
-            RGW_ADMIN, '--id={}'.format(_key_name()),
-            'zone', 'delete',
-            '--rgw-zone=default'
-        ]
-        _call(cmd)
-        update_period()
-
-    if 'default' in list_zonegroups():
-        cmd = [
-            RGW_ADMIN, '--id={}'.format(_key_name()),
-            'zonegroup', 'delete',
-            '--rgw-zonegroup=default'
-        ]
-        _call(cmd)
-        update_period()
+    with period_transaction():
+        if ('default' in list_zonegroups() and
+                'default' in list_zones()):
+            cmd = [
+                RGW_ADMIN, '--id={}'.format(_key_name()),
+                'zonegroup', 'remove',
+                '--rgw-zonegroup=default',
+                '--rgw-zone=default'
+            ]
+            _call(cmd)
+            update_period()
+
+        if 'default' in list_zones():
+            cmd = [
+                RGW_ADMIN, '--id={}'.format(_key_name()),
+                'zone', 'delete',
+                '--rgw-zone=default'
+            ]
+            _call(cmd)
+            update_period()
+
+        if 'default' in list_zonegroups():
+            cmd = [
+                RGW_ADMIN, '--id={}'.format(_key_name()),
+                'zonegroup', 'delete',
+                '--rgw-zonegroup=default'
+            ]
+            _call(cmd)
+            update_period()
+
+
+# radosgw-admin user info fails with EINVAL, or ENOENT in some releases,
+# and one of these messages when the user does not exist.
+USER_NOT_FOUND_ERRNOS = (errno.EINVAL, errno.ENOENT)
+USER_NOT_FOUND_MESSAGES = (
+    'no user info saved',
+    'no such user',
+)
+
+
+def get_user_info(username):
+    """
+    Get information about a RADOS Gateway user
 
+    The user is looked up by id, without listing all users.
 
-def get_user_creds(username):
+    :param username: username of the user
+    :type username: str
+    :return: user information including keys, None if the user does not
+             exist
+    :rtype: Optional[dict]
+    """
+    client = _admin_api()
+    if client:
+        try:
+            return client.get_user(username)
+        except admin_api.AdminAPIError as e:
+            if e.status == 404:
+                return None
+            _admin_api_failed(e)
     cmd = [
         RGW_ADMIN, '--id={}'.format(_key_name()),
         'user', 'info',
         '--uid={}'.format(username)
     ]
-    result = json.loads(_check_output(cmd))
+    try:
+        return json.loads(_cached_check_output('user', cmd))
+    except subprocess.CalledProcessError as e:
+        stderr = e.stderr or ''
+        if isinstance(stderr, bytes):
+            stderr = stderr.decode('UTF-8', 'replace')
+        if (e.returncode in USER_NOT_FOUND_ERRNOS and
+                any(message in stderr.lower()
+                    for message in USER_NOT_FOUND_MESSAGES)):
+            return None
+        raise
+
+
+def user_exists(username):
+    """
+    Check if a RADOS Gateway user exists
+
+    :param username: username of the user
+    :type username: str
+    :rtype: bool
+    """
+    return get_user_info(username) is not None
+
+
+def get_user_creds(username):
+    """
+    Get the credentials of a RADOS Gateway user
+
+    :param username: username of the user
+    :type username: str
+    :return: access key and secret, None for both if the user does not
+             exist
+    :rtype: (str, str)
+    """
+    result = get_user_info(username)
+    if result is None:
+        return (None, None)
     return (result['keys'][0]['access_key'],
             result['keys'][0]['secret_key'])
 
 
+@_invalidates('user')
 def suspend_user(username):
     """
     Suspend a RADOS Gateway user
@@ -550,22 +1439,37 @@ def suspend_user(username):
     :param username: username of user to create
     :type username: str
     """
-    if username not in list_users():
-        hookenv.log(
+    info = get_user_info(username)
+    if info is None:
+        log(
             "Cannot suspended user {}. User not found.".format(username),
             level=hookenv.DEBUG)
         return
-    cmd = [
-        RGW_ADMIN, '--id={}'.format(_key_name()),
-        'user', 'suspend',
-        '--uid={}'.format(username)
-    ]
-    _check_output(cmd)
-    hookenv.log(
+    if info.get('suspended'):
+        log(
+            "User {} already suspended".format(username),
+            level=hookenv.DEBUG)
+        return
+    client = _admin_api()
+    if client:
+        try:
+            client.suspend_user(username)
+        except admin_api.AdminAPIError as e:
+            _admin_api_failed(e)
+            client = None
+    if not client:
+        cmd = [
+            RGW_ADMIN, '--id={}'.format(_key_name()),
+            'user', 'suspend',
+            '--uid={}'.format(username)
+        ]
+        _check_output(cmd)
+    log(
         "Suspended user {}".format(username),
         level=hookenv.DEBUG)
 
 
+@_invalidates('user')
 def create_user(username, system_user=False):
     """
     Create a RADOS Gateway user
@@ -577,6 +1481,15 @@ def create_user(username, system_user=False):
     :return: access key and secret
     :rtype: (str, str)
     """
+    client = _admin_api()
+    if client:
+        try:
+            result = client.create_user(username, 'Synchronization User',
+                                        system=system_user)
+            return (result['keys'][0]['access_key'],
+                    result['keys'][0]['secret_key'])
+        except admin_api.AdminAPIError as e:
+            _admin_api_failed(e)
     cmd = [
         RGW_ADMIN, '--id={}'.format(_key_name()),
         'user', 'create',
@@ -605,6 +1518,7 @@ def create_system_user(username):
     return create_user(username, system_user=True)
 
 
+@_invalidates('realm', 'zone', 'zonegroup', 'sync')
 def pull_realm(url, access_key, secret):
     """
     Pull in a RADOS Gateway Realm from a master RGW instance
@@ -631,6 +1545,7 @@ def pull_realm(url, access_key, secret):
         return None
 
 
+@_invalidates('zone', 'zonegroup', 'sync')
 def pull_period(url, access_key, secret):
     """
     Pull in a RADOS Gateway period from a master RGW instance
@@ -657,6 +1572,7 @@ def pull_period(url, access_key, secret):
         return None
 
 
+@_invalidates('zone', 'zonegroup')
 def rename_zone(name, new_name, zonegroup):
     """Rename an existing RADOS Gateway zone
 
@@ -680,6 +1596,7 @@ def rename_zone(name, new_name, zonegroup):
     return 0 if result == 0 else None
 
 
+@_invalidates('zonegroup')
 def rename_zonegroup(name, new_name):
     """Rename an existing RADOS Gateway zonegroup
 
@@ -715,7 +1632,7 @@ def get_zonegroup_info(zonegroup):
         '--rgw-zonegroup={}'.format(zonegroup),
     ]
     try:
-        return json.loads(_check_output(cmd))
+        return json.loads(_cached_check_output('zonegroup', cmd))
     except TypeError:
         return None
 
@@ -731,10 +1648,22 @@ def get_sync_status():
         'sync', 'status',
     ]
     try:
-        return _check_output(cmd)
+        return _cached_check_output('sync', cmd)
     except subprocess.CalledProcessError:
-        hookenv.log("Failed to fetch sync status", level=hookenv.ERROR)
+        log("Failed to fetch sync status", level=hookenv.ERROR)
+        return None
+
+
+def get_sync_health():
+    """
+    Get the parsed sync status of the local zone
+    :returns: Sync status model, None if it could not be fetched
+    :rtype: Optional[sync_status.SyncStatus]
+    """
+    output = get_sync_status()
+    if output is None:
         return None
+    return sync_status.parse_sync_status(output)
 
 
 def is_multisite_configured(zone, zonegroup):
@@ -747,25 +1676,48 @@ def is_multisite_configured(zone, zonegroup):
     """
     local_zones = list_zones()
     if zone not in local_zones:
-        hookenv.log("zone {} not found in local zones {}"
-                    .format(zone, local_zones), level=hookenv.ERROR)
+        log("zone {} not found in local zones {}"
+            .format(zone, local_zones), level=hookenv.ERROR)
         return False
 
     local_zonegroups = list_zonegroups()
     if zonegroup not in local_zonegroups:
-        hookenv.log("zonegroup {} not found in local zonegroups {}"
-                    .format(zonegroup, local_zonegroups), level=hookenv.ERROR)
+        log("zonegroup {} not found in local zonegroups {}"
+            .format(zonegroup, local_zonegroups), level=hookenv.ERROR)
         return False
 
-    sync_status = get_sync_status()
-    hookenv.log("Multisite sync status {}".format(sync_status),
-                level=hookenv.DEBUG)
-    if sync_status is not None:
-        return ('data sync source:' in sync_status)
+    health = get_sync_health()
+    log("Multisite sync status {}".format(health),
+        level=hookenv.DEBUG)
+    if health is not None:
+        return health.is_multisite
 
     return False
 
 
+@_status_cached
+def cached_is_multisite_configured(zone, zonegroup):
+    """is_multisite_configured, kept across hooks by _status_cached
+
+    :rtype: Boolean
+    """
+    return is_multisite_configured(zone, zonegroup)
+
+
+@_status_cached
+def cached_sync_summary():
+    """Replication summary of the local zone, kept across hooks
+
+    :return: summary of the sync status, '' if the zone is not syncing with
+             other zones, None if the sync status could not be fetched
+    :rtype: Optional[str]
+    """
+    health = get_sync_health()
+    if health is None:
+        return None
+    return health.summary() if health.is_multisite else ''
+
+
 def get_local_zone(zonegroup):
     """Get local zone to provided parent zonegroup.
 
@@ -781,8 +1733,8 @@ def get_local_zone(zonegroup):
     zonegroup_info = get_zonegroup_info(zonegroup)
 
     if zonegroup_info is None:
-        hookenv.log("Failed to fetch zonegroup ({}) info".format(zonegroup),
-                    level=hookenv.ERROR)
+        log("Failed to fetch zonegroup ({}) info".format(zonegroup),
+            level=hookenv.ERROR)
         return None, None
 
     # zonegroup info always contains self name and zones list so fetching
@@ -793,7 +1745,7 @@ def get_local_zone(zonegroup):
         if zone in local_zones:
             return zone, master_zonegroup
 
-    hookenv.log(
+    log(
         "No local zone configured for zonegroup ({})".format(zonegroup),
         level=hookenv.ERROR
     )
@@ -824,7 +1776,7 @@ def rename_multisite_config(zonegroups, new_zonegroup_name,
         if new_zonegroup_name not in zonegroups:
             result = rename_zonegroup(zonegroups[0], new_zonegroup_name)
             if result is None:
-                hookenv.log(
+                log(
                     "Failed renaming zonegroup from {} to {}"
                     .format(zonegroups[0], new_zonegroup_name),
                     level=hookenv.ERROR
@@ -835,7 +1787,7 @@ def rename_multisite_config(zonegroups, new_zonegroup_name,
         if new_zone_name not in zones:
             result = rename_zone(zones[0], new_zone_name, new_zonegroup_name)
             if result is None:
-                hookenv.log(
+                log(
                     "Failed renaming zone from {} to {}"
                     .format(zones[0], new_zone_name), level=hookenv.ERROR
                 )
@@ -843,9 +1795,9 @@ def rename_multisite_config(zonegroups, new_zonegroup_name,
             mutation = True
 
     if mutation:
-        hookenv.log("Renamed zonegroup {} to {}, and zone {} to {}".format(
-                    zonegroups[0], new_zonegroup_name,
-                    zones[0], new_zone_name))
+        log("Renamed zonegroup {} to {}, and zone {} to {}".format(
+            zonegroups[0], new_zonegroup_name,
+            zones[0], new_zone_name))
         return True
 
     return False
@@ -866,7 +1818,7 @@ def modify_multisite_config(zone, zonegroup, endpoints=None, realm=None):
     """
     if modify_zonegroup(zonegroup, endpoints=endpoints, default=True,
                         master=True, realm=realm) is None:
-        hookenv.log(
+        log(
             "Failed configuring zonegroup {}".format(zonegroup),
             level=hookenv.ERROR
         )
@@ -874,17 +1826,457 @@ def modify_multisite_config(zone, zonegroup, endpoints=None, realm=None):
 
     if modify_zone(zone, endpoints=endpoints, default=True,
                    master=True, zonegroup=zonegroup, realm=realm) is None:
-        hookenv.log(
+        log(
             "Failed configuring zone {}".format(zone), level=hookenv.ERROR
         )
         return None
 
     update_period(zonegroup=zonegroup, zone=zone)
-    hookenv.log("Configured zonegroup {}, and zone {} for multisite".format(
-                zonegroup, zone))
+    log("Configured zonegroup {}, and zone {} for multisite".format(
+        zonegroup, zone))
     return True
 
 
+def get_realm_info(name):
+    """Fetch detailed info for the provided realm
+
+    :param name: realm name
+    :type name: str
+    :rtype: dict
+    """
+    cmd = [
+        RGW_ADMIN, '--id={}'.format(_key_name()),
+        'realm', 'get',
+        '--rgw-realm={}'.format(name),
+    ]
+    try:
+        return json.loads(_cached_check_output('realm', cmd))
+    except TypeError:
+        return None
+
+
+def create_zone_system_user(username, zone):
+    """Create the multisite system user and configure it on a zone
+
+    :param username: username of the system user
+    :type username: str
+    :param zone: zone the system user keys are set on
+    :type zone: str
+    :return: access key and secret, None if the user was not created
+    :rtype: Optional[Tuple[str, str]]
+    """
+    access_key, secret = create_system_user(username)
+    if access_key is None:
+        return None
+    modify_zone(zone, access_key=access_key, secret=secret)
+    return access_key, secret
+
+
+class MultisiteState(object):
+    """Multisite configuration observed on the local site
+
+    Each attribute holds the output of the matching radosgw-admin get
+    command, None if the entity does not exist.
+    """
+
+    def __init__(self, realm=None, period=None, zonegroup=None, zone=None):
+        self.realm = realm
+        self.period = period
+        self.zonegroup = zonegroup
+        self.zone = zone
+
+    def is_master(self, endpoints):
+        """Whether the zone is the committed master of the realm
+
+        :param endpoints: endpoints the zone and zonegroup must advertise
+        :type endpoints: list[str]
+        :rtype: Boolean
+        """
+        if None in (self.realm, self.period, self.zonegroup, self.zone):
+            return False
+        zone_endpoints = [
+            zone.get('endpoints')
+            for zone in self.zonegroup.get('zones', [])
+            if zone.get('id') == self.zone.get('id')
+        ]
+        return (
+            self.period.get('realm_id') == self.realm.get('id') and
+            self.period.get('master_zonegroup') == self.zonegroup.get('id') and
+            self.period.get('master_zone') == self.zone.get('id') and
+            self.zonegroup.get('endpoints') == endpoints and
+            zone_endpoints == [endpoints]
+        )
+
+
+def _info_or_none(func, *args):
+    """Run a get command, treating a failure as a missing entity"""
+    try:
+        return func(*args)
+    except subprocess.CalledProcessError:
+        return None
+
+
+def observe_multisite_state(realm, zonegroup, zone):
+    """Read the multisite configuration of the local site once
+
+    :param realm: realm name
+    :type realm: str
+    :param zonegroup: zonegroup name
+    :type zonegroup: str
+    :param zone: zone name
+    :type zone: str
+    :rtype: MultisiteState
+    """
+    return MultisiteState(
+        realm=_info_or_none(get_realm_info, realm),
+        period=get_period(),
+        zonegroup=_info_or_none(get_zonegroup_info, zonegroup),
+        zone=_info_or_none(get_zone_info, zone),
+    )
+
+
+class MultisiteOperation(object):
+    """An operation planned by the multisite reconciler"""
+
+    def __init__(self, name, description, func, *args, **kwargs):
+        self.name = name
+        self.description = description
+        self.required = kwargs.pop('required', False)
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.result = None
+
+    def apply(self):
+        """Run the operation
+
+        :return: whether the operation succeeded, only operations flagged
+                 as required are checked
+        :rtype: Boolean
+        """
+        log('Applying {}'.format(self.description),
+            level=hookenv.DEBUG)
+        self.result = self.func(*self.args, **self.kwargs)
+        return not (self.required and self.result is None)
+
+
+class _OperationFailed(Exception):
+    pass
+
+
+class MultisitePlan(object):
+    """Ordered operations reconciling the local multisite configuration
+
+    The operations are applied in order and followed by a single period
+    commit, issued with the provided keyword arguments of update_period().
+    A plan that has been aborted cannot be applied; the reason is kept in
+    the errors attribute.
+    """
+
+    def __init__(self, **commit):
+        self.operations = []
+        self.errors = []
+        self.commit = commit
+
+    def add(self, name, description, func, *args, **kwargs):
+        """Append an operation to the plan
+
+        :param name: short name, used to look up the result of the operation
+        :type name: str
+        :param description: radosgw-admin command the operation amounts to
+        :type description: str
+        :param func: callable performing the operation
+        :type func: Callable
+        :param required: whether a None result aborts the plan
+        :type required: bool
+        :rtype: MultisiteOperation
+        """
+        operation = MultisiteOperation(name, description, func,
+                                       *args, **kwargs)
+        self.operations.append(operation)
+        return operation
+
+    def abort(self, reason):
+        """Mark the plan as not applicable"""
+        log(reason, level=hookenv.ERROR)
+        self.errors.append(reason)
+
+    @property
+    def mutation(self):
+        """Whether applying the plan changes the configuration"""
+        return bool(self.operations) and not self.errors
+
+    def describe(self):
+        """Commands the plan amounts to, in order
+
+        :rtype: list[str]
+        """
+        steps = ['{} {}'.format(RGW_ADMIN, operation.description)
+                 for operation in self.operations]
+        if steps:
+            steps.append('{} period update --commit'.format(RGW_ADMIN))
+        return steps
+
+    def result(self, name):
+        """Result of the applied operation with the provided name"""
+        for operation in self.operations:
+            if operation.name == name:
+                return operation.result
+        return None
+
+    def apply(self):
+        """Apply the operations and commit the period once
+
+        :return: period transaction of the commit, None if the plan was
+                 aborted or an operation failed
+        :rtype: Optional[PeriodTransaction]
+        """
+        if self.errors:
+            return None
+        try:
+            with period_transaction() as period:
+                for operation in self.operations:
+                    if not operation.apply():
+                        raise _OperationFailed(operation.description)
+                if self.operations:
+                    update_period(**self.commit)
+        except _OperationFailed as e:
+            log('Failed to apply {}, not committing the period'
+                .format(e), level=hookenv.ERROR)
+            return None
+        return period
+
+
+def _endpoints_arg(endpoints):
+    return '--endpoints={}'.format(','.join(endpoints))
+
+
+def _plan_master(plan, state, realm, zonegroup, zone, endpoints):
+    """Plan the configuration of zonegroup and zone as realm master
+
+    Sites with buckets are migrated by renaming their only zonegroup and
+    zone, preserving existing buckets and their objects.
+    """
+    if state.is_master(endpoints):
+        return
+    if not check_cluster_has_buckets():
+        if state.zonegroup is None:
+            plan.add('create-zonegroup',
+                     'zonegroup create --rgw-zonegroup={} --rgw-realm={} {} '
+                     '--master --default'.format(
+                         zonegroup, realm, _endpoints_arg(endpoints)),
+                     create_zonegroup, zonegroup, endpoints=endpoints,
+                     default=True, master=True, realm=realm)
+        if state.zone is None:
+            plan.add('create-zone',
+                     'zone create --rgw-zone={} --rgw-zonegroup={} {} '
+                     '--master --default'.format(
+                         zone, zonegroup, _endpoints_arg(endpoints)),
+                     create_zone, zone, endpoints=endpoints,
+                     default=True, master=True, zonegroup=zonegroup)
+        return
+
+    log('Migrating to multisite with zone ({}) and zonegroup ({})'
+        .format(zone, zonegroup), level=hookenv.DEBUG)
+    zones = list_zones()
+    zonegroups = list_zonegroups()
+    if (len(zonegroups) > 1) and (zonegroup not in zonegroups):
+        plan.abort('Multiple zonegroups found {}, aborting.'
+                   .format(zonegroups))
+        return
+    if (len(zones) > 1) and (zone not in zones):
+        plan.abort('Multiple zones found {}, aborting.'.format(zones))
+        return
+    if zonegroup not in zonegroups or zone not in zones:
+        plan.add('rename',
+                 'zonegroup rename --rgw-zonegroup={} '
+                 '--zonegroup-new-name={}; zone rename --rgw-zone={} '
+                 '--zone-new-name={}'.format(
+                     zonegroups[0], zonegroup, zones[0], zone),
+                 rename_multisite_config, zonegroups, zonegroup,
+                 zones, zone, required=True)
+    plan.add('configure-master',
+             'zonegroup modify --rgw-zonegroup={} --rgw-realm={} {} '
+             '--master --default; zone modify --rgw-zone={} {} '
+             '--master --default'.format(
+                 zonegroup, realm, _endpoints_arg(endpoints),
+                 zone, _endpoints_arg(endpoints)),
+             modify_multisite_config, zone, zonegroup,
+             endpoints=endpoints, realm=realm, required=True)
+
+
+def plan_primary(realm, zonegroup, zone, endpoints, system_user,
+                 state=None):
+    """Plan the configuration of the local site as primary site
+
+    :param realm: realm name
+    :type realm: str
+    :param zonegroup: zonegroup name
+    :type zonegroup: str
+    :param zone: zone name
+    :type zone: str
+    :param endpoints: endpoints of the local site
+    :type endpoints: list[str]
+    :param system_user: name of the multisite system user
+    :type system_user: str
+    :param state: observed state, read when not provided
+    :type state: Optional[MultisiteState]
+    :rtype: MultisitePlan
+    """
+    if state is None:
+        state = observe_multisite_state(realm, zonegroup, zone)
+    plan = MultisitePlan(zonegroup=zonegroup, zone=zone)
+    if state.realm is None:
+        plan.add('create-realm',
+                 'realm create --rgw-realm={} --default'.format(realm),
+                 create_realm, realm, default=True)
+    _plan_master(plan, state, realm, zonegroup, zone, endpoints)
+    if not plan.errors and not user_exists(system_user):
+        plan.add('create-system-user',
+                 'user create --uid={} --system; zone modify --rgw-zone={} '
+                 '--access-key=<generated> --secret=<generated>'.format(
+                     system_user, zone),
+                 create_zone_system_user, system_user, zone)
+    return plan
+
+
+def plan_secondary(realm, zonegroup, zone, endpoints, url, access_key,
+                   secret, state=None):
+    """Plan the configuration of the local site as secondary site
+
+    :param realm: realm name
+    :type realm: str
+    :param zonegroup: zonegroup name
+    :type zonegroup: str
+    :param zone: zone name
+    :type zone: str
+    :param endpoints: endpoints of the local site
+    :type endpoints: list[str]
+    :param url: endpoint of the primary site
+    :type url: str
+    :param access_key: access key of the multisite system user
+    :type access_key: str
+    :param secret: secret of the multisite system user
+    :type secret: str
+    :param state: observed state, read when not provided
+    :type state: Optional[MultisiteState]
+    :rtype: MultisitePlan
+    """
+    if state is None:
+        state = observe_multisite_state(realm, zonegroup, zone)
+    plan = MultisitePlan(zonegroup=zonegroup, zone=zone)
+    if state.realm is not None and state.zone is not None:
+        return plan
+
+    # NOTE(utkarshbhatthere):
+    # A site with existing data can create inconsistencies when added as a
+    # secondary site for RGW. Hence it must be pristine.
+    if check_cluster_has_buckets():
+        plan.abort("Non-Pristine site can't be used as secondary")
+        return plan
+
+    pull_args = '--url={} --access-key={} --secret=<secret>'.format(
+        url, access_key)
+    credentials = {'url': url, 'access_key': access_key, 'secret': secret}
+    if state.realm is None:
+        plan.add('pull-realm', 'realm pull {}'.format(pull_args),
+                 pull_realm, **credentials)
+    plan.add('pull-period', 'period pull {}'.format(pull_args),
+             pull_period, **credentials)
+    if state.realm is None:
+        plan.add('set-default-realm',
+                 'realm default --rgw-realm={}'.format(realm),
+                 set_default_realm, realm)
+    if state.zone is None:
+        plan.add('create-zone',
+                 'zone create --rgw-zone={} --rgw-zonegroup={} {} '
+                 '--access-key={} --secret=<secret>'.format(
+                     zone, zonegroup, _endpoints_arg(endpoints),
+                     access_key),
+                 create_zone, zone, endpoints=endpoints,
+                 default=False, master=False, zonegroup=zonegroup,
+                 access_key=access_key, secret=secret)
+    return plan
+
+
+def plan_force_enable(current_zonegroup, current_zone, realm, zonegroup,
+                      zone, endpoints, state=None):
+    """Plan the promotion of an existing zone and zonegroup to master
+
+    :param current_zonegroup: name of the zonegroup to promote
+    :type current_zonegroup: str
+    :param current_zone: name of the zone to promote
+    :type current_zone: str
+    :param realm: realm name
+    :type realm: str
+    :param zonegroup: name the zonegroup is renamed to
+    :type zonegroup: str
+    :param zone: name the zone is renamed to
+    :type zone: str
+    :param endpoints: endpoints of the local site
+    :type endpoints: list[str]
+    :param state: observed state, read when not provided
+    :type state: Optional[MultisiteState]
+    :rtype: MultisitePlan
+    """
+    if state is None:
+        state = observe_multisite_state(realm, zonegroup, zone)
+    plan = MultisitePlan(zonegroup=zonegroup, zone=zone)
+    if (current_zonegroup, current_zone) != (zonegroup, zone):
+        plan.add('rename',
+                 'zonegroup rename --rgw-zonegroup={} '
+                 '--zonegroup-new-name={}; zone rename --rgw-zone={} '
+                 '--zone-new-name={}'.format(
+                     current_zonegroup, zonegroup, current_zone, zone),
+                 rename_multisite_config, [current_zonegroup], zonegroup,
+                 [current_zone], zone, required=True)
+    if plan.operations or not state.is_master(endpoints):
+        plan.add('configure-master',
+                 'zonegroup modify --rgw-zonegroup={} --rgw-realm={} {} '
+                 '--master --default; zone modify --rgw-zone={} {} '
+                 '--master --default'.format(
+                     zonegroup, realm, _endpoints_arg(endpoints),
+                     zone, _endpoints_arg(endpoints)),
+                 modify_multisite_config, zone, zonegroup,
+                 endpoints=endpoints, realm=realm, required=True)
+    return plan
+
+
+def plan_scaledown(realm, zonegroup, zone, state=None):
+    """Plan the removal of all other zones from the local zonegroup
+
+    :param realm: realm name
+    :type realm: str
+    :param zonegroup: zonegroup name
+    :type zonegroup: str
+    :param zone: zone name
+    :type zone: str
+    :param state: observed state, read when not provided
+    :type state: Optional[MultisiteState]
+    :rtype: MultisitePlan
+    """
+    if state is None:
+        state = observe_multisite_state(realm, zonegroup, zone)
+    plan = MultisitePlan(fatal=True, zonegroup=zonegroup, zone=zone,
+                         realm=realm)
+    for zone_info in (state.zonegroup or {}).get('zones', []):
+        if zone_info['name'] != zone:
+            plan.add('remove-zone',
+                     'zonegroup remove --rgw-zonegroup={} --rgw-zone={}'
+                     .format(zonegroup, zone_info['name']),
+                     remove_zone_from_zonegroup, zone_info['name'],
+                     zonegroup)
+    is_master = (state.zonegroup is not None and state.zone is not None and
+                 state.zonegroup.get('master_zone') == state.zone.get('id'))
+    if plan.operations or not is_master:
+        plan.add('modify-zone',
+                 'zone modify --rgw-zone={} --rgw-zonegroup={} '
+                 '--master --default'.format(zone, zonegroup),
+                 modify_zone, zone, default=True, master=True,
+                 zonegroup=zonegroup)
+    return plan
+
+
 def check_zone_has_buckets(zone, zonegroup):
     """Checks whether provided zone-zonegroup pair contains any bucket.
 
@@ -894,15 +2286,15 @@ def check_zone_has_buckets(zone, zonegroup):
     :type zonegroup: str
     :rtype: Boolean
     """
-    buckets = list_buckets(zone, zonegroup)
-    if buckets is not None:
-        return (len(buckets) > 0)
-    hookenv.log(
-        "Failed to query buckets for zone {} zonegroup {}"
-        .format(zone, zonegroup),
-        level=hookenv.WARNING
-    )
-    return False
+    try:
+        return zone_has_any_bucket(zone, zonegroup)
+    except subprocess.CalledProcessError:
+        log(
+            "Failed to query buckets for zone {} zonegroup {}"
+            .format(zone, zonegroup),
+            level=hookenv.WARNING
+        )
+        return False
 
 
 def check_zonegroup_has_buckets(zonegroup):
@@ -920,21 +2312,53 @@ def check_zonegroup_has_buckets(zonegroup):
 
     # If master zone is not configured for zonegroup
     if master_zone is None:
-        hookenv.log("No master zone configured for zonegroup {}"
-                    .format(master_zonegroup), level=hookenv.WARNING)
+        log("No master zone configured for zonegroup {}"
+            .format(master_zonegroup), level=hookenv.WARNING)
         return False
     return check_zone_has_buckets(master_zone, master_zonegroup)
 
 
 def check_cluster_has_buckets():
-    """Iteratively check if ANY zonegroup has buckets on cluster.
+    """Check if ANY zone local to the cluster has buckets.
+
+    Zonegroups and zones are taken from a single read of the current
+    period, falling back to querying each zonegroup when no realm is
+    configured yet. The check stops at the first zone found to have a
+    bucket. As buckets are never removed while migrating to multi-site,
+    a positive answer is remembered in unit data and not checked again.
 
     :rtype: Boolean
     """
-    for zonegroup in list_zonegroups():
-        if check_zonegroup_has_buckets(zonegroup):
-            return True
-    return False
+    db = unitdata.kv()
+    if db.get(CLUSTER_HAS_BUCKETS_KEY):
+        return True
+
+    period = get_period()
+    if period is None:
+        has_buckets = any(check_zonegroup_has_buckets(zonegroup)
+                          for zonegroup in list_zonegroups())
+    else:
+        local_zones = list_zones()
+        zonegroups = period.get('period_map', {}).get('zonegroups', [])
+        has_buckets = any(
+            check_zone_has_buckets(zone['name'], zonegroup['name'])
+            for zonegroup in zonegroups
+            for zone in zonegroup.get('zones', [])
+            if zone['name'] in local_zones)
+
+    if has_buckets:
+        db.set(CLUSTER_HAS_BUCKETS_KEY, True)
+        db.flush()
+    return has_buckets
+
+
+@_status_cached
+def cached_cluster_has_buckets():
+    """check_cluster_has_buckets, kept across hooks by _status_cached
+
+    :rtype: Boolean
+    """
+    return check_cluster_has_buckets()
 
 
 def list_sync_groups(bucket=None):
@@ -954,7 +2378,7 @@ def list_sync_groups(bucket=None):
     if bucket:
         cmd.append('--bucket={}'.format(bucket))
     try:
-        return json.loads(_check_output(cmd))
+        return json.loads(_cached_check_output('sync-group', cmd))
     except TypeError:
         return []
 
@@ -976,6 +2400,28 @@ def sync_group_exists(group_id, bucket=None):
     return False
 
 
+def find_sync_group(group_id, bucket=None):
+    """Find the sync policy group configuration in the list of groups.
+
+    The list of groups includes the configuration of every group, so a
+    single query tells both whether the group exists and how it is
+    configured.
+
+    :param group_id: Sync policy group id.
+    :type group_id: str
+    :param bucket: Bucket name. If this this given, the bucket level group
+        policy is returned.
+    :type bucket: str
+
+    :return: Sync policy group configuration, None if it does not exist.
+    :rtype: Optional[dict]
+    """
+    for group in list_sync_groups(bucket=bucket):
+        if group['key'] == group_id:
+            return group['val']
+    return None
+
+
 def get_sync_group(group_id, bucket=None):
     """Get the sync policy group configuration.
 
@@ -996,11 +2442,12 @@ def get_sync_group(group_id, bucket=None):
     if bucket:
         cmd.append('--bucket={}'.format(bucket))
     try:
-        return json.loads(_check_output(cmd))
+        return json.loads(_cached_check_output('sync-group', cmd))
     except TypeError:
         return None
 
 
+@_invalidates('sync-group')
 def create_sync_group(group_id, status, bucket=None):
     """Create a sync policy group.
 
@@ -1036,6 +2483,7 @@ def create_sync_group(group_id, status, bucket=None):
         return None
 
 
+@_invalidates('sync-group')
 def remove_sync_group(group_id, bucket=None):
     """Remove a sync group with the given group ID and optional bucket.
 
@@ -1082,15 +2530,14 @@ def is_sync_group_update_needed(group_id, flow_id, pipe_id, source_zone,
 
     :rtype: Boolean
     """
-    # Check if sync group exists.
-    if not sync_group_exists(group_id):
-        hookenv.log('Sync group "{}" not configured yet'.format(group_id))
+    group = find_sync_group(group_id)
+    if group is None:
+        log('Sync group "{}" not configured yet'.format(group_id))
         return True
-    group = get_sync_group(group_id)
 
     # Check sync group status.
     if group.get('status') != desired_status:
-        hookenv.log('Sync group "{}" status changed to "{}"'.format(
+        log('Sync group "{}" status changed to "{}"'.format(
             group["id"], desired_status))
         return True
 
@@ -1106,13 +2553,14 @@ def is_sync_group_update_needed(group_id, flow_id, pipe_id, source_zone,
     pipes = group.get('pipes', [])
     pipes_ids = [pipe['id'] for pipe in pipes]
     if pipe_id not in pipes_ids:
-        hookenv.log('Sync group pipe "{}" not created yet'.format(pipe_id))
+        log('Sync group pipe "{}" not created yet'.format(pipe_id))
         return True
 
     # Sync group configuration is up-to-date.
     return False
 
 
+@_invalidates('sync-group')
 def create_sync_group_flow(group_id, flow_id, flow_type, source_zone,
                            dest_zone):
     """Create a new sync group data flow with the given parameters.
@@ -1154,6 +2602,7 @@ def create_sync_group_flow(group_id, flow_id, flow_type, source_zone,
         return None
 
 
+@_invalidates('sync-group')
 def remove_sync_group_flow(group_id, flow_id, flow_type, source_zone=None,
                            dest_zone=None):
     """Remove a sync group data flow.
@@ -1190,6 +2639,7 @@ def remove_sync_group_flow(group_id, flow_id, flow_type, source_zone=None,
         return None
 
 
+@_invalidates('sync-group')
 def create_sync_group_pipe(group_id, pipe_id, source_zones, dest_zones,
                            source_bucket='*', dest_bucket='*', bucket=None):
     """Create a sync group pipe between source and destination zones.
@@ -1231,6 +2681,37 @@ def create_sync_group_pipe(group_id, pipe_id, source_zones, dest_zones,
         return None
 
 
+def get_sync_group_flow_type(group, flow_id):
+    """Get the type of a sync group data flow.
+
+    :param group: The sync policy group configuration.
+    :type group: dict
+    :param flow_id: The ID of the sync group flow.
+    :type flow_id: str
+
+    :return: Type of the data flow, None if it is not configured.
+    :rtype: Optional[str]
+    """
+    data_flow = group.get('data_flow', {})
+    symmetrical_flows_ids = [
+        flow['id'] for flow in data_flow.get('symmetrical', [])]
+    if flow_id in symmetrical_flows_ids:
+        return SYNC_FLOW_SYMMETRICAL
+
+    directional_flows_ids = [
+        # NOTE: Directional flows IDs are not present in the sync group
+        # configuration. We assume that the ID is a concatenation of the source
+        # zone and destination zone, as currently configured by the charm code.
+        # This is a safe assumption, because there are unique directional
+        # flows for each pair of zones.
+        "{}-{}".format(flow['source_zone'], flow['dest_zone'])
+        for flow in data_flow.get('directional', [])
+    ]
+    if flow_id in directional_flows_ids:
+        return SYNC_FLOW_DIRECTIONAL
+    return None
+
+
 def is_sync_group_flow_update_needed(group, flow_id, source_zone, dest_zone,
                                      desired_flow_type):
     """Check if the given sync group flow needs updating.
@@ -1248,44 +2729,161 @@ def is_sync_group_flow_update_needed(group, flow_id, source_zone, dest_zone,
 
     :rtype: Boolean
     """
-    symmetrical_flows = group['data_flow'].get('symmetrical', [])
-    symmetrical_flows_ids = [flow['id'] for flow in symmetrical_flows]
-
-    directional_flows = group['data_flow'].get('directional', [])
-    directional_flows_ids = [
-        # NOTE: Directional flows IDs are not present in the sync group
-        # configuration. We assume that the ID is a concatenation of the source
-        # zone and destination zone, as currently configured by the charm code.
-        # This is a safe assumption, because there are unique directional
-        # flows for each pair of zones.
-        "{}-{}".format(flow['source_zone'], flow['dest_zone'])
-        for flow in directional_flows
-    ]
-
-    data_flows_ids = symmetrical_flows_ids + directional_flows_ids
-    if flow_id not in data_flows_ids:
-        hookenv.log('Data flow "{}" not configured yet'.format(flow_id))
+    old_flow_type = get_sync_group_flow_type(group, flow_id)
+    if old_flow_type is None:
+        log('Data flow "{}" not configured yet'.format(flow_id))
         return True
 
     # Check if the flow type is consistent with the current configuration.
-    is_symmetrical = (desired_flow_type == SYNC_FLOW_SYMMETRICAL and
-                      flow_id in symmetrical_flows_ids)
-    is_directional = (desired_flow_type == SYNC_FLOW_DIRECTIONAL and
-                      flow_id in directional_flows_ids)
-    if is_symmetrical or is_directional:
+    if old_flow_type == desired_flow_type:
         # Data flow is consistent with the current configuration.
         return False
 
     # Data flow type has changed. We need to remove the old data flow.
-    hookenv.log('Data flow "{}" type changed to "{}"'.format(
+    log('Data flow "{}" type changed to "{}"'.format(
         flow_id, desired_flow_type))
-    old_flow_type = (
-        SYNC_FLOW_SYMMETRICAL if desired_flow_type == SYNC_FLOW_DIRECTIONAL
-        else SYNC_FLOW_DIRECTIONAL)
-    hookenv.log(
+    log(
         'Removing old data flow "{}" before configuring the new one'.format(
             flow_id))
     remove_sync_group_flow(
         group_id=group["id"], flow_id=flow_id, flow_type=old_flow_type,
         source_zone=source_zone, dest_zone=dest_zone)
     return True
+
+
+def _sync_flow_zones(flow_type, source_zone, dest_zone):
+    """Source and destination zones of a data flow and its pipe
+
+    :return: source zones and destination zones
+    :rtype: Tuple[list[str], list[str]]
+    """
+    if flow_type == SYNC_FLOW_DIRECTIONAL:
+        return [source_zone], [dest_zone]
+    return [source_zone, dest_zone], [source_zone, dest_zone]
+
+
+def _sync_flow_zones_arg(flow_type, source_zone, dest_zone):
+    if flow_type == SYNC_FLOW_DIRECTIONAL:
+        return '--source-zone={} --dest-zone={}'.format(source_zone,
+                                                        dest_zone)
+    return '--zones={},{}'.format(source_zone, dest_zone)
+
+
+def plan_sync_group(group_id, status, zonegroup, zone, secondaries,
+                    group=None):
+    """Plan the sync policy group flows and pipes towards secondary zones
+
+    The group configuration is read once and compared with the flows and
+    pipes desired for all secondary zones, so that the differences are
+    applied together and committed with a single period update. Flows and
+    pipes are named after their source and destination zones.
+
+    :param group_id: sync policy group id
+    :type group_id: str
+    :param status: desired status of the sync policy group
+    :type status: str
+    :param zonegroup: zonegroup name
+    :type zonegroup: str
+    :param zone: name of the local (source) zone
+    :type zone: str
+    :param secondaries: desired flow type by secondary zone name
+    :type secondaries: Dict[str, str]
+    :param group: sync policy group configuration, read when not provided
+    :type group: Optional[dict]
+    :rtype: MultisitePlan
+    """
+    if group is None:
+        group = find_sync_group(group_id)
+    plan = MultisitePlan(zonegroup=zonegroup, zone=zone)
+    if group is None or group.get('status') != status:
+        if group is None:
+            log('Sync group "{}" not configured yet'.format(
+                group_id))
+        else:
+            log('Sync group "{}" status changed to "{}"'.format(
+                group_id, status))
+        plan.add('create-sync-group',
+                 'sync group create --group-id={} --status={}'.format(
+                     group_id, status),
+                 create_sync_group, group_id=group_id, status=status)
+    group = group or {}
+    pipes = {pipe['id']: pipe for pipe in group.get('pipes', [])}
+    for secondary_zone, flow_type in sorted(secondaries.items()):
+        flow_id = pipe_id = '{}-{}'.format(zone, secondary_zone)
+        source_zones, dest_zones = _sync_flow_zones(flow_type, zone,
+                                                    secondary_zone)
+        old_flow_type = get_sync_group_flow_type(group, flow_id)
+        if old_flow_type is not None and old_flow_type != flow_type:
+            log('Data flow "{}" type changed to "{}"'.format(
+                flow_id, flow_type))
+            plan.add('remove-sync-group-flow',
+                     'sync group flow remove --group-id={} --flow-id={} '
+                     '--flow-type={} {}'.format(
+                         group_id, flow_id, old_flow_type,
+                         _sync_flow_zones_arg(old_flow_type, zone,
+                                              secondary_zone)),
+                     remove_sync_group_flow, group_id=group_id,
+                     flow_id=flow_id, flow_type=old_flow_type,
+                     source_zone=zone, dest_zone=secondary_zone)
+        if old_flow_type is None:
+            log('Data flow "{}" not configured yet'.format(flow_id))
+        if old_flow_type != flow_type:
+            plan.add('create-sync-group-flow',
+                     'sync group flow create --group-id={} --flow-id={} '
+                     '--flow-type={} {}'.format(
+                         group_id, flow_id, flow_type,
+                         _sync_flow_zones_arg(flow_type, zone,
+                                              secondary_zone)),
+                     create_sync_group_flow, group_id=group_id,
+                     flow_id=flow_id, flow_type=flow_type,
+                     source_zone=zone, dest_zone=secondary_zone)
+        pipe = pipes.get(pipe_id)
+        if (pipe is None or
+                sorted(pipe['source'].get('zones', [])) !=
+                sorted(source_zones) or
+                sorted(pipe['dest'].get('zones', [])) != sorted(dest_zones)):
+            log('Sync group pipe "{}" not configured yet'.format(
+                pipe_id))
+            plan.add('create-sync-group-pipe',
+                     'sync group pipe create --group-id={} --pipe-id={} '
+                     '--source-zones={} --source-bucket=* --dest-zones={} '
+                     '--dest-bucket=*'.format(
+                         group_id, pipe_id, ','.join(source_zones),
+                         ','.join(dest_zones)),
+                     create_sync_group_pipe, group_id=group_id,
+                     pipe_id=pipe_id, source_zones=source_zones,
+                     dest_zones=dest_zones)
+    return plan
+
+
+def benchmark_admin_backends(iterations=10):
+    """Measure per-call latency of the radosgw-admin and Admin Ops backends
+
+    Both backends are timed listing users, which is supported by each of
+    them and is side effect free. The query cache is bypassed so every
+    radosgw-admin call spawns a process.
+
+    :param iterations: number of calls to time per backend
+    :type iterations: int
+    :return: call durations in seconds, keyed by backend
+    :rtype: Dict[str, List[float]]
+    :raises: admin_api.AdminAPIError
+    """
+    client = admin_api_client()
+    if client is None:
+        raise admin_api.AdminAPIError(
+            'No credentials available for the Admin Ops API')
+
+    def _cli():
+        invalidate_cache('user')
+        _list('user')
+
+    results = {}
+    for backend, query in ((ADMIN_BACKEND_CLI, _cli),
+                           (ADMIN_BACKEND_REST, client.list_users)):
+        results[backend] = []
+        for _ in range(iterations):
+            start = time.monotonic()
+            query()
+            results[backend].append(time.monotonic() - start)
+    return results
@@ -0,0 +1,122 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+from charmhelpers.core import unitdata
+from charmhelpers.fetch import (
+    apt_cache,
+    apt_pkg,
+)
+
+# Rewritten by dpkg whenever a package is installed, upgraded or removed.
+DPKG_STATUS = '/var/lib/dpkg/status'
+
+# Unit data key of the installed versions and version comparisons known for
+# the current content of DPKG_STATUS.
+PKG_VERSIONS_KEY = 'pkg-versions'
+
+_versions = None
+
+
+def _dpkg_status_mtime():
+    """Modification time of the dpkg database
+
+    :return: modification time in nanoseconds, None if it does not exist
+    :rtype: Optional[int]
+    """
+    try:
+        return os.stat(DPKG_STATUS).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _load():
+    """Versions known for the current content of the dpkg database
+
+    They are read from unit data in the first call of a hook, and discarded
+    when packages have changed since they were stored.
+
+    :rtype: Dict[str, Any]
+    """
+    global _versions
+    mtime = _dpkg_status_mtime()
+    if _versions is None or _versions['mtime'] != mtime:
+        _versions = unitdata.kv().get(PKG_VERSIONS_KEY)
+        if _versions is None or _versions['mtime'] != mtime:
+            _versions = {'mtime': mtime, 'installed': {}, 'comparisons': {}}
+    return _versions
+
+
+def _save():
+    """Store the known versions in unit data for the following hooks"""
+    db = unitdata.kv()
+    db.set(PKG_VERSIONS_KEY, _versions)
+    db.flush()
+
+
+def installed_version(package):
+    """Installed version of a package
+
+    :param package: package name
+    :type package: str
+    :return: version string, None if the package is not installed
+    :rtype: Optional[str]
+    """
+    versions = _load()
+    installed = versions['installed']
+    if package not in installed:
+        pkgs = apt_cache().dpkg_list([package])
+        installed[package] = pkgs.get(package, {}).get('version')
+        _save()
+    return installed[package]
+
+
+def cmp_pkgrevno(package, revno):
+    """Compare supplied revno with the revno of the installed package
+
+    *  1 => Installed revno is greater than supplied arg
+    *  0 => Installed revno is the same as supplied arg
+    * -1 => Installed revno is less than supplied arg, or the package is
+            not installed
+
+    :param package: package name
+    :type package: str
+    :param revno: version to compare the installed version with
+    :type revno: str
+    :rtype: int
+    """
+    version = installed_version(package)
+    if version is None:
+        return -1
+    comparisons = _versions['comparisons']
+    key = '{} {}'.format(version, revno)
+    if key not in comparisons:
+        comparisons[key] = apt_pkg.version_compare(version, revno)
+        _save()
+    return comparisons[key]
+
+
+def get_upstream_version(package):
+    """Upstream version of an installed package
+
+    :param package: package name
+    :type package: str
+    :return: upstream version, None if the package is not installed
+    :rtype: Optional[str]
+    """
+    version = installed_version(package)
+    if version is None:
+        return None
+    return apt_pkg.upstream_version(version)
@@ -0,0 +1,148 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import configparser
+import os
+import subprocess
+
+from charmhelpers.core import hookenv
+
+from log_sink import log
+
+CEPH = 'ceph'
+ADMIN_SOCKET = '/var/run/ceph/ceph-{}.asok'
+
+# Options a running radosgw observes, which are applied through its admin
+# socket instead of restarting it. Changes to any other option, and removed
+# options, require a restart.
+RUNTIME_OPTIONS = frozenset((
+    'clog_to_syslog',
+    'err_to_stderr',
+    'err_to_syslog',
+    'log_max_recent',
+    'log_to_stderr',
+    'log_to_syslog',
+))
+RUNTIME_OPTION_PREFIXES = ('debug_',)
+
+# Reported by 'config set' for options without an observer in the daemon.
+NOT_OBSERVED = 'not observed'
+
+
+def option_name(name):
+    """Canonical name of a ceph option
+
+    Spaces, dashes and underscores are equivalent in option names.
+
+    :param name: option name, e.g. 'debug rgw'
+    :type name: str
+    :rtype: str
+    """
+    return '_'.join(name.strip().lower().replace('-', ' ').replace(
+        '_', ' ').split())
+
+
+def parse_ceph_conf(text):
+    """Parse the content of a ceph.conf
+
+    :param text: file content
+    :type text: str
+    :return: options of each section, by canonical option name
+    :rtype: Dict[str, Dict[str, str]]
+    """
+    parser = configparser.ConfigParser(
+        delimiters=('=',), comment_prefixes=('#', ';'), strict=False,
+        interpolation=None, default_section='juju-charm-default')
+    parser.optionxform = option_name
+    parser.read_string(text)
+    return {section: dict(parser.items(section, raw=True))
+            for section in parser.sections()}
+
+
+def daemon_options(conf, client):
+    """Options a daemon reads from a parsed ceph.conf
+
+    :param conf: parsed ceph.conf
+    :type conf: Dict[str, Dict[str, str]]
+    :param client: name of the daemon, e.g. 'client.rgw.juju-4'
+    :type client: str
+    :return: options of the global section overridden by its own section
+    :rtype: Dict[str, str]
+    """
+    options = dict(conf.get('global', {}))
+    options.update(conf.get(client, {}))
+    return options
+
+
+def is_runtime_option(name):
+    """Whether a running radosgw observes changes to an option
+
+    :param name: canonical option name
+    :type name: str
+    :rtype: bool
+    """
+    return name in RUNTIME_OPTIONS or name.startswith(RUNTIME_OPTION_PREFIXES)
+
+
+def classify_changes(old, new):
+    """Split the changes between two option sets by how they are applied
+
+    :param old: options the daemon is running with
+    :type old: Dict[str, str]
+    :param new: options to apply
+    :type new: Dict[str, str]
+    :return: new values of the changed runtime options, and the names of the
+             changed options requiring a restart
+    :rtype: Tuple[Dict[str, str], List[str]]
+    """
+    runtime = {}
+    restart = []
+    for name in sorted(set(old) | set(new)):
+        if old.get(name) == new.get(name):
+            continue
+        if name in new and is_runtime_option(name):
+            runtime[name] = new[name]
+        else:
+            restart.append(name)
+    return runtime, restart
+
+
+def apply_runtime_options(client, options):
+    """Set options of a running daemon through its admin socket
+
+    :param client: name of the daemon, e.g. 'client.rgw.juju-4'
+    :type client: str
+    :param options: values of the options to set
+    :type options: Dict[str, str]
+    :return: whether all the options were set and are observed by the daemon
+    :rtype: bool
+    """
+    asok = ADMIN_SOCKET.format(client)
+    if not os.path.exists(asok):
+        log('Admin socket {} not found'.format(asok), level=hookenv.WARNING)
+        return False
+    for name, value in sorted(options.items()):
+        cmd = [CEPH, '--admin-daemon', asok, 'config', 'set', name, value]
+        try:
+            output = subprocess.check_output(
+                cmd, stderr=subprocess.STDOUT).decode('UTF-8')
+        except (OSError, subprocess.CalledProcessError) as e:
+            log('Unable to set {} through {}: {}'.format(name, asok, e),
+                level=hookenv.WARNING)
+            return False
+        if NOT_OBSERVED in output:
+            log('{} is not observed by {}'.format(name, client),
+                level=hookenv.WARNING)
+            return False
+    return True
@@ -0,0 +1,273 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# NOTE: this module only depends on the standard library so that it can be
+# shipped along with the monitoring checks run outside of the charm.
+
+import datetime
+import re
+
+# Formats of the timestamps printed by radosgw-admin: the current time is
+# printed in UTC, e.g. '2024-02-14T10:53:01Z', changes in local time with
+# the UTC offset, e.g. '2024-02-14T10:52:54.372512+0000'.
+SYNC_TIME_FORMATS = (
+    '%Y-%m-%dT%H:%M:%S.%f%z',
+    '%Y-%m-%dT%H:%M:%S%z',
+    '%Y-%m-%dT%H:%M:%S.%fZ',
+    '%Y-%m-%dT%H:%M:%SZ',
+)
+# Timestamps printed by radosgw-admin before Nautilus, in local time without
+# offset, e.g. '2017-11-21 19:57:44.0.286307s'.
+_LEGACY_TIME_RE = re.compile(
+    r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})(?:\.0)?\.(\d{1,6})\d*s?$')
+
+_SHARDS_RE = re.compile(r'^(full|incremental) sync: (\d+)/(\d+) shards')
+_BEHIND_RE = re.compile(r'is behind on (\d+) shards?')
+_RECOVERING_RE = re.compile(r'^(\d+) shards? (?:is|are) recovering')
+_OLDEST_RE = re.compile(
+    r'^oldest incremental change not applied: (\S+(?: \d\S*)?)')
+_SOURCE_RE = re.compile(r'^data sync source: (\S+)(?: \(([^)]*)\))?:?\s*(.*)$')
+_NAMED_RE = re.compile(r'^(\S+) \(([^)]*)\)')
+
+
+def parse_sync_time(value):
+    """Parse a timestamp reported by radosgw-admin
+
+    :param value: timestamp, e.g. '2024-02-14T10:52:54.372512+0000'
+    :type value: str
+    :return: naive UTC timestamp, None if it could not be parsed
+    :rtype: Optional[datetime.datetime]
+    """
+    value = value.strip()
+    for fmt in SYNC_TIME_FORMATS:
+        try:
+            timestamp = datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(
+                datetime.timezone.utc).replace(tzinfo=None)
+        return timestamp
+    match = _LEGACY_TIME_RE.match(value)
+    if match:
+        timestamp = datetime.datetime.strptime(
+            match.group(1), '%Y-%m-%d %H:%M:%S').replace(
+                microsecond=int(match.group(2).ljust(6, '0')))
+        # Naive timestamps are taken as local time by astimezone().
+        return timestamp.astimezone(
+            datetime.timezone.utc).replace(tzinfo=None)
+    return None
+
+
+class SyncSourceStatus(object):
+    """Sync state of the metadata log or of the data log of a source zone"""
+
+    def __init__(self, source=None, source_name=None):
+        self.source = source
+        self.source_name = source_name
+        self.state = None
+        self.full_sync = None
+        self.incremental_sync = None
+        self.behind_shards = 0
+        self.recovering_shards = 0
+        self.oldest_change = None
+        self.caught_up = False
+        self.errors = []
+
+    @property
+    def healthy(self):
+        """Whether sync from this source is progressing without errors"""
+        return not self.errors and self.state != 'failed'
+
+    def __repr__(self):
+        return ('SyncSourceStatus(source={!r}, state={!r}, behind_shards={}, '
+                'recovering_shards={}, oldest_change={!r})'.format(
+                    self.source_name or self.source, self.state,
+                    self.behind_shards, self.recovering_shards,
+                    self.oldest_change))
+
+
+class SyncStatus(object):
+    """Parsed ``radosgw-admin sync status`` report
+
+    The metadata attribute describes metadata sync of the local zone, the
+    data_sources attribute the data sync from each of its peer zones.
+    """
+
+    def __init__(self):
+        self.realm = None
+        self.zonegroup = None
+        self.zone = None
+        self.current_time = None
+        self.metadata = SyncSourceStatus()
+        self.data_sources = []
+
+    def __repr__(self):
+        return ('SyncStatus(zone={!r}, metadata={!r}, data_sources={!r})'
+                .format(self.zone, self.metadata, self.data_sources))
+
+    @property
+    def is_multisite(self):
+        """Whether the zone is syncing data from any other zone"""
+        return bool(self.data_sources)
+
+    @property
+    def metadata_is_master(self):
+        """Whether the zone is the metadata master of the zonegroup"""
+        return (self.metadata.state or '').startswith('no sync')
+
+    @property
+    def data_behind_shards(self):
+        """Number of data log shards behind, summed over all sources"""
+        return sum(source.behind_shards for source in self.data_sources)
+
+    @property
+    def recovering_shards(self):
+        """Number of data log shards recovering, summed over all sources"""
+        return sum(source.recovering_shards for source in self.data_sources)
+
+    @property
+    def oldest_change(self):
+        """Timestamp of the oldest change not yet applied from any log
+
+        :rtype: Optional[datetime.datetime]
+        """
+        changes = [source.oldest_change
+                   for source in [self.metadata] + self.data_sources
+                   if source.oldest_change is not None]
+        return min(changes) if changes else None
+
+    def lag(self, now=None):
+        """Age of the oldest change not yet applied
+
+        :param now: reference time, defaults to the time of the report
+        :type now: Optional[datetime.datetime]
+        :return: replication lag, None when caught up
+        :rtype: Optional[datetime.timedelta]
+        """
+        oldest = self.oldest_change
+        if oldest is None:
+            return None
+        now = now or self.current_time or datetime.datetime.utcnow()
+        return max(now - oldest, datetime.timedelta(0))
+
+    @property
+    def errors(self):
+        """Errors reported for metadata sync or any data sync source"""
+        return self.metadata.errors + [
+            error for source in self.data_sources for error in source.errors]
+
+    @property
+    def caught_up(self):
+        """Whether metadata and data sync have no outstanding changes"""
+        return (not self.errors and
+                self.metadata.behind_shards == 0 and
+                self.data_behind_shards == 0 and
+                self.recovering_shards == 0)
+
+    def summary(self):
+        """One line description of the replication state
+
+        :rtype: str
+        """
+        if not self.is_multisite:
+            return 'multi-site sync not configured'
+        if self.errors:
+            return 'multi-site sync error: {}'.format(self.errors[0])
+        if self.caught_up:
+            return 'multi-site sync caught up'
+        parts = []
+        if self.metadata.behind_shards:
+            parts.append('metadata behind on {} shards'.format(
+                self.metadata.behind_shards))
+        if self.data_behind_shards:
+            parts.append('data behind on {} shards'.format(
+                self.data_behind_shards))
+        if self.recovering_shards:
+            parts.append('{} shards recovering'.format(
+                self.recovering_shards))
+        lag = self.lag()
+        if lag is not None:
+            parts.append('lag {}s'.format(int(lag.total_seconds())))
+        return 'multi-site sync {}'.format(', '.join(parts))
+
+
+def _parse_source_line(status, line):
+    """Parse a line of the metadata or data sync section of a source"""
+    match = _SHARDS_RE.match(line)
+    if match:
+        setattr(status, '{}_sync'.format(match.group(1)),
+                (int(match.group(2)), int(match.group(3))))
+        return
+    match = _BEHIND_RE.search(line)
+    if match:
+        status.behind_shards = int(match.group(1))
+        return
+    match = _RECOVERING_RE.match(line)
+    if match:
+        status.recovering_shards = int(match.group(1))
+        return
+    match = _OLDEST_RE.match(line)
+    if match:
+        status.oldest_change = parse_sync_time(match.group(1))
+        return
+    if 'caught up with' in line:
+        status.caught_up = True
+        return
+    if 'failed' in line or 'ERROR' in line:
+        status.errors.append(line)
+        return
+    if line.startswith(('behind shards:', 'recovering shards:')):
+        return
+    if status.state is None:
+        status.state = line
+
+
+def parse_sync_status(output):
+    """Parse the output of ``radosgw-admin sync status``
+
+    :param output: command output
+    :type output: str
+    :rtype: SyncStatus
+    """
+    status = SyncStatus()
+    section = None
+    for raw_line in output.splitlines():
+        line = raw_line.strip()
+        if not line:
+            continue
+        for key in ('realm', 'zonegroup', 'zone'):
+            if line.startswith(key + ' '):
+                match = _NAMED_RE.match(line[len(key) + 1:].strip())
+                if match:
+                    setattr(status, key, match.group(2))
+                break
+        else:
+            if line.startswith('current time '):
+                status.current_time = parse_sync_time(
+                    line[len('current time '):])
+            elif line.startswith('metadata sync'):
+                section = status.metadata
+                rest = line[len('metadata sync'):].strip(' :')
+                if rest:
+                    _parse_source_line(section, rest)
+            elif line.startswith('data sync source:'):
+                match = _SOURCE_RE.match(line)
+                section = SyncSourceStatus(match.group(1), match.group(2))
+                status.data_sources.append(section)
+                if match.group(3):
+                    _parse_source_line(section, match.group(3))
+            elif section is not None:
+                _parse_source_line(section, line)
+    return status
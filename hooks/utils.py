@@ -12,28 +12,42 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
 import json
 import os
 import socket
 import subprocess
+import time
+import urllib.request
 
 from collections import OrderedDict
 from copy import deepcopy
 
-import boto3
-
 import ceph_radosgw_context
+import haproxy_admin
 import multisite
+import runtime_config
+
+from log_sink import log
+from pkg_versions import (
+    cmp_pkgrevno,
+    get_upstream_version,
+)
 
 from charmhelpers.core.hookenv import (
+    DEBUG,
+    ERROR,
+    WARNING,
+    is_leader,
+    local_unit,
     relation_get,
     relation_ids,
     related_units,
     application_version_set,
     config,
     leader_get,
-    leader_set,
-    log,
+    status_get,
+    status_set,
 )
 from charmhelpers.contrib.openstack import (
     context,
@@ -45,15 +59,16 @@ from charmhelpers.contrib.openstack.utils import (
     resume_unit,
 )
 from charmhelpers.contrib.hahelpers.cluster import (
+    determine_api_port,
     get_hacluster_config,
     https,
 )
 from charmhelpers.core.host import (
-    cmp_pkgrevno,
     lsb_release,
     CompareHostReleases,
     init_is_systemd,
     service,
+    service_restart,
     service_running,
 )
 from charmhelpers.fetch import (
@@ -62,9 +77,8 @@ from charmhelpers.fetch import (
     apt_pkg,
     apt_update,
     add_source,
-    filter_installed_packages,
-    get_upstream_version,
 )
+from charmhelpers.core import hookenv
 from charmhelpers.core import unitdata
 
 # The interface is said to be satisfied if anyone of the interfaces in the
@@ -150,23 +164,220 @@ def restart_map():
                         if v['services']])
 
 
+RENDERED_CONFIGS_KEY = 'rendered-configs'
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _read_file(path):
+    """Content of a file, None if it cannot be read"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def context_fingerprint(ctxt, source):
+    """Fingerprint of a template context and of the template it renders
+
+    :param ctxt: template context
+    :type ctxt: dict
+    :param source: template source
+    :type source: str
+    :return: fingerprint, None if the context cannot be serialized
+    :rtype: Optional[str]
+    """
+    try:
+        data = json.dumps([ctxt, source], sort_keys=True)
+    except (TypeError, ValueError):
+        return None
+    return _sha256(data.encode('UTF-8'))
+
+
+class FingerprintingConfigRenderer(templating.OSConfigRenderer):
+    """OSConfigRenderer skipping the configs whose inputs did not change
+
+    The fingerprint of the context and template of each written config, and
+    the hash of the content written, are kept in unitdata. A config is only
+    rendered when its fingerprint changed or its file no longer holds what
+    was written, and the file is only rewritten when the rendered content
+    differs from what it holds, so that its mtime is left untouched.
+
+    The content configs held before they were first rewritten during the
+    hook is kept in the replaced attribute, empty for configs that did not
+    exist.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(FingerprintingConfigRenderer, self).__init__(*args, **kwargs)
+        self.replaced = {}
+
+    def _load_template(self, config_file):
+        """Template for a config and its source
+
+        :param config_file: path of the config
+        :type config_file: str
+        :rtype: Tuple[jinja2.Template, str]
+        """
+        ostmpl = self.templates[config_file]
+        if ostmpl.is_string_template:
+            return (self._get_template_from_string(ostmpl),
+                    ostmpl.config_template)
+        # Same lookup as OSConfigRenderer.render(): by basename first, then
+        # by munged full path, eg /etc/apache2/apache2.conf ->
+        # etc_apache2_apache2.conf
+        names = (os.path.basename(config_file),
+                 '_'.join(config_file.split('/')[1:]))
+        for name in names:
+            try:
+                template = self._get_template(name)
+            except templating.exceptions.TemplateNotFound:
+                continue
+            with open(template.filename) as f:
+                return template, f.read()
+        log('Could not load template from {} by {} or {}.'
+            ''.format(self.templates_dir, *names), level=ERROR)
+        raise templating.exceptions.TemplateNotFound(names[-1])
+
+    def write(self, config_file):
+        """
+        Write a single config file, raises if config file is not registered.
+        """
+        if config_file not in self.templates:
+            log('Config not registered: %s' % config_file, level=ERROR)
+            raise templating.OSConfigException
+
+        ctxt = self.templates[config_file].context()
+        template, source = self._load_template(config_file)
+        fingerprint = context_fingerprint(ctxt, source)
+
+        db = unitdata.kv()
+        rendered = db.get(RENDERED_CONFIGS_KEY) or {}
+        previous = rendered.get(config_file) or {}
+        content = _read_file(config_file)
+        current = _sha256(content) if content is not None else None
+        if (fingerprint is not None and
+                previous.get('fingerprint') == fingerprint and
+                previous.get('sha256') == current):
+            log('Context and template of {} unchanged, not rendering'
+                .format(config_file), level=DEBUG)
+            return
+
+        _out = template.render(ctxt).encode('UTF-8')
+        digest = _sha256(_out)
+        if digest == current:
+            log('Rendered {} unchanged, not writing'.format(config_file),
+                level=DEBUG)
+        else:
+            self.replaced.setdefault(config_file, content or b'')
+            with open(config_file, 'wb') as out:
+                out.write(_out)
+            log('Wrote template %s.' % config_file)
+
+        rendered[config_file] = {'fingerprint': fingerprint, 'sha256': digest}
+        db.set(RENDERED_CONFIGS_KEY, rendered)
+        db.flush()
+
+
+def config_contexts():
+    """Context generators of each config file managed by the charm
+
+    :rtype: Dict[str, List[context.OSContextGenerator]]
+    """
+    contexts = OrderedDict((cfg, list(rscs['contexts']))
+                           for cfg, rscs in resource_map().items())
+    if cmp_pkgrevno('radosgw', '0.55') >= 0:
+        # Add keystone configuration if found
+        contexts[CEPH_CONF].append(
+            ceph_radosgw_context.IdentityServiceContext()
+        )
+    return contexts
+
+
 # Hardcoded to icehouse to enable use of charmhelper templating/context tools
 # Ideally these function would support non-OpenStack services
 def register_configs(release='icehouse'):
+    configs = FingerprintingConfigRenderer(templates_dir=TEMPLATES,
+                                           openstack_release=release)
+    for cfg, ctxts in config_contexts().items():
+        configs.register(cfg, [ceph_radosgw_context.MemoizedContext(ctxt)
+                               for ctxt in ctxts])
+    return configs
+
+
+def register_status_configs(release='icehouse'):
+    """Register the contexts of the interfaces checked by assess_status
+
+    The workload status only depends on which of the required and optional
+    interfaces have complete contexts; the other contexts are not evaluated.
+    The mon context does not look up the multi-site topology, which does not
+    affect its completeness, so that assessing the status does not run
+    radosgw-admin.
+
+    :rtype: templating.OSConfigRenderer
+    """
+    interfaces = set()
+    for required in (list(REQUIRED_INTERFACES.values()) +
+                     list(get_optional_interfaces().values())):
+        interfaces.update(required)
     configs = templating.OSConfigRenderer(templates_dir=TEMPLATES,
                                           openstack_release=release)
-    CONFIGS = resource_map()
-    pkg = 'radosgw'
-    if not filter_installed_packages([pkg]) and cmp_pkgrevno(pkg, '0.55') >= 0:
-        # Add keystone configuration if found
-        CONFIGS[CEPH_CONF]['contexts'].append(
-            ceph_radosgw_context.IdentityServiceContext()
-        )
-    for cfg, rscs in CONFIGS.items():
-        configs.register(cfg, rscs['contexts'])
+    for cfg, ctxts in config_contexts().items():
+        ctxts = [ceph_radosgw_context.MonContext(query_topology=False)
+                 if isinstance(ctxt, ceph_radosgw_context.MonContext)
+                 else ctxt
+                 for ctxt in ctxts
+                 if interfaces.intersection(ctxt.interfaces)]
+        if ctxts:
+            configs.register(cfg, [ceph_radosgw_context.MemoizedContext(ctxt)
+                                   for ctxt in ctxts])
     return configs
 
 
+class LazyConfigRenderer(object):
+    """Config renderer registered on first use
+
+    Registering the configs evaluates all their contexts, which most hooks
+    never need to do; the renderer is only created when one of its
+    attributes is first accessed.
+    """
+
+    def __init__(self, factory=register_configs, status_factory=None):
+        """
+        :param factory: callable creating the renderer
+        :type factory: Callable[[], templating.OSConfigRenderer]
+        :param status_factory: callable creating a renderer with only the
+                               contexts assess_status checks
+        :type status_factory: Optional[Callable[[],
+                                                templating.OSConfigRenderer]]
+        """
+        self.factory = factory
+        self.status_factory = status_factory
+        self._configs = None
+        self._status_configs = None
+
+    def __getattr__(self, name):
+        if self._configs is None:
+            self._configs = self.factory()
+        return getattr(self._configs, name)
+
+    def status_configs(self):
+        """Renderer to assess the workload status with
+
+        :return: the renderer if the configs have been registered, otherwise
+                 the renderer created by status_factory
+        :rtype: Union[LazyConfigRenderer, templating.OSConfigRenderer]
+        """
+        if self._configs is not None or self.status_factory is None:
+            return self
+        if self._status_configs is None:
+            self._status_configs = self.status_factory()
+        return self._status_configs
+
+
 def services():
     """Returns a list of services associate with this charm."""
     _services = []
@@ -247,9 +458,9 @@ def check_optional_config_and_relations(configs):
         if primary_rids:
             # Migration: The system is not multisite already.
             if (ready_for_service(legacy=False) and
-                not multisite.is_multisite_configured(config('zone'),
-                                                      config('zonegroup'))):
-                if multisite.check_cluster_has_buckets():
+                not multisite.cached_is_multisite_configured(
+                    config('zone'), config('zonegroup'))):
+                if multisite.cached_cluster_has_buckets():
                     zones, zonegroups = get_zones_zonegroups()
                     status_msg = "Multiple zone or zonegroup configured, " \
                                  "use action 'config-multisite-values' to " \
@@ -273,16 +484,16 @@ def check_optional_config_and_relations(configs):
         if secondary_rids:
             # Migration: The system is not multisite already.
             if (ready_for_service(legacy=False) and
-                not multisite.is_multisite_configured(config('zone'),
-                                                      config('zonegroup'))):
-                if multisite.check_cluster_has_buckets():
+                not multisite.cached_is_multisite_configured(
+                    config('zone'), config('zonegroup'))):
+                if multisite.cached_cluster_has_buckets():
                     return ('blocked',
                             "Non-Pristine RGW site can't be used as secondary")
 
             multisite_ready = False
             for rid in secondary_rids:
                 for unit in related_units(rid):
-                    if relation_get('url', unit=unit, rid=rid):
+                    if relation_data(rid, unit).get('url'):
                         multisite_ready = True
                         continue
             if not multisite_ready:
@@ -301,6 +512,11 @@ def check_optional_config_and_relations(configs):
         return ('blocked', "os-public-hostname must have a value "
                            "when virtual hosted bucket is enabled")
 
+    if config('rgw-admin-backend') not in multisite.ADMIN_BACKENDS:
+        return ('blocked', 'Invalid configuration: rgw-admin-backend '
+                           'must be one of {}'
+                           .format(', '.join(multisite.ADMIN_BACKENDS)))
+
     # return 'unknown' as the lowest priority to not clobber an existing
     # status.
     return 'unknown', ''
@@ -334,9 +550,34 @@ def assess_status(configs):
     @returns None - this function is executed for its side-effect
     """
     assess_status_func(configs)()
+    state, message = status_get()
+    if state == 'active':
+        sync_message = multisite_sync_message()
+        if sync_message:
+            status_set(state, '{}, {}'.format(message, sync_message))
     application_version_set(get_upstream_version(VERSION_PACKAGE))
 
 
+def multisite_sync_message():
+    """Describe the multi-site replication state of the local zone.
+
+    The workload status only tells whether the unit is ready, this message
+    is appended to it so operators can see how far behind its peers a zone
+    is.
+
+    :returns: replication summary, None if the unit is not syncing with
+              other zones
+    :rtype: Optional[str]
+    """
+    if not all((config('realm'), config('zonegroup'), config('zone'))):
+        return None
+    multisite_rids = (relation_ids('master') + relation_ids('primary') +
+                      relation_ids('slave') + relation_ids('secondary'))
+    if not multisite_rids or not ready_for_service(legacy=False):
+        return None
+    return multisite.cached_sync_summary() or None
+
+
 def assess_status_func(configs):
     """Helper function to create the function that will assess_status() for
     the unit.
@@ -357,6 +598,8 @@ def assess_status_func(configs):
     """
     required_interfaces = REQUIRED_INTERFACES.copy()
     required_interfaces.update(get_optional_interfaces())
+    if isinstance(configs, LazyConfigRenderer):
+        configs = configs.status_configs()
     return make_assess_status_func(
         configs, required_interfaces,
         charm_func=check_optional_config_and_relations,
@@ -370,6 +613,12 @@ def pause_unit_helper(configs):
     @param configs: a templating.OSConfigRenderer() object
     @returns None - this function is executed for its side-effect
     """
+    try:
+        haproxy_admin.drain(haproxy_admin.server_name(),
+                            config('haproxy-drain-timeout') or 0)
+    except haproxy_admin.HAProxyAdminError as e:
+        log('Unable to drain unit from haproxy: {}'.format(e),
+            level=WARNING)
     _pause_resume_helper(pause_unit, configs)
 
 
@@ -428,14 +677,73 @@ def disable_unused_apache_sites():
         service('restart', 'apache2')
 
 
+def relation_data(rid=None, unit=None):
+    """Relation data bag of a related unit
+
+    The whole data bag is read with a single relation-get and kept in the
+    charmhelpers cache for the remainder of the hook, so that looking up
+    several attributes of a unit does not spawn a relation-get for each of
+    them. relation_set() flushes the cached data of the local unit, the data
+    of remote units does not change during a hook.
+
+    :param rid: relation id, defaults to the relation of the hook
+    :type rid: Optional[str]
+    :param unit: unit name, defaults to the remote unit of the hook
+    :type unit: Optional[str]
+    :return: relation data, empty if the unit did not publish any
+    :rtype: dict
+    """
+    return relation_get(rid=rid, unit=unit) or {}
+
+
+def related_units_data(endpoint):
+    """Relation data bags of all the units related over an endpoint
+
+    :param endpoint: name of the relation endpoint, e.g. 'mon'
+    :type endpoint: str
+    :return: relation id, unit name and relation data of each unit
+    :rtype: Iterator[Tuple[str, str, dict]]
+    """
+    for rid in relation_ids(endpoint):
+        for unit in related_units(rid):
+            yield rid, unit, relation_data(rid, unit)
+
+
+def relation_set(relation_id=None, relation_settings=None, **kwargs):
+    """Set relation data of the local unit
+
+    Same as hookenv.relation_set(), also discarding the cached results of
+    the context generators depending on the relation.
+
+    :param relation_id: relation id, defaults to the relation of the hook
+    :type relation_id: Optional[str]
+    :param relation_settings: settings to set
+    :type relation_settings: Optional[dict]
+    """
+    hookenv.relation_set(relation_id=relation_id,
+                         relation_settings=relation_settings, **kwargs)
+    relation_id = relation_id or hookenv.relation_id()
+    if relation_id:
+        ceph_radosgw_context.invalidate_contexts(relation_id.split(':')[0])
+
+
+def leader_set(settings=None, **kwargs):
+    """Set leader data
+
+    Same as hookenv.leader_set(), also discarding the cached results of the
+    context generators depending on leader data.
+
+    :param settings: settings to set
+    :type settings: Optional[dict]
+    """
+    hookenv.leader_set(settings, **kwargs)
+    ceph_radosgw_context.invalidate_contexts('leader')
+
+
 def systemd_based_radosgw():
     """Determine if install should use systemd based radosgw instances"""
-    host = socket.gethostname()
-    for rid in relation_ids('mon'):
-        for unit in related_units(rid):
-            if relation_get('rgw.{}_key'.format(host), rid=rid, unit=unit):
-                return True
-    return False
+    key = 'rgw.{}_key'.format(socket.gethostname())
+    return any(data.get(key) for _, _, data in related_units_data('mon'))
 
 
 def request_per_unit_key():
@@ -455,6 +763,62 @@ def service_name():
         return 'radosgw'
 
 
+def radosgw_client_name():
+    """Name of the RADOS Gateway daemon, as used for its ceph.conf section
+
+    :rtype: str
+    """
+    if systemd_based_radosgw():
+        return 'client.rgw.{}'.format(socket.gethostname())
+    return 'client.radosgw.gateway'
+
+
+def apply_ceph_conf_changes(configs, service_name, stopstart=False):
+    """Apply changes of ceph.conf to the RADOS Gateway service
+
+    Restart function for restart_on_change(). Changes to options the
+    running daemon observes are applied through its admin socket, the
+    service is only restarted when any other option changed or when the
+    daemon did not accept a change.
+
+    :param configs: renderer the configs were written with
+    :type configs: FingerprintingConfigRenderer
+    :param service_name: RADOS Gateway service
+    :type service_name: str
+    :param stopstart: stop and start the service instead of restarting it
+    :type stopstart: bool
+    """
+    previous = configs.replaced.get(CEPH_CONF)
+    content = _read_file(CEPH_CONF)
+    if previous is None or content is None:
+        runtime, restart = {}, ['all']
+    else:
+        client = radosgw_client_name()
+        runtime, restart = runtime_config.classify_changes(
+            runtime_config.daemon_options(
+                runtime_config.parse_ceph_conf(previous.decode('UTF-8')),
+                client),
+            runtime_config.daemon_options(
+                runtime_config.parse_ceph_conf(content.decode('UTF-8')),
+                client))
+        if not restart and runtime:
+            if runtime_config.apply_runtime_options(client, runtime):
+                log('Applied {} to {} at runtime'.format(
+                    ', '.join(sorted(runtime)), service_name))
+            else:
+                restart = sorted(runtime)
+        elif not restart:
+            log('No option of {} changed, not restarting {}'.format(
+                CEPH_CONF, service_name), level=DEBUG)
+    if content is not None:
+        # Nested restart_on_change() calls only consider later changes.
+        configs.replaced[CEPH_CONF] = content
+    if restart:
+        log('Restarting {} for changes to {}'.format(
+            service_name, ', '.join(restart)))
+        graceful_restart(service_name, stopstart=stopstart)
+
+
 def ready_for_service(legacy=True):
     """
     Determine when local unit is ready to service requests determined
@@ -467,25 +831,22 @@ def ready_for_service(legacy=True):
     :rtype: boolean
     """
     name = 'rgw.{}'.format(socket.gethostname())
-    for rid in relation_ids('mon'):
-        for unit in related_units(rid):
-            if (relation_get('{}_key'.format(name),
-                             rid=rid, unit=unit) and
-                    os.path.exists(
-                        os.path.join(
-                            CEPH_DIR,
-                            'ceph.client.{}.keyring'.format(name)
-                        ))):
-                return True
-            if (legacy and
-                    relation_get('radosgw_key',
-                                 rid=rid, unit=unit) and
-                    os.path.exists(
-                        os.path.join(
-                            CEPH_DIR,
-                            'keyring.rados.gateway'
-                        ))):
-                return True
+    for _, _, data in related_units_data('mon'):
+        if (data.get('{}_key'.format(name)) and
+                os.path.exists(
+                    os.path.join(
+                        CEPH_DIR,
+                        'ceph.client.{}.keyring'.format(name)
+                    ))):
+            return True
+        if (legacy and
+                data.get('radosgw_key') and
+                os.path.exists(
+                    os.path.join(
+                        CEPH_DIR,
+                        'keyring.rados.gateway'
+                    ))):
+            return True
     return False
 
 
@@ -509,6 +870,183 @@ def restart_nonce_changed(nonce):
     return False
 
 
+HEALTHCHECK_PATH = '/swift/healthcheck'
+HEALTHCHECK_INTERVAL = 5
+
+
+def _unit_number(unit):
+    return int(unit.split('/')[1])
+
+
+def rolling_restart_wait():
+    """Time to wait before restarting the service on a leader request
+
+    Units are distributed in turn, in the order of their unit number, over
+    modulo-nodes slots, known-wait seconds apart. The leader restarts the
+    service as it makes the change requiring the restart and never waits,
+    the other units of the first slot are deferred to after the last one.
+
+    :return: seconds to wait
+    :rtype: int
+    """
+    units = set([local_unit()])
+    for rid in relation_ids('cluster'):
+        units.update(related_units(rid))
+    units = sorted(units, key=_unit_number)
+    modulo = config('modulo-nodes')
+    if modulo is None:
+        modulo = len(units)
+    if not modulo or is_leader():
+        return 0
+    slot = units.index(local_unit()) % modulo
+    return (slot or modulo) * (config('known-wait') or 0)
+
+
+def radosgw_healthy():
+    """Whether the local RADOS Gateway answers its health check
+
+    :rtype: bool
+    """
+    port = determine_api_port(listen_port(), singlenode_mode=True)
+    url = 'http://localhost:{}{}'.format(port, HEALTHCHECK_PATH)
+    try:
+        with urllib.request.urlopen(url,
+                                    timeout=HEALTHCHECK_INTERVAL) as response:
+            return response.status == 200
+    except OSError:
+        return False
+
+
+def wait_for_radosgw_healthy(service_name, timeout):
+    """Wait for the local RADOS Gateway to pass its health check
+
+    :param service_name: RADOS Gateway service
+    :type service_name: str
+    :param timeout: seconds to wait
+    :type timeout: int
+    :return: whether the service passed its health check in time
+    :rtype: bool
+    """
+    start = time.monotonic()
+    while not radosgw_healthy():
+        if time.monotonic() - start >= timeout:
+            log('{} did not pass its health check within {} seconds of '
+                'restarting'.format(service_name, timeout), level=WARNING)
+            return False
+        time.sleep(HEALTHCHECK_INTERVAL)
+    log('{} restarted and healthy'.format(service_name))
+    return True
+
+
+def graceful_restart(service_name, stopstart=False):
+    """Restart the RADOS Gateway service once drained from haproxy
+
+    The unit is set to drain in the local haproxy, and the restart waits
+    for up to haproxy-drain-timeout seconds for its sessions to complete.
+    The restarted service is given up to known-wait seconds to pass its
+    health check before the unit is set back to ready.
+
+    :param service_name: RADOS Gateway service
+    :type service_name: str
+    :param stopstart: stop and start the service instead of restarting it
+    :type stopstart: bool
+    :return: whether the restarted service passed its health check
+    :rtype: bool
+    """
+    with haproxy_admin.drained(haproxy_admin.server_name(),
+                               config('haproxy-drain-timeout') or 0):
+        if stopstart:
+            service('stop', service_name)
+            service('start', service_name)
+        else:
+            service_restart(service_name)
+        return wait_for_radosgw_healthy(service_name,
+                                        config('known-wait') or 0)
+
+
+def rolling_restart(service_name):
+    """Restart the RADOS Gateway service in turn with the other units
+
+    The restart is delayed according to rolling_restart_wait(), and done
+    with graceful_restart(). Progress is reported in the workload status.
+
+    :param service_name: RADOS Gateway service
+    :type service_name: str
+    :return: whether the restarted service passed its health check
+    :rtype: bool
+    """
+    wait = rolling_restart_wait()
+    if wait:
+        msg = 'Rolling restart: restarting {} in {} seconds'.format(
+            service_name, wait)
+        log(msg)
+        status_set('maintenance', msg)
+        time.sleep(wait)
+    status_set('maintenance',
+               'Rolling restart: restarting {}'.format(service_name))
+    return graceful_restart(service_name)
+
+
+CONFIG_FULL_PASS_KEY = 'config-changed-full-pass'
+CONFIG_SNAPSHOT_KEY = 'config-changed-snapshot'
+
+
+def request_config_full_pass():
+    """Request that the next config-changed re-runs all of its handlers"""
+    db = unitdata.kv()
+    db.set(CONFIG_FULL_PASS_KEY, True)
+    db.flush()
+
+
+def config_full_pass_requested():
+    """Determine whether config-changed must re-run all of its handlers
+
+    A full pass is also required until a config-changed completed.
+
+    :rtype: boolean
+    """
+    db = unitdata.kv()
+    return (bool(db.get(CONFIG_FULL_PASS_KEY)) or
+            db.get(CONFIG_SNAPSHOT_KEY) is None)
+
+
+def clear_config_full_pass():
+    """Record that config-changed completed a full pass"""
+    db = unitdata.kv()
+    db.unset(CONFIG_FULL_PASS_KEY)
+    db.flush()
+
+
+def save_config_snapshot():
+    """Record the configuration applied by a completed config-changed
+
+    charmhelpers saves its own previous configuration at the end of every
+    hook, so a change made while another hook runs before config-changed
+    would not be reported by Config.changed(). The snapshot is only written
+    by config-changed.
+    """
+    db = unitdata.kv()
+    db.set(CONFIG_SNAPSHOT_KEY, dict(config()))
+    db.flush()
+
+
+def changed_config_keys():
+    """Determine the configuration options changed since the last completed
+    config-changed
+
+    All options are reported as changed when no config-changed completed yet.
+
+    :returns: names of the changed options
+    :rtype: set
+    """
+    current = dict(config())
+    previous = unitdata.kv().get(CONFIG_SNAPSHOT_KEY)
+    if previous is None:
+        return set(current)
+    return set(key for key in set(current) | set(previous)
+               if current.get(key) != previous.get(key))
+
+
 def multisite_deployment():
     """Determine if deployment is multi-site
 
@@ -521,6 +1059,9 @@ def multisite_deployment():
 
 
 def boto_client(access_key, secret_key, endpoint):
+    # boto3 takes longer to import than the rest of the hook code, only pay
+    # for it in the hooks using it.
+    import boto3
     return boto3.resource("s3",
                           verify=False,
                           endpoint_url=endpoint,
@@ -12,8 +12,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
+import subprocess
+
 from unittest import mock
-from unittest.mock import patch
+from unittest.mock import call, patch
 
 from test_utils import CharmTestCase
 
@@ -89,7 +92,7 @@ class MultisiteActionsTestCase(CharmTestCase):
         'is_leader',
         'leader_set',
         'service_name',
-        'service_restart',
+        'graceful_restart',
         'log',
     ]
 
@@ -157,6 +160,21 @@ class MultisiteActionsTestCase(CharmTestCase):
         actions.tidydefaults([])
         self.action_fail.assert_called_once()
 
+    def _assert_buckets_summary(self, expected_messages, succeeded,
+                                missing, failed):
+        self.action_set.assert_called_once()
+        values = self.action_set.call_args[1]['values']
+        self.assertEqual(values['message'], '\n'.join(expected_messages))
+        self.assertEqual(
+            [result['message'] for result in json.loads(values['results'])],
+            expected_messages)
+        self.assertEqual(values['summary.total'], len(expected_messages))
+        self.assertEqual(values['summary.succeeded'], succeeded)
+        self.assertEqual(values['summary.missing'], missing)
+        self.assertEqual(values['summary.failed'], failed)
+        self.assertIn('summary.elapsed-seconds', values)
+        self.assertIn('summary.buckets-per-second', values)
+
     def test_enable_buckets_sync(self):
         self.multisite.is_multisite_configured.return_value = True
         self.multisite.get_zonegroup_info.return_value = {
@@ -166,12 +184,17 @@ class MultisiteActionsTestCase(CharmTestCase):
             'id': 'test-zone-id',
         }
         self.is_leader.return_value = True
-        self.action_get.return_value = 'testbucket1,testbucket2,non-existent'
+        self.action_get.side_effect = {
+            'buckets': 'testbucket1,testbucket2,non-existent',
+            'pattern': None,
+            'concurrency': 8,
+        }.get
         self.test_config.set('zone', 'testzone')
         self.test_config.set('zonegroup', 'testzonegroup')
         self.test_config.set('realm', 'testrealm')
-        self.multisite.list_buckets.return_value = ['testbucket1',
-                                                    'testbucket2']
+        self.multisite.bucket_exists.side_effect = (
+            lambda bucket, zone, zonegroup:
+                bucket in ['testbucket1', 'testbucket2'])
 
         actions.enable_buckets_sync([])
 
@@ -182,10 +205,12 @@ class MultisiteActionsTestCase(CharmTestCase):
         self.multisite.get_zone_info.assert_called_once_with(
             'testzone',
         )
-        self.action_get.assert_called_once_with('buckets')
-        self.multisite.list_buckets.assert_called_once_with(
-            zonegroup='testzonegroup', zone='testzone',
-        )
+        self.action_get.assert_any_call('buckets')
+        self.multisite.bucket_exists.assert_has_calls([
+            call('testbucket1', zonegroup='testzonegroup', zone='testzone'),
+            call('testbucket2', zonegroup='testzonegroup', zone='testzone'),
+            call('non-existent', zonegroup='testzonegroup', zone='testzone'),
+        ], any_order=True)
         self.assertEqual(self.multisite.create_sync_group.call_count, 2)
         self.multisite.create_sync_group.assert_has_calls([
             mock.call(bucket='testbucket1',
@@ -194,7 +219,7 @@ class MultisiteActionsTestCase(CharmTestCase):
             mock.call(bucket='testbucket2',
                       group_id='default',
                       status=self.multisite.SYNC_POLICY_ENABLED),
-        ])
+        ], any_order=True)
         self.assertEqual(self.multisite.create_sync_group_pipe.call_count, 2)
         self.multisite.create_sync_group_pipe.assert_has_calls([
             mock.call(bucket='testbucket1',
@@ -207,7 +232,7 @@ class MultisiteActionsTestCase(CharmTestCase):
                       pipe_id='default',
                       source_zones=['*'],
                       dest_zones=['*']),
-        ])
+        ], any_order=True)
         expected_messages = [
             'Updated "testbucket1" bucket sync policy to "{}"'.format(
                 self.multisite.SYNC_POLICY_ENABLED),
@@ -222,10 +247,7 @@ class MultisiteActionsTestCase(CharmTestCase):
             mock.call(expected_messages[1]),
             mock.call(expected_messages[2]),
         ])
-        self.action_set.assert_called_once_with(
-            values={
-                'message': '\n'.join(expected_messages),
-            })
+        self._assert_buckets_summary(expected_messages, 2, 1, 0)
 
     def test_disable_buckets_sync(self):
         self.multisite.is_multisite_configured.return_value = True
@@ -236,11 +258,16 @@ class MultisiteActionsTestCase(CharmTestCase):
             'id': 'test-zone-id',
         }
         self.is_leader.return_value = True
-        self.action_get.return_value = 'testbucket1,non-existent'
+        self.action_get.side_effect = {
+            'buckets': 'testbucket1,non-existent',
+            'pattern': None,
+            'concurrency': 8,
+        }.get
         self.test_config.set('zone', 'testzone')
         self.test_config.set('zonegroup', 'testzonegroup')
         self.test_config.set('realm', 'testrealm')
-        self.multisite.list_buckets.return_value = ['testbucket1']
+        self.multisite.bucket_exists.side_effect = (
+            lambda bucket, zone, zonegroup: bucket == 'testbucket1')
 
         actions.disable_buckets_sync([])
 
@@ -251,10 +278,11 @@ class MultisiteActionsTestCase(CharmTestCase):
         self.multisite.get_zone_info.assert_called_once_with(
             'testzone',
         )
-        self.action_get.assert_called_once_with('buckets')
-        self.multisite.list_buckets.assert_called_once_with(
-            zonegroup='testzonegroup', zone='testzone',
-        )
+        self.action_get.assert_any_call('buckets')
+        self.multisite.bucket_exists.assert_has_calls([
+            call('testbucket1', zonegroup='testzonegroup', zone='testzone'),
+            call('non-existent', zonegroup='testzonegroup', zone='testzone'),
+        ], any_order=True)
         self.multisite.create_sync_group.assert_called_once_with(
             bucket='testbucket1',
             group_id='default',
@@ -278,10 +306,7 @@ class MultisiteActionsTestCase(CharmTestCase):
             mock.call(expected_messages[0]),
             mock.call(expected_messages[1]),
         ])
-        self.action_set.assert_called_once_with(
-            values={
-                'message': '\n'.join(expected_messages),
-            })
+        self._assert_buckets_summary(expected_messages, 1, 1, 0)
 
     def test_reset_buckets_sync(self):
         self.multisite.is_multisite_configured.return_value = True
@@ -292,11 +317,16 @@ class MultisiteActionsTestCase(CharmTestCase):
             'id': 'test-zone-id',
         }
         self.is_leader.return_value = True
-        self.action_get.return_value = 'testbucket1,non-existent'
+        self.action_get.side_effect = {
+            'buckets': 'testbucket1,non-existent',
+            'pattern': None,
+            'concurrency': 8,
+        }.get
         self.test_config.set('zone', 'testzone')
         self.test_config.set('zonegroup', 'testzonegroup')
         self.test_config.set('realm', 'testrealm')
-        self.multisite.list_buckets.return_value = ['testbucket1']
+        self.multisite.bucket_exists.side_effect = (
+            lambda bucket, zone, zonegroup: bucket == 'testbucket1')
 
         actions.reset_buckets_sync([])
 
@@ -307,10 +337,11 @@ class MultisiteActionsTestCase(CharmTestCase):
         self.multisite.get_zone_info.assert_called_once_with(
             'testzone',
         )
-        self.action_get.assert_called_once_with('buckets')
-        self.multisite.list_buckets.assert_called_once_with(
-            zonegroup='testzonegroup', zone='testzone',
-        )
+        self.action_get.assert_any_call('buckets')
+        self.multisite.bucket_exists.assert_has_calls([
+            call('testbucket1', zonegroup='testzonegroup', zone='testzone'),
+            call('non-existent', zonegroup='testzonegroup', zone='testzone'),
+        ], any_order=True)
         self.multisite.remove_sync_group.assert_called_once_with(
             bucket='testbucket1',
             group_id='default',
@@ -325,7 +356,228 @@ class MultisiteActionsTestCase(CharmTestCase):
             mock.call(expected_messages[0]),
             mock.call(expected_messages[1]),
         ])
+        self._assert_buckets_summary(expected_messages, 1, 1, 0)
+
+    def test_enable_buckets_sync_pattern(self):
+        self.multisite.is_multisite_configured.return_value = True
+        self.multisite.get_zonegroup_info.return_value = {
+            'master_zone': 'test-zone-id',
+        }
+        self.multisite.get_zone_info.return_value = {
+            'id': 'test-zone-id',
+        }
+        self.is_leader.return_value = True
+        self.action_get.side_effect = {
+            'buckets': 'testbucket1',
+            'pattern': 'logs-*',
+            'concurrency': 2,
+        }.get
+        self.test_config.set('zone', 'testzone')
+        self.test_config.set('zonegroup', 'testzonegroup')
+        self.test_config.set('realm', 'testrealm')
+        self.multisite.bucket_exists.return_value = True
+        self.multisite.iter_buckets.return_value = iter(
+            ['testbucket1', 'logs-a', 'data', 'logs-b'])
+
+        actions.enable_buckets_sync([])
+
+        self.multisite.iter_buckets.assert_called_once_with(
+            'testzone', 'testzonegroup')
+        self.multisite.bucket_exists.assert_called_once_with(
+            'testbucket1', zonegroup='testzonegroup', zone='testzone')
+        self.multisite.create_sync_group.assert_has_calls([
+            mock.call(bucket=bucket,
+                      group_id='default',
+                      status=self.multisite.SYNC_POLICY_ENABLED)
+            for bucket in ['testbucket1', 'logs-a', 'logs-b']
+        ], any_order=True)
+        expected_messages = [
+            'Updated "{}" bucket sync policy to "{}"'.format(
+                bucket, self.multisite.SYNC_POLICY_ENABLED)
+            for bucket in ['testbucket1', 'logs-a', 'logs-b']
+        ]
+        self._assert_buckets_summary(expected_messages, 3, 0, 0)
+        self.action_fail.assert_not_called()
+
+    def test_reset_buckets_sync_failure(self):
+        self.multisite.is_multisite_configured.return_value = True
+        self.multisite.get_zonegroup_info.return_value = {
+            'master_zone': 'test-zone-id',
+        }
+        self.multisite.get_zone_info.return_value = {
+            'id': 'test-zone-id',
+        }
+        self.is_leader.return_value = True
+        self.action_get.side_effect = {
+            'buckets': 'testbucket1,testbucket2',
+            'pattern': None,
+            'concurrency': 8,
+        }.get
+        self.test_config.set('zone', 'testzone')
+        self.test_config.set('zonegroup', 'testzonegroup')
+        self.test_config.set('realm', 'testrealm')
+        self.multisite.bucket_exists.return_value = True
+
+        def _remove_sync_group(bucket, group_id):
+            if bucket == 'testbucket2':
+                raise subprocess.CalledProcessError(1, 'radosgw-admin',
+                                                    output='error')
+        self.multisite.remove_sync_group.side_effect = _remove_sync_group
+
+        actions.reset_buckets_sync([])
+
+        expected_messages = [
+            'Reset "testbucket1" bucket sync policy',
+            'Failed to process bucket "testbucket2" : error',
+        ]
+        self._assert_buckets_summary(expected_messages, 1, 0, 1)
+        self.action_fail.assert_called_once_with(
+            'Failed to reset sync for the given buckets : testbucket2')
+
+    def test_process_buckets_unexpected_failures(self):
+        def _operation(bucket):
+            if bucket == 'testbucket2':
+                raise subprocess.TimeoutExpired(['radosgw-admin'], 300)
+            if bucket == 'testbucket3':
+                raise ValueError('invalid JSON')
+            return 'Processed "{}"'.format(bucket)
+
+        results = actions.process_buckets(
+            [('testbucket1', True), ('testbucket2', True),
+             ('testbucket3', True)],
+            _operation, 'testzone', 'testzonegroup', concurrency=2)
+        self.assertEqual(
+            [result['status'] for result in results],
+            [actions.BUCKET_STATUS_SUCCESS, actions.BUCKET_STATUS_FAILED,
+             actions.BUCKET_STATUS_FAILED])
+        self._assert_buckets_summary([
+            'Processed "testbucket1"',
+            'Failed to process bucket "testbucket2" : Command '
+            '\'[\'radosgw-admin\']\' timed out after 300 seconds',
+            'Failed to process bucket "testbucket3" : invalid JSON',
+        ], 1, 0, 2)
+        # Each bucket is given its own retry budget
+        self.assertEqual(self.multisite.retry_budget.call_count, 3)
+
+    @mock.patch.object(actions, 'register_configs')
+    @mock.patch.object(actions, 'listen_port')
+    @mock.patch.object(actions, 'canonical_url')
+    @mock.patch.object(actions, 'related_units')
+    @mock.patch.object(actions, 'relation_get')
+    @mock.patch.object(actions, 'relation_ids')
+    def test_multisite_plan_secondary(self, relation_ids, relation_get,
+                                      related_units, canonical_url,
+                                      listen_port, register_configs):
+        self.test_config.set('realm', 'testrealm')
+        self.test_config.set('zonegroup', 'testzonegroup')
+        self.test_config.set('zone', 'testzone2')
+        canonical_url.return_value = 'http://rgw'
+        listen_port.return_value = 80
+        relation_ids.side_effect = (
+            lambda name: ['secondary:1'] if name == 'secondary' else [])
+        related_units.return_value = ['rgw/0']
+        relation_get.return_value = {
+            'url': 'http://primary:80',
+            'access_key': 'key',
+            'secret': 'secret',
+        }
+        plan = self.multisite.plan_secondary.return_value
+        plan.describe.return_value = ['radosgw-admin realm pull',
+                                      'radosgw-admin period update --commit']
+        plan.operations = [mock.MagicMock()]
+        plan.errors = []
+
+        actions.multisite_plan([])
+
+        self.multisite.plan_secondary.assert_called_once_with(
+            'testrealm', 'testzonegroup', 'testzone2',
+            endpoints=['http://rgw:80'],
+            url='http://primary:80',
+            access_key='key',
+            secret='secret')
+        plan.apply.assert_not_called()
+        self.action_set.assert_called_once_with(values={
+            'plan': 'radosgw-admin realm pull\n'
+                    'radosgw-admin period update --commit',
+            'operations': 1,
+            'errors': '',
+        })
+
+    @mock.patch.object(actions, 'register_configs')
+    @mock.patch.object(actions, 'listen_port')
+    @mock.patch.object(actions, 'canonical_url')
+    @mock.patch.object(actions, 'relation_ids')
+    def test_multisite_plan_no_relation(self, relation_ids, canonical_url,
+                                        listen_port, register_configs):
+        self.test_config.set('realm', 'testrealm')
+        self.test_config.set('zonegroup', 'testzonegroup')
+        self.test_config.set('zone', 'testzone')
+        relation_ids.return_value = []
+        actions.multisite_plan([])
+        self.action_fail.assert_called_once_with(
+            'No complete primary or secondary relation found.')
+        self.action_set.assert_not_called()
+
+    def test_benchmark_admin_backends(self):
+        self.action_get.return_value = 2
+        self.multisite.benchmark_admin_backends.return_value = {
+            'cli': [0.5, 0.3],
+            'rest': [0.002, 0.004],
+        }
+        actions.benchmark_admin_backends([])
+        self.multisite.benchmark_admin_backends.assert_called_once_with(
+            iterations=2)
+        self.action_set.assert_called_once_with(
+            values={
+                'cli-min-ms': 300.0,
+                'cli-mean-ms': 400.0,
+                'cli-max-ms': 500.0,
+                'rest-min-ms': 2.0,
+                'rest-mean-ms': 3.0,
+                'rest-max-ms': 4.0,
+            })
+
+    def test_benchmark_admin_backends_no_credentials(self):
+        self.action_get.return_value = 2
+        self.multisite.benchmark_admin_backends.side_effect = \
+            actions.admin_api.AdminAPIError('no credentials')
+        actions.benchmark_admin_backends([])
+        self.action_fail.assert_called_once_with(
+            'Unable to benchmark the Admin Ops API : no credentials')
+        self.action_set.assert_not_called()
+
+
+class HookProfileTestCase(CharmTestCase):
+
+    TO_PATCH = [
+        'action_get',
+        'action_set',
+        'config',
+        'hook_trace',
+    ]
+
+    def setUp(self):
+        super(HookProfileTestCase, self).setUp(actions, self.TO_PATCH)
+        self.action_get.return_value = 2
+
+    def test_hook_profile(self):
+        traces = [{'hook': 'config-changed'}, {'hook': 'update-status'}]
+        self.hook_trace.read_traces.return_value = traces
+        actions.hook_profile([])
+        self.hook_trace.read_traces.assert_called_once_with(
+            self.hook_trace.trace_file.return_value, count=2)
+        self.action_set.assert_called_once_with(
+            values={
+                'message': '2 hook traces',
+                'traces': json.dumps(traces),
+            })
+
+    def test_hook_profile_disabled(self):
+        self.hook_trace.read_traces.return_value = []
+        self.config.return_value = False
+        actions.hook_profile([])
         self.action_set.assert_called_once_with(
             values={
-                'message': '\n'.join(expected_messages),
+                'message': 'No hook traces recorded, enable the hook-trace '
+                           'option to record them',
             })
@@ -0,0 +1,189 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import base64
+import hashlib
+import hmac
+import http.server
+import json
+import threading
+import unittest
+import urllib.parse
+
+import admin_api
+
+ACCESS_KEY = 'testaccess'
+SECRET = 'testsecret'
+
+
+class StubAdminHandler(http.server.BaseHTTPRequestHandler):
+    """Minimal Admin Ops API served from StubAdminServer.users"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _authorized(self, path):
+        string_to_sign = '\n'.join((self.command, '', '',
+                                    self.headers['Date'], path))
+        digest = hmac.new(SECRET.encode('UTF-8'),
+                          string_to_sign.encode('UTF-8'),
+                          hashlib.sha1).digest()
+        expected = 'AWS {}:{}'.format(
+            ACCESS_KEY, base64.b64encode(digest).decode('UTF-8'))
+        return self.headers['Authorization'] == expected
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode('UTF-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self):
+        server = self.server
+        server.requests.append((self.command, self.path,
+                                self.client_address))
+        url = urllib.parse.urlparse(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        if not self._authorized(url.path):
+            return self._reply(403, {'Code': 'AccessDenied'})
+        if url.path == '/admin/metadata/user':
+            return self._reply(200, sorted(server.users))
+        if url.path == '/admin/metadata/bucket':
+            if 'key' in query:
+                if query['key'] not in server.buckets:
+                    return self._reply(404, {'Code': 'NoSuchKey'})
+                return self._reply(200, {'key': 'bucket:' + query['key']})
+            start = int(query.get('marker', 0))
+            end = start + int(query['max-entries'])
+            return self._reply(200, {
+                'keys': server.buckets[start:end],
+                'truncated': end < len(server.buckets),
+                'marker': str(end),
+            })
+        if url.path == '/admin/user':
+            uid = query.get('uid')
+            if self.command == 'PUT':
+                server.users[uid] = {
+                    'user_id': uid,
+                    'display_name': query['display-name'],
+                    'system': query.get('system', 'false'),
+                    'keys': [{'user': uid,
+                              'access_key': uid + '-access',
+                              'secret_key': uid + '-secret'}],
+                }
+            if uid not in server.users:
+                return self._reply(404, {'Code': 'NoSuchUser'})
+            if self.command == 'POST':
+                server.users[uid]['suspended'] = query['suspended']
+            return self._reply(200, server.users[uid])
+        self._reply(404, {'Code': 'NoSuchKey'})
+
+    do_GET = do_PUT = do_POST = _handle
+
+
+class StubAdminServer(http.server.ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self):
+        super(StubAdminServer, self).__init__(('127.0.0.1', 0),
+                                              StubAdminHandler)
+        self.requests = []
+        self.users = {}
+        self.buckets = ['bucket1', 'bucket2', 'bucket3']
+
+
+class AdminAPIClientTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubAdminServer()
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.client = admin_api.AdminAPIClient(
+            '127.0.0.1', self.server.server_address[1], ACCESS_KEY, SECRET)
+        self.addCleanup(self.client.close)
+
+    def test_create_and_get_user(self):
+        result = self.client.create_user('mrbees', 'Synchronization User',
+                                         system=True)
+        self.assertEqual(result['keys'][0]['access_key'], 'mrbees-access')
+        self.assertEqual(result['system'], 'true')
+        self.assertEqual(self.client.get_user('mrbees'), result)
+        self.assertEqual(self.client.list_users(), ['mrbees'])
+
+    def test_suspend_user(self):
+        self.client.create_user('mrbees', 'Synchronization User')
+        self.assertEqual(
+            self.client.suspend_user('mrbees')['suspended'], 'true')
+
+    def test_list_metadata_keys(self):
+        page = self.client.list_metadata_keys('bucket', max_entries=2)
+        self.assertEqual(page['keys'], ['bucket1', 'bucket2'])
+        self.assertTrue(page['truncated'])
+        page = self.client.list_metadata_keys('bucket', max_entries=2,
+                                              marker=page['marker'])
+        self.assertEqual(page['keys'], ['bucket3'])
+        self.assertFalse(page['truncated'])
+
+    def test_get_metadata(self):
+        self.assertEqual(self.client.get_metadata('bucket', 'bucket1'),
+                         {'key': 'bucket:bucket1'})
+        with self.assertRaises(admin_api.AdminAPIError) as ctx:
+            self.client.get_metadata('bucket', 'missing')
+        self.assertEqual(ctx.exception.status, 404)
+
+    def test_request_query(self):
+        self.client.create_user('mrbees', 'Synchronization User')
+        self.client.request('GET', 'user', uid='mrbees', unused=None)
+        self.assertEqual(self.server.requests[1][1],
+                         '/admin/user?format=json&uid=mrbees')
+
+    def test_keep_alive(self):
+        for _ in range(5):
+            self.client.list_users()
+        clients = set(request[2] for request in self.server.requests)
+        self.assertEqual(len(self.server.requests), 5)
+        self.assertEqual(len(clients), 1)
+
+    def test_reconnect_stale_connection(self):
+        self.client.list_users()
+        # Simulate the gateway dropping an idle keep-alive connection.
+        self.client._conn.sock.close()
+        self.assertEqual(self.client.list_users(), [])
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_error_status(self):
+        with self.assertRaises(admin_api.AdminAPIError) as ctx:
+            self.client.get_user('unknown')
+        self.assertEqual(ctx.exception.status, 404)
+
+    def test_bad_signature(self):
+        self.client.secret = 'wrong'
+        with self.assertRaises(admin_api.AdminAPIError) as ctx:
+            self.client.list_users()
+        self.assertEqual(ctx.exception.status, 403)
+
+    def test_connection_refused(self):
+        self.server.shutdown()
+        self.server.server_close()
+        with self.assertRaises(admin_api.AdminAPIError) as ctx:
+            self.client.list_users()
+        self.assertIsNone(ctx.exception.status)
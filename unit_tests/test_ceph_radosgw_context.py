@@ -21,9 +21,9 @@ import charmhelpers.fetch as fetch
 from test_utils import CharmTestCase
 
 TO_PATCH = [
+    'atexit',
     'config',
     'log',
-    'relation_get',
     'relation_ids',
     'related_units',
     'cmp_pkgrevno',
@@ -38,10 +38,26 @@ TO_PATCH = [
 ]
 
 
+MON_RELATION_KEYS = (
+    'auth',
+    'ceph-public-address',
+    'fsid',
+    'private-address',
+    'rgw.testhost_key',
+)
+
+
+def _relation_data(relation_get):
+    """Serve relation data bags from a per attribute relation_get stub"""
+    def _data(rid, unit):
+        return {key: relation_get(key, unit=unit, rid=rid)
+                for key in MON_RELATION_KEYS}
+    return _data
+
+
 class HAProxyContextTests(CharmTestCase):
     def setUp(self):
         super(HAProxyContextTests, self).setUp(context, TO_PATCH)
-        self.relation_get.side_effect = self.test_relation.get
         self.config.side_effect = self.test_config.get
         self.cmp_pkgrevno.return_value = 1
         self.arch.return_value = 'amd64'
@@ -90,16 +106,11 @@ class MonContextTest(CharmTestCase):
         self.test_config.set('zonegroup', 'zonegroup1')
         self.test_config.set('realm', 'realmX')
 
-    @staticmethod
-    def plain_list_stub(key):
-        if key == "zone":
-            return ["default"]
-        if key == "zonegroup":
-            return ["zonegroup1"]
-        if key == "realm":
-            return ["realmX"]
-        else:
-            return []
+    topology = {
+        'zones': ['default'],
+        'zonegroups': ['zonegroup1'],
+        'realms': ['realmX'],
+    }
 
     @patch('ceph_radosgw_context.https')
     @patch('charmhelpers.contrib.hahelpers.cluster.relation_ids')
@@ -128,10 +139,11 @@ class MonContextTest(CharmTestCase):
             elif attr == 'fsid':
                 return 'testfsid'
 
-        self.relation_get.side_effect = _relation_get
+        self.utils.relation_data.side_effect = _relation_data(
+            _relation_get)
         self.relation_ids.return_value = ['mon:6']
         self.related_units.return_value = ['ceph/0', 'ceph/1', 'ceph/2']
-        self.multisite.plain_list = self.plain_list_stub
+        self.multisite.topology.return_value = self.topology
         self.determine_api_port.return_value = 70
         expect = {
             'auth_supported': 'cephx',
@@ -165,6 +177,15 @@ class MonContextTest(CharmTestCase):
         self.assertEqual(expect, mon_ctxt())
         self.assertTrue(mock_ensure_rsv_v6.called)
 
+        # No multi-site configuration, the topology is not queried
+        self.multisite.topology.reset_mock()
+        for key in ('zone', 'zonegroup', 'realm'):
+            self.test_config.set(key, None)
+            del expect['rgw_{}'.format(key)]
+        addresses = ['10.5.4.1', '10.5.4.2', '10.5.4.3']
+        self.assertEqual(expect, mon_ctxt())
+        self.multisite.topology.assert_not_called()
+
     @patch('ceph_radosgw_context.https')
     @patch.object(ceph, 'config', lambda *args:
                   '{"client.radosgw.gateway": {"rgw init timeout": 60}}')
@@ -185,10 +206,11 @@ class MonContextTest(CharmTestCase):
             elif attr == 'fsid':
                 return 'testfsid'
 
-        self.relation_get.side_effect = _relation_get
+        self.utils.relation_data.side_effect = _relation_data(
+            _relation_get)
         self.relation_ids.return_value = ['mon:6']
         self.related_units.return_value = ['ceph/0', 'ceph/1', 'ceph/2']
-        self.multisite.plain_list = self.plain_list_stub
+        self.multisite.topology.return_value = self.topology
         self.determine_api_port.return_value = 70
         expect = {
             'auth_supported': 'cephx',
@@ -250,9 +272,10 @@ class MonContextTest(CharmTestCase):
             elif attr == 'fsid':
                 return 'testfsid'
 
-        self.relation_get.side_effect = _relation_get
+        self.utils.relation_data.side_effect = _relation_data(
+            _relation_get)
         self.relation_ids.return_value = ['mon:6']
-        self.multisite.plain_list = self.plain_list_stub
+        self.multisite.topology.return_value = self.topology
         self.related_units.return_value = ['ceph-proxy/0']
         self.determine_api_port.return_value = 70
         expect = {
@@ -300,7 +323,7 @@ class MonContextTest(CharmTestCase):
         mock_config_get.side_effect = self.test_config.get
         self.socket.gethostname.return_value = 'testhost'
         mon_ctxt = context.MonContext()
-        self.relation_get.return_value = None
+        self.utils.relation_data.return_value = {}
         self.relation_ids.return_value = ['mon:6']
         self.related_units.return_value = ['ceph/0', 'ceph/1', 'ceph/2']
         self.assertEqual({}, mon_ctxt())
@@ -330,10 +353,11 @@ class MonContextTest(CharmTestCase):
             elif attr == 'fsid':
                 return 'testfsid'
 
-        self.relation_get.side_effect = _relation_get
+        self.utils.relation_data.side_effect = _relation_data(
+            _relation_get)
         self.relation_ids.return_value = ['mon:6']
         self.related_units.return_value = ['ceph/0', 'ceph/1', 'ceph/2']
-        self.multisite.plain_list = self.plain_list_stub
+        self.multisite.topology.return_value = self.topology
         self.determine_api_port.return_value = 70
         expect = {
             'auth_supported': 'none',
@@ -384,11 +408,12 @@ class MonContextTest(CharmTestCase):
             elif attr == 'fsid':
                 return 'testfsid'
 
-        self.relation_get.side_effect = _relation_get
+        self.utils.relation_data.side_effect = _relation_data(
+            _relation_get)
         self.relation_ids.return_value = ['mon:6']
         self.related_units.return_value = ['ceph/0', 'ceph/1', 'ceph/2']
         self.determine_api_port.return_value = 70
-        self.multisite.plain_list = self.plain_list_stub
+        self.multisite.topology.return_value = self.topology
         expect = {
             'auth_supported': 'cephx',
             'hostname': 'testhost',
@@ -496,10 +521,11 @@ class MonContextTest(CharmTestCase):
             elif attr == 'fsid':
                 return fsids.pop()
 
-        self.relation_get.side_effect = _relation_get
+        self.utils.relation_data.side_effect = _relation_data(
+            _relation_get)
         self.relation_ids.return_value = ['mon:6']
         self.related_units.return_value = ['ceph/0', 'ceph/1', 'ceph/2']
-        self.multisite.plain_list = self.plain_list_stub
+        self.multisite.topology.return_value = self.topology
         self.determine_api_port.return_value = 70
         expect = {
             'auth_supported': 'cephx',
@@ -551,10 +577,11 @@ class MonContextTest(CharmTestCase):
             elif attr == 'fsid':
                 return 'testfsid'
 
-        self.relation_get.side_effect = _relation_get
+        self.utils.relation_data.side_effect = _relation_data(
+            _relation_get)
         self.relation_ids.return_value = ['mon:6']
         self.related_units.return_value = ['ceph/0', 'ceph/1', 'ceph/2']
-        self.multisite.plain_list = self.plain_list_stub
+        self.multisite.topology.return_value = self.topology
         self.determine_api_port.return_value = 70
         expect = {
             'auth_supported': 'cephx',
@@ -587,3 +614,67 @@ class ApacheContextTest(CharmTestCase):
     def setUp(self):
         super(ApacheContextTest, self).setUp(context, TO_PATCH)
         self.config.side_effect = self.test_config.get
+
+
+class MemoizedContextTest(CharmTestCase):
+
+    class StubContext(object):
+        interfaces = ['mon']
+        depends = ('mon', 'multisite')
+        missing_data = ['fsid']
+
+        def __init__(self):
+            self.calls = 0
+
+        def __call__(self):
+            self.calls += 1
+            return {'mon_hosts': ['10.5.0.1'], 'calls': self.calls}
+
+    def setUp(self):
+        super(MemoizedContextTest, self).setUp(context, TO_PATCH)
+        self.multisite.cache_generation.return_value = 0
+        self.generator = self.StubContext()
+        self.ctxt = context.MemoizedContext(self.generator)
+
+    def test_memoized(self):
+        stats = context.context_stats()
+        self.assertEqual(self.ctxt()['calls'], 1)
+        self.ctxt()['mon_hosts'].append('10.5.0.2')
+        self.assertEqual(self.ctxt(), {'mon_hosts': ['10.5.0.1'],
+                                       'calls': 1})
+        self.assertEqual(self.generator.calls, 1)
+        self.assertEqual(context.context_stats()['evaluations'],
+                         stats['evaluations'] + 1)
+        self.assertEqual(context.context_stats()['saved'],
+                         stats['saved'] + 2)
+
+    def test_generator_attributes(self):
+        self.assertEqual(self.ctxt.interfaces, ['mon'])
+        self.assertEqual(self.ctxt.missing_data, ['fsid'])
+        self.assertEqual(self.ctxt.depends, ('mon', 'multisite'))
+        self.assertEqual(
+            context.MemoizedContext(context.HAProxyContext()).depends,
+            ('cluster', 'certificates'))
+
+    def test_invalidated_certificates(self):
+        ctxt = context.MemoizedContext(context.HAProxyContext())
+        with patch.object(context.HAProxyContext, '__call__') as haproxy:
+            haproxy.side_effect = [{'https': False}, {'https': True}]
+            self.assertEqual(ctxt(), {'https': False})
+            self.assertEqual(ctxt(), {'https': False})
+            context.invalidate_contexts('certificates')
+            self.assertEqual(ctxt(), {'https': True})
+
+    def test_invalidated(self):
+        self.ctxt()
+        context.invalidate_contexts('identity-service', 'leader')
+        self.ctxt()
+        self.assertEqual(self.generator.calls, 1)
+        context.invalidate_contexts('mon')
+        self.assertEqual(self.ctxt()['calls'], 2)
+
+    def test_invalidated_multisite(self):
+        self.ctxt()
+        self.multisite.cache_generation.return_value = 1
+        self.assertEqual(self.ctxt()['calls'], 2)
+        self.assertEqual(self.ctxt()['calls'], 2)
@@ -12,13 +12,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
 from unittest.mock import (
+    call,
     patch,
     MagicMock,
 )
 
 import utils
 
+from charmhelpers.core import hookenv
+
 from test_utils import CharmTestCase
 
 TO_PATCH = [
@@ -35,6 +44,8 @@ TO_PATCH = [
     'config',
     'leader_get',
     'leader_set',
+    'status_get',
+    'status_set',
 ]
 
 
@@ -44,6 +55,7 @@ class CephRadosGWUtilTests(CharmTestCase):
         self.get_upstream_version.return_value = '10.2.2'
         self.socket.gethostname.return_value = 'testhost'
         self.config.side_effect = self.test_config.get
+        self.status_get.return_value = ('active', 'Unit is ready')
 
     def test_assess_status(self):
         with patch.object(utils, 'assess_status_func') as asf:
@@ -57,6 +69,43 @@ class CephRadosGWUtilTests(CharmTestCase):
             )
             self.application_version_set.assert_called_with('10.2.2')
 
+    @patch.object(utils, 'multisite_sync_message')
+    def test_assess_status_multisite_sync(self, multisite_sync_message):
+        multisite_sync_message.return_value = 'multi-site sync caught up'
+        self.status_get.return_value = ('active', 'Unit is ready')
+        with patch.object(utils, 'assess_status_func'):
+            utils.assess_status('test-config')
+        self.status_set.assert_called_once_with(
+            'active', 'Unit is ready, multi-site sync caught up')
+
+        self.status_set.reset_mock()
+        multisite_sync_message.reset_mock()
+        self.status_get.return_value = ('blocked', 'Missing relations')
+        with patch.object(utils, 'assess_status_func'):
+            utils.assess_status('test-config')
+        multisite_sync_message.assert_not_called()
+        self.status_set.assert_not_called()
+
+    @patch.object(utils, 'ready_for_service')
+    @patch.object(utils, 'multisite')
+    def test_multisite_sync_message(self, multisite, ready_for_service):
+        self.relation_ids.return_value = []
+        self.assertIsNone(utils.multisite_sync_message())
+        self.test_config.set('realm', 'beedata')
+        self.test_config.set('zonegroup', 'brundall')
+        self.test_config.set('zone', 'brundall-north')
+        self.assertIsNone(utils.multisite_sync_message())
+        self.relation_ids.side_effect = (
+            lambda name: ['primary:1'] if name == 'primary' else [])
+        ready_for_service.return_value = True
+        multisite.cached_sync_summary.return_value = (
+            'multi-site sync caught up')
+        self.assertEqual(utils.multisite_sync_message(),
+                         'multi-site sync caught up')
+        ready_for_service.assert_called_once_with(legacy=False)
+        multisite.cached_sync_summary.return_value = ''
+        self.assertIsNone(utils.multisite_sync_message())
+
     @patch.object(utils, 'get_optional_interfaces')
     @patch.object(utils, 'check_optional_config_and_relations')
     @patch.object(utils, 'REQUIRED_INTERFACES')
@@ -79,10 +128,13 @@ class CephRadosGWUtilTests(CharmTestCase):
             charm_func=check_optional_relations,
             services='s1', ports=None)
 
-    def test_pause_unit_helper(self):
+    @patch.object(utils, 'haproxy_admin')
+    def test_pause_unit_helper(self, haproxy_admin):
+        haproxy_admin.server_name.return_value = 'ceph-radosgw-0'
         with patch.object(utils, '_pause_resume_helper') as prh:
             utils.pause_unit_helper('random-config')
             prh.assert_called_once_with(utils.pause_unit, 'random-config')
+        haproxy_admin.drain.assert_called_once_with('ceph-radosgw-0', 60)
         with patch.object(utils, '_pause_resume_helper') as prh:
             utils.resume_unit_helper('random-config')
             prh.assert_called_once_with(utils.resume_unit, 'random-config')
@@ -104,9 +156,29 @@ class CephRadosGWUtilTests(CharmTestCase):
             lambda rid: data[rid].keys()
         )
         self.relation_get.side_effect = (
-            lambda attr, rid, unit: data[rid][unit].get(attr)
+            lambda rid, unit: data[rid][unit]
         )
 
+    @patch('charmhelpers.core.hookenv.subprocess')
+    def test_relation_data(self, subprocess):
+        self.addCleanup(hookenv.cache.clear)
+        self.relation_get.side_effect = hookenv.relation_get
+        subprocess.check_output.return_value = (
+            b'{"auth": "cephx", "fsid": "testfsid"}')
+        self.assertEqual(utils.relation_data('mon:1', 'ceph-mon/0')['auth'],
+                         'cephx')
+        self.assertEqual(utils.relation_data('mon:1', 'ceph-mon/0')['fsid'],
+                         'testfsid')
+        subprocess.check_output.assert_called_once_with(
+            ['relation-get', '--format=json', '-r', 'mon:1', '-',
+             'ceph-mon/0'])
+        # relation_set() flushes the cached data of the local unit.
+        utils.relation_data('mon:1', 'ceph-radosgw/0')
+        hookenv.flush('ceph-radosgw/0')
+        utils.relation_data('mon:1', 'ceph-radosgw/0')
+        utils.relation_data('mon:1', 'ceph-mon/0')
+        self.assertEqual(subprocess.check_output.call_count, 3)
+
     def test_systemd_based_radosgw_old_style(self):
         _relation_data = {
             'mon:1': {
@@ -295,6 +367,339 @@ class CephRadosGWUtilTests(CharmTestCase):
                                             'soofar')
         mock_db.flush.assert_called_once_with()
 
+    @patch.object(utils, 'is_leader')
+    @patch.object(utils, 'local_unit')
+    def test_rolling_restart_wait(self, local_unit, is_leader):
+        is_leader.return_value = False
+        self.relation_ids.return_value = ['cluster:1']
+        units = ['rgw/10', 'rgw/1', 'rgw/2', 'rgw/3']
+        self.related_units.side_effect = lambda rid: [
+            unit for unit in units if unit != local_unit.return_value]
+        self.test_config.set('known-wait', 30)
+        # serial restart: rgw/1, rgw/2, rgw/3, rgw/10
+        for unit, wait in (('rgw/1', 120), ('rgw/2', 30), ('rgw/3', 60),
+                           ('rgw/10', 90)):
+            local_unit.return_value = unit
+            self.assertEqual(utils.rolling_restart_wait(), wait)
+        self.test_config.set('modulo-nodes', 2)
+        local_unit.return_value = 'rgw/3'
+        self.assertEqual(utils.rolling_restart_wait(), 60)
+        local_unit.return_value = 'rgw/10'
+        self.assertEqual(utils.rolling_restart_wait(), 30)
+        self.test_config.set('modulo-nodes', 0)
+        self.assertEqual(utils.rolling_restart_wait(), 0)
+        self.test_config.set('modulo-nodes', None)
+        is_leader.return_value = True
+        self.assertEqual(utils.rolling_restart_wait(), 0)
+
+    @patch.object(utils.urllib.request, 'urlopen')
+    @patch.object(utils, 'determine_api_port')
+    @patch.object(utils, 'listen_port')
+    def test_radosgw_healthy(self, listen_port, determine_api_port, urlopen):
+        listen_port.return_value = 80
+        determine_api_port.return_value = 70
+        urlopen.return_value.__enter__.return_value.status = 200
+        self.assertTrue(utils.radosgw_healthy())
+        determine_api_port.assert_called_once_with(80, singlenode_mode=True)
+        urlopen.assert_called_once_with(
+            'http://localhost:70/swift/healthcheck',
+            timeout=utils.HEALTHCHECK_INTERVAL)
+        urlopen.side_effect = ConnectionRefusedError
+        self.assertFalse(utils.radosgw_healthy())
+
+    @patch.object(utils.time, 'sleep')
+    @patch.object(utils, 'graceful_restart')
+    @patch.object(utils, 'rolling_restart_wait')
+    def test_rolling_restart(self, rolling_restart_wait, graceful_restart,
+                             sleep):
+        rolling_restart_wait.return_value = 60
+        graceful_restart.return_value = True
+        self.assertTrue(utils.rolling_restart('ceph-radosgw@rgw.testhost'))
+        sleep.assert_called_once_with(60)
+        graceful_restart.assert_called_once_with('ceph-radosgw@rgw.testhost')
+        self.status_set.assert_has_calls([
+            call('maintenance', 'Rolling restart: restarting '
+                 'ceph-radosgw@rgw.testhost in 60 seconds'),
+            call('maintenance', 'Rolling restart: restarting '
+                 'ceph-radosgw@rgw.testhost'),
+        ])
+
+    @patch.object(utils, 'wait_for_radosgw_healthy')
+    @patch.object(utils, 'service_restart')
+    @patch.object(utils, 'haproxy_admin')
+    def test_graceful_restart(self, haproxy_admin, service_restart,
+                              wait_for_radosgw_healthy):
+        haproxy_admin.server_name.return_value = 'ceph-radosgw-0'
+        wait_for_radosgw_healthy.return_value = True
+        self.assertTrue(utils.graceful_restart('radosgw'))
+        haproxy_admin.drained.assert_called_once_with('ceph-radosgw-0', 60)
+        haproxy_admin.drained.return_value.__enter__.assert_called_once_with()
+        service_restart.assert_called_once_with('radosgw')
+        wait_for_radosgw_healthy.assert_called_once_with('radosgw', 30)
+        haproxy_admin.drained.return_value.__exit__.assert_called_once()
+
+    @patch.object(utils.time, 'monotonic')
+    @patch.object(utils.time, 'sleep')
+    @patch.object(utils, 'radosgw_healthy')
+    def test_wait_for_radosgw_healthy(self, radosgw_healthy, sleep,
+                                      monotonic):
+        radosgw_healthy.side_effect = [False, True]
+        monotonic.return_value = 0
+        self.assertTrue(utils.wait_for_radosgw_healthy('radosgw', 30))
+        sleep.assert_called_once_with(utils.HEALTHCHECK_INTERVAL)
+        sleep.reset_mock()
+        radosgw_healthy.side_effect = None
+        radosgw_healthy.return_value = False
+        monotonic.side_effect = [0, 10, 20, 30]
+        self.assertFalse(utils.wait_for_radosgw_healthy('radosgw', 30))
+        self.assertEqual(sleep.call_count, 2)
+
+    def _mock_kv(self, data):
+        mock_db = MagicMock()
+        mock_db.get.side_effect = lambda key: data.get(key)
+        mock_db.set.side_effect = data.__setitem__
+        mock_db.unset.side_effect = data.pop
+        self.unitdata.kv.return_value = mock_db
+        return mock_db
+
+    def test_config_full_pass(self):
+        _db_data = {utils.CONFIG_SNAPSHOT_KEY: {'loglevel': 1}}
+        mock_db = self._mock_kv(_db_data)
+        self.assertFalse(utils.config_full_pass_requested())
+        utils.request_config_full_pass()
+        self.assertTrue(utils.config_full_pass_requested())
+        utils.clear_config_full_pass()
+        self.assertFalse(utils.config_full_pass_requested())
+        self.assertEqual(mock_db.flush.call_count, 2)
+
+    def test_config_full_pass_no_snapshot(self):
+        self._mock_kv({})
+        self.assertTrue(utils.config_full_pass_requested())
+
+    def test_changed_config_keys(self):
+        _db_data = {}
+        self._mock_kv(_db_data)
+        self.config.side_effect = None
+        self.config.return_value = {'loglevel': 1, 'port': 80}
+        # Nothing was applied yet
+        self.assertEqual(utils.changed_config_keys(), {'loglevel', 'port'})
+        utils.save_config_snapshot()
+        self.assertEqual(_db_data[utils.CONFIG_SNAPSHOT_KEY],
+                         {'loglevel': 1, 'port': 80})
+        self.assertEqual(utils.changed_config_keys(), set())
+        # Changes are reported until the next snapshot, whichever hooks
+        # run in between
+        self.config.return_value = {'loglevel': 10, 'port': 80}
+        self.assertEqual(utils.changed_config_keys(), {'loglevel'})
+        self.assertEqual(utils.changed_config_keys(), {'loglevel'})
+        utils.save_config_snapshot()
+        self.assertEqual(utils.changed_config_keys(), set())
+
+    @patch.object(utils, 'graceful_restart')
+    @patch.object(utils.runtime_config, 'apply_runtime_options')
+    @patch.object(utils, '_read_file')
+    @patch.object(utils, 'systemd_based_radosgw')
+    def test_apply_ceph_conf_changes(self, systemd_based_radosgw, _read_file,
+                                     apply_runtime_options, graceful_restart):
+        systemd_based_radosgw.return_value = True
+        self.socket.gethostname.return_value = 'testhost'
+        configs = MagicMock()
+        configs.replaced = {
+            utils.CEPH_CONF: b'[global]\nmon host = a\ndebug rgw = 1/5\n',
+        }
+        _read_file.return_value = (
+            b'[global]\nmon host = a\ndebug rgw = 20/20\n')
+        apply_runtime_options.return_value = True
+        utils.apply_ceph_conf_changes(configs, 'ceph-radosgw@rgw.testhost')
+        apply_runtime_options.assert_called_once_with(
+            'client.rgw.testhost', {'debug_rgw': '20/20'})
+        graceful_restart.assert_not_called()
+        self.assertEqual(configs.replaced[utils.CEPH_CONF],
+                         _read_file.return_value)
+        # Nothing changed since the options were applied.
+        utils.apply_ceph_conf_changes(configs, 'ceph-radosgw@rgw.testhost')
+        apply_runtime_options.assert_called_once()
+        graceful_restart.assert_not_called()
+
+    @patch.object(utils, 'graceful_restart')
+    @patch.object(utils.runtime_config, 'apply_runtime_options')
+    @patch.object(utils, '_read_file')
+    @patch.object(utils, 'systemd_based_radosgw')
+    def test_apply_ceph_conf_changes_restart(self, systemd_based_radosgw,
+                                             _read_file,
+                                             apply_runtime_options,
+                                             graceful_restart):
+        systemd_based_radosgw.return_value = False
+        configs = MagicMock()
+        configs.replaced = {}
+        _read_file.return_value = b'[global]\nmon host = b\n'
+        # ceph.conf was not written by the renderer
+        utils.apply_ceph_conf_changes(configs, 'radosgw', stopstart=True)
+        graceful_restart.assert_called_once_with('radosgw', stopstart=True)
+        graceful_restart.reset_mock()
+        _read_file.return_value = b'[global]\nmon host = c\ndebug ms = 1\n'
+        utils.apply_ceph_conf_changes(configs, 'radosgw')
+        apply_runtime_options.assert_not_called()
+        graceful_restart.assert_called_once_with('radosgw', stopstart=False)
+        graceful_restart.reset_mock()
+        # the daemon did not accept a runtime change
+        _read_file.return_value = b'[global]\nmon host = c\ndebug ms = 5\n'
+        apply_runtime_options.return_value = False
+        utils.apply_ceph_conf_changes(configs, 'radosgw')
+        apply_runtime_options.assert_called_once_with(
+            'client.radosgw.gateway', {'debug_ms': '5'})
+        graceful_restart.assert_called_once_with('radosgw', stopstart=False)
+
+    @patch.object(utils, 'wait_for_radosgw_healthy')
+    @patch.object(utils, 'service')
+    @patch.object(utils, 'haproxy_admin')
+    @patch.object(utils, '_read_file')
+    @patch.object(utils, 'systemd_based_radosgw')
+    def test_apply_ceph_conf_changes_drained(self, systemd_based_radosgw,
+                                             _read_file, haproxy_admin,
+                                             service,
+                                             wait_for_radosgw_healthy):
+        systemd_based_radosgw.return_value = False
+        haproxy_admin.server_name.return_value = 'ceph-radosgw-0'
+        drained = haproxy_admin.drained.return_value
+        drained.__enter__.side_effect = (
+            lambda: service.assert_not_called())
+        drained.__exit__.side_effect = (
+            lambda *args: wait_for_radosgw_healthy.assert_called_once_with(
+                'radosgw', 30))
+        configs = MagicMock()
+        configs.replaced = {}
+        _read_file.return_value = b'[global]\nmon host = b\n'
+        utils.apply_ceph_conf_changes(configs, 'radosgw', stopstart=True)
+        haproxy_admin.drained.assert_called_once_with('ceph-radosgw-0', 60)
+        drained.__enter__.assert_called_once_with()
+        service.assert_has_calls([call('stop', 'radosgw'),
+                                  call('start', 'radosgw')])
+        drained.__exit__.assert_called_once()
+
+    def test_lazy_config_renderer(self):
+        factory = MagicMock()
+        configs = utils.LazyConfigRenderer(factory)
+        factory.assert_not_called()
+        configs.write_all()
+        configs.complete_contexts()
+        factory.assert_called_once_with()
+        factory.return_value.write_all.assert_called_once_with()
+
+    def test_lazy_config_renderer_status_configs(self):
+        factory = MagicMock()
+        status_factory = MagicMock()
+        configs = utils.LazyConfigRenderer(factory, status_factory)
+        self.assertIs(configs.status_configs(), status_factory.return_value)
+        self.assertIs(configs.status_configs(), status_factory.return_value)
+        status_factory.assert_called_once_with()
+        factory.assert_not_called()
+        configs.write_all()
+        self.assertIs(configs.status_configs(), configs)
+        configs = utils.LazyConfigRenderer(factory)
+        self.assertIs(configs.status_configs(), configs)
+
+    @patch.object(utils, 'get_optional_interfaces')
+    @patch.object(utils, 'config_contexts')
+    def test_register_status_configs(self, config_contexts,
+                                     get_optional_interfaces):
+        mon, haproxy, ssl = MagicMock(), MagicMock(), MagicMock()
+        mon.interfaces = ['mon']
+        haproxy.interfaces = ['cluster']
+        ssl.interfaces = ['https']
+        mon.return_value = {'mon_hosts': '10.0.0.1'}
+        config_contexts.return_value = {
+            utils.HAPROXY_CONF: [haproxy],
+            utils.CEPH_CONF: [mon],
+            utils.APACHE_SITE_24_CONF: [ssl],
+        }
+        get_optional_interfaces.return_value = {}
+        configs = utils.register_status_configs()
+        self.assertEqual(list(configs.templates), [utils.CEPH_CONF])
+        self.assertEqual(configs.complete_contexts(), ['mon'])
+        haproxy.assert_not_called()
+        ssl.assert_not_called()
+        get_optional_interfaces.return_value = {'ha': ['cluster']}
+        configs = utils.register_status_configs()
+        self.assertEqual(list(configs.templates),
+                         [utils.HAPROXY_CONF, utils.CEPH_CONF])
+
+    @patch.object(utils.multisite, 'subprocess')
+    @patch.object(utils.multisite, 'unitdata')
+    @patch.object(utils.multisite, 'hookenv')
+    @patch.object(utils.context, 'CephBlueStoreCompressionContext')
+    @patch.object(utils, 'ready_for_service')
+    @patch.object(utils, 'relation_data')
+    @patch.object(utils, 'services')
+    @patch.object(utils, 'make_assess_status_func')
+    @patch.object(utils, 'get_optional_interfaces')
+    @patch.object(utils, 'config_contexts')
+    def test_assess_status_warm_cache(self, config_contexts,
+                                      get_optional_interfaces,
+                                      make_assess_status_func, services,
+                                      relation_data, ready_for_service,
+                                      bluestore_compression, ms_hookenv,
+                                      ms_unitdata, ms_subprocess):
+        # update-status of a healthy multi-site unit runs no radosgw-admin
+        # once the multi-site status facts are kept in unit data
+        rgw_context = utils.ceph_radosgw_context
+        for key, value in (('realm', 'beedata'), ('zonegroup', 'brundall'),
+                           ('zone', 'brundall-north')):
+            self.test_config.set(key, value)
+        self.relation_ids.side_effect = (
+            lambda name: {'mon': ['mon:1'],
+                          'primary': ['primary:2']}.get(name, []))
+        self.related_units.return_value = ['ceph-mon/0']
+        relation_data.return_value = {
+            'auth': 'cephx', 'fsid': 'f1d', 'ceph-public-address': '10.0.0.1',
+            'rgw.testhost_key': 'secret'}
+        ready_for_service.return_value = True
+        self.leader_get.return_value = 'x'
+        get_optional_interfaces.return_value = {}
+        config_contexts.return_value = {
+            utils.CEPH_CONF: [rgw_context.MonContext()]}
+        make_assess_status_func.side_effect = (
+            lambda configs, interfaces, charm_func, **kwargs: lambda: (
+                self.assertEqual(configs.complete_contexts(), ['mon']),
+                self.assertEqual(charm_func(configs), ('unknown', ''))))
+        ms_hookenv.config.side_effect = self.test_config.get
+        now = time.time()
+        status_cache = {
+            key: {'time': now, 'value': value} for key, value in (
+                ('cached_is_multisite_configured'
+                 '["brundall-north", "brundall"]', True),
+                ('cached_sync_summary[]', 'multi-site sync caught up'))}
+        ms_unitdata.kv.return_value.get.side_effect = (
+            lambda key: {utils.multisite.STATUS_CACHE_KEY:
+                         status_cache}.get(key))
+        with patch.multiple(rgw_context, relation_ids=self.relation_ids,
+                            related_units=self.related_units,
+                            config=self.test_config.get,
+                            cmp_pkgrevno=MagicMock(return_value=1),
+                            determine_api_port=MagicMock(return_value=70),
+                            unit_public_ip=MagicMock(),
+                            https=MagicMock(return_value=False),
+                            CephConfContext=MagicMock()):
+            utils.multisite.flush_cache()
+            utils.assess_status(utils.register_status_configs())
+        self.assertEqual(ms_subprocess.mock_calls, [])
+        self.status_set.assert_called_once_with(
+            'active', 'Unit is ready, multi-site sync caught up')
+
+    @patch.object(utils, 'resource_map')
+    def test_config_contexts(self, resource_map):
+        mon = MagicMock()
+        resource_map.return_value = {
+            utils.CEPH_CONF: {'contexts': [mon], 'services': []}}
+        self.cmp_pkgrevno.return_value = 1
+        contexts = utils.config_contexts()
+        self.assertEqual(contexts[utils.CEPH_CONF][0], mon)
+        self.assertIsInstance(
+            contexts[utils.CEPH_CONF][1],
+            utils.ceph_radosgw_context.IdentityServiceContext)
+        self.cmp_pkgrevno.return_value = -1
+        self.assertEqual(utils.config_contexts(), {utils.CEPH_CONF: [mon]})
+
     def test_multisite_deployment(self):
         self.test_config.set('zone', 'testzone')
         self.test_config.set('zonegroup', 'testzonegroup')
@@ -324,3 +729,155 @@ class CephRadosGWUtilTests(CharmTestCase):
         s3_info = utils.s3_app('myapp')
         self.assertEqual(s3_info, 'a')
         self.leader_get.assert_called_once_with('s3-apps')
+
+
+class ContextInvalidationTests(unittest.TestCase):
+
+    @patch.object(utils.ceph_radosgw_context, 'invalidate_contexts')
+    @patch.object(utils.hookenv, 'relation_id')
+    @patch.object(utils.hookenv, 'relation_set')
+    def test_relation_set(self, relation_set, relation_id,
+                          invalidate_contexts):
+        relation_id.return_value = 'cluster:3'
+        utils.relation_set(relation_id='mon:1', key='value')
+        relation_set.assert_called_once_with(
+            relation_id='mon:1', relation_settings=None, key='value')
+        invalidate_contexts.assert_called_once_with('mon')
+        utils.relation_set(relation_settings={'key': 'value'})
+        invalidate_contexts.assert_called_with('cluster')
+
+    @patch.object(utils.ceph_radosgw_context, 'invalidate_contexts')
+    @patch.object(utils.hookenv, 'leader_set')
+    def test_leader_set(self, leader_set, invalidate_contexts):
+        utils.leader_set(namespace_tenants=True)
+        leader_set.assert_called_once_with(None, namespace_tenants=True)
+        invalidate_contexts.assert_called_once_with('leader')
+
+
+class DictContext(object):
+
+    interfaces = []
+
+    def __init__(self, **ctxt):
+        self.ctxt = ctxt
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return dict(self.ctxt)
+
+
+class FingerprintingConfigRendererTests(CharmTestCase):
+
+    def setUp(self):
+        super(FingerprintingConfigRendererTests, self).setUp(utils, TO_PATCH)
+        patcher = patch.object(utils, 'log')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.templates_dir = os.path.join(self.tmpdir, 'templates')
+        os.mkdir(self.templates_dir)
+        self.write_template('port = {{ port }}')
+        self.config_file = os.path.join(self.tmpdir, 'test.conf')
+        self.db = {}
+        mock_db = MagicMock()
+        mock_db.get.side_effect = self.db.get
+        mock_db.set.side_effect = self.db.__setitem__
+        self.unitdata.kv.return_value = mock_db
+        self.context = DictContext(port=80)
+        self.renderer = self.new_renderer()
+
+    def new_renderer(self):
+        renderer = utils.FingerprintingConfigRenderer(
+            templates_dir=self.templates_dir, openstack_release='icehouse')
+        renderer.register(self.config_file, [self.context])
+        return renderer
+
+    def write_template(self, source):
+        with open(os.path.join(self.templates_dir, 'test.conf'), 'w') as f:
+            f.write(source)
+
+    def read_config(self):
+        with open(self.config_file) as f:
+            return f.read()
+
+    def test_write(self):
+        self.renderer.write_all()
+        self.assertEqual(self.read_config(), 'port = 80')
+        self.assertEqual(
+            set(self.db[utils.RENDERED_CONFIGS_KEY][self.config_file]),
+            {'fingerprint', 'sha256'})
+
+    @patch('jinja2.Template.render')
+    def test_write_unchanged(self, render):
+        render.return_value = 'port = 80'
+        self.renderer.write_all()
+        os.utime(self.config_file, (0, 0))
+        # A new hook, with a new renderer and the same context.
+        self.new_renderer().write_all()
+        render.assert_called_once_with({'port': 80})
+        self.assertEqual(os.stat(self.config_file).st_mtime, 0)
+        self.assertEqual(self.context.calls, 2)
+
+    def test_write_context_changed(self):
+        self.renderer.write_all()
+        self.context.ctxt['port'] = 8080
+        self.new_renderer().write_all()
+        self.assertEqual(self.read_config(), 'port = 8080')
+
+    def test_write_template_changed(self):
+        self.renderer.write_all()
+        self.write_template('rgw port = {{ port }}')
+        self.new_renderer().write_all()
+        self.assertEqual(self.read_config(), 'rgw port = 80')
+
+    def test_write_file_modified(self):
+        self.renderer.write_all()
+        with open(self.config_file, 'w') as f:
+            f.write('port = 1\n')
+        self.new_renderer().write_all()
+        self.assertEqual(self.read_config(), 'port = 80')
+        os.unlink(self.config_file)
+        self.new_renderer().write_all()
+        self.assertEqual(self.read_config(), 'port = 80')
+
+    def test_write_identical_output(self):
+        with open(self.config_file, 'w') as f:
+            f.write('port = 80')
+        os.utime(self.config_file, (0, 0))
+        self.renderer.write_all()
+        self.assertEqual(os.stat(self.config_file).st_mtime, 0)
+        self.assertIn(self.config_file, self.db[utils.RENDERED_CONFIGS_KEY])
+
+    def test_replaced(self):
+        self.renderer.write_all()
+        self.assertEqual(self.renderer.replaced, {self.config_file: b''})
+        self.context.ctxt['port'] = 8080
+        self.renderer.write_all()
+        self.assertEqual(self.renderer.replaced, {self.config_file: b''})
+        renderer = self.new_renderer()
+        renderer.write_all()
+        self.assertEqual(renderer.replaced, {})
+        self.context.ctxt['port'] = 80
+        renderer.write_all()
+        self.assertEqual(renderer.replaced,
+                         {self.config_file: b'port = 8080'})
+
+    def test_write_unserializable_context(self):
+        self.context.ctxt['port'] = {1, 2}
+        self.renderer.write_all()
+        self.assertIsNone(
+            self.db[utils.RENDERED_CONFIGS_KEY][self.config_file][
+                'fingerprint'])
+
+    def test_write_not_registered(self):
+        with self.assertRaises(utils.templating.OSConfigException):
+            self.renderer.write('/etc/unknown.conf')
+
+    def test_context_fingerprint(self):
+        self.assertEqual(utils.context_fingerprint({'a': 1, 'b': 2}, 'x'),
+                         utils.context_fingerprint({'b': 2, 'a': 1}, 'x'))
+        self.assertNotEqual(utils.context_fingerprint({'a': 1}, 'x'),
+                            utils.context_fingerprint({'a': 1}, 'y'))
+        self.assertIsNone(utils.context_fingerprint({'a': object()}, 'x'))
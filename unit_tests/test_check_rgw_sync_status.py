@@ -0,0 +1,169 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import sync_status
+
+from test_sync_status import (
+    PRIMARY_CAUGHT_UP,
+    SECONDARY_BEHIND,
+    SECONDARY_BEHIND_LEGACY,
+    SOURCE_FAILED,
+)
+
+sys.path.append('files/nagios')
+
+import check_rgw_sync_status  # noqa: E402
+
+THRESHOLDS = {
+    'behind_warning': 2,
+    'behind_critical': 10,
+    'lag_warning': 300,
+    'lag_critical': 3600,
+    'metadata_stall': 1800,
+}
+
+
+class CheckRGWSyncStatusTestCase(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.cache_file = os.path.join(tmpdir.name, 'sync-status.txt')
+
+    def _check(self, output, **thresholds):
+        return check_rgw_sync_status.check(
+            sync_status.parse_sync_status(output),
+            **dict(THRESHOLDS, **thresholds))
+
+    def test_check_caught_up(self):
+        self.assertEqual(self._check(PRIMARY_CAUGHT_UP),
+                         (check_rgw_sync_status.STATE_OK,
+                          'multi-site sync caught up'))
+
+    def test_check_behind(self):
+        self.assertEqual(
+            self._check(SECONDARY_BEHIND),
+            (check_rgw_sync_status.STATE_WARNING,
+             'data behind on 3 shards, oldest change 599s old'))
+        self.assertEqual(
+            self._check(SECONDARY_BEHIND, behind_critical=3),
+            (check_rgw_sync_status.STATE_CRITICAL,
+             'data behind on 3 shards, oldest change 599s old'))
+        self.assertEqual(
+            self._check(SECONDARY_BEHIND, behind_warning=4, lag_warning=600),
+            (check_rgw_sync_status.STATE_OK,
+             'multi-site sync metadata behind on 2 shards, data behind on '
+             '3 shards, 2 shards recovering, lag 599s'))
+
+    def test_check_metadata_stall(self):
+        self.assertEqual(
+            self._check(SECONDARY_BEHIND, behind_warning=4, lag_warning=600,
+                        metadata_stall=60),
+            (check_rgw_sync_status.STATE_CRITICAL,
+             'metadata sync stalled for 120s on 2 shards'))
+
+    def test_check_source_failed(self):
+        self.assertEqual(
+            self._check(SOURCE_FAILED),
+            (check_rgw_sync_status.STATE_CRITICAL,
+             'failed to retrieve sync info: (5) Input/output error'))
+
+    @mock.patch.object(check_rgw_sync_status.subprocess, 'check_output')
+    def test_refresh(self, check_output):
+        check_output.return_value = PRIMARY_CAUGHT_UP.encode('UTF-8')
+        self.assertTrue(check_rgw_sync_status.refresh(
+            self.cache_file, 300, 'rgw.testhost'))
+        check_output.assert_called_once_with(
+            ['radosgw-admin', '--id=rgw.testhost', 'sync', 'status'],
+            stderr=check_rgw_sync_status.subprocess.DEVNULL, timeout=60)
+        with open(self.cache_file) as f:
+            self.assertEqual(f.read(), PRIMARY_CAUGHT_UP)
+        # The cached report is reused until it expires.
+        self.assertFalse(check_rgw_sync_status.refresh(
+            self.cache_file, 300, 'rgw.testhost'))
+        self.assertEqual(check_output.call_count, 1)
+        self.assertTrue(check_rgw_sync_status.refresh(
+            self.cache_file, 0, 'rgw.testhost'))
+        self.assertEqual(check_output.call_count, 2)
+
+    def test_main(self):
+        with open(self.cache_file, 'w') as f:
+            f.write(SOURCE_FAILED)
+        self.assertEqual(
+            check_rgw_sync_status.main(['--cache-file', self.cache_file]),
+            check_rgw_sync_status.STATE_CRITICAL)
+
+    @mock.patch.object(check_rgw_sync_status.subprocess, 'check_output')
+    def _refresh_and_check(self, output, args, check_output):
+        check_output.return_value = output.encode('UTF-8')
+        self.assertEqual(
+            check_rgw_sync_status.main(['--refresh', '--cache-file',
+                                        self.cache_file]), 0)
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            state = check_rgw_sync_status.main(
+                ['--cache-file', self.cache_file] + args)
+        return state, stdout.getvalue().strip()
+
+    def test_main_lag(self):
+        self.assertEqual(
+            self._refresh_and_check(SECONDARY_BEHIND, []),
+            (check_rgw_sync_status.STATE_OK,
+             'OK: multi-site sync metadata behind on 2 shards, data behind '
+             'on 3 shards, 2 shards recovering, lag 599s'))
+        self.assertEqual(
+            self._refresh_and_check(SECONDARY_BEHIND,
+                                    ['--lag-warning', '300']),
+            (check_rgw_sync_status.STATE_WARNING,
+             'WARNING: oldest change 599s old'))
+        self.assertEqual(
+            self._refresh_and_check(SECONDARY_BEHIND,
+                                    ['--lag-warning', '300',
+                                     '--lag-critical', '500']),
+            (check_rgw_sync_status.STATE_CRITICAL,
+             'CRITICAL: oldest change 599s old'))
+        self.assertEqual(
+            self._refresh_and_check(SECONDARY_BEHIND,
+                                    ['--metadata-stall', '60']),
+            (check_rgw_sync_status.STATE_CRITICAL,
+             'CRITICAL: metadata sync stalled for 120s on 2 shards'))
+
+    def test_main_lag_legacy(self):
+        state, message = self._refresh_and_check(SECONDARY_BEHIND_LEGACY, [])
+        self.assertEqual(state, check_rgw_sync_status.STATE_CRITICAL)
+        self.assertRegex(message, r'^CRITICAL: oldest change \d+s old$')
+
+    def test_main_stale(self):
+        with open(self.cache_file, 'w') as f:
+            f.write(PRIMARY_CAUGHT_UP)
+        stale = time.time() - 1000
+        os.utime(self.cache_file, (stale, stale))
+        self.assertEqual(
+            check_rgw_sync_status.main(['--cache-file', self.cache_file,
+                                        '--max-age', '900']),
+            check_rgw_sync_status.STATE_UNKNOWN)
+
+    def test_main_missing(self):
+        self.assertEqual(
+            check_rgw_sync_status.main(['--cache-file', self.cache_file]),
+            check_rgw_sync_status.STATE_UNKNOWN)
@@ -0,0 +1,168 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import socketserver
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import haproxy_admin
+
+STAT_HEADER = '# pxname,svname,status,scur,'
+
+
+class StubHAProxy(object):
+    """Admin socket answering 'show stat' from a table of server sessions"""
+
+    def __init__(self, path):
+        self.sessions = {
+            ('rgw', 'ceph-radosgw-0'): [3, 3, 0],
+            ('rgw', 'ceph-radosgw-1'): [1],
+            ('rgw-ssl', 'ceph-radosgw-0'): [0],
+        }
+        self.commands = []
+        stub = self
+
+        class Handler(socketserver.StreamRequestHandler):
+
+            def handle(self):
+                cmd = self.rfile.readline().decode('UTF-8').strip()
+                stub.commands.append(cmd)
+                self.wfile.write(stub.respond(cmd).encode('UTF-8'))
+
+        self.server = socketserver.UnixStreamServer(path, Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def respond(self, cmd):
+        if cmd == 'show stat':
+            lines = [STAT_HEADER]
+            for (backend, server), sessions in sorted(self.sessions.items()):
+                scur = sessions.pop(0) if len(sessions) > 1 else sessions[0]
+                lines.append('{},{},UP,{},'.format(backend, server, scur))
+            return '\n'.join(lines) + '\n'
+        if cmd.startswith('set server '):
+            if cmd.split()[2].split('/')[0] == 'unknown':
+                return 'No such backend.\n'
+            return '\n'
+        return 'Unknown command.\n'
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class HAProxyAdminTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, 'admin.sock')
+        self.haproxy = StubHAProxy(self.path)
+        self.addCleanup(self.haproxy.stop)
+        for name, target in (('hookenv', haproxy_admin),
+                             ('log', haproxy_admin),
+                             ('sleep', haproxy_admin.time)):
+            patcher = mock.patch.object(target, name)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+        self.hookenv.local_unit.return_value = 'ceph-radosgw/0'
+
+    def test_server_name(self):
+        self.assertEqual(haproxy_admin.server_name(), 'ceph-radosgw-0')
+        self.assertEqual(haproxy_admin.server_name('ceph-radosgw/12'),
+                         'ceph-radosgw-12')
+
+    def test_command_unreachable(self):
+        with self.assertRaises(haproxy_admin.HAProxyAdminError):
+            haproxy_admin.command(
+                'show stat', path=os.path.join(self.tmpdir, 'missing.sock'))
+
+    def test_server_stats(self):
+        stats = haproxy_admin.server_stats('ceph-radosgw-0', path=self.path)
+        self.assertEqual(sorted(stats), ['rgw', 'rgw-ssl'])
+        self.assertEqual(stats['rgw']['scur'], '3')
+        self.assertEqual(stats['rgw-ssl']['status'], 'UP')
+
+    def test_server_stats_unexpected(self):
+        with mock.patch.object(haproxy_admin, 'command') as command:
+            command.return_value = 'Unknown command.\n'
+            with self.assertRaises(haproxy_admin.HAProxyAdminError):
+                haproxy_admin.server_stats('ceph-radosgw-0', path=self.path)
+
+    def test_set_server_state(self):
+        self.assertEqual(
+            haproxy_admin.set_server_state('ceph-radosgw-0', 'drain',
+                                           path=self.path),
+            ['rgw', 'rgw-ssl'])
+        self.assertEqual(self.haproxy.commands[1:], [
+            'set server rgw/ceph-radosgw-0 state drain',
+            'set server rgw-ssl/ceph-radosgw-0 state drain',
+        ])
+        with self.assertRaises(ValueError):
+            haproxy_admin.set_server_state('ceph-radosgw-0', 'down',
+                                           path=self.path)
+
+    def test_set_server_state_error(self):
+        self.haproxy.sessions[('unknown', 'ceph-radosgw-0')] = [0]
+        with self.assertRaises(haproxy_admin.HAProxyAdminError):
+            haproxy_admin.set_server_state('ceph-radosgw-0', 'drain',
+                                           path=self.path)
+
+    def test_drain(self):
+        self.assertTrue(
+            haproxy_admin.drain('ceph-radosgw-0', 60, path=self.path))
+        self.sleep.assert_called_once_with(haproxy_admin.DRAIN_POLL_INTERVAL)
+
+    def test_drain_unknown_server(self):
+        self.assertTrue(
+            haproxy_admin.drain('ceph-radosgw-5', 60, path=self.path))
+        self.assertEqual(self.haproxy.commands, ['show stat'])
+
+    @mock.patch.object(haproxy_admin.time, 'monotonic')
+    def test_drain_timeout(self, monotonic):
+        monotonic.side_effect = [0, 30, 60]
+        self.assertFalse(
+            haproxy_admin.drain('ceph-radosgw-1', 60, path=self.path))
+        self.assertEqual(self.sleep.call_count, 1)
+
+    def test_drained(self):
+        with haproxy_admin.drained('ceph-radosgw-0', 60, path=self.path):
+            self.assertIn('set server rgw/ceph-radosgw-0 state drain',
+                          self.haproxy.commands)
+        self.assertEqual(self.haproxy.commands[-2:], [
+            'set server rgw/ceph-radosgw-0 state ready',
+            'set server rgw-ssl/ceph-radosgw-0 state ready',
+        ])
+
+    def test_drained_raises(self):
+        with self.assertRaises(RuntimeError):
+            with haproxy_admin.drained('ceph-radosgw-0', 60, path=self.path):
+                raise RuntimeError()
+        self.assertEqual(self.haproxy.commands[-1],
+                         'set server rgw-ssl/ceph-radosgw-0 state ready')
+
+    def test_drained_unreachable(self):
+        ran = []
+        with haproxy_admin.drained(
+                'ceph-radosgw-0', 60,
+                path=os.path.join(self.tmpdir, 'missing.sock')):
+            ran.append(True)
+        self.assertEqual(ran, [True])
+        self.log.assert_called_once_with(
+            mock.ANY, level=self.hookenv.WARNING)
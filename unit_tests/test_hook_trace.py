@@ -0,0 +1,121 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import hook_trace
+
+
+class HookTraceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.addCleanup(hook_trace.stop)
+        self.path = os.path.join(self.tmpdir.name, hook_trace.TRACE_FILE)
+        self.root = os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__)))
+
+    def test_command_category(self):
+        self.assertEqual(hook_trace.command_category(['relation-get', '-']),
+                         'relation-get')
+        self.assertEqual(
+            hook_trace.command_category(['/usr/bin/apt-get', 'install']),
+            'apt')
+        self.assertEqual(hook_trace.command_category([]), 'unknown')
+
+    def test_summarize_argv(self):
+        self.assertEqual(
+            hook_trace.summarize_argv(
+                ['/usr/bin/radosgw-admin', '--id=rgw.testhost', 'user',
+                 'create', '--access-key=mykey', '--secret=mysecret']),
+            'radosgw-admin --id=rgw.testhost user create '
+            '--access-key=*** ...')
+        self.assertEqual(
+            hook_trace.summarize_argv(['juju-log', 'x' * 100]),
+            'juju-log {}...'.format('x' * 45))
+
+    def test_trace_subprocesses(self):
+        tracer = hook_trace.start('config-changed', root=self.root)
+        subprocess.check_output([sys.executable, '-c', 'pass'])
+        subprocess.call([sys.executable, '-c', 'pass'])
+        self.assertIs(hook_trace.stop(), tracer)
+        subprocess.check_call([sys.executable, '-c', 'pass'])
+        self.assertIs(subprocess.Popen, hook_trace._popen)
+
+        report = tracer.report()
+        self.assertEqual(report['hook'], 'config-changed')
+        self.assertEqual(report['calls'], 2)
+        category = os.path.basename(sys.executable)
+        self.assertEqual(report['categories'][category]['count'], 2)
+        self.assertEqual(len(report['slowest']), 2)
+        self.assertTrue(report['slowest'][0]['caller'].startswith(
+            os.path.join('unit_tests', 'test_hook_trace.py:')))
+        self.assertTrue(report['slowest'][0]['caller'].endswith(
+            'test_trace_subprocesses'))
+
+    def test_report_slowest(self):
+        tracer = hook_trace.HookTracer('update-status', self.root)
+        for duration in (0.1, 0.5, 0.2):
+            tracer.record(['radosgw-admin', 'sync', 'status'], duration,
+                          'hooks/utils.py:1 assess_status')
+        tracer.record(['juju-log', 'hello'], 0.01,
+                      'hooks/hooks.py:1 update_status')
+        report = tracer.report(slowest=2)
+        self.assertEqual([call['seconds'] for call in report['slowest']],
+                         [0.5, 0.2])
+        self.assertEqual(report['categories'], {
+            'radosgw-admin': {'count': 3, 'seconds': 0.8},
+            'juju-log': {'count': 1, 'seconds': 0.01},
+        })
+        self.assertEqual(report['subprocess-seconds'], 0.81)
+
+    def test_write_and_read_traces(self):
+        self.assertEqual(hook_trace.read_traces(self.path), [])
+        for i in range(5):
+            hook_trace.write_trace(self.path, {'hook': str(i)}, keep=3)
+        self.assertEqual(
+            [trace['hook'] for trace in hook_trace.read_traces(self.path)],
+            ['2', '3', '4'])
+        self.assertEqual(
+            hook_trace.read_traces(self.path, count=1), [{'hook': '4'}])
+        self.assertEqual(os.listdir(self.tmpdir.name),
+                         [hook_trace.TRACE_FILE])
+
+    @mock.patch.object(hook_trace, 'hookenv')
+    def test_traced(self, hookenv):
+        hookenv.config.return_value = True
+        hookenv.charm_dir.return_value = self.tmpdir.name
+        with self.assertRaises(ValueError):
+            with hook_trace.traced('install') as tracer:
+                subprocess.check_call([sys.executable, '-c', 'pass'])
+                raise ValueError()
+        self.assertIsNone(hook_trace._tracer)
+        traces = hook_trace.read_traces(self.path)
+        self.assertEqual(len(traces), 1)
+        self.assertEqual(traces[0]['hook'], 'install')
+        self.assertEqual(traces[0]['calls'], len(tracer.calls))
+
+    @mock.patch.object(hook_trace, 'hookenv')
+    def test_traced_disabled(self, hookenv):
+        hookenv.config.return_value = False
+        with hook_trace.traced('install') as tracer:
+            self.assertIsNone(tracer)
+            self.assertIs(subprocess.Popen, hook_trace._popen)
+        hookenv.charm_dir.assert_not_called()
@@ -12,8 +12,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import base64
-import json
-import os
 from unittest.mock import (
     patch, call, MagicMock, ANY
 )
@@ -21,8 +19,11 @@ from unittest.mock import (
 from test_utils import (
     CharmTestCase,
 )
+from charmhelpers.contrib.openstack import utils as ch_utils
 from charmhelpers.contrib.openstack.ip import PUBLIC
 
+import charms_ceph.utils  # noqa: F401 - patched by test_upgrade_available
+
 with patch('charmhelpers.contrib.hardening.harden.harden') as mock_dec:
     mock_dec.side_effect = (lambda *dargs, **dkwargs: lambda f:
                             lambda *args, **kwargs: f(*args, **kwargs))
@@ -30,6 +31,8 @@ with patch('charmhelpers.contrib.hardening.harden.harden') as mock_dec:
         with patch('utils.register_configs'):
             import hooks as ceph_hooks
 
+import utils  # noqa: E402
+
 TO_PATCH = [
     'CONFIGS',
     'add_source',
@@ -37,7 +40,10 @@ TO_PATCH = [
     'apt_install',
     'apt_purge',
     'boto_client',
+    'changed_config_keys',
+    'clear_config_full_pass',
     'config',
+    'config_full_pass_requested',
     'cmp_pkgrevno',
     'execd_preinstall',
     'listen_port',
@@ -49,6 +55,7 @@ TO_PATCH = [
     'relation_set',
     'relation_get',
     'related_units',
+    'relation_data',
     'remote_service_name',
     'status_set',
     'subprocess',
@@ -58,7 +65,7 @@ TO_PATCH = [
     'disable_unused_apache_sites',
     'service_reload',
     'service_stop',
-    'service_restart',
+    'graceful_restart',
     'service_pause',
     'service_resume',
     'service',
@@ -66,12 +73,13 @@ TO_PATCH = [
     'socket',
     'restart_map',
     'systemd_based_radosgw',
+    'request_config_full_pass',
     'request_per_unit_key',
+    'save_config_snapshot',
     'get_certificate_request',
     'process_certificates',
     'filter_installed_packages',
     'filter_missing_packages',
-    'ceph_utils',
     'multisite_deployment',
     'multisite',
     'ready_for_service',
@@ -79,25 +87,6 @@ TO_PATCH = [
 ]
 
 
-# Stub Methods
-def get_zonegroup_stub():
-    # populate dummy zones info
-    zone_one = {}
-    zone_one['id'] = "test_zone_id_one"
-    zone_one['name'] = "testzone"
-
-    zone_two = {}
-    zone_two['id'] = "test_zone_id_two"
-    zone_two['name'] = "testzone_two"
-
-    # populate dummy zonegroup info
-    zonegroup = {}
-    zonegroup['name'] = "testzonegroup"
-    zonegroup['master_zone'] = "test_zone_id_one"
-    zonegroup['zones'] = [zone_one, zone_two]
-    return zonegroup
-
-
 class CephRadosGWTests(CharmTestCase):
 
     def setUp(self):
@@ -113,8 +102,40 @@ class CephRadosGWTests(CharmTestCase):
         self.filter_installed_packages.side_effect = lambda pkgs: pkgs
         self.filter_missing_packages.side_effect = lambda pkgs: pkgs
         self.multisite_deployment.return_value = False
+        # All options are reported as changed on the first config-changed.
+        self.config_full_pass_requested.return_value = False
+        self.changed_config_keys.side_effect = (
+            lambda: set(self.test_config.get_all())
+        )
 
-    def test_upgrade_available(self):
+    @patch.object(ceph_hooks, 'apply_ceph_conf_changes')
+    def test_radosgw_restart_functions(self, apply_ceph_conf_changes):
+        self.service_name.return_value = 'ceph-radosgw@rgw.testhost'
+        restart_functions = ceph_hooks.radosgw_restart_functions(True)
+        self.assertEqual(list(restart_functions),
+                         ['ceph-radosgw@rgw.testhost'])
+        restart_functions['ceph-radosgw@rgw.testhost'](
+            'ceph-radosgw@rgw.testhost')
+        apply_ceph_conf_changes.assert_called_once_with(
+            self.CONFIGS, 'ceph-radosgw@rgw.testhost', stopstart=True)
+
+    @patch.object(ceph_hooks, 'hook_name')
+    @patch.object(ceph_hooks, 'ch_relation_id')
+    def test_invalidate_multisite_status(self, relation_id, hook_name):
+        relation_id.return_value = None
+        hook_name.return_value = 'update-status'
+        ceph_hooks.invalidate_multisite_status()
+        self.multisite.invalidate_status_cache.assert_not_called()
+        hook_name.return_value = 'config-changed'
+        ceph_hooks.invalidate_multisite_status()
+        relation_id.return_value = 'secondary:1'
+        hook_name.return_value = 'secondary-relation-changed'
+        ceph_hooks.invalidate_multisite_status()
+        self.assertEqual(
+            self.multisite.invalidate_status_cache.call_count, 2)
+
+    @patch('charms_ceph.utils')
+    def test_upgrade_available(self, ceph_utils):
         _vers = {
             'distro': 'luminous',
             'cloud:bionic-rocky': 'mimic',
@@ -125,10 +146,10 @@ class CephRadosGWTests(CharmTestCase):
         mock_config.previous.return_value = 'distro'
         self.config.side_effect = None
         self.config.return_value = mock_config
-        self.ceph_utils.UPGRADE_PATHS = {
+        ceph_utils.UPGRADE_PATHS = {
             'luminous': 'mimic',
         }
-        self.ceph_utils.resolve_ceph_version.side_effect = (
+        ceph_utils.resolve_ceph_version.side_effect = (
             lambda v: _vers.get(v)
         )
         self.assertTrue(ceph_hooks.upgrade_available())
@@ -186,6 +207,7 @@ class CephRadosGWTests(CharmTestCase):
         is_leader.assert_called_once()
         leader_set.assert_called_once_with(namespace_tenants=False)
         self.service_pause.assert_called_once_with('radosgw')
+        self.request_config_full_pass.assert_called_once_with()
 
     @patch.object(ceph_hooks, 'leader_set')
     @patch.object(ceph_hooks, 'is_leader')
@@ -215,11 +237,11 @@ class CephRadosGWTests(CharmTestCase):
         mock_certs_joined.assert_called_once_with('certificates:1')
 
     @patch.object(ceph_hooks, 'service_name')
-    @patch.object(ceph_hooks, 'service_restart')
+    @patch.object(ceph_hooks, 'graceful_restart')
     @patch.object(ceph_hooks, 'certs_joined')
     @patch.object(ceph_hooks, 'update_nrpe_config')
     def test_config_changed_upgrade(self, update_nrpe_config,
-                                    mock_certs_joined, mock_service_restart,
+                                    mock_certs_joined, mock_graceful_restart,
                                     mock_service_name):
         _install_packages = self.patch('install_packages')
         _install_packages.return_value = True
@@ -233,7 +255,105 @@ class CephRadosGWTests(CharmTestCase):
         self.CONFIGS.write_all.assert_called_with()
         update_nrpe_config.assert_called_with()
         mock_certs_joined.assert_called_once_with('certificates:1')
-        mock_service_restart.assert_called_once_with('radosgw@localhost')
+        mock_graceful_restart.assert_called_once_with('radosgw@localhost')
+
+    @patch.object(ceph_hooks, 'process_multisite_relations')
+    @patch.object(ceph_hooks, 'configure_https')
+    @patch.object(ceph_hooks, 'identity_changed')
+    @patch.object(ceph_hooks, 'mon_relation')
+    @patch.object(ceph_hooks, 'certs_joined')
+    @patch.object(ceph_hooks, 'update_nrpe_config')
+    def test_config_changed_loglevel(self, update_nrpe_config,
+                                     mock_certs_joined, mock_mon_relation,
+                                     mock_identity_changed,
+                                     mock_configure_https,
+                                     mock_process_multisite_relations):
+        self.patch('install_packages')
+        self.changed_config_keys.side_effect = None
+        self.changed_config_keys.return_value = {'loglevel'}
+        self.relation_ids.side_effect = lambda name: ['{}:1'.format(name)]
+        self.related_units.return_value = ['unit/0']
+        ceph_hooks.config_changed()
+        self.CONFIGS.write_all.assert_called_once_with()
+        mock_configure_https.assert_not_called()
+        update_nrpe_config.assert_not_called()
+        mock_certs_joined.assert_not_called()
+        mock_mon_relation.assert_not_called()
+        mock_identity_changed.assert_not_called()
+        mock_process_multisite_relations.assert_not_called()
+        self.open_port.assert_called_once_with(
+            self.listen_port.return_value)
+        self.save_config_snapshot.assert_called_once_with()
+        self.clear_config_full_pass.assert_called_once_with()
+
+    @patch.object(ceph_hooks, 'process_multisite_relations')
+    @patch.object(ceph_hooks, 'configure_https')
+    @patch.object(ceph_hooks, 'identity_changed')
+    @patch.object(ceph_hooks, 'mon_relation')
+    @patch.object(ceph_hooks, 'certs_joined')
+    @patch.object(ceph_hooks, 'update_nrpe_config')
+    def test_config_changed_pool_config(self, update_nrpe_config,
+                                        mock_certs_joined, mock_mon_relation,
+                                        mock_identity_changed,
+                                        mock_configure_https,
+                                        mock_process_multisite_relations):
+        self.patch('install_packages')
+        self.changed_config_keys.side_effect = None
+        self.changed_config_keys.return_value = {'rgw-buckets-pool-weight'}
+        self.relation_ids.side_effect = lambda name: ['{}:1'.format(name)]
+        self.related_units.return_value = ['unit/0']
+        ceph_hooks.config_changed()
+        mock_mon_relation.assert_called_once_with('mon:1', 'unit/0')
+        mock_identity_changed.assert_not_called()
+        mock_certs_joined.assert_not_called()
+        mock_process_multisite_relations.assert_not_called()
+        update_nrpe_config.assert_not_called()
+
+    @patch.object(ceph_hooks, 'configure_https')
+    @patch.object(ceph_hooks, 'certs_joined')
+    @patch.object(ceph_hooks, 'update_nrpe_config')
+    def test_config_changed_full_pass(self, update_nrpe_config,
+                                      mock_certs_joined,
+                                      mock_configure_https):
+        self.patch('install_packages')
+        self.changed_config_keys.side_effect = None
+        self.changed_config_keys.return_value = set()
+        self.config_full_pass_requested.return_value = True
+        _relations = {
+            'certificates': ['certificates:1']
+        }
+        self.relation_ids.side_effect = lambda name: _relations.get(name, [])
+        ceph_hooks.config_changed()
+        mock_configure_https.assert_called_once_with()
+        update_nrpe_config.assert_called_once_with()
+        mock_certs_joined.assert_called_once_with('certificates:1')
+        self.changed_config_keys.assert_not_called()
+        self.clear_config_full_pass.assert_called_once_with()
+
+    def test_config_changed_handlers_full_arg(self):
+        self.changed_config_keys.side_effect = None
+        self.changed_config_keys.return_value = set()
+        self.sys.argv = ['hooks/config-changed', '--full']
+        self.assertEqual(ceph_hooks.config_changed_handlers(),
+                         set(ceph_hooks.CONFIG_CHANGED_HANDLERS))
+
+    @patch.object(ceph_hooks, 'is_unit_paused_set')
+    @patch.object(ceph_hooks, 'update_nrpe_config')
+    def test_config_changed_paused(self, update_nrpe_config,
+                                   is_unit_paused_set):
+        self.patch('install_packages')
+        is_unit_paused_set.return_value = True
+        ceph_hooks.config_changed()
+        self.request_config_full_pass.assert_called_once_with()
+        self.clear_config_full_pass.assert_not_called()
+        update_nrpe_config.assert_not_called()
+
+    @patch.object(ceph_hooks, 'leader_get')
+    @patch.object(ceph_hooks, 'is_leader')
+    def test_upgrade_charm(self, is_leader, leader_get):
+        is_leader.return_value = False
+        ceph_hooks.upgrade_charm()
+        self.request_config_full_pass.assert_called_once_with()
 
     @patch.object(ceph_hooks, 'is_request_complete',
                   lambda *args, **kwargs: True)
@@ -244,7 +364,9 @@ class CephRadosGWTests(CharmTestCase):
         _ceph = self.patch('ceph')
         _ceph.import_radosgw_key.return_value = True
         is_leader.return_value = True
-        self.relation_get.return_value = 'seckey'
+        self.relation_data.return_value = {
+            'rgw.testinghostname_key': 'seckey',
+        }
         self.multisite.list_zones.side_effect = [
             [],           # at first the default zone doesn't exist, then...
             ['default'],  # ... it got created
@@ -267,7 +389,9 @@ class CephRadosGWTests(CharmTestCase):
         _ceph = self.patch('ceph')
         _ceph.import_radosgw_key.return_value = True
         is_leader.return_value = True
-        self.relation_get.return_value = 'seckey'
+        self.relation_data.return_value = {
+            'rgw.testinghostname_key': 'seckey',
+        }
         self.multisite.list_zones.side_effect = [
             [],           # at first the default zone doesn't exist, then...
             ['default'],  # ... it got created
@@ -293,7 +417,7 @@ class CephRadosGWTests(CharmTestCase):
                                 _resolve_address, is_leader):
         _ceph = self.patch('ceph')
         _ceph.import_radosgw_key.return_value = False
-        self.relation_get.return_value = None
+        self.relation_data.return_value = {}
         is_leader.return_value = True
         self.multisite.list_zones.side_effect = [
             [],           # at first the default zone doesn't exist, then...
@@ -311,7 +435,9 @@ class CephRadosGWTests(CharmTestCase):
                                               mock_send_request_if_needed):
         _ceph = self.patch('ceph')
         _ceph.import_radosgw_key.return_value = False
-        self.relation_get.return_value = 'seckey'
+        self.relation_data.return_value = {
+            'rgw.testinghostname_key': 'seckey',
+        }
         ceph_hooks.mon_relation()
         self.service_resume.assert_not_called()
         self.assertFalse(_ceph.import_radosgw_key.called)
@@ -556,25 +682,67 @@ class CephRadosGWTests(CharmTestCase):
         )
         mock_configure_https.assert_called_once_with()
 
+    @patch.object(ch_utils, 'config')
+    @patch.object(ch_utils, 'juju_log')
+    @patch.object(ch_utils, 'status_set')
+    @patch.object(ch_utils, 'is_unit_paused_set')
+    @patch.object(ch_utils, 'is_unit_upgrading_set')
+    @patch.object(utils, 'application_version_set')
+    @patch.object(utils, 'get_upstream_version')
+    @patch.object(utils, 'multisite_sync_message')
+    @patch.object(utils, 'status_get')
+    @patch.object(utils, 'check_optional_config_and_relations')
+    @patch.object(utils, 'services')
+    @patch.object(utils, 'get_optional_interfaces')
+    def test_update_status_configs_not_registered(
+            self, get_optional_interfaces, services, check_optional,
+            status_get, multisite_sync_message, get_upstream_version,
+            application_version_set, is_unit_upgrading_set,
+            is_unit_paused_set, status_set, juju_log, ch_config):
+        get_optional_interfaces.return_value = {}
+        services.return_value = []
+        check_optional.return_value = ('unknown', '')
+        status_get.return_value = ('active', 'Unit is ready')
+        multisite_sync_message.return_value = None
+        is_unit_upgrading_set.return_value = False
+        is_unit_paused_set.return_value = False
+        ch_config.return_value = None
+        register_configs = MagicMock()
+        register_status_configs = MagicMock()
+        status_configs = register_status_configs.return_value
+        status_configs.complete_contexts.return_value = ['mon']
+        configs = utils.LazyConfigRenderer(register_configs,
+                                           register_status_configs)
+        ceph_hooks.update_status()
+        utils.assess_status(configs)
+        register_configs.assert_not_called()
+        status_configs.complete_contexts.assert_called_once_with()
+        status_set.assert_called_once_with('active', 'Unit is ready')
+
+    @patch.object(ceph_hooks, 'leader_set')
+    @patch.object(ceph_hooks, 'leader_get')
     @patch.object(ceph_hooks, 'canonical_url')
     @patch.object(ceph_hooks, 'is_leader')
-    def test_radosgw_user_changed(self, is_leader, canonical_url):
+    def test_radosgw_user_changed(self, is_leader, canonical_url, leader_get,
+                                  leader_set):
         relation_data = {
             'radosgw-user:3': {'system-role': 'false'},
-            'radosgw-user:5': {'system-role': 'true'}}
+            'radosgw-user:5': {'system-role': 'true'},
+            'radosgw-user:7': {}}
         user = {
             'juju-radosgw-user-3': ('access1', 'key1'),
             'juju-radosgw-user-5-system': ('access2', 'key2')}
         self.ready_for_service.return_value = True
         is_leader.return_value = True
+        leader_get.return_value = None
         self.remote_service_name.return_value = 'ceph-dashboard'
         canonical_url.return_value = 'http://radosgw'
         self.listen_port.return_value = 80
         self.socket.gethostname.return_value = 'testinghostname'
         self.relation_ids.return_value = relation_data.keys()
         self.relation_get.side_effect = lambda rid, app: relation_data[rid]
-        self.multisite.list_users.return_value = ['juju-radosgw-user-3']
-        self.multisite.get_user_creds.side_effect = lambda u: user[u]
+        self.multisite.get_user_creds.side_effect = \
+            lambda u: user[u] if u == 'juju-radosgw-user-3' else (None, None)
         self.multisite.create_user.side_effect = lambda u, system_user: user[u]
         ceph_hooks.radosgw_user_changed()
         expected = [
@@ -599,12 +767,104 @@ class CephRadosGWTests(CharmTestCase):
                     'daemon-id': 'testinghostname'}),
             call(
                 relation_id='radosgw-user:5',
+                relation_settings={
+                    'internal-url': 'http://radosgw:80',
+                    'daemon-id': 'testinghostname'}),
+            call(
+                relation_id='radosgw-user:7',
                 relation_settings={
                     'internal-url': 'http://radosgw:80',
                     'daemon-id': 'testinghostname'})]
         self.relation_set.assert_has_calls(
             expected,
             any_order=True)
+        self.assertEqual(self.relation_set.call_count, 5)
+        self.multisite.create_user.assert_called_once_with(
+            'juju-radosgw-user-5-system', system_user=True)
+        self.multisite.suspend_user.assert_has_calls([
+            call('juju-radosgw-user-3-system'),
+            call('juju-radosgw-user-5')])
+        self.assertEqual(self.multisite.suspend_user.call_count, 2)
+        self.multisite.list_users.assert_not_called()
+        leader_set.assert_called_once_with({
+            'user-creds-juju-radosgw-user-3': '["access1", "key1"]',
+            'user-creds-juju-radosgw-user-5-system': '["access2", "key2"]'})
+
+    @patch.object(ceph_hooks, 'leader_set')
+    @patch.object(ceph_hooks, 'leader_get')
+    @patch.object(ceph_hooks, 'canonical_url')
+    @patch.object(ceph_hooks, 'is_leader')
+    def test_radosgw_user_changed_cached(self, is_leader, canonical_url,
+                                         leader_get, leader_set):
+        leader_settings = {
+            'user-creds-juju-radosgw-user-3': '["access1", "key1"]',
+            'user-creds-juju-radosgw-user-3-system': '["access2", "key2"]'}
+        self.ready_for_service.return_value = True
+        is_leader.return_value = True
+        leader_get.side_effect = leader_settings.get
+        self.remote_service_name.return_value = 'ceph-dashboard'
+        canonical_url.return_value = 'http://radosgw'
+        self.listen_port.return_value = 80
+        self.relation_get.return_value = {'system-role': 'false'}
+        ceph_hooks.radosgw_user_changed('radosgw-user:3')
+        self.relation_set.assert_any_call(
+            app='ceph-dashboard',
+            relation_id='radosgw-user:3',
+            relation_settings={
+                'uid': 'juju-radosgw-user-3',
+                'access-key': 'access1',
+                'secret-key': 'key1'})
+        self.multisite.suspend_user.assert_called_once_with(
+            'juju-radosgw-user-3-system')
+        self.multisite.get_user_creds.assert_not_called()
+        self.multisite.create_user.assert_not_called()
+        leader_set.assert_called_once_with(
+            {'user-creds-juju-radosgw-user-3-system': None})
+
+    @patch.object(ceph_hooks, 'leader_set')
+    @patch.object(ceph_hooks, 'leader_get')
+    @patch.object(ceph_hooks, 'canonical_url')
+    @patch.object(ceph_hooks, 'is_leader')
+    def test_radosgw_user_changed_role_switched(self, is_leader,
+                                                canonical_url, leader_get,
+                                                leader_set):
+        # The non-system user was created before credentials were recorded
+        leader_settings = {
+            'user-creds-juju-radosgw-user-3-system': '["access2", "key2"]'}
+        self.ready_for_service.return_value = True
+        is_leader.return_value = True
+        leader_get.side_effect = leader_settings.get
+        self.remote_service_name.return_value = 'ceph-dashboard'
+        canonical_url.return_value = 'http://radosgw'
+        self.listen_port.return_value = 80
+        self.relation_get.return_value = {'system-role': 'true'}
+        ceph_hooks.radosgw_user_changed('radosgw-user:3')
+        self.multisite.suspend_user.assert_called_once_with(
+            'juju-radosgw-user-3')
+        self.multisite.get_user_creds.assert_not_called()
+        leader_set.assert_not_called()
+
+    def test_radosgw_user_changed_no_relations(self):
+        self.relation_ids.return_value = []
+        ceph_hooks.radosgw_user_changed()
+        self.ready_for_service.assert_not_called()
+        self.relation_set.assert_not_called()
+
+    @patch.object(ceph_hooks, 'leader_set')
+    @patch.object(ceph_hooks, 'is_leader')
+    @patch.object(ceph_hooks, 'ch_relation_id')
+    def test_radosgw_user_departed(self, ch_relation_id, is_leader,
+                                   leader_set):
+        ch_relation_id.return_value = 'radosgw-user:3'
+        is_leader.return_value = True
+        self.related_units.return_value = []
+        ceph_hooks.radosgw_user_departed()
+        self.multisite.suspend_user.assert_has_calls([
+            call('juju-radosgw-user-3-system'),
+            call('juju-radosgw-user-3')])
+        leader_set.assert_called_once_with({
+            'user-creds-juju-radosgw-user-3-system': None,
+            'user-creds-juju-radosgw-user-3': None})
 
     @patch.object(ceph_hooks, 'canonical_url')
     @patch.object(ceph_hooks, 'is_leader')
@@ -692,7 +952,7 @@ class MiscMultisiteTests(CharmTestCase):
         'primary_relation_joined',
         'primary_relation_changed',
         'secondary_relation_changed',
-        'service_restart',
+        'rolling_restart',
         'service_name',
         'multisite'
     ]
@@ -722,17 +982,13 @@ class MiscMultisiteTests(CharmTestCase):
         self.restart_nonce_changed.return_value = True
         self.is_leader.return_value = False
         ceph_hooks.leader_settings_changed()
-        self.service_restart.assert_called_once_with('rgw@hostname')
+        self.rolling_restart.assert_called_once_with('rgw@hostname')
         self.primary_relation_joined.assert_called_once_with('primary:1')
 
     def test_process_multisite_relations(self):
         ceph_hooks.process_multisite_relations()
         self.primary_relation_joined.assert_called_once_with('primary:1')
-        self.assertEqual(self.primary_relation_changed.call_count, 2)
-        self.primary_relation_changed.assert_has_calls([
-            call('primary:1', 'rgw/0'),
-            call('primary:1', 'rgw/1'),
-        ])
+        self.primary_relation_changed.assert_called_once_with()
         self.assertEqual(self.secondary_relation_changed.call_count, 2)
         self.secondary_relation_changed.assert_has_calls([
             call('secondary:1', 'rgw-s/0'),
@@ -753,16 +1009,20 @@ class CephRadosMultisiteTests(CharmTestCase):
         'is_leader',
         'multisite',
         'leader_set',
-        'service_restart',
+        'graceful_restart',
         'service_name',
         'log',
         'multisite_deployment',
         'systemd_based_radosgw',
+        'relation_ids',
+        'related_units',
     ]
 
     def setUp(self):
         super(CephRadosMultisiteTests, self).setUp(ceph_hooks,
                                                    self.TO_PATCH)
+        self.relation_ids.return_value = ['primary:1']
+        self.related_units.return_value = ['rgw/0']
         self.config.side_effect = self.test_config.get
         self.ready_for_service.return_value = True
         self.canonical_url.return_value = 'http://rgw'
@@ -799,67 +1059,65 @@ class PrimaryMultisiteTests(CephRadosMultisiteTests):
         ])
         self.relation_set.assert_not_called()
 
+    def _mock_plan(self, plan, mutation=True, epoch_changed=True,
+                   credentials=None):
+        plan.errors = []
+        plan.mutation = mutation
+        plan.result.side_effect = (
+            lambda name: credentials if name == 'create-system-user' else None
+        )
+        plan.apply.return_value.epoch_changed = epoch_changed
+        return plan
+
     def test_primary_relation_joined_create_everything(self):
         for k, v in self._complete_config.items():
             self.test_config.set(k, v)
         self.listen_port.return_value = 80
         self.is_leader.return_value = True
         self.leader_get.side_effect = lambda attr: self._leader_data.get(attr)
-        self.multisite.list_realms.return_value = []
-        self.multisite.list_zonegroups.return_value = []
-        self.multisite.list_zones.return_value = []
-        self.multisite.list_users.return_value = []
-        self.multisite.create_system_user.return_value = (
-            'mykey', 'mysecret',
-        )
+        plan = self._mock_plan(self.multisite.plan_primary.return_value,
+                               credentials=('newkey', 'newsecret'))
         ceph_hooks.primary_relation_joined('primary:1')
         self.config.assert_has_calls([
             call('realm'),
             call('zonegroup'),
             call('zone'),
         ])
-        self.multisite.create_realm.assert_called_once_with(
-            'testrealm',
-            default=True,
-        )
-        self.multisite.create_zonegroup.assert_called_once_with(
-            'testzonegroup',
+        self.multisite.update_period.assert_called_once_with(fatal=False)
+        self.multisite.plan_primary.assert_called_once_with(
+            'testrealm', 'testzonegroup', 'testzone',
             endpoints=['http://rgw:80'],
-            default=True,
-            master=True,
-            realm='testrealm',
-        )
-        self.multisite.create_zone.assert_called_once_with(
-            'testzone',
-            endpoints=['http://rgw:80'],
-            default=True,
-            master=True,
-            zonegroup='testzonegroup',
+            system_user=ceph_hooks.MULTISITE_SYSTEM_USER,
         )
-        self.multisite.create_system_user.assert_called_once_with(
-            ceph_hooks.MULTISITE_SYSTEM_USER
-        )
-        self.multisite.modify_zone.assert_called_once_with(
-            'testzone',
-            access_key='mykey',
-            secret='mysecret',
-        )
-        self.multisite.update_period.assert_has_calls([
-            call(fatal=False),
-            call(zonegroup='testzonegroup', zone='testzone'),
-        ])
-        self.service_restart.assert_called_once_with('rgw@hostname')
+        plan.apply.assert_called_once_with()
+        plan.result.assert_called_once_with('create-system-user')
+        self.graceful_restart.assert_called_once_with('rgw@hostname')
         self.leader_set.assert_has_calls([
-            call(access_key='mykey',
-                 secret='mysecret'),
+            call(access_key='newkey',
+                 secret='newsecret'),
             call(restart_nonce=ANY),
         ])
         self.relation_set.assert_called_with(
             relation_id='primary:1',
-            access_key='mykey',
-            secret='mysecret',
+            access_key='newkey',
+            secret='newsecret',
         )
 
+    def test_primary_relation_joined_period_unchanged(self):
+        for k, v in self._complete_config.items():
+            self.test_config.set(k, v)
+        self.listen_port.return_value = 80
+        self.is_leader.return_value = True
+        self.leader_get.side_effect = (
+            lambda attr: self._leader_data_done.get(attr)
+        )
+        self._mock_plan(self.multisite.plan_primary.return_value,
+                        epoch_changed=False)
+        ceph_hooks.primary_relation_joined('primary:1')
+        self.multisite.update_period.assert_not_called()
+        self.graceful_restart.assert_not_called()
+        self.leader_set.assert_not_called()
+
     def test_primary_relation_joined_create_nothing(self):
         for k, v in self._complete_config.items():
             self.test_config.set(k, v)
@@ -867,20 +1125,31 @@ class PrimaryMultisiteTests(CephRadosMultisiteTests):
         self.leader_get.side_effect = (
             lambda attr: self._leader_data_done.get(attr)
         )
-        self.multisite.list_realms.return_value = ['testrealm']
-        self.multisite.list_zonegroups.return_value = ['testzonegroup']
-        self.multisite.list_zones.return_value = ['testzone']
-        self.multisite.list_users.return_value = [
-            ceph_hooks.MULTISITE_SYSTEM_USER
-        ]
+        self._mock_plan(self.multisite.plan_primary.return_value,
+                        mutation=False)
         ceph_hooks.primary_relation_joined('primary:1')
-        self.multisite.create_realm.assert_not_called()
-        self.multisite.create_zonegroup.assert_not_called()
-        self.multisite.create_zone.assert_not_called()
-        self.multisite.create_system_user.assert_not_called()
         self.multisite.update_period.assert_not_called()
-        self.service_restart.assert_not_called()
+        self.graceful_restart.assert_not_called()
         self.leader_set.assert_not_called()
+        self.relation_set.assert_called_with(
+            relation_id='primary:1',
+            access_key='mykey',
+            secret='mysecret',
+        )
+
+    def test_primary_relation_joined_plan_aborted(self):
+        for k, v in self._complete_config.items():
+            self.test_config.set(k, v)
+        self.is_leader.return_value = True
+        self.leader_get.side_effect = (
+            lambda attr: self._leader_data_done.get(attr)
+        )
+        plan = self._mock_plan(self.multisite.plan_primary.return_value)
+        plan.errors = ['Multiple zones found, aborting.']
+        ceph_hooks.primary_relation_joined('primary:1')
+        plan.apply.assert_not_called()
+        self.graceful_restart.assert_not_called()
+        self.relation_set.assert_called_once()
 
     def test_primary_relation_joined_not_leader(self):
         for k, v in self._complete_config.items():
@@ -903,26 +1172,28 @@ class PrimaryMultisiteTests(CephRadosMultisiteTests):
         self.is_leader.return_value = True
         self.test_config.set('sync-policy-state', '')
 
-        ceph_hooks.primary_relation_changed('primary:1')
+        ceph_hooks.primary_relation_changed()
 
         self.is_leader.assert_called_once()
         self.ready_for_service.assert_called_once_with(legacy=False)
         self.config.assert_called_once_with('sync-policy-state')
+        self.relation_get.assert_not_called()
 
     def test_primary_relation_changed_sync_rel_data_incomplete(self):
         self.is_leader.return_value = True
         self.test_config.set('sync-policy-state', 'allowed')
         self.relation_get.return_value = {'zone': 'secondary'}
 
-        ceph_hooks.primary_relation_changed('primary:1', 'rgw/0')
+        ceph_hooks.primary_relation_changed()
 
         self.is_leader.assert_called_once()
         self.ready_for_service.assert_called_once_with(legacy=False)
         self.config.assert_called_once_with('sync-policy-state')
         self.relation_get.assert_called_once_with(rid='primary:1',
                                                   unit='rgw/0')
+        self.multisite.plan_sync_group.assert_not_called()
 
-    def test_primary_relation_changed(self):
+    def _primary_sync_config(self):
         self.is_leader.return_value = True
         configs = {
             'sync-policy-state': 'allowed',
@@ -931,6 +1202,9 @@ class PrimaryMultisiteTests(CephRadosMultisiteTests):
         }
         for k, v in configs.items():
             self.test_config.set(k, v)
+
+    def test_primary_relation_changed(self):
+        self._primary_sync_config()
         self.relation_get.return_value = {
             'zone': 'zone_b',
             'sync_policy_flow_type': 'symmetrical',
@@ -938,13 +1212,9 @@ class PrimaryMultisiteTests(CephRadosMultisiteTests):
             # from the relation data.
             'zone_tier_type': 'cloud',
         }
-        self.multisite.is_sync_group_update_needed.return_value = True
-        group_test_data_file = os.path.join(
-            os.path.dirname(__file__), 'testdata', 'test_get_sync_group.json')
-        with open(group_test_data_file, 'r') as f:
-            self.multisite.get_sync_group.return_value = json.loads(f.read())
+        plan = self._mock_plan(self.multisite.plan_sync_group.return_value)
 
-        ceph_hooks.primary_relation_changed('primary:1', 'rgw/0')
+        ceph_hooks.primary_relation_changed()
 
         self.is_leader.assert_called_once()
         self.ready_for_service.assert_called_once_with(legacy=False)
@@ -955,50 +1225,75 @@ class PrimaryMultisiteTests(CephRadosMultisiteTests):
         ])
         self.relation_get.assert_called_once_with(rid='primary:1',
                                                   unit='rgw/0')
-        self.multisite.is_sync_group_update_needed.assert_called_once_with(
-            group_id=ceph_hooks.MULTISITE_DEFAULT_SYNC_GROUP_ID,
-            flow_id='zone_a-zone_b',
-            pipe_id='zone_a-zone_b',
-            source_zone='zone_a',
-            dest_zone='zone_b',
-            desired_status='allowed',
-            desired_flow_type=self.multisite.SYNC_FLOW_DIRECTIONAL)
-        self.multisite.create_sync_group.assert_called_once_with(
-            group_id=ceph_hooks.MULTISITE_DEFAULT_SYNC_GROUP_ID,
-            status='allowed')
-        self.multisite.create_sync_group_flow.assert_called_once_with(
+        self.multisite.plan_sync_group.assert_called_once_with(
             group_id=ceph_hooks.MULTISITE_DEFAULT_SYNC_GROUP_ID,
-            flow_id='zone_a-zone_b',
-            flow_type=self.multisite.SYNC_FLOW_DIRECTIONAL,
-            source_zone='zone_a', dest_zone='zone_b')
-        self.multisite.create_sync_group_pipe.assert_called_once_with(
-            group_id=ceph_hooks.MULTISITE_DEFAULT_SYNC_GROUP_ID,
-            pipe_id='zone_a-zone_b',
-            source_zones=['zone_a'], dest_zones=['zone_b'])
-        self.multisite.update_period.assert_called_once_with(
-            zonegroup='testzonegroup', zone='zone_a')
-        self.service_restart.assert_called_once_with('rgw@hostname')
+            status='allowed',
+            zonegroup='testzonegroup',
+            zone='zone_a',
+            secondaries={'zone_b': self.multisite.SYNC_FLOW_DIRECTIONAL})
+        plan.apply.assert_called_once_with()
+        self.graceful_restart.assert_called_once_with('rgw@hostname')
         self.leader_set.assert_called_once_with(restart_nonce=ANY)
 
-    @patch.object(json, 'loads')
-    def test_multisite_relation_departed(self, json_loads):
+    def test_primary_relation_changed_multiple_secondaries(self):
+        self._primary_sync_config()
+        self.relation_ids.return_value = ['primary:1', 'primary:2']
+        self.related_units.side_effect = lambda rid: {
+            'primary:1': ['rgw-b/0', 'rgw-b/1'],
+            'primary:2': ['rgw-c/0'],
+        }[rid]
+        relation_data = {
+            'rgw-b/0': {'zone': 'zone_b',
+                        'sync_policy_flow_type': 'symmetrical'},
+            'rgw-b/1': {'zone': 'zone_b',
+                        'sync_policy_flow_type': 'symmetrical'},
+            'rgw-c/0': {'zone': 'zone_c',
+                        'sync_policy_flow_type': 'directional'},
+        }
+        self.relation_get.side_effect = (
+            lambda rid, unit: relation_data[unit]
+        )
+        plan = self._mock_plan(self.multisite.plan_sync_group.return_value)
+
+        ceph_hooks.primary_relation_changed()
+
+        self.multisite.plan_sync_group.assert_called_once_with(
+            group_id=ceph_hooks.MULTISITE_DEFAULT_SYNC_GROUP_ID,
+            status='allowed',
+            zonegroup='testzonegroup',
+            zone='zone_a',
+            secondaries={'zone_b': 'symmetrical', 'zone_c': 'directional'})
+        plan.apply.assert_called_once_with()
+        self.graceful_restart.assert_called_once_with('rgw@hostname')
+
+    def test_primary_relation_changed_no_mutation(self):
+        self._primary_sync_config()
+        self.relation_get.return_value = {
+            'zone': 'zone_b',
+            'sync_policy_flow_type': 'symmetrical',
+        }
+        plan = self._mock_plan(self.multisite.plan_sync_group.return_value,
+                               mutation=False)
+
+        ceph_hooks.primary_relation_changed()
+
+        plan.apply.assert_not_called()
+        self.graceful_restart.assert_not_called()
+        self.leader_set.assert_not_called()
+
+    def test_multisite_relation_departed(self):
         for k, v in self._complete_config.items():
             self.test_config.set(k, v)
         self.is_leader.return_value = True
         # Multisite is configured at first but then disabled.
         self.multisite.is_multisite_configured.side_effect = [True, False]
-        self.multisite.get_zonegroup_info.return_value = get_zonegroup_stub()
-        # json.loads() raises TypeError for mock objects.
-        json_loads.returnvalue = []
         ceph_hooks.multisite_relation_departed()
 
-        self.multisite.modify_zone.assert_called_once_with(
-            'testzone', default=True, master=True, zonegroup='testzonegroup'
-        )
-        self.multisite.update_period.assert_called_once_with(
-            fatal=True, zonegroup='testzonegroup',
-            zone='testzone', realm='testrealm'
+        self.multisite.plan_scaledown.assert_called_once_with(
+            'testrealm', 'testzonegroup', 'testzone'
         )
+        self.multisite.plan_scaledown.return_value.apply \
+            .assert_called_once_with()
 
 
 class SecondaryMultisiteTests(CephRadosMultisiteTests):
@@ -1033,42 +1328,26 @@ class SecondaryMultisiteTests(CephRadosMultisiteTests):
         self.listen_port.return_value = 80
         self.leader_get.return_value = None
         self.relation_get.return_value = self._test_relation
-        self.multisite.list_realms.return_value = []
-        self.multisite.list_zones.return_value = []
-        self.multisite.check_cluster_has_buckets.return_value = False
+        plan = self.multisite.plan_secondary.return_value
+        plan.errors = []
+        plan.mutation = True
+        plan.apply.return_value.epoch_changed = True
         ceph_hooks.secondary_relation_changed('secondary:1', 'rgw/0')
         self.config.assert_has_calls([
             call('realm'),
             call('zonegroup'),
             call('zone'),
         ])
-        self.multisite.pull_realm.assert_called_once_with(
-            url=self._test_relation['url'],
-            access_key=self._test_relation['access_key'],
-            secret=self._test_relation['secret'],
-        )
-        self.multisite.pull_period.assert_called_with(
-            url=self._test_relation['url'],
-            access_key=self._test_relation['access_key'],
-            secret=self._test_relation['secret'],
-        )
-        self.multisite.set_default_realm.assert_called_once_with(
-            'testrealm'
-        )
-        self.multisite.create_zone.assert_called_once_with(
-            'testzone2',
+        self.multisite.plan_secondary.assert_called_once_with(
+            'testrealm', 'testzonegroup', 'testzone2',
             endpoints=['http://rgw:80'],
-            default=False,
-            master=False,
-            zonegroup='testzonegroup',
+            url=self._test_relation['url'],
             access_key=self._test_relation['access_key'],
             secret=self._test_relation['secret'],
         )
-        self.multisite.update_period.assert_has_calls([
-            call(fatal=False),
-            call(zonegroup='testzonegroup', zone='testzone2'),
-        ])
-        self.service_restart.assert_called_once()
+        plan.apply.assert_called_once_with()
+        self.multisite.update_period.assert_called_once_with(fatal=False)
+        self.graceful_restart.assert_called_once()
         self.leader_set.assert_called_once_with(restart_nonce=ANY)
         self.relation_set.assert_has_calls([
             call(
@@ -1081,6 +1360,23 @@ class SecondaryMultisiteTests(CephRadosMultisiteTests):
             ),
         ])
 
+    def test_secondary_relation_changed_not_pristine(self):
+        for k, v in self._complete_config.items():
+            self.test_config.set(k, v)
+        self.is_leader.return_value = True
+        self.listen_port.return_value = 80
+        self.leader_get.return_value = 'nonce'
+        self.relation_get.return_value = self._test_relation
+        plan = self.multisite.plan_secondary.return_value
+        plan.errors = ["Non-Pristine site can't be used as secondary"]
+        ceph_hooks.secondary_relation_changed('secondary:1', 'rgw/0')
+        plan.apply.assert_not_called()
+        self.graceful_restart.assert_not_called()
+        self.relation_set.assert_called_once_with(
+            relation_id='secondary:1',
+            sync_policy_flow_type='symmetrical',
+        )
+
     def test_secondary_relation_changed_incomplete_relation(self):
         for k, v in self._complete_config.items():
             self.test_config.set(k, v)
@@ -1120,6 +1416,7 @@ class SecondaryMultisiteTests(CephRadosMultisiteTests):
         nrpe_setup = MagicMock()
         nrpe.NRPE.return_value = nrpe_setup
         services.return_value = ['baz', 'qux']
+        self.multisite_deployment.return_value = False
 
         # Call the routine
         ceph_hooks.update_nrpe_config()
@@ -1133,6 +1430,9 @@ class SecondaryMultisiteTests(CephRadosMultisiteTests):
         nrpe.add_init_service_checks.assert_called_with(nrpe_setup,
                                                         ['baz', 'qux'], 'bar')
         nrpe.add_haproxy_checks.assert_called_with(nrpe_setup, 'bar')
+        nrpe_setup.remove_check.assert_called_once_with(
+            shortname='rgw-sync-status')
+        nrpe_setup.add_check.assert_not_called()
         nrpe_setup.write.assert_called()
 
         # Verify that remove_check is called appropriately if we pass
@@ -1140,3 +1440,50 @@ class SecondaryMultisiteTests(CephRadosMultisiteTests):
         ceph_hooks.update_nrpe_config(checks_to_remove=['quux', 'quuux'])
         nrpe_setup.remove_check.assert_has_calls([call(shortname='quux'),
                                                   call(shortname='quuux')])
+
+    @patch('os.makedirs')
+    @patch.object(ceph_hooks, 'write_file')
+    @patch.object(ceph_hooks, 'shutil')
+    @patch.object(ceph_hooks, 'charm_dir')
+    @patch.object(ceph_hooks, 'apt_install')
+    @patch.object(ceph_hooks, 'services')
+    @patch.object(ceph_hooks, 'nrpe')
+    def test_update_nrpe_config_multisite(self, nrpe, services, apt_install,
+                                          charm_dir, shutil, write_file,
+                                          makedirs):
+        nrpe.get_nagios_unit_name.return_value = 'bar'
+        nrpe_setup = MagicMock()
+        nrpe.NRPE.return_value = nrpe_setup
+        services.return_value = ['baz']
+        charm_dir.return_value = '/charm'
+        self.multisite_deployment.return_value = True
+        self.multisite._key_name.return_value = 'rgw.testhost'
+        self.test_config.set('nagios-sync-cache-ttl', 120)
+        self.test_config.set('nagios-sync-behind-shards-critical', 32)
+
+        ceph_hooks.update_nrpe_config()
+
+        shutil.copy2.assert_has_calls([
+            call('/charm/files/nagios/check_rgw_sync_status.py',
+                 '/usr/local/lib/nagios/plugins'),
+            call('/charm/hooks/sync_status.py',
+                 '/usr/local/lib/nagios/plugins'),
+        ])
+        check = '/usr/local/lib/nagios/plugins/check_rgw_sync_status.py'
+        write_file.assert_called_once_with(
+            '/etc/cron.d/check-rgw-sync-status',
+            '# Juju managed\n'
+            '* * * * * root {} --refresh '
+            '--cache-file /var/lib/nagios/rgw-sync-status.txt '
+            '--ttl 120 --id rgw.testhost\n'.format(check),
+            perms=0o644)
+        nrpe_setup.add_check.assert_called_once_with(
+            shortname='rgw-sync-status',
+            description='multi-site replication bar',
+            check_cmd=(
+                '{} --cache-file /var/lib/nagios/rgw-sync-status.txt '
+                '--max-age 300 '
+                '--behind-shards-warning 16 --behind-shards-critical 32 '
+                '--lag-warning 900 --lag-critical 3600 '
+                '--metadata-stall 1800'.format(check)))
+        nrpe_setup.remove_check.assert_not_called()
@@ -0,0 +1,127 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+CHARM_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Time, in microseconds, importing the hooks module may spend outside of
+# charmhelpers, which accounts for most of its import time but is not
+# maintained here. The charm modules take about 140ms.
+IMPORT_TIME_BUDGET = 300000
+# Runs of the import the fastest of which is compared with the budget.
+IMPORT_TIME_RUNS = 3
+
+# Modules only some hooks need, which must not be imported with the hooks.
+DEFERRED_MODULES = ('apt_pkg', 'boto3', 'botocore', 'charms_ceph')
+
+IMPORT_HOOKS = """
+import sys
+import hooks
+modules = [m for m in sys.modules if m.split('.')[0] in {}]
+print(','.join(sorted(modules)))
+print(hooks.CONFIGS._configs is None)
+""".format(DEFERRED_MODULES)
+
+
+def parse_importtime(output):
+    """Entries of a -X importtime output
+
+    :param output: stderr of the interpreter
+    :type output: str
+    :return: module name, cumulative microseconds and nesting level of each
+             import, in the order printed: nested imports come before the
+             module importing them
+    :rtype: List[Tuple[str, int, int]]
+    """
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        try:
+            cumulative = int(cumulative)
+        except ValueError:
+            # Header line
+            continue
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((name.strip(), cumulative, level))
+    return entries
+
+
+def own_import_time(entries, module, excluded='charmhelpers'):
+    """Cumulative import time of a module, less that of a package
+
+    :param entries: entries parsed by parse_importtime
+    :type entries: List[Tuple[str, int, int]]
+    :param module: name of the module
+    :type module: str
+    :param excluded: top-level package whose imports are not counted
+    :type excluded: str
+    :rtype: int
+    """
+    total = excluded_time = 0
+    for i, (name, cumulative, level) in enumerate(entries):
+        if name == module:
+            total = cumulative
+        if name.split('.')[0] != excluded:
+            continue
+        # Only count the outermost import of the package, its nested
+        # imports are included in its cumulative time.
+        parent = next((e[0] for e in entries[i + 1:] if e[2] < level), None)
+        if parent is None or parent.split('.')[0] != excluded:
+            excluded_time += cumulative
+    return total - excluded_time
+
+
+class ImportTimeTestCase(unittest.TestCase):
+
+    def import_hooks(self):
+        env = dict(os.environ,
+                   CHARM_DIR=tempfile.gettempdir(),
+                   PYTHONPATH=os.pathsep.join(
+                       (os.path.join(CHARM_DIR, 'hooks'),
+                        os.path.join(CHARM_DIR, 'lib'))))
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', IMPORT_HOOKS],
+            cwd=CHARM_DIR, env=env, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, universal_newlines=True)
+        self.assertEqual(proc.returncode, 0, proc.stderr[-2000:])
+        return proc.stdout.splitlines(), parse_importtime(proc.stderr)
+
+    def test_parse_importtime(self):
+        output = ('import time: self [us] | cumulative | imported package\n'
+                  'import time:        80 |         80 |     charmhelpers.a\n'
+                  'import time:        40 |        120 |   charmhelpers\n'
+                  'import time:       120 |        120 |   utils\n'
+                  'import time:       300 |        540 | hooks\n')
+        entries = parse_importtime(output)
+        self.assertEqual(entries, [('charmhelpers.a', 80, 2),
+                                   ('charmhelpers', 120, 1),
+                                   ('utils', 120, 1),
+                                   ('hooks', 540, 0)])
+        self.assertEqual(own_import_time(entries, 'hooks'), 420)
+
+    def test_import_hooks(self):
+        times = []
+        for _ in range(IMPORT_TIME_RUNS):
+            (deferred, configs_deferred), entries = self.import_hooks()
+            self.assertEqual(deferred, '')
+            self.assertEqual(configs_deferred, 'True')
+            times.append(own_import_time(entries, 'hooks'))
+        self.assertLess(min(times), IMPORT_TIME_BUDGET)
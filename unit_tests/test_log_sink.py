@@ -0,0 +1,128 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import unittest
+from unittest import mock
+
+import log_sink
+
+
+class SummariseTestCase(unittest.TestCase):
+
+    def test_summarise_small(self):
+        self.assertEqual(log_sink.summarise(['a', 'b']), "['a', 'b']")
+        self.assertEqual(log_sink.summarise('message'), 'message')
+
+    def test_summarise_list(self):
+        users = ['user-{}'.format(i) for i in range(50000)]
+        self.assertEqual(
+            log_sink.summarise(users),
+            "50000 items, first 5: "
+            "['user-0', 'user-1', 'user-2', 'user-3', 'user-4']")
+
+    def test_summarise_dict(self):
+        self.assertEqual(
+            log_sink.summarise({'zones': list(range(10))}, limit=10,
+                               sample=1),
+            "1 items, first 1: {'zones': ... (31 more characters)")
+
+    def test_summarise_str(self):
+        self.assertEqual(log_sink.summarise('x' * 30, limit=10),
+                         'xxxxxxxxxx... (20 more characters)')
+
+
+class LogSinkTestCase(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(log_sink.hookenv, 'log')
+        self.log = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.sink = log_sink.LogSink(threshold=100)
+
+    def test_log_unbuffered(self):
+        self.sink.log('message', level='DEBUG')
+        self.log.assert_called_once_with('message', level='DEBUG')
+
+    def test_buffered(self):
+        with self.sink.buffered():
+            self.sink.log('one', level='DEBUG')
+            self.sink.log('two', level='DEBUG')
+            self.sink.log(['three'])
+            self.sink.log('four', level='DEBUG')
+            self.log.assert_not_called()
+        self.log.assert_has_calls([
+            mock.call('one\ntwo', level='DEBUG'),
+            mock.call("['three']", level=None),
+            mock.call('four', level='DEBUG'),
+        ])
+        self.assertEqual(self.log.call_count, 3)
+        self.sink.log('five')
+        self.log.assert_called_with('five', level=None)
+
+    def test_buffered_raises(self):
+        with self.assertRaises(RuntimeError):
+            with self.sink.buffered():
+                self.sink.log('one', level='DEBUG')
+                raise RuntimeError()
+        self.log.assert_called_once_with('one', level='DEBUG')
+        self.assertFalse(self.sink.buffering)
+
+    def test_buffered_nested(self):
+        with self.sink.buffered():
+            with self.sink.buffered():
+                self.sink.log('one', level='DEBUG')
+            self.log.assert_not_called()
+            self.sink.log('two', level='DEBUG')
+        self.log.assert_called_once_with('one\ntwo', level='DEBUG')
+
+    def test_flush_immediate_level(self):
+        with self.sink.buffered():
+            self.sink.log('one', level='DEBUG')
+            self.sink.log('failed', level='ERROR')
+            self.log.assert_has_calls([
+                mock.call('one', level='DEBUG'),
+                mock.call('failed', level='ERROR'),
+            ])
+            self.assertEqual(self.sink.messages, [])
+
+    def test_flush_threshold(self):
+        with self.sink.buffered():
+            for i in range(3):
+                self.sink.log(str(i) * 40, level='DEBUG')
+            self.log.assert_has_calls([
+                mock.call('0' * 40 + '\n' + '1' * 40, level='DEBUG'),
+                mock.call('2' * 40, level='DEBUG'),
+            ])
+            self.sink.log('three', level='DEBUG')
+            self.assertEqual(self.log.call_count, 2)
+        self.log.assert_called_with('three', level='DEBUG')
+
+    def test_buffered_threads(self):
+        def _log(thread):
+            for i in range(100):
+                self.sink.log('{}-{}'.format(thread, i), level='DEBUG')
+
+        with self.sink.buffered():
+            threads = [threading.Thread(target=_log, args=(t,))
+                       for t in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        logged = [line
+                  for c in self.log.call_args_list
+                  for line in c[0][0].split('\n')]
+        self.assertEqual(sorted(logged), sorted(
+            '{}-{}'.format(t, i) for t in range(4) for i in range(100)))
@@ -12,9 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import errno
 import inspect
 import os
 import json
+import subprocess
+import threading
 from unittest import mock
 
 import multisite
@@ -46,13 +49,18 @@ class TestMultisiteHelpers(CharmTestCase):
         'subprocess',
         'socket',
         'hookenv',
+        'log',
         'utils',
+        'unitdata',
     ]
 
     def setUp(self):
         super(TestMultisiteHelpers, self).setUp(multisite, self.TO_PATCH)
         self.socket.gethostname.return_value = 'testhost'
         self.utils.request_per_unit_key.return_value = True
+        self.kv = self.unitdata.kv.return_value
+        self.kv.get.return_value = None
+        multisite.flush_cache()
 
     def _testdata(self, funcname):
         return os.path.join(os.path.dirname(__file__),
@@ -77,7 +85,7 @@ class TestMultisiteHelpers(CharmTestCase):
                 'radosgw-admin', '--id=rgw.testhost',
                 'realm', 'create',
                 '--rgw-realm=beedata', '--default'
-            ])
+            ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
 
     def test_list_realms(self):
         with open(self._testdata(whoami()), 'rb') as f:
@@ -91,7 +99,7 @@ class TestMultisiteHelpers(CharmTestCase):
             'radosgw-admin', '--id=rgw.testhost',
             'realm', 'default',
             '--rgw-realm=newrealm'
-        ])
+        ], timeout=mock.ANY)
 
     def test_create_user(self):
         with open(self._testdata(whoami()), 'rb') as f:
@@ -110,7 +118,7 @@ class TestMultisiteHelpers(CharmTestCase):
                 'user', 'create',
                 '--uid=mrbees',
                 '--display-name=Synchronization User',
-            ])
+            ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
 
     def test_create_system_user(self):
         with open(self._testdata(whoami()), 'rb') as f:
@@ -130,7 +138,7 @@ class TestMultisiteHelpers(CharmTestCase):
                 '--uid=mrbees',
                 '--display-name=Synchronization User',
                 '--system'
-            ])
+            ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
 
     def test_create_zonegroup(self):
         with open(self._testdata(whoami()), 'rb') as f:
@@ -151,7 +159,7 @@ class TestMultisiteHelpers(CharmTestCase):
                 '--rgw-realm=beedata',
                 '--default',
                 '--master'
-            ])
+            ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
 
     def test_list_zonegroups(self):
         with open(self._testdata(whoami()), 'rb') as f:
@@ -182,7 +190,7 @@ class TestMultisiteHelpers(CharmTestCase):
                 '--access-key=mykey',
                 '--secret=mypassword',
                 '--read-only=0',
-            ])
+            ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
 
     def test_modify_zone(self):
         multisite.modify_zone(
@@ -199,7 +207,7 @@ class TestMultisiteHelpers(CharmTestCase):
             '--endpoints=http://localhost:80,https://localhost:443',
             '--access-key=mykey', '--secret=secret',
             '--read-only=1',
-        ])
+        ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
 
     def test_modify_zone_promote_master(self):
         multisite.modify_zone(
@@ -214,7 +222,7 @@ class TestMultisiteHelpers(CharmTestCase):
             '--master',
             '--default',
             '--read-only=0',
-        ])
+        ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
 
     def test_modify_zone_partial_credentials(self):
         multisite.modify_zone(
@@ -228,7 +236,7 @@ class TestMultisiteHelpers(CharmTestCase):
             '--rgw-zone=brundall-east',
             '--endpoints=http://localhost:80,https://localhost:443',
             '--read-only=0',
-        ])
+        ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
 
     def test_list_zones(self):
         with open(self._testdata(whoami()), 'rb') as f:
@@ -236,12 +244,80 @@ class TestMultisiteHelpers(CharmTestCase):
             result = multisite.list_zones()
             self.assertTrue('brundall-east' in result)
 
+    @mock.patch.object(multisite, '_cache_stats_logged', False)
+    def test_list_zones_cached(self):
+        with open(self._testdata('test_list_zones'), 'rb') as f:
+            self.subprocess.check_output.return_value = f.read()
+        self.assertEqual(multisite.list_zones(), multisite.list_zones())
+        self.assertTrue('brundall-east' in multisite.plain_list('zone'))
+        self.subprocess.check_output.assert_called_once_with([
+            'radosgw-admin', '--id=rgw.testhost',
+            'zone', 'list'
+        ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
+        self.assertEqual(multisite.cache_stats(),
+                         {'hits': 2, 'misses': 1})
+        self.hookenv.atexit.assert_called_once_with(
+            multisite._log_cache_stats)
+
+    def test_list_zones_cache_invalidated(self):
+        testdata = {}
+        for key in ('realm', 'zone'):
+            with open(self._testdata('test_list_{}s'.format(key)), 'rb') as f:
+                testdata[key] = f.read()
+        self.subprocess.check_output.side_effect = \
+            lambda cmd, **kwargs: testdata[cmd[2]]
+        multisite.list_zones()
+        multisite.list_realms()
+        multisite.update_period()
+        multisite.list_zones()
+        multisite.list_realms()
+        # zone list is re-queried after the period commit, realm list is not
+        self.assertEqual(self.subprocess.check_output.call_count, 3)
+
+    def test_cache_generation(self):
+        self.subprocess.check_output.return_value = b'[]'
+        generation = multisite.cache_generation()
+        multisite.plain_list('zone')
+        self.assertEqual(multisite.cache_generation(), generation)
+        multisite.create_sync_group('default', 'allowed')
+        self.assertEqual(multisite.cache_generation(), generation + 1)
+
+    @mock.patch.object(multisite, 'determine_api_port')
+    @mock.patch.object(multisite, '_admin_api_clients', threading.local())
+    def test_admin_api_client(self, determine_api_port):
+        determine_api_port.return_value = 70
+        self.hookenv.leader_get.return_value = None
+        self.assertIsNone(multisite.admin_api_client())
+        self.hookenv.leader_get.side_effect = {
+            'access_key': 'access',
+            'secret': 'secret',
+        }.get
+        client = multisite.admin_api_client()
+        self.assertEqual((client.host, client.port, client.access_key),
+                         ('localhost', 70, 'access'))
+        self.assertIs(multisite.admin_api_client(), client)
+        clients = []
+        thread = threading.Thread(
+            target=lambda: clients.append(multisite.admin_api_client()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(clients[0], client)
+
+    def test_list_zones_retry_on_empty(self):
+        self.subprocess.check_output.side_effect = [
+            b'{"default_info": "", "zones": []}',
+            b'{"default_info": "", "zones": ["brundall-east"]}',
+        ]
+        with mock.patch('time.sleep'):
+            result = multisite.list_zones(retry_on_empty=True)
+        self.assertEqual(result, ['brundall-east'])
+
     def test_update_period(self):
         multisite.update_period()
         self.subprocess.check_call.assert_called_once_with([
             'radosgw-admin', '--id=rgw.testhost',
             'period', 'update', '--commit'
-        ])
+        ], timeout=mock.ANY)
 
     @mock.patch.object(multisite, 'list_zonegroups')
     @mock.patch.object(multisite, 'list_zones')
@@ -256,13 +332,14 @@ class TestMultisiteHelpers(CharmTestCase):
         self.subprocess.call.assert_has_calls([
             mock.call(['radosgw-admin', '--id=rgw.testhost',
                        'zonegroup', 'remove',
-                       '--rgw-zonegroup=default', '--rgw-zone=default']),
+                       '--rgw-zonegroup=default', '--rgw-zone=default'],
+                      timeout=mock.ANY),
             mock.call(['radosgw-admin', '--id=rgw.testhost',
                        'zone', 'delete',
-                       '--rgw-zone=default']),
+                       '--rgw-zone=default'], timeout=mock.ANY),
             mock.call(['radosgw-admin', '--id=rgw.testhost',
                        'zonegroup', 'delete',
-                       '--rgw-zonegroup=default'])
+                       '--rgw-zonegroup=default'], timeout=mock.ANY)
         ])
         mock_update_period.assert_called_with()
 
@@ -279,6 +356,68 @@ class TestMultisiteHelpers(CharmTestCase):
         self.subprocess.call.assert_not_called()
         mock_update_period.assert_not_called()
 
+    @mock.patch.object(multisite, 'list_zonegroups')
+    @mock.patch.object(multisite, 'list_zones')
+    def test_tidy_defaults_single_commit(self,
+                                         mock_list_zones,
+                                         mock_list_zonegroups):
+        mock_list_zones.return_value = ['default']
+        mock_list_zonegroups.return_value = ['default']
+        self.subprocess.check_output.return_value = \
+            b'{"id": "period-id", "epoch": 2}'
+        multisite.tidy_defaults()
+        self.assertEqual(self.subprocess.call.call_count, 3)
+        self.subprocess.check_call.assert_called_once_with([
+            'radosgw-admin', '--id=rgw.testhost',
+            'period', 'update', '--commit'
+        ], timeout=mock.ANY)
+
+    def test_period_transaction(self):
+        self.subprocess.check_output.side_effect = [
+            b'{"id": "period-id", "epoch": 2}',
+            b'{"id": "period-id", "epoch": 3}',
+        ]
+        with multisite.period_transaction() as txn:
+            multisite.update_period(fatal=False)
+            with multisite.period_transaction() as inner:
+                self.assertIs(inner, txn)
+                multisite.update_period(zonegroup='brundall', zone='east')
+            self.subprocess.check_call.assert_not_called()
+            self.subprocess.call.assert_not_called()
+        self.subprocess.check_call.assert_called_once_with([
+            'radosgw-admin', '--id=rgw.testhost',
+            'period', 'update', '--commit',
+            '--rgw-zonegroup=brundall', '--rgw-zone=east'
+        ], timeout=mock.ANY)
+        self.assertTrue(txn.committed)
+        self.assertTrue(txn.epoch_changed)
+        # commits outside of a transaction are issued straight away
+        multisite.update_period()
+        self.assertEqual(self.subprocess.check_call.call_count, 2)
+
+    def test_period_transaction_epoch_unchanged(self):
+        self.subprocess.check_output.return_value = \
+            b'{"id": "period-id", "epoch": 2}'
+        with multisite.period_transaction() as txn:
+            multisite.update_period()
+        self.assertTrue(txn.committed)
+        self.assertFalse(txn.epoch_changed)
+
+    def test_period_transaction_noop(self):
+        with multisite.period_transaction() as txn:
+            pass
+        self.subprocess.check_output.assert_not_called()
+        self.subprocess.check_call.assert_not_called()
+        self.assertFalse(txn.committed)
+
+    def test_period_transaction_error(self):
+        with self.assertRaises(RuntimeError):
+            with multisite.period_transaction():
+                multisite.update_period()
+                raise RuntimeError()
+        self.subprocess.check_call.assert_not_called()
+        self.assertIsNone(multisite._period_transaction)
+
     def test_pull_realm(self):
         multisite.pull_realm(url='http://master:80',
                              access_key='testkey',
@@ -288,7 +427,7 @@ class TestMultisiteHelpers(CharmTestCase):
             'realm', 'pull',
             '--url=http://master:80',
             '--access-key=testkey', '--secret=testsecret',
-        ])
+        ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
 
     def test_pull_period(self):
         multisite.pull_period(url='http://master:80',
@@ -299,16 +438,64 @@ class TestMultisiteHelpers(CharmTestCase):
             'period', 'pull',
             '--url=http://master:80',
             '--access-key=testkey', '--secret=testsecret',
-        ])
+        ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
 
     def test_list_buckets(self):
         self.subprocess.CalledProcessError = BaseException
         multisite.list_buckets('default', 'default')
         self.subprocess.check_output.assert_called_once_with([
             'radosgw-admin', '--id=rgw.testhost',
-            'bucket', 'list', '--rgw-zone=default',
+            'metadata', 'list', 'bucket', '--rgw-zone=default',
+            '--rgw-zonegroup=default', '--max-entries=1000'
+        ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
+
+    def test_iter_buckets(self):
+        self.subprocess.check_output.side_effect = [
+            b'{"keys": ["b1", "b2"], "truncated": true, "count": 2, '
+            b'"marker": "b2"}',
+            b'{"keys": ["b3"], "truncated": false, "count": 1}',
+        ]
+        buckets = multisite.iter_buckets('default', 'default', page_size=2)
+        self.assertEqual(next(buckets), 'b1')
+        self.subprocess.check_output.assert_called_once()
+        self.assertEqual(list(buckets), ['b2', 'b3'])
+        self.subprocess.check_output.assert_called_with([
+            'radosgw-admin', '--id=rgw.testhost',
+            'metadata', 'list', 'bucket', '--rgw-zone=default',
+            '--rgw-zonegroup=default', '--max-entries=2', '--marker=b2'
+        ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
+
+    def test_iter_buckets_unpaginated(self):
+        self.subprocess.check_output.return_value = b'["b1", "b2"]'
+        self.assertEqual(list(multisite.iter_buckets('default', 'default')),
+                         ['b1', 'b2'])
+        self.subprocess.check_output.assert_called_once()
+
+    def test_zone_has_any_bucket(self):
+        self.subprocess.check_output.return_value = \
+            b'{"keys": [], "truncated": false, "count": 0}'
+        self.assertFalse(multisite.zone_has_any_bucket('default', 'default'))
+        self.subprocess.check_output.return_value = \
+            b'{"keys": ["b1"], "truncated": true, "count": 1, "marker": "b1"}'
+        self.assertTrue(multisite.zone_has_any_bucket('default', 'default'))
+        self.subprocess.check_output.assert_called_with([
+            'radosgw-admin', '--id=rgw.testhost',
+            'metadata', 'list', 'bucket', '--rgw-zone=default',
+            '--rgw-zonegroup=default', '--max-entries=1'
+        ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
+        self.assertEqual(self.subprocess.check_output.call_count, 2)
+
+    def test_bucket_exists(self):
+        self.subprocess.CalledProcessError = subprocess.CalledProcessError
+        self.assertTrue(multisite.bucket_exists('b1', 'default', 'default'))
+        self.subprocess.check_output.assert_called_once_with([
+            'radosgw-admin', '--id=rgw.testhost',
+            'metadata', 'get', 'bucket:b1', '--rgw-zone=default',
             '--rgw-zonegroup=default'
-        ])
+        ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
+        self.subprocess.check_output.side_effect = \
+            subprocess.CalledProcessError(errno.ENOENT, ['radosgw-admin'])
+        self.assertFalse(multisite.bucket_exists('b2', 'default', 'default'))
 
     def test_rename_zonegroup(self):
         multisite.rename_zonegroup('default', 'test_zone_group')
@@ -316,7 +503,7 @@ class TestMultisiteHelpers(CharmTestCase):
             'radosgw-admin', '--id=rgw.testhost',
             'zonegroup', 'rename', '--rgw-zonegroup=default',
             '--zonegroup-new-name=test_zone_group'
-        ])
+        ], timeout=mock.ANY)
 
     def test_rename_zone(self):
         multisite.rename_zone('default', 'test_zone', 'test_zone_group')
@@ -325,14 +512,14 @@ class TestMultisiteHelpers(CharmTestCase):
             'zone', 'rename', '--rgw-zone=default',
             '--zone-new-name=test_zone',
             '--rgw-zonegroup=test_zone_group'
-        ])
+        ], timeout=mock.ANY)
 
     def test_get_zonegroup(self):
         multisite.get_zonegroup_info('test_zone')
         self.subprocess.check_output.assert_called_once_with([
             'radosgw-admin', '--id=rgw.testhost',
             'zonegroup', 'get', '--rgw-zonegroup=test_zone'
-        ])
+        ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
 
     def test_modify_zonegroup_migrate(self):
         multisite.modify_zonegroup('test_zonegroup',
@@ -344,7 +531,7 @@ class TestMultisiteHelpers(CharmTestCase):
             'zonegroup', 'modify',
             '--rgw-zonegroup=test_zonegroup', '--rgw-realm=test_realm',
             '--endpoints=http://localhost:80', '--default', '--master',
-        ])
+        ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
 
     def test_modify_zone_migrate(self):
         multisite.modify_zone('test_zone', default=True, master=True,
@@ -357,7 +544,7 @@ class TestMultisiteHelpers(CharmTestCase):
             '--rgw-zonegroup=test_zonegroup',
             '--endpoints=http://localhost:80',
             '--master', '--default', '--read-only=0',
-        ])
+        ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
 
     @mock.patch.object(multisite, 'list_zones')
     @mock.patch.object(multisite, 'get_zonegroup_info')
@@ -383,7 +570,7 @@ class TestMultisiteHelpers(CharmTestCase):
             'radosgw-admin', '--id=rgw.testhost',
             'zonegroup', 'rename', '--rgw-zonegroup=default',
             '--zonegroup-new-name=test_zonegroup'
-        ])
+        ], timeout=mock.ANY)
 
     def test_modify_multisite_config_zonegroup_fail(self):
         self.assertEqual(
@@ -401,7 +588,7 @@ class TestMultisiteHelpers(CharmTestCase):
             '--rgw-realm=test_realm',
             '--endpoints=http://localhost:80', '--default',
             '--master',
-        ])
+        ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
 
     @mock.patch.object(multisite, 'modify_zonegroup')
     def test_modify_multisite_config_zone_fail(self, mock_modify_zonegroup):
@@ -423,7 +610,7 @@ class TestMultisiteHelpers(CharmTestCase):
             '--rgw-zonegroup=test_zonegroup',
             '--endpoints=http://localhost:80',
             '--master', '--default', '--read-only=0',
-        ])
+        ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
 
     @mock.patch.object(multisite, 'rename_zonegroup')
     def test_rename_multisite_config_zone_fail(self, mock_rename_zonegroup):
@@ -441,7 +628,7 @@ class TestMultisiteHelpers(CharmTestCase):
             'zone', 'rename', '--rgw-zone=default',
             '--zone-new-name=test_zone',
             '--rgw-zonegroup=test_zonegroup',
-        ])
+        ], timeout=mock.ANY)
 
     @mock.patch.object(json, 'loads')
     def test_remove_zone_from_zonegroup(self, json_loads):
@@ -455,7 +642,7 @@ class TestMultisiteHelpers(CharmTestCase):
             'radosgw-admin', '--id=rgw.testhost',
             'zonegroup', 'remove', '--rgw-zonegroup=test_zonegroup',
             '--rgw-zone=test_zone',
-        ])
+        ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
 
     @mock.patch.object(json, 'loads')
     def test_add_zone_from_zonegroup(self, json_loads):
@@ -469,21 +656,265 @@ class TestMultisiteHelpers(CharmTestCase):
             'radosgw-admin', '--id=rgw.testhost',
             'zonegroup', 'add', '--rgw-zonegroup=test_zonegroup',
             '--rgw-zone=test_zone',
-        ])
+        ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
 
-    @mock.patch.object(multisite, 'list_zonegroups')
+    @mock.patch.object(multisite, 'get_period')
+    @mock.patch.object(multisite, 'zone_has_any_bucket')
     @mock.patch.object(multisite, 'get_local_zone')
-    @mock.patch.object(multisite, 'list_buckets')
+    @mock.patch.object(multisite, 'list_zonegroups')
     def test_check_zone_has_buckets(self, mock_list_zonegroups,
                                     mock_get_local_zone,
-                                    mock_list_buckets):
+                                    mock_zone_has_any_bucket,
+                                    mock_get_period):
+        mock_get_period.return_value = None
         mock_list_zonegroups.return_value = ['test_zonegroup']
         mock_get_local_zone.return_value = 'test_zone', 'test_zonegroup'
-        mock_list_buckets.return_value = ['test_bucket_1', 'test_bucket_2']
+        mock_zone_has_any_bucket.return_value = True
         self.assertEqual(
             multisite.check_cluster_has_buckets(),
             True
         )
+        mock_zone_has_any_bucket.assert_called_once_with(
+            'test_zone', 'test_zonegroup')
+        self.kv.set.assert_called_once_with(
+            multisite.CLUSTER_HAS_BUCKETS_KEY, True)
+        self.kv.flush.assert_called_once_with()
+
+    @mock.patch.object(multisite, 'list_zones')
+    @mock.patch.object(multisite, 'get_period')
+    @mock.patch.object(multisite, 'zone_has_any_bucket')
+    def test_check_cluster_has_buckets_period(self, mock_zone_has_any_bucket,
+                                              mock_get_period,
+                                              mock_list_zones):
+        mock_get_period.return_value = {
+            'id': 'period-id',
+            'epoch': 2,
+            'period_map': {
+                'zonegroups': [
+                    {'name': 'zg1', 'zones': [{'name': 'remote'},
+                                              {'name': 'z1'}]},
+                    {'name': 'zg2', 'zones': [{'name': 'z2'}]},
+                    {'name': 'zg3', 'zones': [{'name': 'z3'}]},
+                ],
+            },
+        }
+        mock_list_zones.return_value = ['z1', 'z2', 'z3']
+        mock_zone_has_any_bucket.side_effect = [False, True]
+        self.assertTrue(multisite.check_cluster_has_buckets())
+        mock_zone_has_any_bucket.assert_has_calls([
+            mock.call('z1', 'zg1'),
+            mock.call('z2', 'zg2'),
+        ])
+        self.assertEqual(mock_zone_has_any_bucket.call_count, 2)
+        mock_get_period.assert_called_once_with()
+        mock_list_zones.assert_called_once_with()
+
+    @mock.patch.object(multisite, 'list_zones')
+    @mock.patch.object(multisite, 'get_period')
+    def test_check_cluster_has_buckets_none(self, mock_get_period,
+                                            mock_list_zones):
+        mock_get_period.return_value = {
+            'period_map': {
+                'zonegroups': [{'name': 'zg1', 'zones': [{'name': 'z1'}]}],
+            },
+        }
+        mock_list_zones.return_value = ['z1']
+        self.subprocess.check_output.return_value = \
+            b'{"keys": [], "truncated": false, "count": 0}'
+        self.assertFalse(multisite.check_cluster_has_buckets())
+        self.kv.set.assert_not_called()
+
+    @mock.patch.object(multisite, 'get_period')
+    def test_check_cluster_has_buckets_remembered(self, mock_get_period):
+        self.kv.get.return_value = True
+        self.assertTrue(multisite.check_cluster_has_buckets())
+        self.kv.get.assert_called_once_with(
+            multisite.CLUSTER_HAS_BUCKETS_KEY)
+        mock_get_period.assert_not_called()
+
+    @mock.patch.object(multisite, 'list_zonegroups')
+    @mock.patch.object(multisite, 'list_zones')
+    def test_is_multisite_configured(self, mock_list_zones,
+                                     mock_list_zonegroups):
+        mock_list_zones.return_value = ['brundall-north']
+        mock_list_zonegroups.return_value = ['brundall']
+        self.subprocess.check_output.return_value = (
+            b'  metadata sync no sync (zone is master)\n'
+            b'      data sync source: 3b9e (brundall-south)\n'
+            b'                        syncing\n'
+            b'                        data is behind on 3 shards\n')
+        self.assertTrue(multisite.is_multisite_configured(
+            'brundall-north', 'brundall'))
+        health = multisite.get_sync_health()
+        self.assertEqual(health.data_behind_shards, 3)
+        self.subprocess.check_output.assert_called_once_with([
+            'radosgw-admin', '--id=rgw.testhost',
+            'sync', 'status',
+        ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
+
+        multisite.invalidate_cache('sync')
+        self.subprocess.check_output.return_value = (
+            b'  metadata sync no sync (zone is master)\n')
+        self.assertFalse(multisite.is_multisite_configured(
+            'brundall-north', 'brundall'))
+
+    def _dict_kv(self):
+        db = {}
+        self.kv.get.side_effect = db.get
+        self.kv.set.side_effect = db.__setitem__
+        self.kv.unset.side_effect = db.pop
+        return db
+
+    @mock.patch.object(multisite.time, 'time')
+    @mock.patch.object(multisite, 'is_multisite_configured')
+    def test_cached_is_multisite_configured(self, is_multisite_configured,
+                                            time):
+        db = self._dict_kv()
+        self.hookenv.config.return_value = 1800
+        is_multisite_configured.return_value = True
+        time.return_value = 1000
+        self.assertTrue(multisite.cached_is_multisite_configured(
+            'brundall-north', 'brundall'))
+        time.return_value = 2799
+        self.assertTrue(multisite.cached_is_multisite_configured(
+            'brundall-north', 'brundall'))
+        is_multisite_configured.assert_called_once_with(
+            'brundall-north', 'brundall')
+        self.assertEqual(
+            db[multisite.STATUS_CACHE_KEY],
+            {'cached_is_multisite_configured["brundall-north", "brundall"]':
+             {'time': 1000, 'value': True}})
+        # Other arguments
+        multisite.cached_is_multisite_configured('brundall-east', 'brundall')
+        self.assertEqual(is_multisite_configured.call_count, 2)
+        # Expired
+        time.return_value = 2800
+        multisite.cached_is_multisite_configured('brundall-north', 'brundall')
+        self.assertEqual(is_multisite_configured.call_count, 3)
+
+    @mock.patch.object(multisite, 'check_cluster_has_buckets')
+    def test_cached_cluster_has_buckets_disabled(self,
+                                                 check_cluster_has_buckets):
+        self._dict_kv()
+        self.hookenv.config.return_value = 0
+        check_cluster_has_buckets.return_value = False
+        self.assertFalse(multisite.cached_cluster_has_buckets())
+        self.assertFalse(multisite.cached_cluster_has_buckets())
+        self.assertEqual(check_cluster_has_buckets.call_count, 2)
+        self.kv.set.assert_not_called()
+
+    @mock.patch.object(multisite, 'get_sync_health')
+    def test_cached_sync_summary(self, get_sync_health):
+        self._dict_kv()
+        self.hookenv.config.return_value = 1800
+        get_sync_health.return_value = None
+        self.assertIsNone(multisite.cached_sync_summary())
+        self.kv.set.assert_not_called()
+        health = mock.MagicMock()
+        health.is_multisite = False
+        get_sync_health.return_value = health
+        self.assertEqual(multisite.cached_sync_summary(), '')
+        health.is_multisite = True
+        health.summary.return_value = 'multi-site sync caught up'
+        # Not multi-site is kept until invalidated
+        self.assertEqual(multisite.cached_sync_summary(), '')
+        multisite.invalidate_cache('sync')
+        self.assertEqual(multisite.cached_sync_summary(),
+                         'multi-site sync caught up')
+
+    def test_invalidate_status_cache(self):
+        db = self._dict_kv()
+        db[multisite.STATUS_CACHE_KEY] = {'key': {'time': 0, 'value': True}}
+        multisite.invalidate_cache('user')
+        self.assertIn(multisite.STATUS_CACHE_KEY, db)
+        multisite.invalidate_cache('zonegroup')
+        self.assertNotIn(multisite.STATUS_CACHE_KEY, db)
+        self.kv.flush.assert_called_once_with()
+        multisite.invalidate_status_cache()
+        self.kv.flush.assert_called_once_with()
+
+    @mock.patch.object(multisite, 'plain_list')
+    def test_read_topology(self, plain_list):
+        period = {
+            'id': '3b9e', 'epoch': 4, 'realm_id': 'r1',
+            'master_zonegroup': 'zg1', 'master_zone': 'z1',
+        }
+        plain_list.side_effect = lambda key: ['{}1'.format(key)]
+        self.assertEqual(multisite._read_topology(period), {
+            'realm_id': 'r1', 'period': '3b9e', 'epoch': 4,
+            'master_zonegroup': 'zg1', 'master_zone': 'z1',
+            'realms': ['realm1'], 'zonegroups': ['zonegroup1'],
+            'zones': ['zone1'],
+        })
+        self.assertIsNone(multisite._read_topology(None)['period'])
+
+    @mock.patch.object(multisite, 'plain_list')
+    @mock.patch.object(multisite, 'get_period')
+    def test_topology(self, get_period, plain_list):
+        db = self._dict_kv()
+        zones = ['brundall-north']
+        get_period.return_value = {'id': '3b9e', 'epoch': 4}
+        plain_list.side_effect = lambda key: zones if key == 'zone' else []
+        self.assertEqual(multisite.topology()['zones'], ['brundall-north'])
+        self.assertEqual(multisite.topology()['period'], '3b9e')
+        get_period.assert_called_once_with()
+        self.assertEqual(db[multisite.TOPOLOGY_KEY]['epoch'], 4)
+        self.assertEqual(plain_list.call_count, 3)
+        # Next hook, same period and epoch
+        multisite.flush_cache()
+        multisite.topology()
+        self.assertEqual(get_period.call_count, 2)
+        self.assertEqual(plain_list.call_count, 3)
+        # Zone added by another unit: the period id is unchanged but the
+        # commit bumped the epoch
+        multisite.flush_cache()
+        zones = ['brundall-north', 'brundall-south']
+        get_period.return_value = {'id': '3b9e', 'epoch': 5}
+        self.assertEqual(multisite.topology()['zones'],
+                         ['brundall-north', 'brundall-south'])
+        self.assertEqual(plain_list.call_count, 6)
+        # New period
+        multisite.flush_cache()
+        get_period.return_value = {'id': '4c0f', 'epoch': 1}
+        self.assertEqual(multisite.topology()['period'], '4c0f')
+        self.assertEqual(plain_list.call_count, 9)
+        # Zone created by the charm
+        multisite.invalidate_cache('zone')
+        self.assertNotIn(multisite.TOPOLOGY_KEY, db)
+        multisite.topology()
+        self.assertEqual(plain_list.call_count, 12)
+        # User changes leave the topology alone
+        multisite.invalidate_cache('user')
+        multisite.topology()
+        self.assertEqual(plain_list.call_count, 12)
+
+    @mock.patch.object(multisite, 'plain_list')
+    @mock.patch.object(multisite, 'get_period')
+    def test_topology_no_realm(self, get_period, plain_list):
+        db = self._dict_kv()
+        get_period.return_value = None
+        plain_list.side_effect = lambda key: ['default']
+        self.assertEqual(multisite.topology()['zones'], ['default'])
+        multisite.topology()
+        self.assertEqual(plain_list.call_count, 3)
+        self.assertIsNone(db[multisite.TOPOLOGY_KEY]['period'])
+        # Next hook, still no realm
+        multisite.flush_cache()
+        self.assertEqual(multisite.topology()['zones'], ['default'])
+        self.assertEqual(get_period.call_count, 2)
+        self.assertEqual(plain_list.call_count, 3)
+        # A realm was configured by another unit
+        multisite.flush_cache()
+        get_period.return_value = {'id': '3b9e', 'epoch': 1}
+        self.assertEqual(multisite.topology()['period'], '3b9e')
+        self.assertEqual(plain_list.call_count, 6)
+
+    def test_check_zone_has_buckets_failure(self):
+        self.subprocess.CalledProcessError = subprocess.CalledProcessError
+        self.subprocess.check_output.side_effect = \
+            subprocess.CalledProcessError(errno.ENOENT, ['radosgw-admin'])
+        self.assertFalse(
+            multisite.check_zone_has_buckets('test_zone', 'test_zonegroup'))
 
     def test_get_zone_info(self):
         multisite.get_zone_info('test_zone', 'test_zonegroup')
@@ -491,7 +922,7 @@ class TestMultisiteHelpers(CharmTestCase):
             'radosgw-admin', '--id=rgw.testhost',
             'zone', 'get',
             '--rgw-zone=test_zone', '--rgw-zonegroup=test_zonegroup',
-        ])
+        ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
 
     def test_sync_group_exists(self):
         groups = [
@@ -503,7 +934,7 @@ class TestMultisiteHelpers(CharmTestCase):
         self.subprocess.check_output.assert_called_with([
             'radosgw-admin', '--id=rgw.testhost',
             'sync', 'group', 'get',
-        ])
+        ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
 
     def test_bucket_sync_group_exists(self):
         with open(self._testdata('test_list_sync_groups'), 'rb') as f:
@@ -514,7 +945,7 @@ class TestMultisiteHelpers(CharmTestCase):
                 'radosgw-admin', '--id=rgw.testhost',
                 'sync', 'group', 'get',
                 '--bucket=test',
-            ])
+            ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
 
     def test_sync_group_does_not_exists(self):
         with open(self._testdata('test_list_sync_groups'), 'rb') as f:
@@ -523,7 +954,7 @@ class TestMultisiteHelpers(CharmTestCase):
             self.subprocess.check_output.assert_called_with([
                 'radosgw-admin', '--id=rgw.testhost',
                 'sync', 'group', 'get',
-            ])
+            ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
 
     def test_get_sync_group(self):
         with open(self._testdata(whoami()), 'rb') as f:
@@ -534,7 +965,7 @@ class TestMultisiteHelpers(CharmTestCase):
                 'radosgw-admin', '--id=rgw.testhost',
                 'sync', 'group', 'get',
                 '--group-id=default',
-            ])
+            ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
 
     def test_create_sync_group(self):
         test_group_json = json.dumps({"id": "default"}).encode()
@@ -549,7 +980,7 @@ class TestMultisiteHelpers(CharmTestCase):
             'sync', 'group', 'create',
             '--group-id=default',
             '--status={}'.format(multisite.SYNC_POLICY_ENABLED),
-        ])
+        ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
 
     def test_create_sync_group_wrong_status(self):
         self.assertRaises(
@@ -563,15 +994,30 @@ class TestMultisiteHelpers(CharmTestCase):
             'radosgw-admin', '--id=rgw.testhost',
             'sync', 'group', 'remove',
             '--group-id=default',
-        ])
+        ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
+
+    def test_find_sync_group(self):
+        with open(self._testdata('test_list_sync_groups'), 'rb') as f:
+            self.subprocess.check_output.return_value = f.read()
+        group = multisite.find_sync_group('default')
+        self.assertEqual(group['id'], 'default')
+        self.assertIsNone(multisite.find_sync_group('group-non-existent'))
+        self.subprocess.check_output.assert_called_once_with([
+            'radosgw-admin', '--id=rgw.testhost',
+            'sync', 'group', 'get',
+        ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
 
-    @mock.patch.object(multisite, 'get_sync_group')
-    @mock.patch.object(multisite, 'sync_group_exists')
-    def test_is_sync_group_update_needed(self, mock_sync_group_exists,
-                                         mock_get_sync_group):
-        mock_sync_group_exists.return_value = True
+    def test_sync_group_cache_invalidated(self):
+        self.subprocess.check_output.return_value = b'[]'
+        multisite.list_sync_groups()
+        multisite.create_sync_group('default', 'allowed')
+        multisite.list_sync_groups()
+        self.assertEqual(self.subprocess.check_output.call_count, 3)
+
+    @mock.patch.object(multisite, 'find_sync_group')
+    def test_is_sync_group_update_needed(self, mock_find_sync_group):
         with open(self._testdata('test_get_sync_group'), 'r') as f:
-            mock_get_sync_group.return_value = json.loads(f.read())
+            mock_find_sync_group.return_value = json.loads(f.read())
 
         result = multisite.is_sync_group_update_needed(
             group_id='default',
@@ -583,8 +1029,7 @@ class TestMultisiteHelpers(CharmTestCase):
             desired_flow_type=multisite.SYNC_FLOW_SYMMETRICAL,
         )
 
-        mock_sync_group_exists.assert_called_with('default')
-        mock_get_sync_group.assert_called_with('default')
+        mock_find_sync_group.assert_called_once_with('default')
         self.assertFalse(result)
 
     def test_is_sync_group_flow_update_needed(self):
@@ -635,7 +1080,7 @@ class TestMultisiteHelpers(CharmTestCase):
                 '--flow-id=flow_id',
                 '--flow-type=symmetrical',
                 '--zones=zone_a,zone_b',
-            ])
+            ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
 
     def test_create_sync_group_flow_directional(self):
         with open(self._testdata('test_create_sync_group_flow'), 'rb') as f:
@@ -655,7 +1100,7 @@ class TestMultisiteHelpers(CharmTestCase):
                 '--flow-id=flow_id',
                 '--flow-type=directional',
                 '--source-zone=zone_a', '--dest-zone=zone_b',
-            ])
+            ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
 
     def test_create_sync_group_flow_wrong_type(self):
         self.assertRaises(
@@ -677,7 +1122,7 @@ class TestMultisiteHelpers(CharmTestCase):
             '--group-id=default',
             '--flow-id=flow_id',
             '--flow-type=symmetrical',
-        ])
+        ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
 
     def test_remove_sync_group_flow_directional(self):
         multisite.remove_sync_group_flow(
@@ -694,7 +1139,7 @@ class TestMultisiteHelpers(CharmTestCase):
             '--flow-id=flow_id',
             '--flow-type=directional',
             '--source-zone=zone_a', '--dest-zone=zone_b',
-        ])
+        ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
 
     def test_create_sync_group_pipe(self):
         with open(self._testdata(whoami()), 'rb') as f:
@@ -713,4 +1158,594 @@ class TestMultisiteHelpers(CharmTestCase):
                 '--pipe-id=pipe_id',
                 '--source-zones=zone_a,zone_b', '--source-bucket=*',
                 '--dest-zones=zone_c,zone_d', '--dest-bucket=*',
-            ])
+            ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
+
+
+class TestMultisiteAdminBackend(CharmTestCase):
+
+    TO_PATCH = [
+        'subprocess',
+        'socket',
+        'hookenv',
+        'log',
+        'utils',
+        'admin_api_client',
+    ]
+
+    def setUp(self):
+        super(TestMultisiteAdminBackend, self).setUp(multisite,
+                                                     self.TO_PATCH)
+        self.socket.gethostname.return_value = 'testhost'
+        self.utils.request_per_unit_key.return_value = True
+        self.hookenv.config.side_effect = self.test_config.get
+        self.test_config.set('rgw-admin-backend', 'rest')
+        self.test_config.set('zone', 'east')
+        self.test_config.set('zonegroup', 'brundall')
+        self.client = self.admin_api_client.return_value
+        self.subprocess.check_output.return_value = \
+            b'["testuser", "multisite-sync"]'
+        multisite.flush_cache()
+
+    def test_list_users(self):
+        self.client.list_users.return_value = ['testuser']
+        self.assertEqual(multisite.list_users(), ['testuser'])
+        self.subprocess.check_output.assert_not_called()
+
+    def test_list_users_cli(self):
+        self.test_config.set('rgw-admin-backend', 'cli')
+        self.assertEqual(multisite.list_users(),
+                         ['testuser', 'multisite-sync'])
+        self.admin_api_client.assert_not_called()
+
+    def test_list_users_no_credentials(self):
+        self.admin_api_client.return_value = None
+        self.assertEqual(multisite.list_users(),
+                         ['testuser', 'multisite-sync'])
+
+    def test_list_users_fallback(self):
+        self.client.list_users.side_effect = \
+            multisite.admin_api.AdminAPIError('connection refused')
+        self.assertEqual(multisite.list_users(),
+                         ['testuser', 'multisite-sync'])
+        self.subprocess.check_output.assert_called_once_with([
+            'radosgw-admin', '--id=rgw.testhost',
+            'user', 'list'
+        ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
+
+    def test_create_system_user(self):
+        self.client.create_user.return_value = {
+            'keys': [{'access_key': 'access', 'secret_key': 'secret'}],
+        }
+        self.assertEqual(multisite.create_system_user('multisite-sync'),
+                         ('access', 'secret'))
+        self.client.create_user.assert_called_once_with(
+            'multisite-sync', 'Synchronization User', system=True)
+        self.subprocess.check_output.assert_not_called()
+
+    def test_get_user_info(self):
+        self.client.get_user.return_value = {'user_id': 'testuser'}
+        self.assertEqual(multisite.get_user_info('testuser'),
+                         {'user_id': 'testuser'})
+        self.client.get_user.assert_called_once_with('testuser')
+        self.client.list_users.assert_not_called()
+        self.subprocess.check_output.assert_not_called()
+
+    def test_get_user_info_not_found(self):
+        self.client.get_user.side_effect = \
+            multisite.admin_api.AdminAPIError('not found', status=404)
+        self.assertIsNone(multisite.get_user_info('testuser'))
+        self.assertFalse(multisite.user_exists('testuser'))
+        self.subprocess.check_output.assert_not_called()
+
+    def test_get_user_info_cli(self):
+        self.test_config.set('rgw-admin-backend', 'cli')
+        self.subprocess.check_output.return_value = \
+            b'{"user_id": "testuser", "suspended": 0}'
+        self.assertTrue(multisite.user_exists('testuser'))
+        self.assertTrue(multisite.user_exists('testuser'))
+        self.subprocess.check_output.assert_called_once_with([
+            'radosgw-admin', '--id=rgw.testhost',
+            'user', 'info', '--uid=testuser'
+        ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
+
+    def test_get_user_info_cli_not_found(self):
+        self.test_config.set('rgw-admin-backend', 'cli')
+        self.subprocess.CalledProcessError = subprocess.CalledProcessError
+        self.subprocess.check_output.side_effect = \
+            subprocess.CalledProcessError(
+                errno.EINVAL, 'radosgw-admin',
+                stderr=b'could not fetch user info: no user info saved\n')
+        self.assertIsNone(multisite.get_user_info('testuser'))
+        self.assertEqual(multisite.get_user_creds('testuser'), (None, None))
+        self.assertFalse(multisite.user_exists('testuser'))
+        # Not retried, the failure is permanent
+        self.assertEqual(self.subprocess.check_output.call_count, 3)
+        self.subprocess.check_output.side_effect = \
+            subprocess.CalledProcessError(
+                errno.EINVAL, 'radosgw-admin',
+                stderr=b'invalid argument\n')
+        with self.assertRaises(subprocess.CalledProcessError):
+            multisite.get_user_info('testuser')
+        self.subprocess.check_output.side_effect = \
+            subprocess.CalledProcessError(errno.EACCES, 'radosgw-admin')
+        with self.assertRaises(subprocess.CalledProcessError):
+            multisite.get_user_info('testuser')
+
+    def test_suspend_user_suspended(self):
+        self.client.get_user.return_value = {'user_id': 'testuser',
+                                             'suspended': 1}
+        multisite.suspend_user('testuser')
+        self.client.suspend_user.assert_not_called()
+
+    def test_suspend_user_fallback(self):
+        self.client.get_user.return_value = {'user_id': 'testuser',
+                                             'suspended': 0}
+        self.client.suspend_user.side_effect = \
+            multisite.admin_api.AdminAPIError('forbidden', status=403)
+        multisite.suspend_user('testuser')
+        self.subprocess.check_output.assert_called_once_with([
+            'radosgw-admin', '--id=rgw.testhost',
+            'user', 'suspend', '--uid=testuser'
+        ], stderr=self.subprocess.PIPE, timeout=mock.ANY)
+
+    def test_iter_buckets(self):
+        self.client.list_metadata_keys.return_value = {
+            'keys': ['bucket1'], 'truncated': False,
+        }
+        self.assertEqual(list(multisite.iter_buckets('east', 'brundall')),
+                         ['bucket1'])
+        self.client.list_metadata_keys.assert_called_once_with(
+            'bucket', max_entries=1000, marker=None)
+        self.subprocess.check_output.assert_not_called()
+
+    def test_iter_buckets_remote_zone(self):
+        self.subprocess.check_output.return_value = b'[]'
+        self.assertEqual(list(multisite.iter_buckets('west', 'brundall')),
+                         [])
+        self.client.list_metadata_keys.assert_not_called()
+
+    def test_bucket_exists(self):
+        self.assertTrue(multisite.bucket_exists('b1', 'east', 'brundall'))
+        self.client.get_metadata.side_effect = \
+            multisite.admin_api.AdminAPIError('not found', status=404)
+        self.assertFalse(multisite.bucket_exists('b2', 'east', 'brundall'))
+        self.subprocess.check_output.assert_not_called()
+
+    def test_benchmark_admin_backends(self):
+        results = multisite.benchmark_admin_backends(iterations=3)
+        self.assertEqual(len(results['cli']), 3)
+        self.assertEqual(len(results['rest']), 3)
+        self.assertEqual(self.subprocess.check_output.call_count, 3)
+        self.assertEqual(self.client.list_users.call_count, 3)
+
+
+class TestRetryEngine(CharmTestCase):
+
+    TO_PATCH = [
+        'subprocess',
+        'socket',
+        'hookenv',
+        'log',
+        'utils',
+        'time',
+    ]
+
+    def setUp(self):
+        super(TestRetryEngine, self).setUp(multisite, self.TO_PATCH)
+        self.socket.gethostname.return_value = 'testhost'
+        self.utils.request_per_unit_key.return_value = True
+        self.subprocess.CalledProcessError = subprocess.CalledProcessError
+        self.subprocess.TimeoutExpired = subprocess.TimeoutExpired
+        self.time.monotonic.return_value = 1000.0
+        multisite.flush_cache()
+        for patcher in (mock.patch.object(multisite, '_retry_stats', {}),
+                        mock.patch.dict(multisite._retry_state,
+                                        {'start': None, 'logged': False})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _failure(self, returncode, stderr=b''):
+        return subprocess.CalledProcessError(
+            returncode, ['radosgw-admin'], stderr=stderr)
+
+    def test_classify_failure(self):
+        self.assertEqual(multisite.classify_failure(errno.EAGAIN),
+                         multisite.FAILURE_TRANSIENT)
+        self.assertEqual(multisite.classify_failure(errno.ENOENT),
+                         multisite.FAILURE_PERMANENT)
+        self.assertEqual(
+            multisite.classify_failure(
+                1, b'monclient(hunting): authenticate timed out after 300'),
+            multisite.FAILURE_TRANSIENT)
+        self.assertEqual(
+            multisite.classify_failure(1, 'zonegroup foo does not exist'),
+            multisite.FAILURE_PERMANENT)
+        self.assertEqual(multisite.classify_failure(1, None),
+                         multisite.FAILURE_UNKNOWN)
+
+    def test_retry_policy_delay(self):
+        policy = multisite.RetryPolicy(max_attempts=5, base_delay=2,
+                                       max_delay=10)
+        for attempt, cap in ((1, 2), (2, 4), (3, 8), (4, 10), (8, 10)):
+            delay = policy.delay(attempt)
+            self.assertGreaterEqual(delay, cap / 2)
+            self.assertLessEqual(delay, cap)
+
+    def test_permanent_failure_not_retried(self):
+        self.subprocess.check_output.side_effect = self._failure(
+            errno.ENOENT, b'failed to init zonegroup: (2) No such file')
+        with self.assertRaises(subprocess.CalledProcessError):
+            multisite.get_zonegroup_info('missing')
+        self.subprocess.check_output.assert_called_once()
+        self.time.sleep.assert_not_called()
+        self.assertEqual(multisite.retry_stats()['zonegroup get'],
+                         {'calls': 1, 'retries': 0, 'failures': 1,
+                          'backoff': 0.0})
+
+    def test_transient_failure_retried(self):
+        self.subprocess.check_output.side_effect = [
+            self._failure(errno.ETIMEDOUT),
+            self._failure(1, b'Resource temporarily unavailable'),
+            b'["brundall"]',
+        ]
+        self.assertEqual(multisite.list_zonegroups(), ['brundall'])
+        self.assertEqual(self.time.sleep.call_count, 2)
+        stats = multisite.retry_stats()['zonegroup list']
+        self.assertEqual(stats['retries'], 2)
+        self.assertEqual(stats['failures'], 0)
+        self.hookenv.atexit.assert_called_once_with(
+            multisite._log_retry_stats)
+
+    def test_retries_exhausted(self):
+        self.subprocess.check_call.side_effect = self._failure(errno.EBUSY)
+        with self.assertRaises(subprocess.CalledProcessError):
+            multisite.set_default_realm('beedata')
+        self.assertEqual(self.subprocess.check_call.call_count,
+                         multisite.WRITE_RETRY_POLICY.max_attempts)
+
+    def test_retry_budget_exhausted(self):
+        multisite._retry_state['start'] = 1000.0 - multisite.RETRY_BUDGET
+        self.subprocess.check_output.side_effect = self._failure(errno.EAGAIN)
+        with self.assertRaises(subprocess.CalledProcessError):
+            multisite.list_zonegroups()
+        self.subprocess.check_output.assert_called_once_with(
+            ['radosgw-admin', '--id=rgw.testhost', 'zonegroup', 'list'],
+            stderr=self.subprocess.PIPE,
+            timeout=multisite.MIN_COMMAND_TIMEOUT)
+        self.time.sleep.assert_not_called()
+
+    def test_thread_retry_budget(self):
+        multisite._retry_state['start'] = 1000.0 - multisite.RETRY_BUDGET
+        self.subprocess.check_output.side_effect = [
+            self._failure(errno.EAGAIN),
+            b'["brundall"]',
+        ]
+        with multisite.retry_budget():
+            self.assertEqual(multisite.list_zonegroups(), ['brundall'])
+        self.time.sleep.assert_called_once()
+        self.assertEqual(
+            self.subprocess.check_output.call_args[1]['timeout'],
+            multisite.RETRY_BUDGET)
+        # Back to the exhausted budget of the hook
+        self.assertEqual(multisite._command_timeout(),
+                         multisite.MIN_COMMAND_TIMEOUT)
+
+    def test_command_timeout(self):
+        self.subprocess.check_output.return_value = b'["brundall"]'
+        multisite.list_zonegroups()
+        self.time.monotonic.return_value = 1100.0
+        multisite.list_zones()
+        self.assertEqual(
+            [c[1]['timeout']
+             for c in self.subprocess.check_output.call_args_list],
+            [multisite.RETRY_BUDGET, multisite.RETRY_BUDGET - 100])
+
+    def test_timeout_retried(self):
+        self.subprocess.check_output.side_effect = [
+            subprocess.TimeoutExpired(['radosgw-admin'], 300),
+            b'["brundall"]',
+        ]
+        self.assertEqual(multisite.list_zonegroups(), ['brundall'])
+        self.assertEqual(self.time.sleep.call_count, 1)
+        self.assertEqual(multisite.retry_stats()['zonegroup list']['retries'],
+                         1)
+
+    def test_timeout_expected_failures(self):
+        self.subprocess.check_output.side_effect = subprocess.TimeoutExpired(
+            ['radosgw-admin'], 300)
+        self.assertEqual(multisite.plain_list('zone'), [])
+        self.assertIsNone(multisite.get_period())
+        self.subprocess.call.side_effect = subprocess.TimeoutExpired(
+            ['radosgw-admin'], 300)
+        self.assertEqual(multisite.rename_zonegroup('default', 'brundall'),
+                         None)
+        self.subprocess.call.assert_called_once_with(
+            ['radosgw-admin', '--id=rgw.testhost', 'zonegroup', 'rename',
+             '--rgw-zonegroup=default', '--zonegroup-new-name=brundall'],
+            timeout=multisite.RETRY_BUDGET)
+        self.time.sleep.assert_not_called()
+
+
+class TestMultisiteReconciler(CharmTestCase):
+
+    TO_PATCH = [
+        'check_cluster_has_buckets',
+        'hookenv',
+        'log',
+        'user_exists',
+        'list_zonegroups',
+        'list_zones',
+        'update_period',
+    ]
+
+    ENDPOINTS = ['http://rgw:80']
+
+    def setUp(self):
+        super(TestMultisiteReconciler, self).setUp(multisite, self.TO_PATCH)
+        self.check_cluster_has_buckets.return_value = False
+        self.user_exists.return_value = False
+
+    def _master_state(self):
+        zonegroup = get_zonegroup_stub()
+        zonegroup['id'] = 'test_zonegroup_id'
+        zonegroup['endpoints'] = self.ENDPOINTS
+        zonegroup['zones'][0]['endpoints'] = self.ENDPOINTS
+        return multisite.MultisiteState(
+            realm={'id': 'test_realm_id', 'name': 'test_realm'},
+            period={'realm_id': 'test_realm_id',
+                    'master_zonegroup': 'test_zonegroup_id',
+                    'master_zone': 'test_zone_id'},
+            zonegroup=zonegroup,
+            zone={'id': 'test_zone_id', 'name': 'test_zone'},
+        )
+
+    def _names(self, plan):
+        return [operation.name for operation in plan.operations]
+
+    @mock.patch.object(multisite, 'get_period')
+    @mock.patch.object(multisite, 'get_zone_info')
+    @mock.patch.object(multisite, 'get_zonegroup_info')
+    @mock.patch.object(multisite, 'get_realm_info')
+    def test_observe_multisite_state(self, get_realm_info,
+                                     get_zonegroup_info, get_zone_info,
+                                     get_period):
+        get_realm_info.side_effect = subprocess.CalledProcessError(2, 'get')
+        state = multisite.observe_multisite_state('realm', 'zg', 'zone')
+        self.assertIsNone(state.realm)
+        self.assertEqual(state.period, get_period.return_value)
+        self.assertEqual(state.zonegroup, get_zonegroup_info.return_value)
+        self.assertEqual(state.zone, get_zone_info.return_value)
+        get_zonegroup_info.assert_called_once_with('zg')
+        get_zone_info.assert_called_once_with('zone')
+
+    def test_is_master(self):
+        state = self._master_state()
+        self.assertTrue(state.is_master(self.ENDPOINTS))
+        self.assertFalse(state.is_master(['http://other:80']))
+        state.period['master_zone'] = 'other_zone_id'
+        self.assertFalse(state.is_master(self.ENDPOINTS))
+        self.assertFalse(
+            multisite.MultisiteState().is_master(self.ENDPOINTS))
+
+    def test_plan_primary_create_everything(self):
+        plan = multisite.plan_primary(
+            'test_realm', 'test_zonegroup', 'test_zone', self.ENDPOINTS,
+            'multisite-sync', state=multisite.MultisiteState())
+        self.assertEqual(self._names(plan), [
+            'create-realm', 'create-zonegroup', 'create-zone',
+            'create-system-user',
+        ])
+        self.assertTrue(plan.mutation)
+        self.assertEqual(plan.describe(), [
+            'radosgw-admin realm create --rgw-realm=test_realm --default',
+            'radosgw-admin zonegroup create --rgw-zonegroup=test_zonegroup '
+            '--rgw-realm=test_realm --endpoints=http://rgw:80 '
+            '--master --default',
+            'radosgw-admin zone create --rgw-zone=test_zone '
+            '--rgw-zonegroup=test_zonegroup --endpoints=http://rgw:80 '
+            '--master --default',
+            'radosgw-admin user create --uid=multisite-sync --system; '
+            'zone modify --rgw-zone=test_zone --access-key=<generated> '
+            '--secret=<generated>',
+            'radosgw-admin period update --commit',
+        ])
+
+    def test_plan_primary_create_nothing(self):
+        self.user_exists.return_value = True
+        plan = multisite.plan_primary(
+            'test_realm', 'test_zonegroup', 'test_zone', self.ENDPOINTS,
+            'multisite-sync', state=self._master_state())
+        self.assertEqual(plan.operations, [])
+        self.assertFalse(plan.mutation)
+        self.assertEqual(plan.describe(), [])
+        self.check_cluster_has_buckets.assert_not_called()
+
+    def test_plan_primary_migration(self):
+        self.user_exists.return_value = True
+        self.check_cluster_has_buckets.return_value = True
+        self.list_zonegroups.return_value = ['default']
+        self.list_zones.return_value = ['default']
+        plan = multisite.plan_primary(
+            'test_realm', 'test_zonegroup', 'test_zone', self.ENDPOINTS,
+            'multisite-sync', state=multisite.MultisiteState())
+        self.assertEqual(self._names(plan), [
+            'create-realm', 'rename', 'configure-master',
+        ])
+        self.assertEqual(plan.operations[1].args, (
+            ['default'], 'test_zonegroup', ['default'], 'test_zone'))
+
+    def test_plan_primary_migration_multiple_zones(self):
+        self.check_cluster_has_buckets.return_value = True
+        self.list_zonegroups.return_value = ['default']
+        self.list_zones.return_value = ['default', 'other']
+        plan = multisite.plan_primary(
+            'test_realm', 'test_zonegroup', 'test_zone', self.ENDPOINTS,
+            'multisite-sync',
+            state=multisite.MultisiteState(realm={'id': 'test_realm_id'}))
+        self.assertEqual(plan.errors,
+                         ["Multiple zones found ['default', 'other'], "
+                          "aborting."])
+        self.assertFalse(plan.mutation)
+        self.assertIsNone(plan.apply())
+        self.user_exists.assert_not_called()
+
+    @mock.patch.object(multisite, 'period_transaction')
+    def test_plan_apply(self, period_transaction):
+        period = period_transaction.return_value.__enter__.return_value
+        calls = []
+        plan = multisite.MultisitePlan(zonegroup='zg', zone='zone')
+        plan.add('first', 'first', lambda: calls.append('first') or 1)
+        plan.add('second', 'second', lambda: calls.append('second') or 2)
+        self.assertEqual(plan.apply(), period)
+        self.assertEqual(calls, ['first', 'second'])
+        self.assertEqual(plan.result('second'), 2)
+        self.update_period.assert_called_once_with(zonegroup='zg',
+                                                   zone='zone')
+
+    def test_plan_apply_required_failure(self):
+        plan = multisite.MultisitePlan(zonegroup='zg', zone='zone')
+        plan.add('rename', 'rename', lambda: None, required=True)
+        second = mock.MagicMock()
+        plan.add('configure-master', 'configure', second)
+        self.assertIsNone(plan.apply())
+        second.assert_not_called()
+        self.update_period.assert_not_called()
+
+    def test_plan_apply_empty(self):
+        plan = multisite.MultisitePlan(zonegroup='zg', zone='zone')
+        self.assertIsNotNone(plan.apply())
+        self.update_period.assert_not_called()
+
+    def test_plan_secondary_fresh(self):
+        plan = multisite.plan_secondary(
+            'test_realm', 'test_zonegroup', 'test_zone2', self.ENDPOINTS,
+            'http://primary:80', 'key', 'secret',
+            state=multisite.MultisiteState())
+        self.assertEqual(self._names(plan), [
+            'pull-realm', 'pull-period', 'set-default-realm', 'create-zone',
+        ])
+        self.assertEqual(plan.operations[-1].kwargs, {
+            'endpoints': self.ENDPOINTS, 'default': False, 'master': False,
+            'zonegroup': 'test_zonegroup', 'access_key': 'key',
+            'secret': 'secret',
+        })
+        self.assertNotIn('secret=secret', '\n'.join(plan.describe()))
+
+    def test_plan_secondary_missing_zone(self):
+        plan = multisite.plan_secondary(
+            'test_realm', 'test_zonegroup', 'test_zone2', self.ENDPOINTS,
+            'http://primary:80', 'key', 'secret',
+            state=multisite.MultisiteState(realm={'id': 'test_realm_id'}))
+        self.assertEqual(self._names(plan), ['pull-period', 'create-zone'])
+
+    def test_plan_secondary_configured(self):
+        plan = multisite.plan_secondary(
+            'test_realm', 'test_zonegroup', 'test_zone2', self.ENDPOINTS,
+            'http://primary:80', 'key', 'secret',
+            state=multisite.MultisiteState(realm={'id': 'test_realm_id'},
+                                           zone={'id': 'test_zone2_id'}))
+        self.assertEqual(plan.operations, [])
+        self.check_cluster_has_buckets.assert_not_called()
+
+    def test_plan_secondary_not_pristine(self):
+        self.check_cluster_has_buckets.return_value = True
+        plan = multisite.plan_secondary(
+            'test_realm', 'test_zonegroup', 'test_zone2', self.ENDPOINTS,
+            'http://primary:80', 'key', 'secret',
+            state=multisite.MultisiteState())
+        self.assertEqual(plan.errors,
+                         ["Non-Pristine site can't be used as secondary"])
+        self.assertEqual(plan.operations, [])
+
+    def test_plan_force_enable(self):
+        plan = multisite.plan_force_enable(
+            'default', 'default', 'test_realm', 'test_zonegroup',
+            'test_zone', self.ENDPOINTS, state=multisite.MultisiteState())
+        self.assertEqual(self._names(plan), ['rename', 'configure-master'])
+        plan = multisite.plan_force_enable(
+            'test_zonegroup', 'test_zone', 'test_realm', 'test_zonegroup',
+            'test_zone', self.ENDPOINTS, state=self._master_state())
+        self.assertEqual(plan.operations, [])
+
+    def test_plan_scaledown(self):
+        state = self._master_state()
+        state.zonegroup['zones'].append({'id': 'test_zone2_id',
+                                         'name': 'test_zone2'})
+        plan = multisite.plan_scaledown('test_realm', 'test_zonegroup',
+                                        'test_zone', state=state)
+        self.assertEqual(self._names(plan), ['remove-zone', 'modify-zone'])
+        self.assertEqual(plan.operations[0].args,
+                         ('test_zone2', 'test_zonegroup'))
+        self.assertEqual(plan.commit, {
+            'fatal': True, 'zonegroup': 'test_zonegroup',
+            'zone': 'test_zone', 'realm': 'test_realm',
+        })
+
+    def _sync_group(self):
+        with open(os.path.join(os.path.dirname(__file__), 'testdata',
+                               'test_get_sync_group.json'), 'r') as f:
+            return json.loads(f.read())
+
+    def test_plan_sync_group_missing(self):
+        with mock.patch.object(multisite, 'find_sync_group') as find:
+            find.return_value = None
+            plan = multisite.plan_sync_group(
+                'default', 'allowed', 'test_zonegroup', 'zone_a',
+                {'zone_b': multisite.SYNC_FLOW_SYMMETRICAL,
+                 'zone_c': multisite.SYNC_FLOW_DIRECTIONAL})
+        find.assert_called_once_with('default')
+        self.assertEqual(self._names(plan), [
+            'create-sync-group',
+            'create-sync-group-flow', 'create-sync-group-pipe',
+            'create-sync-group-flow', 'create-sync-group-pipe',
+        ])
+        self.assertEqual(plan.operations[4].kwargs, {
+            'group_id': 'default', 'pipe_id': 'zone_a-zone_c',
+            'source_zones': ['zone_a'], 'dest_zones': ['zone_c'],
+        })
+        self.assertEqual(plan.commit, {'zonegroup': 'test_zonegroup',
+                                       'zone': 'zone_a'})
+
+    def test_plan_sync_group_configured(self):
+        plan = multisite.plan_sync_group(
+            'default', 'allowed', 'test_zonegroup', 'zone_a',
+            {'zone_b': multisite.SYNC_FLOW_SYMMETRICAL},
+            group=self._sync_group())
+        self.assertEqual(plan.operations, [])
+        self.assertFalse(plan.mutation)
+
+    def test_plan_sync_group_changes(self):
+        plan = multisite.plan_sync_group(
+            'default', 'enabled', 'test_zonegroup', 'zone_a',
+            {'zone_b': multisite.SYNC_FLOW_DIRECTIONAL,
+             'zone_c': multisite.SYNC_FLOW_SYMMETRICAL},
+            group=self._sync_group())
+        self.assertEqual(self._names(plan), [
+            'create-sync-group',
+            'remove-sync-group-flow', 'create-sync-group-flow',
+            'create-sync-group-pipe',
+            'create-sync-group-flow', 'create-sync-group-pipe',
+        ])
+        self.assertEqual(plan.operations[1].kwargs['flow_type'],
+                         multisite.SYNC_FLOW_SYMMETRICAL)
+        self.assertEqual(plan.operations[2].kwargs['flow_type'],
+                         multisite.SYNC_FLOW_DIRECTIONAL)
+
+    @mock.patch.object(multisite, 'create_sync_group_pipe')
+    @mock.patch.object(multisite, 'create_sync_group_flow')
+    @mock.patch.object(multisite, 'period_transaction')
+    def test_plan_sync_group_apply(self, period_transaction,
+                                   create_sync_group_flow,
+                                   create_sync_group_pipe):
+        group = self._sync_group()
+        plan = multisite.plan_sync_group(
+            'default', 'allowed', 'test_zonegroup', 'zone_a',
+            {'zone_b': multisite.SYNC_FLOW_SYMMETRICAL,
+             'zone_c': multisite.SYNC_FLOW_SYMMETRICAL,
+             'zone_d': multisite.SYNC_FLOW_SYMMETRICAL},
+            group=group)
+        plan.apply()
+        self.assertEqual(create_sync_group_flow.call_count, 2)
+        self.assertEqual(create_sync_group_pipe.call_count, 2)
+        self.update_period.assert_called_once_with(
+            zonegroup='test_zonegroup', zone='zone_a')
@@ -0,0 +1,117 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest import mock
+
+import pkg_versions
+
+from test_utils import CharmTestCase
+
+TO_PATCH = [
+    'apt_cache',
+    'apt_pkg',
+    'unitdata',
+    '_dpkg_status_mtime',
+]
+
+RADOSGW_VERSION = '17.2.6-0ubuntu0.22.04.2'
+
+# Patched in the test cases
+dpkg_status_mtime = pkg_versions._dpkg_status_mtime
+
+
+class PkgVersionsTestCase(CharmTestCase):
+
+    def setUp(self):
+        super(PkgVersionsTestCase, self).setUp(pkg_versions, TO_PATCH)
+        patcher = mock.patch.object(pkg_versions, '_versions', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.db = {}
+        kv = self.unitdata.kv.return_value
+        kv.get.side_effect = self.db.get
+        kv.set.side_effect = self.db.__setitem__
+        self._dpkg_status_mtime.return_value = 1000
+        self.dpkg_list = self.apt_cache.return_value.dpkg_list
+        self.dpkg_list.side_effect = lambda pkgs: {
+            pkg: {'name': pkg, 'version': RADOSGW_VERSION}
+            for pkg in pkgs if pkg == 'radosgw'}
+        self.apt_pkg.version_compare.return_value = 1
+        self.apt_pkg.upstream_version.return_value = '17.2.6'
+
+    def test_installed_version(self):
+        self.assertEqual(pkg_versions.installed_version('radosgw'),
+                         RADOSGW_VERSION)
+        self.assertEqual(pkg_versions.installed_version('radosgw'),
+                         RADOSGW_VERSION)
+        self.assertIsNone(pkg_versions.installed_version('apache2'))
+        self.assertIsNone(pkg_versions.installed_version('apache2'))
+        self.dpkg_list.assert_has_calls([
+            mock.call(['radosgw']), mock.call(['apache2'])])
+        self.assertEqual(self.dpkg_list.call_count, 2)
+        self.assertEqual(self.db[pkg_versions.PKG_VERSIONS_KEY], {
+            'mtime': 1000,
+            'installed': {'radosgw': RADOSGW_VERSION, 'apache2': None},
+            'comparisons': {},
+        })
+
+    def test_installed_version_stored(self):
+        self.db[pkg_versions.PKG_VERSIONS_KEY] = {
+            'mtime': 1000,
+            'installed': {'radosgw': '16.2.9'},
+            'comparisons': {},
+        }
+        self.assertEqual(pkg_versions.installed_version('radosgw'), '16.2.9')
+        self.dpkg_list.assert_not_called()
+
+    def test_installed_version_packages_changed(self):
+        self.db[pkg_versions.PKG_VERSIONS_KEY] = {
+            'mtime': 900,
+            'installed': {'radosgw': '16.2.9'},
+            'comparisons': {'16.2.9 17.0.0': -1},
+        }
+        self.assertEqual(pkg_versions.installed_version('radosgw'),
+                         RADOSGW_VERSION)
+        self._dpkg_status_mtime.return_value = 1100
+        self.assertEqual(pkg_versions.installed_version('radosgw'),
+                         RADOSGW_VERSION)
+        self.assertEqual(self.dpkg_list.call_count, 2)
+
+    def test_cmp_pkgrevno(self):
+        self.assertEqual(pkg_versions.cmp_pkgrevno('radosgw', '17.0.0'), 1)
+        self.assertEqual(pkg_versions.cmp_pkgrevno('radosgw', '17.0.0'), 1)
+        self.apt_pkg.version_compare.assert_called_once_with(
+            RADOSGW_VERSION, '17.0.0')
+        self.assertEqual(
+            self.db[pkg_versions.PKG_VERSIONS_KEY]['comparisons'],
+            {'{} 17.0.0'.format(RADOSGW_VERSION): 1})
+
+    def test_cmp_pkgrevno_not_installed(self):
+        self.assertEqual(pkg_versions.cmp_pkgrevno('apache2', '2.4'), -1)
+        self.apt_pkg.version_compare.assert_not_called()
+
+    def test_get_upstream_version(self):
+        self.assertEqual(pkg_versions.get_upstream_version('radosgw'),
+                         '17.2.6')
+        self.apt_pkg.upstream_version.assert_called_once_with(
+            RADOSGW_VERSION)
+        self.assertIsNone(pkg_versions.get_upstream_version('apache2'))
+
+    @mock.patch.object(pkg_versions.os, 'stat')
+    def test_dpkg_status_mtime(self, stat):
+        stat.return_value.st_mtime_ns = 1000
+        self.assertEqual(dpkg_status_mtime(), 1000)
+        stat.assert_called_once_with('/var/lib/dpkg/status')
+        stat.side_effect = FileNotFoundError
+        self.assertIsNone(dpkg_status_mtime())
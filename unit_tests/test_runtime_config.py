@@ -0,0 +1,123 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import subprocess
+import unittest
+from unittest import mock
+
+import runtime_config
+
+CEPH_CONF = """[global]
+auth cluster required = cephx
+mon host = 10.5.0.1 10.5.0.2
+debug rgw = 1/5
+log to syslog = false
+# User-provided options from the config-flags charm option.
+rgw-max-chunk-size = 4194304
+
+[client.rgw.testhost]
+host = testhost
+rgw frontends = beast port=70
+debug_ms = 0/0
+"""
+
+
+class RuntimeConfigTestCase(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(runtime_config, 'hookenv')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_option_name(self):
+        self.assertEqual(runtime_config.option_name('debug rgw'),
+                         'debug_rgw')
+        self.assertEqual(runtime_config.option_name(' Rgw-Max  chunk_size'),
+                         'rgw_max_chunk_size')
+
+    def test_parse_ceph_conf(self):
+        conf = runtime_config.parse_ceph_conf(CEPH_CONF)
+        self.assertEqual(sorted(conf), ['client.rgw.testhost', 'global'])
+        self.assertEqual(conf['global']['debug_rgw'], '1/5')
+        self.assertEqual(conf['global']['rgw_max_chunk_size'], '4194304')
+        self.assertEqual(conf['client.rgw.testhost']['rgw_frontends'],
+                         'beast port=70')
+
+    def test_daemon_options(self):
+        conf = runtime_config.parse_ceph_conf(CEPH_CONF)
+        conf['global']['debug_ms'] = '1/1'
+        options = runtime_config.daemon_options(conf, 'client.rgw.testhost')
+        self.assertEqual(options['debug_ms'], '0/0')
+        self.assertEqual(options['mon_host'], '10.5.0.1 10.5.0.2')
+        self.assertNotIn(
+            'host',
+            runtime_config.daemon_options(conf, 'client.radosgw.gateway'))
+
+    def test_is_runtime_option(self):
+        self.assertTrue(runtime_config.is_runtime_option('debug_rgw'))
+        self.assertTrue(runtime_config.is_runtime_option('log_to_syslog'))
+        self.assertFalse(runtime_config.is_runtime_option('rgw_frontends'))
+
+    def test_classify_changes(self):
+        old = {'debug_rgw': '1/5', 'debug_ms': '0/0', 'mon_host': 'a',
+               'log_to_syslog': 'false'}
+        self.assertEqual(
+            runtime_config.classify_changes(
+                old, dict(old, debug_rgw='20/20', log_to_syslog='true')),
+            ({'debug_rgw': '20/20', 'log_to_syslog': 'true'}, []))
+        new = dict(old, debug_rgw='20/20', mon_host='b', rgw_zone='z')
+        del new['debug_ms']
+        self.assertEqual(
+            runtime_config.classify_changes(old, new),
+            ({'debug_rgw': '20/20'}, ['debug_ms', 'mon_host', 'rgw_zone']))
+        self.assertEqual(runtime_config.classify_changes(old, old), ({}, []))
+
+    @mock.patch.object(runtime_config.subprocess, 'check_output')
+    @mock.patch.object(runtime_config.os.path, 'exists')
+    def test_apply_runtime_options(self, exists, check_output):
+        exists.return_value = True
+        check_output.return_value = b'{"success": ""}'
+        self.assertTrue(runtime_config.apply_runtime_options(
+            'client.rgw.testhost',
+            {'debug_rgw': '20/20', 'debug_ms': '1/1'}))
+        check_output.assert_has_calls([
+            mock.call(['ceph', '--admin-daemon',
+                       '/var/run/ceph/ceph-client.rgw.testhost.asok',
+                       'config', 'set', name, value],
+                      stderr=subprocess.STDOUT)
+            for name, value in (('debug_ms', '1/1'), ('debug_rgw', '20/20'))
+        ])
+
+    @mock.patch.object(runtime_config.subprocess, 'check_output')
+    @mock.patch.object(runtime_config.os.path, 'exists')
+    def test_apply_runtime_options_not_observed(self, exists, check_output):
+        exists.return_value = True
+        check_output.return_value = (
+            b'{"success": "log_max_recent = \'500\' (not observed, '
+            b'change may require restart) "}')
+        self.assertFalse(runtime_config.apply_runtime_options(
+            'client.rgw.testhost', {'log_max_recent': '500'}))
+
+    @mock.patch.object(runtime_config.subprocess, 'check_output')
+    @mock.patch.object(runtime_config.os.path, 'exists')
+    def test_apply_runtime_options_failed(self, exists, check_output):
+        exists.return_value = True
+        check_output.side_effect = subprocess.CalledProcessError(22, 'ceph')
+        self.assertFalse(runtime_config.apply_runtime_options(
+            'client.rgw.testhost', {'debug_rgw': '20/20'}))
+        exists.return_value = False
+        check_output.reset_mock()
+        self.assertFalse(runtime_config.apply_runtime_options(
+            'client.rgw.testhost', {'debug_rgw': '20/20'}))
+        check_output.assert_not_called()
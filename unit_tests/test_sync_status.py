@@ -0,0 +1,182 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import os
+import time
+import unittest
+from unittest import mock
+
+import sync_status
+
+SECONDARY_BEHIND = """\
+          realm 1e4c1b0a-71c4-4b7c-a5a1-8e0a0fbd3c57 (beedata)
+      zonegroup 2a8d1a8e-6c2d-4a3b-9b0e-64d1f5a8d9c1 (brundall)
+           zone 3b9e6f1c-5d7a-4b8e-8f2c-1a2b3c4d5e6f (brundall-south)
+   current time 2024-02-14T10:53:01Z
+zonegroup features enabled: resharding
+                   disabled: compress-encrypted
+  metadata sync syncing
+                full sync: 0/64 shards
+                incremental sync: 64/64 shards
+                metadata is behind on 2 shards
+                behind shards: [7,21]
+                oldest incremental change not applied: \
+2024-02-14T10:51:00.372512+0000 [7]
+      data sync source: 4c0d7e2b-8f1a-4c6d-9e3b-2f4a5b6c7d8e (brundall-north)
+                        syncing
+                        full sync: 0/128 shards
+                        incremental sync: 128/128 shards
+                        data is behind on 3 shards
+                        behind shards: [1,5,9]
+                        oldest incremental change not applied: \
+2024-02-14T10:43:01.372512+0000 [5]
+                        2 shards are recovering
+                        recovering shards: [2,3]
+"""
+
+PRIMARY_CAUGHT_UP = """\
+          realm 1e4c1b0a-71c4-4b7c-a5a1-8e0a0fbd3c57 (beedata)
+      zonegroup 2a8d1a8e-6c2d-4a3b-9b0e-64d1f5a8d9c1 (brundall)
+           zone 4c0d7e2b-8f1a-4c6d-9e3b-2f4a5b6c7d8e (brundall-north)
+  metadata sync no sync (zone is master)
+      data sync source: 3b9e6f1c-5d7a-4b8e-8f2c-1a2b3c4d5e6f (brundall-south)
+                        syncing
+                        full sync: 0/128 shards
+                        incremental sync: 128/128 shards
+                        data is caught up with source
+"""
+
+SOURCE_FAILED = """\
+           zone 4c0d7e2b-8f1a-4c6d-9e3b-2f4a5b6c7d8e (brundall-north)
+  metadata sync no sync (zone is master)
+      data sync source: 3b9e6f1c-5d7a-4b8e-8f2c-1a2b3c4d5e6f (brundall-south)
+                        failed to retrieve sync info: (5) Input/output error
+"""
+
+# Reported by radosgw-admin before Nautilus, in local time.
+SECONDARY_BEHIND_LEGACY = """\
+          realm 1e4c1b0a-71c4-4b7c-a5a1-8e0a0fbd3c57 (beedata)
+      zonegroup 2a8d1a8e-6c2d-4a3b-9b0e-64d1f5a8d9c1 (brundall)
+           zone 3b9e6f1c-5d7a-4b8e-8f2c-1a2b3c4d5e6f (brundall-south)
+  metadata sync syncing
+                full sync: 0/64 shards
+                incremental sync: 64/64 shards
+                metadata is caught up with master
+      data sync source: 4c0d7e2b-8f1a-4c6d-9e3b-2f4a5b6c7d8e (brundall-north)
+                        syncing
+                        full sync: 0/128 shards
+                        incremental sync: 128/128 shards
+                        data is behind on 1 shards
+                        oldest incremental change not applied: \
+2017-11-21 19:57:44.0.286307s
+"""
+
+SINGLE_SITE = """\
+          realm 1e4c1b0a-71c4-4b7c-a5a1-8e0a0fbd3c57 (beedata)
+      zonegroup 2a8d1a8e-6c2d-4a3b-9b0e-64d1f5a8d9c1 (brundall)
+           zone 4c0d7e2b-8f1a-4c6d-9e3b-2f4a5b6c7d8e (brundall-north)
+  metadata sync no sync (zone is master)
+"""
+
+
+class SyncStatusTestCase(unittest.TestCase):
+
+    def test_parse_secondary_behind(self):
+        status = sync_status.parse_sync_status(SECONDARY_BEHIND)
+        self.assertEqual(status.realm, 'beedata')
+        self.assertEqual(status.zonegroup, 'brundall')
+        self.assertEqual(status.zone, 'brundall-south')
+        self.assertEqual(status.current_time,
+                         datetime.datetime(2024, 2, 14, 10, 53, 1))
+        self.assertTrue(status.is_multisite)
+        self.assertFalse(status.metadata_is_master)
+        self.assertEqual(status.metadata.state, 'syncing')
+        self.assertEqual(status.metadata.incremental_sync, (64, 64))
+        self.assertEqual(status.metadata.behind_shards, 2)
+        self.assertEqual(len(status.data_sources), 1)
+        source = status.data_sources[0]
+        self.assertEqual(source.source_name, 'brundall-north')
+        self.assertEqual(source.state, 'syncing')
+        self.assertEqual(source.full_sync, (0, 128))
+        self.assertEqual(source.behind_shards, 3)
+        self.assertEqual(source.recovering_shards, 2)
+        self.assertTrue(source.healthy)
+        self.assertEqual(status.data_behind_shards, 3)
+        self.assertEqual(status.recovering_shards, 2)
+        self.assertEqual(status.metadata.oldest_change,
+                         datetime.datetime(2024, 2, 14, 10, 51, 0, 372512))
+        self.assertEqual(status.oldest_change,
+                         datetime.datetime(2024, 2, 14, 10, 43, 1, 372512))
+        self.assertEqual(int(status.lag().total_seconds()), 599)
+        self.assertFalse(status.caught_up)
+        self.assertEqual(
+            status.summary(),
+            'multi-site sync metadata behind on 2 shards, data behind on 3 '
+            'shards, 2 shards recovering, lag 599s')
+
+    def test_parse_primary_caught_up(self):
+        status = sync_status.parse_sync_status(PRIMARY_CAUGHT_UP)
+        self.assertTrue(status.is_multisite)
+        self.assertTrue(status.metadata_is_master)
+        self.assertTrue(status.data_sources[0].caught_up)
+        self.assertIsNone(status.oldest_change)
+        self.assertIsNone(status.lag())
+        self.assertTrue(status.caught_up)
+        self.assertEqual(status.summary(), 'multi-site sync caught up')
+
+    def test_parse_source_failed(self):
+        status = sync_status.parse_sync_status(SOURCE_FAILED)
+        self.assertTrue(status.is_multisite)
+        self.assertFalse(status.data_sources[0].healthy)
+        self.assertFalse(status.caught_up)
+        self.assertEqual(
+            status.summary(),
+            'multi-site sync error: failed to retrieve sync info: (5) '
+            'Input/output error')
+
+    def test_parse_secondary_behind_legacy(self):
+        self._set_timezone('CET-1')
+        status = sync_status.parse_sync_status(SECONDARY_BEHIND_LEGACY)
+        self.assertEqual(status.oldest_change,
+                         datetime.datetime(2017, 11, 21, 18, 57, 44, 286307))
+        self.assertEqual(
+            status.lag(datetime.datetime(2017, 11, 21, 19, 7, 44, 286307)),
+            datetime.timedelta(minutes=10))
+
+    def test_parse_single_site(self):
+        status = sync_status.parse_sync_status(SINGLE_SITE)
+        self.assertFalse(status.is_multisite)
+        self.assertEqual(status.summary(), 'multi-site sync not configured')
+
+    def _set_timezone(self, tz):
+        patcher = mock.patch.dict(os.environ, {'TZ': tz})
+        patcher.start()
+        self.addCleanup(time.tzset)
+        self.addCleanup(patcher.stop)
+        time.tzset()
+
+    def test_parse_sync_time(self):
+        self.assertEqual(sync_status.parse_sync_time('2024-02-14T10:53:01Z'),
+                         datetime.datetime(2024, 2, 14, 10, 53, 1))
+        self.assertEqual(
+            sync_status.parse_sync_time('2024-02-14T11:52:54.372512+0100'),
+            datetime.datetime(2024, 2, 14, 10, 52, 54, 372512))
+        self.assertIsNone(sync_status.parse_sync_time('[5]'))
+
+    def test_parse_sync_time_legacy(self):
+        self._set_timezone('UTC0')
+        self.assertEqual(
+            sync_status.parse_sync_time('2017-11-21 19:57:44.0.286307s'),
+            datetime.datetime(2017, 11, 21, 19, 57, 44, 286307))